@@ -1,17 +1,20 @@
 """
 知识库 API 端点
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import asyncio
 import json
 import os
+import shutil
 from datetime import datetime
 
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 from app.models.user import User
-from app.models.knowledge_base import KnowledgeDocument, QARecord
+from app.models.knowledge_base import KnowledgeDocument, QARecord, ConversationSession as ConversationSessionModel
 from app.schemas.knowledge_base import (
     KnowledgeDocument as KnowledgeDocumentSchema,
     KnowledgeDocumentCreate,
@@ -21,6 +24,8 @@ from app.schemas.knowledge_base import (
     QARecordList,
     DocumentUploadRequest,
     DocumentUploadResponse,
+    BulkUploadResponse,
+    IngestJobResponse,
     QuestionRequest,
     QuestionResponse,
     SimilarSearchRequest,
@@ -29,8 +34,33 @@ from app.schemas.knowledge_base import (
     FeedbackResponse,
     CollectionListResponse,
     CollectionInfo,
+    QueryCacheStatsResponse,
+    ConversationSessionCreate,
+    ConversationSessionSchema,
+    ConversationSessionDetail,
+    ConversationSessionList,
+)
+from app.services.rag_service import get_rag_service, invalidate_rag_collection, rag_cache_stats
+from app.services.answer_cache import semantic_answer_cache
+from app.services.llm_gateway import PRIORITY_INTERACTIVE, bind_llm_request_context
+from app.services.lexical_index import backfill_lexical_index
+from app.services.llm_telemetry import bind_llm_call_context
+from app.services.knowledge_vector_service import (
+    INACTIVE_STATUSES,
+    purge_inactive_document_vectors,
+    remove_document_vectors,
+)
+from app.services.chat_history import chat_history_manager
+from app.services.conversation_service import conversation_store
+from app.services.sse import coalesce_token_events, format_sse
+from app.services.knowledge_ingest_service import (
+    SUPPORTED_EXTENSIONS,
+    create_ingest_job,
+    extract_zip,
+    file_extension,
+    get_ingest_job,
+    run_ingest_job,
 )
-from app.services.rag_service import RAGService
 from app.api.deps import get_current_active_user
 from app.core.config import settings
 from app.utils.file_paths import get_upload_dir_path
@@ -101,7 +131,7 @@ async def upload_document(
         db.refresh(document)
         
         # 向量化文档
-        rag_service = RAGService(db)
+        rag_service = get_rag_service(db)
         result = rag_service.add_documents(
             documents=[content],
             metadatas=[{
@@ -117,6 +147,7 @@ async def upload_document(
             # 更新文档状态
             document.is_vectorized = True
             document.chunk_count = result["total_chunks"]
+            document.vector_ids = json.dumps(result["vector_ids"][0], default=str)
             db.commit()
             
             return DocumentUploadResponse(
@@ -138,6 +169,125 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _save_upload_file(file: UploadFile, target_path) -> int:
+    """分块写入上传文件（不整体读入内存），返回文件大小"""
+    with open(target_path, "wb") as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+    return os.path.getsize(target_path)
+
+
+@router.post("/documents/bulk-upload", response_model=BulkUploadResponse)
+async def bulk_upload_documents(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    category: Optional[str] = Form(None),
+    tags: Optional[str] = Form(None),
+    collection_name: str = Form("knowledge_base"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    批量上传文档到知识库（支持多个文件或 zip 压缩包）
+
+    立即返回任务ID，解析与向量化在后台并行执行，进度通过 WebSocket 推送
+    """
+    upload_dir = get_upload_dir_path() / "knowledge_base"
+    os.makedirs(upload_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    # 落盘并展开 zip
+    saved_files = []
+    skipped_files = []
+    for index, file in enumerate(files):
+        file_name = os.path.basename(file.filename or f"file_{index}")
+        ext = file_extension(file_name)
+        if ext != "zip" and ext not in SUPPORTED_EXTENSIONS:
+            skipped_files.append(file_name)
+            continue
+        target_path = upload_dir / f"{timestamp}_{index}_{file_name}"
+        file_size = await run_in_threadpool(_save_upload_file, file, target_path)
+        if file_size > settings.MAX_UPLOAD_SIZE:
+            os.remove(target_path)
+            skipped_files.append(file_name)
+            continue
+        if ext == "zip":
+            try:
+                extracted = await run_in_threadpool(extract_zip, target_path, upload_dir)
+            except Exception as e:
+                print(f"[WARNING] 解压失败: {file_name}, {e}")
+                skipped_files.append(file_name)
+                continue
+            finally:
+                os.remove(target_path)
+            saved_files.extend(extracted)
+        else:
+            saved_files.append((file_name, target_path))
+
+    if not saved_files:
+        return BulkUploadResponse(success=False, skipped_files=skipped_files, message="没有可导入的文档")
+
+    def create_documents():
+        documents = []
+        for file_name, path in saved_files:
+            document = KnowledgeDocument(
+                title=os.path.splitext(file_name)[0],
+                content="",
+                category=category,
+                tags=tags,
+                collection_name=collection_name,
+                file_name=file_name,
+                file_type=file_extension(file_name),
+                file_size=os.path.getsize(path),
+                file_path=str(path),
+                created_by=current_user.id,
+                is_vectorized=False,
+                chunk_count=0
+            )
+            db.add(document)
+            documents.append(document)
+        db.commit()
+        return [(document.id, document.title, document.file_type) for document in documents]
+
+    created = await run_in_threadpool(create_documents)
+    rag_service = await run_in_threadpool(get_rag_service, db)
+    job = await run_in_threadpool(
+        create_ingest_job,
+        current_user.id,
+        [{"document_id": document_id, "title": title} for document_id, title, _ in created]
+    )
+
+    loop = asyncio.get_running_loop()
+    background_tasks.add_task(
+        run_ingest_job,
+        job["job_id"],
+        rag_service,
+        [{"document_id": document_id, "file_type": file_type} for document_id, _, file_type in created],
+        loop
+    )
+
+    return BulkUploadResponse(
+        success=True,
+        job_id=job["job_id"],
+        document_ids=[document_id for document_id, _, _ in created],
+        skipped_files=skipped_files,
+        message=f"已提交 {len(created)} 个文档的导入任务"
+    )
+
+
+@router.get("/ingest-jobs/{job_id}", response_model=IngestJobResponse)
+def get_ingest_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    查询批量导入任务进度
+    """
+    job = get_ingest_job(job_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return job
+
+
 @router.get("/documents", response_model=KnowledgeDocumentList)
 def get_documents(
     skip: int = 0,
@@ -196,15 +346,81 @@ def update_document(
     
     # 更新字段
     update_data = document_update.model_dump(exclude_unset=True)
+    content_changed = "content" in update_data and update_data["content"] != document.content
     for field, value in update_data.items():
         setattr(document, field, value)
     
     db.commit()
     db.refresh(document)
+
+    if document.status in INACTIVE_STATUSES:
+        # 归档或删除后不再参与检索
+        if document.is_vectorized:
+            remove_document_vectors(db, get_rag_service(db), document)
+    elif content_changed or not document.is_vectorized:
+        # 内容变更或重新启用：按记录的向量主键删除旧向量后重建
+        rag_service = get_rag_service(db)
+        if remove_document_vectors(db, rag_service, document):
+            result = rag_service.add_documents(
+                documents=[document.content],
+                metadatas=[{
+                    "document_id": document.id,
+                    "title": document.title,
+                    "category": document.category or "",
+                    "tags": document.tags or "",
+                }],
+                collection_name=document.collection_name
+            )
+            if result["success"]:
+                document.is_vectorized = True
+                document.chunk_count = result["total_chunks"]
+                document.vector_ids = json.dumps(result["vector_ids"][0], default=str)
+                document.ingest_error = None
+                db.commit()
+                db.refresh(document)
     
     return document
 
 
+@router.post("/documents/{document_id}/retry-ingest", response_model=BulkUploadResponse)
+async def retry_ingest_document(
+    document_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    重新解析并向量化导入失败的文档（后台执行，进度通过 WebSocket 推送）
+    """
+    document = await run_in_threadpool(
+        lambda: db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
+    )
+    if not document or document.status in INACTIVE_STATUSES:
+        raise HTTPException(status_code=404, detail="文档不存在")
+    if document.is_vectorized:
+        raise HTTPException(status_code=400, detail="文档已向量化，无需重试")
+    if not document.file_path:
+        raise HTTPException(status_code=400, detail="文档没有原始文件，请编辑内容后保存以重新向量化")
+
+    rag_service = await run_in_threadpool(get_rag_service, db)
+    job = await run_in_threadpool(
+        create_ingest_job, current_user.id, [{"document_id": document.id, "title": document.title}]
+    )
+    background_tasks.add_task(
+        run_ingest_job,
+        job["job_id"],
+        rag_service,
+        [{"document_id": document.id, "file_type": document.file_type}],
+        asyncio.get_running_loop()
+    )
+    return BulkUploadResponse(
+        success=True,
+        job_id=job["job_id"],
+        document_ids=[document.id],
+        message="已提交重新导入任务"
+    )
+
+
 @router.delete("/documents/{document_id}")
 def delete_document(
     document_id: int,
@@ -221,10 +437,84 @@ def delete_document(
     # 软删除
     document.status = "deleted"
     db.commit()
+
+    # 同步删除向量；失败时由后台清理任务兜底
+    if not remove_document_vectors(db, get_rag_service(db), document):
+        invalidate_rag_collection(document.collection_name)
     
     return {"success": True, "message": "文档已删除"}
 
 
+def purge_vectors_background():
+    """后台清理已删除/已归档文档的向量（在线程池运行）"""
+    db = SessionLocal()
+    try:
+        purge_inactive_document_vectors(db, get_rag_service(db))
+    except Exception as e:
+        print(f"[ERROR] 后台清理向量失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+@router.post("/maintenance/purge-vectors")
+def purge_vectors(
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    清理已删除/已归档文档残留的向量并压缩集合（后台执行）
+    """
+    pending = db.query(KnowledgeDocument).filter(
+        KnowledgeDocument.status.in_(INACTIVE_STATUSES),
+        KnowledgeDocument.is_vectorized == True
+    ).count()
+    background_tasks.add_task(purge_vectors_background)
+    return {"success": True, "pending_documents": pending, "message": "向量清理任务已提交"}
+
+
+def backfill_lexical_index_background():
+    """后台为已有文档补建词法索引（在线程池运行）"""
+    db = SessionLocal()
+    try:
+        backfill_lexical_index(db, get_rag_service(db))
+    except Exception as e:
+        print(f"[ERROR] 后台补建词法索引失败: {str(e)}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+@router.post("/maintenance/backfill-lexical-index")
+def backfill_lexical_index_endpoint(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    为尚未建立词法索引的已有文档补建索引（后台执行，可重复调用）
+    """
+    background_tasks.add_task(backfill_lexical_index_background)
+    return {"success": True, "message": "词法索引补建任务已提交"}
+
+
+def _resolve_chat_history(db: Session, request: QuestionRequest, current_user: User) -> Optional[List[dict]]:
+    """获取对话历史：优先使用服务端会话，否则使用请求携带的 chat_history"""
+    if request.session_id:
+        history = conversation_store.get_history(db, request.session_id, current_user.id)
+        if history is None:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return history or None
+    if request.chat_history:
+        return [
+            {"role": msg.role, "content": msg.content}
+            for msg in request.chat_history
+        ]
+    return None
+
+
 @router.post("/query", response_model=QuestionResponse)
 def query_knowledge_base(
     request: QuestionRequest,
@@ -232,26 +522,36 @@ def query_knowledge_base(
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    查询知识库 (支持对话历史)
+    查询知识库 (支持对话历史或服务端会话)
     """
+    # 同步接口在线程池中以复制的上下文运行，问答调用走 LLM 网关的交互通道
+    bind_llm_request_context(PRIORITY_INTERACTIVE, current_user.id)
+    bind_llm_call_context("knowledge_qa")
+    chat_history = _resolve_chat_history(db, request, current_user)
     try:
-        # 转换对话历史为字典格式
-        chat_history = None
-        if request.chat_history:
-            chat_history = [
-                {"role": msg.role, "content": msg.content}
-                for msg in request.chat_history
-            ]
-
-        # 使用 RAG 服务查询
-        rag_service = RAGService(db)
-        result = rag_service.query(
-            question=request.question,
-            collection_name=request.collection_name,
-            top_k=request.top_k,
-            return_source=request.return_source,
-            chat_history=chat_history
-        )
+
+        # 使用 RAG 服务查询（多轮对话依赖上下文，不走语义答案缓存）
+        rag_service = get_rag_service(db)
+        cached = None
+        if chat_history:
+            semantic_answer_cache.bypass(request.collection_name, "chat_history")
+        else:
+            cached = semantic_answer_cache.lookup(db, rag_service, request.question, request.collection_name)
+
+        if cached:
+            result = {
+                "success": True,
+                "answer": cached["answer"],
+                "sources": cached["sources"] if request.return_source else [],
+            }
+        else:
+            result = rag_service.query(
+                question=request.question,
+                collection_name=request.collection_name,
+                top_k=request.top_k,
+                return_source=request.return_source,
+                chat_history=chat_history
+            )
         
         if not result["success"]:
             return QuestionResponse(
@@ -273,13 +573,20 @@ def query_knowledge_base(
         db.add(qa_record)
         db.commit()
         db.refresh(qa_record)
+
+        if request.session_id:
+            conversation_store.append_turn(
+                db, request.session_id, request.question, result["answer"], qa_record.id
+            )
         
         return QuestionResponse(
             success=True,
             question=request.question,
             answer=result["answer"],
             sources=result.get("sources", []),
-            qa_record_id=qa_record.id
+            qa_record_id=qa_record.id,
+            cached=bool(cached),
+            history_tokens_saved=result.get("history_tokens_saved", 0)
         )
         
     except Exception as e:
@@ -296,76 +603,96 @@ async def query_knowledge_base_stream(
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    流式查询知识库 (Server-Sent Events, 支持对话历史)
+    流式查询知识库 (Server-Sent Events, 支持对话历史或服务端会话)
     """
+    chat_history = await run_in_threadpool(_resolve_chat_history, db, request, current_user)
+
     async def event_generator():
+        bind_llm_request_context(PRIORITY_INTERACTIVE, current_user.id)
+        bind_llm_call_context("knowledge_qa")
         try:
-            # 转换对话历史为字典格式
-            chat_history = None
-            if request.chat_history:
-                chat_history = [
-                    {"role": msg.role, "content": msg.content}
-                    for msg in request.chat_history
-                ]
-
-            # 使用 RAG 服务流式查询
-            rag_service = RAGService(db)
-
-            # 获取流式响应生成器
-            stream_gen = rag_service.query(
-                question=request.question,
-                collection_name=request.collection_name,
-                top_k=request.top_k,
-                return_source=request.return_source,
-                stream=True,
-                chat_history=chat_history
-            )
+            # 使用 RAG 服务流式查询（多轮对话依赖上下文，不走语义答案缓存）
+            # 涉及数据库与同步网络调用的步骤放到线程池，避免阻塞事件循环
+            rag_service = await run_in_threadpool(get_rag_service, db)
+            cached = None
+            if chat_history:
+                semantic_answer_cache.bypass(request.collection_name, "chat_history")
+            else:
+                cached = await run_in_threadpool(
+                    semantic_answer_cache.lookup, db, rag_service, request.question, request.collection_name
+                )
 
-            # 用于保存完整答案
-            full_answer = ""
-            sources = []
+            # 流式生成可能持续数十秒，期间先归还数据库连接，保存记录时再重新获取
+            await run_in_threadpool(db.close)
 
-            # 流式发送数据
-            for chunk in stream_gen:
-                yield chunk
-
-                # 解析数据以保存记录
-                if chunk.startswith("data: "):
-                    data_str = chunk[6:].strip()
-                    if data_str:
-                        try:
-                            data = json.loads(data_str)
-                            if data.get("type") == "sources":
-                                sources = data.get("sources", [])
-                            elif data.get("type") == "done":
-                                full_answer = data.get("answer", "")
-                        except:
-                            pass
+            if cached:
+                # 命中缓存时一次性返回答案与来源
+                async def cached_stream():
+                    cached_sources = cached["sources"] if request.return_source else []
+                    yield {"type": "done", "answer": cached["answer"], "sources": cached_sources, "cached": True}
 
-            # 保存问答记录
-            if full_answer:
-                qa_record = QARecord(
+                stream_gen = cached_stream()
+            else:
+                # 获取异步流式事件生成器
+                stream_gen = rag_service.aquery_stream(
                     question=request.question,
-                    answer=full_answer,
                     collection_name=request.collection_name,
-                    source_count=len(sources),
-                    sources=json.dumps(sources, ensure_ascii=False),
-                    created_by=current_user.id
+                    top_k=request.top_k,
+                    return_source=request.return_source,
+                    chat_history=chat_history
                 )
 
-                db.add(qa_record)
-                db.commit()
-                db.refresh(qa_record)
+            # 用于保存完整答案（直接读取结构化事件，不再从 SSE 文本中解析）
+            full_answer = ""
+            sources = []
+
+            # 合并 token 后按帧发送
+            async for event in coalesce_token_events(stream_gen):
+                if event["type"] == "sources":
+                    sources = event["sources"]
+                elif event["type"] == "done":
+                    full_answer = event.get("answer", "")
+                    sources = event.get("sources", sources)
+                yield format_sse(event)
+
+            # 保存问答记录
+            if full_answer:
+                def save_qa_record() -> int:
+                    # get_db 的清理在响应开始前已执行，这里用完需自行关闭会话归还连接
+                    try:
+                        qa_record = QARecord(
+                            question=request.question,
+                            answer=full_answer,
+                            collection_name=request.collection_name,
+                            source_count=len(sources),
+                            sources=json.dumps(sources, ensure_ascii=False),
+                            created_by=current_user.id
+                        )
+                        db.add(qa_record)
+                        db.commit()
+                        db.refresh(qa_record)
+                        if request.session_id:
+                            conversation_store.append_turn(
+                                db, request.session_id, request.question, full_answer, qa_record.id
+                            )
+                        return qa_record.id
+                    finally:
+                        db.close()
+
+                qa_record_id = await run_in_threadpool(save_qa_record)
 
                 # 发送 QA 记录 ID
-                yield f"data: {json.dumps({'type': 'qa_record_id', 'qa_record_id': qa_record.id}, ensure_ascii=False)}\n\n"
+                yield format_sse({"type": "qa_record_id", "qa_record_id": qa_record_id})
 
+        except asyncio.CancelledError:
+            # 客户端断开连接，Starlette 取消生成器，LLM 流随之关闭，不保存不完整回答
+            print(f"[INFO] 流式查询已取消（客户端断开）: {request.question[:50]}")
+            raise
         except Exception as e:
             print(f"[ERROR] 流式查询失败: {str(e)}")
             import traceback
             traceback.print_exc()
-            error_data = json.dumps({"type": "error", "error": str(e)}, ensure_ascii=False)
-            yield f"data: {error_data}\n\n"
+            yield format_sse({"type": "error", "error": str(e)})
 
     return StreamingResponse(
         event_generator(),
@@ -388,7 +715,7 @@ def search_similar_documents(
     搜索相似文档
     """
     try:
-        rag_service = RAGService(db)
+        rag_service = get_rag_service(db)
         results = rag_service.search_similar(
             query=request.query,
             collection_name=request.collection_name,
@@ -406,6 +733,81 @@ def search_similar_documents(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/cache/stats", response_model=QueryCacheStatsResponse)
+def get_query_cache_stats(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取问答查询缓存命中统计（汇总所有已创建的 RAGService 实例）
+    """
+    stats = rag_cache_stats()
+    return QueryCacheStatsResponse(
+        success=True,
+        instances=stats["instances"],
+        embedding=stats["embedding"],
+        retrieval=stats["retrieval"],
+        answer=semantic_answer_cache.stats(),
+        history=chat_history_manager.stats()
+    )
+
+
+@router.post("/sessions", response_model=ConversationSessionSchema)
+def create_session(
+    request: ConversationSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    创建对话会话
+    """
+    return conversation_store.create(db, current_user.id, request.collection_name, request.title)
+
+
+@router.get("/sessions", response_model=ConversationSessionList)
+def list_sessions(
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取当前用户的对话会话列表
+    """
+    return ConversationSessionList(items=conversation_store.list_sessions(db, current_user.id, skip, limit))
+
+
+@router.get("/sessions/{session_id}", response_model=ConversationSessionDetail)
+def get_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    获取对话会话详情（含消息）
+    """
+    session = db.query(ConversationSessionModel).filter(
+        ConversationSessionModel.id == session_id,
+        ConversationSessionModel.user_id == current_user.id
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return session
+
+
+@router.delete("/sessions/{session_id}")
+def delete_session(
+    session_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    删除对话会话
+    """
+    if not conversation_store.delete(db, session_id, current_user.id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return {"success": True, "message": "会话已删除"}
+
+
 @router.get("/qa-records", response_model=QARecordList)
 def get_qa_records(
     skip: int = 0,
@@ -428,6 +830,7 @@ def get_qa_records(
 @router.post("/feedback", response_model=FeedbackResponse)
 def submit_feedback(
     request: FeedbackRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -447,6 +850,14 @@ def submit_feedback(
         qa_record.rating = request.rating
     
     db.commit()
+
+    # 答案变为可复用时，在后台预先计算其问题向量，避免首次命中查询时现算
+    if semantic_answer_cache.enabled and semantic_answer_cache.is_eligible(qa_record):
+        background_tasks.add_task(
+            semantic_answer_cache.warm,
+            get_rag_service(db),
+            [(qa_record.id, qa_record.question)],
+        )
     
     return FeedbackResponse(
         success=True,
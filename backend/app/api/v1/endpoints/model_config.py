@@ -13,7 +13,7 @@ from app.schemas.model_config import (
     SetDefaultModelRequest
 )
 from app.api.deps import get_current_active_superuser
-from app.services.ai_service import clear_ai_service_cache
+from app.services.system_config_cache import system_config_cache
 
 router = APIRouter()
 
@@ -81,6 +81,8 @@ def list_model_configs(
             "max_tokens": config.max_tokens,
             "provider": config.provider,
             "model_type": config.model_type,
+            "pool_name": config.pool_name,
+            "weight": config.weight,
             "is_active": config.is_active,
             "is_default": config.is_default,
             "created_at": config.created_at,
@@ -115,6 +117,8 @@ def get_model_config(
         "max_tokens": config.max_tokens,
         "provider": config.provider,
         "model_type": config.model_type,
+        "pool_name": config.pool_name,
+        "weight": config.weight,
         "is_active": config.is_active,
         "is_default": config.is_default,
         "created_at": config.created_at,
@@ -148,6 +152,8 @@ def get_default_model_config(
         "max_tokens": config.max_tokens,
         "provider": config.provider,
         "model_type": config.model_type,
+        "pool_name": config.pool_name,
+        "weight": config.weight,
         "is_active": config.is_active,
         "is_default": config.is_default
     }
@@ -190,6 +196,8 @@ def create_model_config(
         max_tokens=config.max_tokens,
         provider=config.provider,
         model_type=config.model_type,
+        pool_name=config.pool_name or None,
+        weight=config.weight or 1,
         is_active=config.is_active,
         is_default=is_first
     )
@@ -198,8 +206,8 @@ def create_model_config(
     db.commit()
     db.refresh(db_config)
 
-    # 模型配置变更，清除 AIService 缓存
-    clear_ai_service_cache()
+    # 模型配置变更：递增共享版本号，各 worker 清除 AIService / RAGService 缓存
+    system_config_cache.invalidate()
 
     # 返回脱敏后的配置
     return ModelConfigResponse(
@@ -214,6 +222,8 @@ def create_model_config(
         max_tokens=db_config.max_tokens,
         provider=db_config.provider,
         model_type=db_config.model_type,
+        pool_name=db_config.pool_name,
+        weight=db_config.weight,
         is_active=db_config.is_active,
         is_default=db_config.is_default,
         created_at=db_config.created_at,
@@ -260,8 +270,8 @@ def update_model_config(
     db.commit()
     db.refresh(db_config)
 
-    # 模型配置变更，清除 AIService 缓存
-    clear_ai_service_cache()
+    # 模型配置变更：递增共享版本号，各 worker 清除 AIService / RAGService 缓存
+    system_config_cache.invalidate()
 
     return ModelConfigResponse(
         id=db_config.id,
@@ -275,6 +285,8 @@ def update_model_config(
         max_tokens=db_config.max_tokens,
         provider=db_config.provider,
         model_type=db_config.model_type,
+        pool_name=db_config.pool_name,
+        weight=db_config.weight,
         is_active=db_config.is_active,
         is_default=db_config.is_default,
         created_at=db_config.created_at,
@@ -306,8 +318,8 @@ def delete_model_config(
     db.delete(db_config)
     db.commit()
 
-    # 模型配置变更，清除 AIService 缓存
-    clear_ai_service_cache()
+    # 模型配置变更：递增共享版本号，各 worker 清除 AIService / RAGService 缓存
+    system_config_cache.invalidate()
 
     return {"message": "模型配置已删除"}
 
@@ -338,8 +350,8 @@ def set_default_model(
     
     db.commit()
 
-    # 默认模型变更，清除 AIService 缓存
-    clear_ai_service_cache()
+    # 默认模型变更：递增共享版本号，各 worker 清除 AIService / RAGService 缓存
+    system_config_cache.invalidate()
 
     return {
         "message": "默认模型已更新",
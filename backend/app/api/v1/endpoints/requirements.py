@@ -19,6 +19,8 @@ from app.core.config import settings
 from app.services.document_parser import DocumentParser
 from app.services.document_embedding_service import document_embedding_service
 from app.services.ai_service import get_ai_service
+from app.services.llm_gateway import PRIORITY_BACKGROUND, bind_llm_request_context
+from app.services.llm_telemetry import bind_llm_call_context
 from app.services.websocket_service import manager
 from app.models.test_point import TestPoint
 from app.models.test_case import TestCase
@@ -110,6 +112,8 @@ def process_requirement_background(
     loop: Optional[asyncio.AbstractEventLoop] = None
 ):
     """后台处理需求文档（在线程池运行，避免阻塞事件循环）"""
+    bind_llm_request_context(PRIORITY_BACKGROUND, user_id)
+    bind_llm_call_context("extract_test_points", requirement_id=requirement_id)
     db = SessionLocal()
     requirement_file_path = None
     try:
@@ -165,43 +169,55 @@ def process_requirement_background(
 
         print(f"[INFO] 调用 AI 服务提取测试点...")
         ai_service = get_ai_service(db)
-        try:
-            test_points_data = ai_service.extract_test_points(
-                ai_context,
-                allow_fallback=False,
-            )
-        except Exception as ai_error:
-            raise RuntimeError(f"AI 提取测试点失败: {ai_error}") from ai_error
-        print(f"[INFO] AI 提取完成，测试点数量: {len(test_points_data)}")
-
         summary_text = "自动生成（需求上传）"
         version_label = allocate_requirement_version(db, requirement_id)
 
-        # 保存测试点
-        for tp_data in test_points_data:
-            code = generate_test_point_code(db)
-            test_point = TestPoint(
-                requirement_id=requirement_id,
-                code=code,
-                title=tp_data.get('title', ''),
-                description=tp_data.get('description', ''),
-                category=tp_data.get('category', ''),
-                priority=tp_data.get('priority', 'medium'),
-                business_line=tp_data.get('business_line', '')
-            )
-            db.add(test_point)
-            db.flush()  # 确保编号被保存，以便下一个测试点能获取正确的编号
-            record_history_entry(
-                db,
-                test_point,
-                summary_text,
-                operator_id=user_id,
-                status="completed",
-                version_label=version_label,
-            )
+        # 流式提取：每个测试点解析完成即保存并推送，无需等待完整响应
+        if settings.TEST_POINT_STREAMING:
+            test_points_data = ai_service.stream_test_points(ai_context)
+        else:
+            test_points_data = ai_service.extract_test_points(ai_context)
 
-        db.commit()
-        print(f"[INFO] 测试点保存成功")
+        saved_count = 0
+        try:
+            for tp_data in test_points_data:
+                code = generate_test_point_code(db)
+                test_point = TestPoint(
+                    requirement_id=requirement_id,
+                    code=code,
+                    title=tp_data.get('title', ''),
+                    description=tp_data.get('description', ''),
+                    category=tp_data.get('category', ''),
+                    priority=tp_data.get('priority', 'medium'),
+                    business_line=tp_data.get('business_line', '')
+                )
+                db.add(test_point)
+                db.flush()  # 确保编号被保存，以便下一个测试点能获取正确的编号
+                record_history_entry(
+                    db,
+                    test_point,
+                    summary_text,
+                    operator_id=user_id,
+                    status="completed",
+                    version_label=version_label,
+                )
+                db.commit()
+                saved_count += 1
+                _run_async_notification(
+                    loop,
+                    manager.notify_test_point_created(user_id, requirement_id, {
+                        "id": test_point.id,
+                        "code": test_point.code,
+                        "title": test_point.title,
+                        "category": test_point.category,
+                        "priority": test_point.priority,
+                        "business_line": test_point.business_line,
+                    }, saved_count),
+                    "发送测试点创建通知失败"
+                )
+        except Exception as ai_error:
+            raise RuntimeError(f"AI 提取测试点失败: {ai_error}") from ai_error
+        print(f"[INFO] AI 提取完成，测试点保存成功，数量: {saved_count}")
 
         # 更新状态为完成
         requirement.status = RequirementStatus.COMPLETED
@@ -212,7 +228,7 @@ def process_requirement_background(
         # 发送 WebSocket 通知
         _run_async_notification(
             loop,
-            manager.notify_test_point_generated(user_id, requirement_id, len(test_points_data)),
+            manager.notify_test_point_generated(user_id, requirement_id, saved_count),
             "发送测试点生成通知失败"
         )
 
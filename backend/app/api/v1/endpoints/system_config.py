@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import json
 import os
 
@@ -15,9 +15,30 @@ from app.schemas.system_config import (
     MilvusConfigUpdate,
     ModelConfigUpdate,
     EmbeddingConfigUpdate,
+    EmbeddingReindexCreate,
+    VectorReindexJobSchema,
+    LLMCacheStats,
     PromptConfigUpdate,
     AutomationPlatformConfigUpdate
 )
+from app.models.vector_reindex_job import VectorReindexJob
+from app.services.ai_service import get_structured_output_stats
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_retry import get_retry_stats
+from app.services.llm_router import routing_stats
+from app.services.llm_telemetry import aggregate_llm_calls, llm_call_recorder
+from app.services.llm_response_cache import llm_response_cache
+from app.services.single_flight import single_flight_stats
+from app.services.system_config_cache import system_config_cache
+from app.services.vector_reindex_service import (
+    cancel_reindex_job,
+    create_reindex_job,
+    pause_reindex_job,
+    pin_current_embedding_model,
+    reindex_job_report,
+    resume_reindex_job,
+    run_reindex_job,
+)
 
 router = APIRouter()
 
@@ -131,6 +152,7 @@ def get_or_create_config(db: Session, key: str, default_value: str, description:
         db.add(config)
         db.commit()
         db.refresh(config)
+        system_config_cache.invalidate()
     return config
 
 
@@ -246,6 +268,9 @@ def update_milvus_config(
     settings.MILVUS_DB_NAME = config.db_name
     settings.MILVUS_COLLECTION_NAME = config.collection_name
 
+    # Milvus 配置变更：递增共享版本号，各 worker 清除 RAGService 缓存
+    system_config_cache.invalidate()
+
     return {
         "message": "Milvus 配置更新成功（建议重启后端以完全生效）",
         "uri": config.uri,
@@ -309,6 +334,9 @@ def update_model_config(
     settings.OPENAI_API_KEY = config.api_key
     settings.OPENAI_API_BASE = config.api_base
     settings.MODEL_NAME = config.model_name
+
+    # 模型配置变更：递增共享版本号，各 worker 清除 RAGService 缓存
+    system_config_cache.invalidate()
     
     return {
         "message": "模型配置更新成功（部分配置需要重启后端才能完全生效）",
@@ -349,6 +377,13 @@ def update_embedding_config(
     current_user: User = Depends(get_current_active_superuser)
 ):
     """更新 Embedding 模型配置"""
+    # 模型变更时，现有集合继续使用旧模型读取，直到重建任务完成后切换
+    existing_model_config = db.query(SystemConfig).filter(SystemConfig.config_key == "EMBEDDING_MODEL").first()
+    previous_model = existing_model_config.config_value if existing_model_config else settings.EMBEDDING_MODEL
+    pinned_collections = []
+    if previous_model and previous_model != config.embedding_model:
+        pinned_collections = pin_current_embedding_model(db, previous_model)
+
     # 更新数据库
     embedding_model_config = get_or_create_config(db, "EMBEDDING_MODEL", "text-embedding-ada-002", "Embedding 模型名称")
     embedding_model_config.config_value = config.embedding_model
@@ -372,13 +407,186 @@ def update_embedding_config(
     settings.EMBEDDING_API_KEY = config.embedding_api_key
     settings.EMBEDDING_API_BASE = config.embedding_api_base
 
+    # Embedding 配置变更：递增共享版本号，各 worker 清除 RAGService 缓存
+    system_config_cache.invalidate()
+
     return {
         "message": "Embedding 模型配置更新成功（部分配置需要重启后端才能完全生效）",
         "embedding_model": config.embedding_model,
-        "embedding_api_base": config.embedding_api_base
+        "embedding_api_base": config.embedding_api_base,
+        # 这些集合需创建重建任务后才会切换到新模型
+        "pending_reindex_collections": pinned_collections
     }
 
 
+def _get_reindex_job(db: Session, job_id: int) -> VectorReindexJob:
+    job = db.query(VectorReindexJob).filter(VectorReindexJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="重建任务不存在")
+    return job
+
+
+@router.post("/embedding/reindex", response_model=VectorReindexJobSchema)
+def create_embedding_reindex_job(
+    payload: EmbeddingReindexCreate,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """创建向量重建任务：用当前 Embedding 模型在影子集合中重建，完成后自动切换读取"""
+    try:
+        job = create_reindex_job(db, payload.collection_name, current_user.id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(run_reindex_job, job.id)
+    return reindex_job_report(job)
+
+
+@router.get("/embedding/reindex-jobs", response_model=List[VectorReindexJobSchema])
+def list_embedding_reindex_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取向量重建任务列表"""
+    jobs = db.query(VectorReindexJob).order_by(VectorReindexJob.id.desc()).limit(50).all()
+    return [reindex_job_report(job) for job in jobs]
+
+
+@router.get("/embedding/reindex-jobs/{job_id}", response_model=VectorReindexJobSchema)
+def get_embedding_reindex_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取向量重建任务进度（含吞吐与预计剩余时间）"""
+    return reindex_job_report(_get_reindex_job(db, job_id))
+
+
+@router.post("/embedding/reindex-jobs/{job_id}/pause", response_model=VectorReindexJobSchema)
+def pause_embedding_reindex_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """暂停向量重建任务（双写保持开启）"""
+    job = _get_reindex_job(db, job_id)
+    try:
+        pause_reindex_job(db, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return reindex_job_report(job)
+
+
+@router.post("/embedding/reindex-jobs/{job_id}/resume", response_model=VectorReindexJobSchema)
+def resume_embedding_reindex_job(
+    job_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """从检查点恢复暂停或失败的向量重建任务"""
+    job = _get_reindex_job(db, job_id)
+    try:
+        resume_reindex_job(db, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    background_tasks.add_task(run_reindex_job, job.id)
+    return reindex_job_report(job)
+
+
+@router.post("/embedding/reindex-jobs/{job_id}/cancel", response_model=VectorReindexJobSchema)
+def cancel_embedding_reindex_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """取消向量重建任务，停止双写并删除影子集合（读取保持在旧集合）"""
+    job = _get_reindex_job(db, job_id)
+    try:
+        cancel_reindex_job(db, job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return reindex_job_report(job)
+
+
+@router.get("/llm-gateway/stats")
+def get_llm_gateway_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取 LLM 网关各 provider 的排队深度、并发、等待时间，以及 token 用量与前缀缓存命中率"""
+    return llm_gateway.stats()
+
+
+@router.get("/cache/stats")
+def get_system_config_cache_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取系统配置缓存的版本号、加载与失效次数"""
+    return system_config_cache.stats()
+
+
+@router.get("/llm-routing/stats")
+def get_llm_routing_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取模型端点池各端点的健康状态、延迟与失败次数"""
+    return routing_stats()
+
+
+@router.get("/structured-output/stats")
+def get_structured_output_parse_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取测试点/测试用例结构化输出的解析失败、逐项修复次数与修复消耗的 token"""
+    return get_structured_output_stats()
+
+
+@router.get("/llm-retry/stats")
+def get_llm_retry_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取 LLM 调用的尝试、重试、不可重试错误与退避等待时间统计"""
+    return get_retry_stats()
+
+
+@router.get("/single-flight/stats")
+def get_single_flight_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取相同的并发 LLM / 问题向量请求被合并的次数"""
+    return single_flight_stats()
+
+
+@router.get("/llm-calls/stats")
+def get_llm_call_stats(
+    hours: float = Query(24, gt=0, le=24 * 90, description="统计最近多少小时"),
+    feature: Optional[str] = Query(None, description="只统计指定功能"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """按功能与模型汇总 LLM 调用次数、错误、重试、缓存命中、token 用量与 p50/p95 延迟"""
+    result = aggregate_llm_calls(db, hours=hours, feature=feature)
+    result["recorder"] = llm_call_recorder.stats()
+    return result
+
+
+@router.get("/llm-cache/stats", response_model=LLMCacheStats)
+def get_llm_cache_stats(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """获取 LLM 响应缓存命中统计"""
+    return llm_response_cache.stats()
+
+
+@router.delete("/llm-cache")
+def clear_llm_cache(
+    current_user: User = Depends(get_current_active_superuser)
+):
+    """清空 LLM 响应缓存"""
+    removed = llm_response_cache.clear()
+    return {"message": f"已清空 {removed} 条 LLM 响应缓存", "removed": removed}
+
+
 @router.get("/automation-platform")
 def get_automation_platform_config(
     db: Session = Depends(get_db),
@@ -436,6 +644,7 @@ def update_automation_platform_config(
 
     # 更新运行时配置，便于后续接口直接读取
     settings.AUTOMATION_PLATFORM_API_BASE = config.api_base
+    system_config_cache.invalidate()
 
     return {
         "message": "自动化测试平台配置更新成功",
@@ -539,6 +748,7 @@ def update_prompt_config(
     claim_test_case_prompt_config.config_value = config.claim_test_case_prompt
 
     db.commit()
+    system_config_cache.invalidate()
 
     return {
         "message": "Prompt 配置更新成功",
@@ -579,6 +789,9 @@ def create_config(
     
     # 更新 .env 文件
     update_env_file(config.config_key, config.config_value)
+
+    # 通用配置项可能覆盖 RAG 使用的模型/Embedding 配置
+    system_config_cache.invalidate()
     
     return db_config
 
@@ -604,6 +817,9 @@ def update_config(
     
     # 更新 .env 文件
     update_env_file(db_config.config_key, db_config.config_value)
+
+    # 通用配置项可能覆盖 RAG 使用的模型/Embedding 配置
+    system_config_cache.invalidate()
     
     return db_config
 
@@ -621,5 +837,8 @@ def delete_config(
     
     db.delete(db_config)
     db.commit()
+
+    # 通用配置项可能覆盖 RAG 使用的模型/Embedding 配置
+    system_config_cache.invalidate()
     
     return {"message": "配置删除成功"}
@@ -1,5 +1,7 @@
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 import asyncio
+import json
+import time
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
@@ -9,6 +11,7 @@ from datetime import datetime
 import openpyxl
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
+from app.core.config import settings
 from app.db.session import get_db, SessionLocal
 from app.api.deps import get_current_active_user
 from app.models.user import User
@@ -16,13 +19,16 @@ from app.models.test_case import TestCase
 from app.models.test_point import TestPoint
 from app.models.requirement import Requirement
 from app.models.scenario import Scenario
-from app.models.system_config import SystemConfig
 from app.schemas.test_case import TestCase as TestCaseSchema, TestCaseCreate, TestCaseUpdate, TestCaseApproval
 from app.schemas.common import PaginatedResponse
 from app.services.ai_service import get_ai_service
+from app.services.llm_gateway import PRIORITY_BACKGROUND, bind_llm_request_context
+from app.services.llm_telemetry import bind_llm_call_context
 from app.services.websocket_service import manager
-from app.services.document_parser import DocumentParser
+from app.services.test_case_context_service import build_test_case_context
+from app.services.sse import format_sse
 from app.services.automation_service import get_automation_service
+from app.services.system_config_cache import system_config_cache
 from app.services.workflow_task_cleanup import detach_workflow_tasks_from_test_cases
 
 router = APIRouter()
@@ -50,63 +56,75 @@ def generate_test_case_code(db: Session, test_point: TestPoint) -> str:
     return f"{test_point.code}-{count + 1}"
 
 
+def save_generated_test_cases(db: Session, test_point: TestPoint, test_cases_data: List[dict]) -> int:
+    """保存 AI 生成的测试用例并提交，返回保存数量"""
+    for tc_data in test_cases_data:
+        code = generate_test_case_code(db, test_point)
+
+        # 处理 preconditions: 如果是字典，转换为 JSON 字符串
+        preconditions = tc_data.get('preconditions', '')
+        if isinstance(preconditions, dict):
+            preconditions = json.dumps(preconditions, ensure_ascii=False)
+
+        test_case = TestCase(
+            test_point_id=test_point.id,
+            code=code,
+            title=tc_data.get('title', ''),
+            description=tc_data.get('description', ''),
+            preconditions=preconditions,
+            test_steps=tc_data.get('test_steps', []),
+            expected_result=tc_data.get('expected_result', ''),
+            priority=tc_data.get('priority', 'medium'),
+            test_type=tc_data.get('test_type', 'functional')
+        )
+        db.add(test_case)
+        db.flush()  # 确保编号被保存
+
+    db.commit()
+    return len(test_cases_data)
+
+
+def _test_point_data(test_point: TestPoint) -> dict:
+    return {
+        'title': test_point.title,
+        'description': test_point.description,
+        'category': test_point.category,
+        'priority': test_point.priority,
+        'business_line': test_point.business_line  # 添加业务线字段
+    }
+
+
 def generate_test_cases_background(
     test_point_id: int,
     user_id: int,
     loop: Optional[asyncio.AbstractEventLoop] = None
 ):
     """后台生成测试用例（在线程池运行）"""
+    bind_llm_request_context(PRIORITY_BACKGROUND, user_id)
+    bind_llm_call_context("generate_test_cases", test_point_id=test_point_id)
     db = SessionLocal()
     try:
         test_point = db.query(TestPoint).filter(TestPoint.id == test_point_id).first()
         if not test_point:
             return
+        bind_llm_call_context(requirement_id=test_point.requirement_id)
         
         requirement = db.query(Requirement).filter(Requirement.id == test_point.requirement_id).first()
         if not requirement:
             return
         
-        # 解析需求文档获取上下文
-        context = DocumentParser.parse(requirement.file_path, requirement.file_type.value)
-        
         # 准备测试点数据
-        test_point_data = {
-            'title': test_point.title,
-            'description': test_point.description,
-            'category': test_point.category,
-            'priority': test_point.priority,
-            'business_line': test_point.business_line  # 添加业务线字段
-        }
+        test_point_data = _test_point_data(test_point)
+
+        # 只检索与该测试点相关的需求片段作为上下文（受 token 预算限制）
+        context, _ = build_test_case_context(requirement, test_point_data)
 
         # 使用 AI 生成测试用例
         ai_svc = get_ai_service(db)
         test_cases_data = ai_svc.generate_test_cases(test_point_data, context)
         
         # 保存测试用例
-        for tc_data in test_cases_data:
-            code = generate_test_case_code(db, test_point)
-
-            # 处理 preconditions: 如果是字典，转换为 JSON 字符串
-            preconditions = tc_data.get('preconditions', '')
-            if isinstance(preconditions, dict):
-                import json
-                preconditions = json.dumps(preconditions, ensure_ascii=False)
-
-            test_case = TestCase(
-                test_point_id=test_point_id,
-                code=code,
-                title=tc_data.get('title', ''),
-                description=tc_data.get('description', ''),
-                preconditions=preconditions,
-                test_steps=tc_data.get('test_steps', []),
-                expected_result=tc_data.get('expected_result', ''),
-                priority=tc_data.get('priority', 'medium'),
-                test_type=tc_data.get('test_type', 'functional')
-            )
-            db.add(test_case)
-            db.flush()  # 确保编号被保存
-
-        db.commit()
+        save_generated_test_cases(db, test_point, test_cases_data)
         
         # 发送通知
         _run_async_notification(
@@ -247,6 +265,166 @@ async def generate_test_cases(
     return {"message": "Generating test cases..."}
 
 
+def _prepare_test_case_generation(test_point_id: int):
+    """读取测试点、检索需求上下文并构建 Prompt（在线程池运行，使用独立会话）"""
+    db = SessionLocal()
+    try:
+        test_point = db.query(TestPoint).filter(TestPoint.id == test_point_id).first()
+        if not test_point:
+            raise ValueError("测试点不存在")
+        requirement = db.query(Requirement).filter(Requirement.id == test_point.requirement_id).first()
+        if not requirement:
+            raise ValueError("需求不存在")
+        test_point_data = _test_point_data(test_point)
+        context, _ = build_test_case_context(requirement, test_point_data)
+        ai_svc = get_ai_service(db)
+        return ai_svc, ai_svc.build_test_case_messages(test_point_data, context), test_point_data
+    finally:
+        db.close()
+
+
+def _persist_generated_test_cases(test_point_id: int, test_cases_data: List[dict]) -> int:
+    """保存单个测试点的生成结果（在线程池运行，使用独立会话）"""
+    db = SessionLocal()
+    try:
+        test_point = db.query(TestPoint).filter(TestPoint.id == test_point_id).first()
+        if not test_point:
+            raise ValueError("测试点不存在")
+        return save_generated_test_cases(db, test_point, test_cases_data)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def _generate_for_test_point(test_point_id: int, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """生成并保存单个测试点的测试用例，返回完成事件"""
+    # 每个测试点在独立任务中运行，上下文互不影响
+    bind_llm_call_context(test_point_id=test_point_id)
+    async with semaphore:
+        start_time = time.time()
+        try:
+            ai_svc, messages, test_point_data = await asyncio.to_thread(_prepare_test_case_generation, test_point_id)
+            test_cases_data = await ai_svc.agenerate_test_cases(messages, test_point_data)
+            count = await asyncio.to_thread(_persist_generated_test_cases, test_point_id, test_cases_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[ERROR] 测试点 {test_point_id} 生成测试用例失败: {e}")
+            return {"type": "test_point_failed", "test_point_id": test_point_id, "error": str(e)}
+        return {
+            "type": "test_point_completed",
+            "test_point_id": test_point_id,
+            "test_case_count": count,
+            "elapsed": round(time.time() - start_time, 2),
+        }
+
+
+async def generate_requirement_test_cases_events(
+    test_point_ids: List[int],
+    user_id: Optional[int] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    并发生成需求下所有测试点的测试用例
+
+    通过 ainvoke 并发调用 LLM（并发数由 TEST_CASE_GENERATION_CONCURRENCY 限制），
+    每个测试点完成即保存并产出事件；调用方取消时未完成的调用一并取消，已保存的结果保留。
+
+    Args:
+        test_point_ids: 测试点ID列表
+        user_id: 发起用户，用于 LLM 网关按用户公平排队
+
+    Yields:
+        start / test_point_completed / test_point_failed / done 事件
+    """
+    # 生成器在响应任务的上下文中运行，子任务创建时复制该上下文
+    bind_llm_request_context(PRIORITY_BACKGROUND, user_id)
+    bind_llm_call_context("generate_test_cases")
+    semaphore = asyncio.Semaphore(max(settings.TEST_CASE_GENERATION_CONCURRENCY, 1))
+    start_time = time.time()
+    yield {"type": "start", "total": len(test_point_ids)}
+
+    tasks = [asyncio.create_task(_generate_for_test_point(tp_id, semaphore)) for tp_id in test_point_ids]
+    completed, failed, total_cases = 0, 0, 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            event = await next_done
+            if event["type"] == "test_point_completed":
+                completed += 1
+                total_cases += event["test_case_count"]
+            else:
+                failed += 1
+            event["finished"] = completed + failed
+            event["total"] = len(test_point_ids)
+            yield event
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    elapsed = round(time.time() - start_time, 2)
+    print(f"[INFO] 批量生成测试用例完成: 成功 {completed}, 失败 {failed}, 用例 {total_cases} 个, 耗时 {elapsed} 秒")
+    yield {
+        "type": "done",
+        "completed": completed,
+        "failed": failed,
+        "test_case_count": total_cases,
+        "elapsed": elapsed,
+    }
+
+
+@router.post("/generate/requirement/{requirement_id}")
+async def generate_requirement_test_cases(
+    requirement_id: int,
+    only_missing: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    为需求下的所有测试点并发生成测试用例（SSE 推送每个测试点的完成事件）
+
+    Args:
+        only_missing: 只为尚无测试用例的测试点生成
+    """
+    def load_test_point_ids() -> Optional[List[int]]:
+        try:
+            requirement = db.query(Requirement).filter(
+                Requirement.id == requirement_id,
+                Requirement.user_id == current_user.id
+            ).first()
+            if not requirement:
+                return None
+            query = db.query(TestPoint.id).filter(TestPoint.requirement_id == requirement_id)
+            if only_missing:
+                query = query.filter(~TestPoint.test_cases.any())
+            return [tp_id for (tp_id,) in query.order_by(TestPoint.id).all()]
+        finally:
+            # 流式响应开始前依赖项已完成清理，在此主动释放连接
+            db.close()
+
+    test_point_ids = await asyncio.to_thread(load_test_point_ids)
+    if test_point_ids is None:
+        raise HTTPException(status_code=404, detail="Requirement not found")
+
+    async def event_stream():
+        bind_llm_call_context(requirement_id=requirement_id)
+        try:
+            async for event in generate_requirement_test_cases_events(test_point_ids, current_user.id):
+                yield format_sse(event)
+        except asyncio.CancelledError:
+            print(f"[INFO] 客户端已断开，停止需求 {requirement_id} 的批量生成")
+            raise
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.put("/{test_case_id}", response_model=TestCaseSchema)
 def update_test_case(
     test_case_id: int,
@@ -637,12 +815,9 @@ def generate_automation_case(
     # 如果没有传module_id，从系统配置读取
     if not module_id:
         print(f"[INFO] module_id未传入，尝试从系统配置读取...")
-        module_id_config = db.query(SystemConfig).filter(
-            SystemConfig.config_key == "AUTOMATION_PLATFORM_MODULE_ID"
-        ).first()
+        module_id = system_config_cache.get("AUTOMATION_PLATFORM_MODULE_ID")
 
-        if module_id_config and module_id_config.config_value:
-            module_id = module_id_config.config_value
+        if module_id:
             print(f"[INFO] ✅ 从系统配置读取到 module_id: {module_id}")
         else:
             print(f"[ERROR] ❌ 系统配置中未找到 AUTOMATION_PLATFORM_MODULE_ID")
@@ -24,6 +24,8 @@ from app.schemas.test_point import (
 )
 from app.schemas.common import PaginatedResponse
 from app.services.ai_service import get_ai_service
+from app.services.llm_gateway import PRIORITY_BACKGROUND, bind_llm_request_context
+from app.services.llm_telemetry import bind_llm_call_context
 from app.services.websocket_service import manager
 from app.services.document_parser import DocumentParser
 from app.services.document_embedding_service import document_embedding_service
@@ -180,6 +182,8 @@ def regenerate_test_points_background(
     loop: Optional[asyncio.AbstractEventLoop] = None
 ):
     """重新生成测试点后台任务"""
+    bind_llm_request_context(PRIORITY_BACKGROUND, user_id)
+    bind_llm_call_context("regenerate_test_points", requirement_id=requirement_id)
     db = SessionLocal()
     try:
         requirement = db.query(Requirement).filter(Requirement.id == requirement_id).first()
@@ -213,10 +217,11 @@ def regenerate_test_points_background(
             print("[WARNING] 向量检索失败，使用原始文本作为上下文")
 
         ai_svc = get_ai_service(db)
+        # 用户主动重新生成，需要新的结果，不走 LLM 响应缓存
         test_points_data = ai_svc.extract_test_points(
             ai_context,
             user_feedback,
-            allow_fallback=False,
+            use_cache=False,
         )
 
         if not test_points_data:
@@ -397,6 +402,8 @@ def optimize_test_points_background(
     user_id: int,
     loop: Optional[asyncio.AbstractEventLoop] = None,
 ) -> None:
+    bind_llm_request_context(PRIORITY_BACKGROUND, user_id)
+    bind_llm_call_context("optimize_test_points", requirement_id=payload.requirement_id)
     db = SessionLocal()
     try:
         requirement = (
@@ -442,7 +449,7 @@ def optimize_test_points_background(
                 batch_candidates = ai_svc.extract_test_points(
                     prompt_text,
                     user_feedback=payload.batch_prompt or payload.business_info or "",
-                    allow_fallback=True,
+                    use_cache=False,
                 )
             except Exception as ai_error:
                 print(f"[ERROR] 批量优化失败: {ai_error}")
@@ -465,7 +472,7 @@ def optimize_test_points_background(
                     results = ai_svc.extract_test_points(
                         prompt_text,
                         user_feedback=per_prompt or payload.batch_prompt or "",
-                        allow_fallback=True,
+                        use_cache=False,
                     )
                 except Exception as ai_error:
                     print(f"[ERROR] 单点优化失败: {ai_error}")
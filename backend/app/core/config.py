@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List
 from pathlib import Path
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -37,18 +37,97 @@ class Settings(BaseSettings):
     DOCUMENT_CHUNK_OVERLAP: int = 100
     EMBEDDING_BATCH_SIZE: int = 16
 
+    # Knowledge-base query cache
+    RAG_EMBEDDING_CACHE_SIZE: int = 1024  # 问题向量缓存条数
+    RAG_RETRIEVAL_CACHE_SIZE: int = 512  # 检索结果缓存条数
+    RAG_RETRIEVAL_CACHE_TTL: int = 600  # 检索结果缓存有效期(秒)，0 表示仅按集合变更失效
+
+    # Semantic answer cache (opt-in)
+    RAG_ANSWER_CACHE_ENABLED: bool = False
+    RAG_ANSWER_CACHE_MAX_DISTANCE: float = 0.08  # 余弦距离阈值
+    RAG_ANSWER_CACHE_MIN_RATING: int = 4  # 评分达到该值或标记有帮助的历史答案才会被复用
+    RAG_ANSWER_CACHE_CANDIDATES: int = 200  # 每个集合参与比较的最近历史问答数
+    RAG_ANSWER_CACHE_EMBEDDING_SIZE: int = 2000  # 历史问题向量缓存条数
+
+    # Hybrid (lexical + vector) retrieval
+    RAG_HYBRID_ENABLED: bool = True
+    RAG_HYBRID_CANDIDATES: int = 20  # 向量与词法检索各自召回的候选数上限
+    RAG_RRF_K: int = 60  # 倒数排名融合平滑常数
+    RAG_LEXICAL_BACKFILL_BATCH_SIZE: int = 50  # 为已有文档建立词法索引时每批处理的文档数
+
+    # Multi-turn chat history compaction
+    RAG_HISTORY_KEEP_TURNS: int = 3  # 原样保留的最近对话轮数
+    RAG_HISTORY_TOKEN_BUDGET: int = 2000  # 对话历史默认 token 预算
+    RAG_HISTORY_MODEL_BUDGETS: str = ""  # 按模型覆盖预算，如 "gpt-4o:6000,deepseek-chat:4000"
+    RAG_HISTORY_SUMMARY_MAX_CHARS: int = 300
+    RAG_HISTORY_SUMMARY_CACHE_SIZE: int = 512
+
+    # Conversation sessions
+    RAG_SESSION_CACHE_SIZE: int = 256  # 内存中缓存的热点会话数
+    RAG_SESSION_CACHE_TTL: int = 1800  # 热点会话缓存有效期(秒)
+
+    # Streaming
+    RAG_STREAM_FLUSH_INTERVAL_MS: int = 30  # token 合并时间窗口(毫秒)
+    RAG_STREAM_FLUSH_CHARS: int = 256  # 单帧 token 最大字符数
+
+    # Knowledge-base vector purge
+    RAG_VECTOR_PURGE_BATCH_SIZE: int = 100  # 每批清理的文档数
+
+    # Knowledge-base bulk ingestion
+    KB_INGEST_WORKERS: int = 4  # 并行解析与向量化的文档数
+
+    # Embedding model re-index
+    VECTOR_REINDEX_BATCH_SIZE: int = 20  # 每批回填的文档/需求数（每批提交一次检查点）
+    VECTOR_REINDEX_CHUNKS_PER_SECOND: float = 20.0  # 回填限速(文本块/秒)，0 表示不限速
+
     # Requirement processing
     TEST_POINT_MAX_INPUT_CHARS: int = 120000  # ≈120KB
     TEST_POINT_CONTEXT_CHUNKS: int = 24
     MIN_REQUIREMENT_CHARACTERS: int = 200
     MIN_NON_EMPTY_LINE_RATIO: float = 0.05
+    TEST_POINT_STREAMING: bool = True  # 上传需求时流式提取测试点，逐个保存并推送
+
+    # Test case generation context
+    TEST_CASE_CONTEXT_TOP_K: int = 6  # 按测试点检索的需求文本块数
+    TEST_CASE_CONTEXT_TOKEN_BUDGET: int = 3000  # 需求上下文 token 上限
+    TEST_CASE_GENERATION_CONCURRENCY: int = 8  # 批量生成及工作流分支并发的 LLM 调用数
 
     # LLM retry
-    AI_MAX_RETRIES: int = 3
-    AI_RETRY_INTERVAL: float = 2.0
+    AI_MAX_RETRIES: int = 3  # 单次调用最多尝试次数（含首次）
+    AI_RETRY_INTERVAL: float = 2.0  # 指数退避的初始等待(秒)，之后每次翻倍并加随机抖动
+    AI_RETRY_MAX_INTERVAL: float = 30.0  # 单次退避等待上限(秒)，服务端 Retry-After 不受此限制
+    AI_RETRY_DEADLINE_SECONDS: float = 600.0  # 单次调用含重试的总耗时预算(秒)，0 表示不限
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True  # 相同的并发 LLM / 问题向量请求合并为一次调用
     AI_REQUEST_TIMEOUT: int = 180  # API 请求超时时间(秒)
     AI_TEMPERATURE: float = 1.0  # AI 温度参数默认值
 
+    # LLM gateway（按 provider 限流、限并发，interactive 优先于 background）
+    LLM_GATEWAY_ENABLED: bool = True
+    LLM_GATEWAY_MAX_CONCURRENCY: int = 16  # 每个 provider 同时进行的请求数，0 表示不限
+    LLM_GATEWAY_REQUESTS_PER_MINUTE: int = 0  # 每个 provider 每分钟请求数，0 表示不限
+    LLM_GATEWAY_TOKENS_PER_MINUTE: int = 0  # 每个 provider 每分钟 token 数(预估输入 + 输出上限)，0 表示不限
+    LLM_GATEWAY_PROVIDER_LIMITS: str = ""  # 按 provider 覆盖，如 {"deepseek": {"rpm": 500, "tpm": 200000, "concurrency": 8}}
+    LLM_GATEWAY_MAX_WAIT_SECONDS: float = 120.0  # 排队超时(秒)，0 表示不限
+    LLM_GATEWAY_COMPLETION_TOKENS: int = 1000  # 未设置 max_tokens 时预估的输出 token 数
+
+    # LLM endpoint pool（相同 pool_name 的模型配置之间负载均衡与故障转移）
+    LLM_ROUTING_MODE: str = "single"  # single / weighted(加权轮询) / least_latency(最低延迟)
+    LLM_ENDPOINT_FAILURE_THRESHOLD: int = 3  # 连续失败次数达到阈值后摘除端点
+    LLM_ENDPOINT_COOLDOWN_SECONDS: float = 30.0  # 摘除后再次探测的间隔(秒)
+
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = False  # 相同模型、参数与消息的调用复用已持久化的响应
+    LLM_CACHE_TTL_SECONDS: int = 604800  # 缓存有效期(秒)，0 表示不过期
+    LLM_CACHE_MAX_ENTRIES: int = 10000  # 最大条目数，超出时淘汰最久未命中的条目
+
+    # LLM telemetry（每次调用的调用方、用量、耗时写入 llm_calls 表）
+    LLM_TELEMETRY_ENABLED: bool = True
+    LLM_TELEMETRY_FLUSH_SECONDS: float = 2.0  # 后台批量写入间隔(秒)
+    LLM_TELEMETRY_MAX_PENDING: int = 10000  # 待写记录上限，数据库不可用时丢弃最早的记录
+
+    # System config cache（system_configs 表常驻内存，按版本号刷新）
+    SYSTEM_CONFIG_VERSION_CHECK_SECONDS: float = 5.0  # 检查共享版本号的间隔(秒)，0 表示每次读取都检查
+
     # JWT
     SECRET_KEY: str = "your-secret-key-change-this-in-production"
     ALGORITHM: str = "HS256"
@@ -75,5 +154,15 @@ class Settings(BaseSettings):
         """将 CORS_ORIGINS 字符串转换为列表"""
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
 
+    @property
+    def rag_history_model_budgets(self) -> Dict[str, int]:
+        """将 RAG_HISTORY_MODEL_BUDGETS 字符串转换为 {模型名: 预算}"""
+        budgets = {}
+        for item in self.RAG_HISTORY_MODEL_BUDGETS.split(","):
+            model_name, _, budget = item.strip().rpartition(":")
+            if model_name and budget.strip().isdigit():
+                budgets[model_name.strip()] = int(budget)
+        return budgets
+
 
 settings = Settings()
@@ -10,21 +10,35 @@ def import_models():
     from app.models.requirement import Requirement
     from app.models.test_point import TestPoint
     from app.models.test_case import TestCase
-    from app.models.system_config import SystemConfig
-    from app.models.knowledge_base import KnowledgeDocument, QARecord
+    from app.models.system_config import SystemConfig, SystemConfigVersion
+    from app.models.knowledge_base import KnowledgeDocument, KnowledgeIngestJob, QARecord, ConversationSession, ConversationMessage
     from app.models.model_config import ModelConfig
     from app.models.test_point_history import TestPointHistory
     from app.models.scenario import Scenario
+    from app.models.vector_reindex_job import VectorReindexJob, VectorReindexShadowFailure
+    from app.models.llm_response_cache import LLMResponseCache
+    from app.models.llm_call import LLMCall
+    from app.models.lexical_index import LexicalChunk, LexicalPosting
     return (
         User,
         Requirement,
         TestPoint,
         TestCase,
         SystemConfig,
+        SystemConfigVersion,
         KnowledgeDocument,
+        KnowledgeIngestJob,
         QARecord,
+        ConversationSession,
+        ConversationMessage,
         ModelConfig,
         TestPointHistory,
         Scenario,
+        VectorReindexJob,
+        VectorReindexShadowFailure,
+        LLMResponseCache,
+        LLMCall,
+        LexicalChunk,
+        LexicalPosting,
     )
 
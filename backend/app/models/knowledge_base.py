@@ -27,6 +27,9 @@ class KnowledgeDocument(Base):
     collection_name = Column(String(200), default="knowledge_base", comment="Milvus 集合名称")
     chunk_count = Column(Integer, default=0, comment="文本块数量")
     is_vectorized = Column(Boolean, default=False, comment="是否已向量化")
+    vector_ids = Column(Text, comment="Milvus 向量主键列表(JSON)")
+    ingest_job_id = Column(String(32), index=True, comment="最近一次批量导入任务ID")
+    ingest_error = Column(Text, comment="最近一次解析/向量化失败的原因，成功后清空")
     
     # 状态
     status = Column(String(50), default="active", comment="状态: active/archived/deleted")
@@ -43,6 +46,21 @@ class KnowledgeDocument(Base):
     qa_records = relationship("QARecord", back_populates="document", cascade="all, delete-orphan")
 
 
+class KnowledgeIngestJob(Base):
+    """知识库批量导入任务表（各文档的进度记录在 knowledge_documents.ingest_job_id 关联的文档上）"""
+    __tablename__ = "knowledge_ingest_jobs"
+
+    id = Column(String(32), primary_key=True, comment="任务ID (UUID hex)")
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="提交者ID")
+    status = Column(String(20), nullable=False, default="pending", comment="状态: pending/processing/completed/partial/failed")
+    total = Column(Integer, nullable=False, default=0, comment="文档总数")
+    completed = Column(Integer, nullable=False, default=0, comment="成功文档数")
+    failed = Column(Integer, nullable=False, default=0, comment="失败文档数")
+    total_chunks = Column(Integer, nullable=False, default=0, comment="文本块总数")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    finished_at = Column(DateTime(timezone=True), comment="结束时间")
+
+
 class QARecord(Base):
     """问答记录表"""
     __tablename__ = "qa_records"
@@ -74,3 +92,43 @@ class QARecord(Base):
     document = relationship("KnowledgeDocument", back_populates="qa_records")
     creator = relationship("User", back_populates="qa_records")
 
+
+
+class ConversationSession(Base):
+    """知识库多轮对话会话表"""
+    __tablename__ = "conversation_sessions"
+
+    id = Column(String(36), primary_key=True, comment="会话ID (UUID)")
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="所属用户ID")
+    collection_name = Column(String(200), default="knowledge_base", comment="使用的集合名称")
+    title = Column(String(500), comment="会话标题(首个问题)")
+    message_count = Column(Integer, default=0, comment="消息数量")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="最后活跃时间")
+
+    # 关系
+    messages = relationship(
+        "ConversationMessage",
+        back_populates="session",
+        cascade="all, delete-orphan",
+        order_by="ConversationMessage.id",
+    )
+
+
+class ConversationMessage(Base):
+    """对话消息表（只追加）"""
+    __tablename__ = "conversation_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String(36), ForeignKey("conversation_sessions.id", ondelete="CASCADE"), nullable=False, index=True, comment="会话ID")
+    role = Column(String(20), nullable=False, comment="角色: user/assistant")
+    content = Column(Text, nullable=False, comment="消息内容")
+    qa_record_id = Column(Integer, ForeignKey("qa_records.id", ondelete="SET NULL"), nullable=True, comment="关联问答记录ID")
+
+    # 时间戳
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+
+    # 关系
+    session = relationship("ConversationSession", back_populates="messages")
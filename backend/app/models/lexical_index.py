@@ -0,0 +1,32 @@
+"""知识库词法索引模型 - BM25 倒排索引的文本块与倒排项，所有 worker 共享读写"""
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class LexicalChunk(Base):
+    """词法索引文本块表"""
+    __tablename__ = "lexical_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    collection_name = Column(String(200), nullable=False, index=True, comment="逻辑集合名称")
+    document_id = Column(Integer, index=True, comment="知识库文档ID（不建外键，随向量一同删除）")
+    chunk_index = Column(Integer, comment="文本块序号")
+    text = Column(Text, nullable=False, comment="文本块内容")
+    metadata_json = Column(Text, comment="文本块元数据(JSON)")
+    length = Column(Integer, nullable=False, default=0, comment="词项数（BM25 长度归一化）")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+
+
+class LexicalPosting(Base):
+    """词法索引倒排项表：(集合, 词项) -> 文本块及词频"""
+    __tablename__ = "lexical_postings"
+    __table_args__ = (
+        Index("idx_lexical_postings_collection_term", "collection_name", "term"),
+    )
+
+    chunk_id = Column(Integer, ForeignKey("lexical_chunks.id", ondelete="CASCADE"), primary_key=True, comment="文本块ID")
+    term = Column(String(200), primary_key=True, comment="词项")
+    collection_name = Column(String(200), nullable=False, comment="逻辑集合名称")
+    tf = Column(Integer, nullable=False, comment="词频")
@@ -0,0 +1,30 @@
+"""LLM 调用记录模型 - 每次 Chat / Agent / Embedding 调用的调用方、用量、耗时与结果"""
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, String, Text
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class LLMCall(Base):
+    """LLM 调用记录表（遥测数据，不与业务表建立外键，业务数据删除后记录仍可用于统计）"""
+    __tablename__ = "llm_calls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    feature = Column(String(100), index=True, comment="调用功能，如 extract_test_points")
+    requirement_id = Column(Integer, index=True, comment="关联需求ID")
+    test_point_id = Column(Integer, index=True, comment="关联测试点ID")
+    thread_id = Column(String(100), index=True, comment="工作流线程ID")
+    call_type = Column(String(20), nullable=False, default="chat", comment="调用类型: chat / embedding")
+    provider = Column(String(100), comment="模型提供方")
+    model_name = Column(String(200), index=True, comment="模型名称")
+    prompt_tokens = Column(Integer, comment="输入 token 数")
+    cached_prompt_tokens = Column(Integer, comment="命中 provider 前缀缓存的输入 token 数")
+    completion_tokens = Column(Integer, comment="输出 token 数")
+    tokens_estimated = Column(Boolean, default=False, comment="provider 未返回用量，token 数为估算值")
+    latency_ms = Column(Float, comment="耗时(毫秒)")
+    attempt = Column(Integer, default=1, comment="第几次尝试，大于 1 表示重试")
+    cache_hit = Column(Boolean, default=False, comment="是否命中响应缓存 / 向量缓存（未调用模型）")
+    success = Column(Boolean, default=True, comment="是否成功")
+    error_type = Column(String(200), comment="错误类型")
+    error_message = Column(Text, comment="错误信息（截断）")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True, comment="调用时间")
@@ -0,0 +1,20 @@
+"""LLM 响应缓存模型 - 按 (provider, 模型, 参数, 消息哈希) 持久化 LLM 输出"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class LLMResponseCache(Base):
+    """LLM 响应缓存表"""
+    __tablename__ = "llm_response_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), nullable=False, unique=True, index=True, comment="缓存键(SHA-256)")
+    provider = Column(String(100), comment="模型提供方")
+    model_name = Column(String(200), index=True, comment="模型名称")
+    content = Column(Text, nullable=False, comment="LLM 响应内容")
+    hit_count = Column(Integer, default=0, comment="命中次数")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    last_hit_at = Column(DateTime(timezone=True), index=True, comment="最近命中时间")
+    expires_at = Column(DateTime(timezone=True), index=True, comment="过期时间")
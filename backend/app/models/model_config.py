@@ -26,6 +26,10 @@ class ModelConfig(Base):
     provider = Column(String(50), comment="提供商: openai/modelscope/azure/custom")
     model_type = Column(String(50), default="chat", comment="模型类型: chat/completion")
 
+    # 负载均衡：相同 pool_name 的配置视为等价端点，按权重或延迟分摊请求
+    pool_name = Column(String(100), index=True, comment="端点池名称")
+    weight = Column(Integer, default=1, comment="加权轮询权重")
+
     # 状态
     is_active = Column(Boolean, default=True, comment="是否启用")
     is_default = Column(Boolean, default=False, comment="是否为默认模型")
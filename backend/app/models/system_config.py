@@ -13,3 +13,12 @@ class SystemConfig(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+
+
+class SystemConfigVersion(Base):
+    """系统配置版本号（单行），配置写入时递增，各 worker 据此判断内存快照是否过期"""
+    __tablename__ = "system_config_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
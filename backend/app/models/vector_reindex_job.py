@@ -0,0 +1,47 @@
+"""向量重建任务模型 - 记录 Embedding 模型切换后的影子集合回填进度"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, Float, ForeignKey
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+
+class VectorReindexJob(Base):
+    """向量重建任务表"""
+    __tablename__ = "vector_reindex_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    collection_name = Column(String(200), nullable=False, index=True, comment="逻辑集合名称")
+    source_collection = Column(String(200), nullable=False, comment="当前读取的物理集合")
+    source_model = Column(String(200), comment="当前集合使用的 Embedding 模型")
+    target_collection = Column(String(200), nullable=False, comment="影子集合")
+    target_model = Column(String(200), nullable=False, comment="新 Embedding 模型")
+
+    # pending/running/paused/completed/failed/cancelled
+    status = Column(String(50), default="pending", index=True, comment="任务状态")
+
+    # 进度与检查点：按源记录 ID 递增回填，checkpoint_id 之前的记录均已写入影子集合
+    total_items = Column(Integer, default=0, comment="待回填记录数")
+    processed_items = Column(Integer, default=0, comment="已回填记录数")
+    processed_chunks = Column(Integer, default=0, comment="已写入文本块数")
+    checkpoint_id = Column(Integer, default=0, comment="已回填的最大源记录ID")
+    max_item_id = Column(Integer, default=0, comment="回填上界，之后新增的记录由双写覆盖")
+
+    # 本次运行的起点，用于计算吞吐与剩余时间（恢复运行时重置）
+    run_started_at = Column(DateTime(timezone=True), comment="本次运行开始时间")
+    run_start_items = Column(Integer, default=0, comment="本次运行开始时已回填记录数")
+    items_per_second = Column(Float, default=0, comment="最近吞吐(记录/秒)")
+
+    error_message = Column(Text, comment="错误信息")
+    created_by = Column(Integer, ForeignKey("users.id"), comment="创建者ID")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), comment="更新时间")
+    finished_at = Column(DateTime(timezone=True), comment="完成时间")
+
+
+class VectorReindexShadowFailure(Base):
+    """双写影子集合失败的源记录（任意 worker 写入，重建任务切换前补写）"""
+    __tablename__ = "vector_reindex_shadow_failures"
+
+    job_id = Column(Integer, ForeignKey("vector_reindex_jobs.id", ondelete="CASCADE"), primary_key=True, comment="重建任务ID")
+    item_id = Column(Integer, primary_key=True, comment="源记录ID（文档ID或需求ID）")
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="记录时间")
@@ -44,6 +44,7 @@ class KnowledgeDocumentInDB(KnowledgeDocumentBase):
     chunk_count: int
     is_vectorized: bool
     status: str
+    ingest_error: Optional[str] = None
     created_by: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -138,6 +139,37 @@ class DocumentUploadResponse(BaseModel):
     error: Optional[str] = None
 
 
+class BulkUploadResponse(BaseModel):
+    """批量上传响应"""
+    success: bool
+    job_id: Optional[str] = None
+    document_ids: List[int] = []
+    skipped_files: List[str] = []
+    message: Optional[str] = None
+
+
+class IngestJobDocument(BaseModel):
+    """导入任务中的单个文档"""
+    document_id: int
+    title: str
+    status: str  # pending/completed/failed
+    chunk_count: int = 0
+    error: Optional[str] = None
+
+
+class IngestJobResponse(BaseModel):
+    """批量导入任务状态"""
+    job_id: str
+    status: str  # pending/processing/completed/partial/failed
+    total: int
+    completed: int
+    failed: int
+    total_chunks: int
+    documents: List[IngestJobDocument]
+    created_at: str
+    finished_at: Optional[str] = None
+
+
 class ChatMessage(BaseModel):
     """对话消息"""
     role: str  # "user" 或 "assistant"
@@ -151,6 +183,7 @@ class QuestionRequest(BaseModel):
     top_k: int = 5
     return_source: bool = True
     chat_history: Optional[List[ChatMessage]] = None  # 对话历史
+    session_id: Optional[str] = None  # 服务端会话ID，传入时忽略 chat_history
 
 
 class QuestionResponse(BaseModel):
@@ -160,6 +193,8 @@ class QuestionResponse(BaseModel):
     answer: Optional[str] = None
     sources: Optional[List[Dict[str, Any]]] = None
     qa_record_id: Optional[int] = None
+    cached: bool = False  # 是否命中语义答案缓存
+    history_tokens_saved: int = 0  # 对话历史压缩节省的 token 数（估算）
     error: Optional[str] = None
 
 
@@ -206,3 +241,43 @@ class CollectionListResponse(BaseModel):
     collections: List[CollectionInfo]
     error: Optional[str] = None
 
+
+class QueryCacheStatsResponse(BaseModel):
+    """问答查询缓存统计响应"""
+    success: bool
+    instances: int = 0  # 当前缓存的 RAGService 实例数
+    embedding: Dict[str, Any]
+    retrieval: Dict[str, Any]
+    answer: Dict[str, Any] = {}
+    history: Dict[str, Any] = {}
+
+
+# ============ 对话会话 Schema ============
+
+class ConversationSessionCreate(BaseModel):
+    """创建对话会话"""
+    collection_name: str = "knowledge_base"
+    title: Optional[str] = None
+
+
+class ConversationSessionSchema(BaseModel):
+    """对话会话"""
+    id: str
+    collection_name: Optional[str] = None
+    title: Optional[str] = None
+    message_count: int = 0
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class ConversationSessionDetail(ConversationSessionSchema):
+    """对话会话详情（含消息）"""
+    messages: List[ChatMessage] = []
+
+
+class ConversationSessionList(BaseModel):
+    """对话会话列表"""
+    items: List[ConversationSessionSchema]
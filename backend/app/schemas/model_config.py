@@ -17,6 +17,8 @@ class ModelConfigBase(BaseModel):
     max_tokens: Optional[int] = Field(None, description="最大 token 数")
     provider: Optional[str] = Field(None, description="提供商: openai/modelscope/azure/custom")
     model_type: Optional[str] = Field("chat", description="模型类型: chat/completion")
+    pool_name: Optional[str] = Field(None, description="端点池名称(相同池内的配置互为负载均衡与故障转移端点)")
+    weight: Optional[int] = Field(1, ge=1, description="加权轮询权重")
     is_active: Optional[bool] = Field(True, description="是否启用")
 
     @field_validator('model_name')
@@ -50,6 +52,8 @@ class ModelConfigUpdate(BaseModel):
     max_tokens: Optional[int] = None
     provider: Optional[str] = None
     model_type: Optional[str] = None
+    pool_name: Optional[str] = None
+    weight: Optional[int] = Field(None, ge=1)
     is_active: Optional[bool] = None
 
     @field_validator('model_name')
@@ -80,6 +84,8 @@ class ModelConfigInDB(BaseModel):
     max_tokens: Optional[int] = None
     provider: Optional[str] = None
     model_type: Optional[str] = None
+    pool_name: Optional[str] = None
+    weight: Optional[int] = None
     is_active: bool
     is_default: bool
     created_at: datetime
@@ -119,6 +125,8 @@ class ModelConfig(ModelConfigInDB):
             "max_tokens": db_model.max_tokens,
             "provider": db_model.provider,
             "model_type": db_model.model_type,
+            "pool_name": db_model.pool_name,
+            "weight": db_model.weight,
             "is_active": db_model.is_active,
             "is_default": db_model.is_default,
             "created_at": db_model.created_at,
@@ -149,6 +157,8 @@ class ModelConfigResponse(BaseModel):
     max_tokens: Optional[int] = None
     provider: Optional[str] = None
     model_type: Optional[str] = None
+    pool_name: Optional[str] = None
+    weight: Optional[int] = None
     is_active: bool
     is_default: bool
     created_at: datetime
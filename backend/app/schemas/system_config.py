@@ -54,6 +54,44 @@ class EmbeddingConfigUpdate(BaseModel):
     embedding_api_base: str
 
 
+class EmbeddingReindexCreate(BaseModel):
+    """创建向量重建任务"""
+    collection_name: str = "knowledge_base"
+
+
+class VectorReindexJobSchema(BaseModel):
+    """向量重建任务进度"""
+    id: int
+    collection_name: str
+    source_collection: str
+    source_model: Optional[str] = None
+    target_collection: str
+    target_model: str
+    status: str
+    total_items: int
+    processed_items: int
+    processed_chunks: int
+    checkpoint_id: int
+    progress: int
+    items_per_second: float
+    eta_seconds: Optional[int] = None
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class LLMCacheStats(BaseModel):
+    """LLM 响应缓存统计"""
+    enabled: bool
+    entries: Optional[int] = None
+    hits: int
+    misses: int
+    hit_ratio: float
+    writes: int
+    evictions: int
+    errors: int
+
+
 class AutomationPlatformConfigUpdate(BaseModel):
     """自动化测试平台配置"""
     api_base: str
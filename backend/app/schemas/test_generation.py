@@ -0,0 +1,79 @@
+"""Agent 结构化输出模型 - 测试点与测试用例生成"""
+
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+
+
+_PRIORITY_ALIASES = {"高": "high", "中": "medium", "低": "low"}
+_BUSINESS_LINE_ALIASES = {"契约": "contract", "保全": "preservation", "理赔": "claim"}
+
+
+def _normalize_priority(value):
+    if isinstance(value, str):
+        value = value.strip()
+        return _PRIORITY_ALIASES.get(value, value.lower())
+    return value
+
+
+class TestPointDraft(BaseModel):
+    """单个测试点"""
+    title: str = Field(min_length=1, description="测试点标题")
+    description: str = Field(description="测试点详细描述")
+    category: str = Field(description="分类: 功能 / 边界 / 异常 / 业务规则")
+    priority: Literal["high", "medium", "low"] = Field(description="优先级: high / medium / low")
+    business_line: Optional[Literal["contract", "preservation", "claim"]] = Field(
+        default=None,
+        description="业务线: contract(契约) / preservation(保全) / claim(理赔), 根据需求内容判断"
+    )
+
+    @field_validator("priority", mode="before")
+    @classmethod
+    def normalize_priority(cls, value):
+        return _normalize_priority(value)
+
+    @field_validator("business_line", mode="before")
+    @classmethod
+    def normalize_business_line(cls, value):
+        # 兼容 "contract-契约"、"契约" 等写法
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                return None
+            for alias, business_line in _BUSINESS_LINE_ALIASES.items():
+                if alias in value:
+                    return business_line
+            return value.split("-")[0].strip().lower()
+        return value
+
+
+class TestPointDraftList(BaseModel):
+    """Agent 最终输出: 测试点列表"""
+    test_points: List[TestPointDraft] = Field(description="从需求文档中识别出的全部测试点")
+
+
+class TestStepDraft(BaseModel):
+    """单个测试步骤"""
+    step: int = Field(ge=1, description="步骤序号, 从 1 开始")
+    action: str = Field(min_length=1, description="操作")
+    expected: str = Field(description="该步骤的预期结果")
+
+
+class TestCaseDraft(BaseModel):
+    """单个测试用例"""
+    title: str = Field(min_length=1, description="用例标题")
+    description: str = Field(description="用例描述")
+    preconditions: str = Field(default="", description="前置条件")
+    test_steps: List[TestStepDraft] = Field(min_length=1, description="测试步骤")
+    expected_result: str = Field(description="预期结果")
+    priority: Literal["high", "medium", "low"] = Field(default="medium", description="优先级: high / medium / low")
+    test_type: str = Field(default="functional", description="测试类型, 如 functional / boundary / exception")
+
+    @field_validator("priority", mode="before")
+    @classmethod
+    def normalize_priority(cls, value):
+        return _normalize_priority(value)
+
+
+class TestCaseDraftList(BaseModel):
+    """Agent 最终输出: 测试用例列表"""
+    test_cases: List[TestCaseDraft] = Field(description="针对测试点生成的 2-3 个测试用例")
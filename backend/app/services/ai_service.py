@@ -1,18 +1,38 @@
+import asyncio
+import json
 import operator
 import time
-from typing import List, Dict, Any, TypedDict, Annotated, Optional
+from contextvars import ContextVar
+from typing import List, Dict, Any, TypedDict, Annotated, Iterator, Optional, Tuple
 
 from typing_extensions import TypedDict as ExtTypedDict
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from langchain.chat_models import init_chat_model
 from langchain_openai import OpenAIEmbeddings
-from langchain.agents.structured_output import ToolStrategy
+from langchain.agents.structured_output import StructuredOutputError, ToolStrategy
 from langchain.agents import create_agent
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END, START
+from langgraph.types import Send
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
+from app.schemas.test_generation import TestCaseDraft, TestCaseDraftList, TestPointDraft, TestPointDraftList
+from app.services.llm_gateway import LLMGatewayCallbackHandler
+from app.services.llm_router import ROUTING_LEAST_LATENCY, ROUTING_WEIGHTED, PooledChatModel, register_endpoints
+from app.services.llm_response_cache import llm_response_cache, make_cache_key
+from app.services.llm_retry import RetryBudget
+from app.services.llm_telemetry import (
+    CALL_TYPE_CHAT,
+    LLMTelemetryCallbackHandler,
+    attempt_config,
+    llm_feature,
+    record_cache_hit,
+)
+from app.services.single_flight import llm_single_flight
+from app.services.system_config_cache import system_config_cache
+from app.utils.json_stream import IncrementalJSONArrayParser
 from app.tools.date_tools import current_date_tool, current_datetime_tool, current_date_yyyymmdd_tool
 
 
@@ -22,9 +42,16 @@ class GraphState(ExtTypedDict):
     test_points: Annotated[List[Dict[str, Any]], operator.add]
     user_feedback: str
     test_cases: Annotated[List[Dict[str, Any]], operator.add]
+    failed_test_points: Annotated[List[Dict[str, Any]], operator.add]
     current_step: str
 
 
+class TestPointBranchState(ExtTypedDict):
+    """单个测试点分支的输入（由 Send 分发）"""
+    test_point: Dict[str, Any]
+    messages: List[Any]
+
+
 class AgentContext(BaseModel):
     """Agent 上下文，用于携带用户标识"""
     user_id: Optional[str] = "default"
@@ -36,9 +63,17 @@ class AgentResponseFormat(BaseModel):
     detail: Optional[str] = None
 
 
+# 当前调用上下文的数据库会话：AIService 实例按模型配置共享，只缓存 LLM 客户端与编译好的 Agent，
+# 会话随请求/线程上下文隔离，并发调用互不覆盖
+_request_db: ContextVar[Optional[Session]] = ContextVar("ai_service_request_db", default=None)
+
+
 class AIService:
     """AI 服务 - 使用 LangGraph 生成测试点和用例"""
 
+    # LLM 响应缓存与在途请求合并的指纹中的模型与参数部分（__init__ 中按模型配置设置）
+    llm_cache_scope: Dict[str, Any] = {}
+
     def __init__(self, db: Session = None, model_config_id: int = None):
         """
         初始化 AI 服务
@@ -52,21 +87,76 @@ class AIService:
         # 获取模型配置
         model_config = self._get_model_config(model_config_id)
 
-        # LangChain 1.0+ API: 使用 api_key 和 base_url 参数
+        temperature = self._parse_temperature(model_config)
+        provider = model_config.get("provider") or settings.PROVIDER
+        actual_provider = provider
+        if provider and provider.lower() == "modelscope":
+            actual_provider = "openai"
+        # 使用配置的超时时间
+        timeout = getattr(settings, 'AI_REQUEST_TIMEOUT', 180) or 180
+        # LLM 响应缓存键的模型与参数部分
+        self.llm_cache_scope = {
+            "provider": actual_provider or "",
+            "model": model_config["model_name"],
+            "temperature": temperature,
+            "max_tokens": model_config.get("max_tokens"),
+        }
+        print(f"[INFO] 初始化 AI 服务 - 模型: {model_config['model_name']}, 超时: {timeout}秒, 温度: {temperature}, 最大重试: {settings.AI_MAX_RETRIES}次")
+        self.llm = self._create_chat_model(model_config, timeout)
+
+        # 端点池：相同 pool_name 的配置之间负载均衡与故障转移
+        pool_configs = self._get_pool_configs(model_config)
+        if pool_configs:
+            register_endpoints([
+                (config["id"], config["name"] or config["model_name"], config["weight"]) for config in pool_configs
+            ])
+            self.llm = PooledChatModel(
+                endpoints=[
+                    (config["id"], self.llm if config["id"] == model_config["id"] else self._create_chat_model(config, timeout))
+                    for config in pool_configs
+                ],
+                routing_mode=settings.LLM_ROUTING_MODE,
+            )
+            print(f"[INFO] 模型端点池 {model_config['pool_name']}: {len(pool_configs)} 个端点, 路由模式: {settings.LLM_ROUTING_MODE}")
+        self.embeddings = OpenAIEmbeddings(
+            api_key=model_config["api_key"],
+            base_url=model_config["api_base"] if model_config["api_base"] else None
+        )
+        # 初始化基于结构化输出的 Agent
+        self.agent_executor = self._build_agent_executor()
+
+    @property
+    def db(self) -> Optional[Session]:
+        """当前调用上下文的数据库会话（保存在 ContextVar 中，不保存在共享实例上）"""
+        return _request_db.get()
+
+    @db.setter
+    def db(self, db: Optional[Session]):
+        _request_db.set(db)
+
+    @staticmethod
+    def _parse_temperature(model_config: Dict[str, Any]) -> float:
         # 处理 temperature: 如果为空字符串或 None,使用默认值 1.0
         temp_value = model_config.get("temperature", "1.0")
-        temperature = float(temp_value) if temp_value and str(temp_value).strip() else 1.0
+        return float(temp_value) if temp_value and str(temp_value).strip() else 1.0
 
+    @staticmethod
+    def _create_chat_model(model_config: Dict[str, Any], timeout: float):
+        """按模型配置创建 Chat 模型（挂载对应 provider 的 LLM 网关回调）"""
+        # LangChain 1.0+ API: 使用 api_key 和 base_url 参数
+        temperature = AIService._parse_temperature(model_config)
         provider = model_config.get("provider") or settings.PROVIDER
         base_url = model_config["api_base"] if model_config["api_base"] else None
         actual_provider = provider
         if provider and provider.lower() == "modelscope":
             actual_provider = "openai"
-        # 使用配置的超时时间
-        timeout = getattr(settings, 'AI_REQUEST_TIMEOUT', 180) or 180
-        print(f"[INFO] 初始化 AI 服务 - 模型: {model_config['model_name']}, 超时: {timeout}秒, 温度: {temperature}, 最大重试: {settings.AI_MAX_RETRIES}次")
+        # 所有模型调用经过 LLM 网关（按 provider 限流、限并发、优先级排队），并记录调用遥测
+        callbacks = [
+            LLMGatewayCallbackHandler(provider or "default"),
+            LLMTelemetryCallbackHandler(actual_provider or "default", model_config["model_name"]),
+        ]
         try:
-            self.llm = init_chat_model(
+            return init_chat_model(
                 model=model_config["model_name"],
                 model_provider=actual_provider,
                 temperature=temperature,
@@ -74,23 +164,19 @@ class AIService:
                 max_tokens=model_config.get("max_tokens"),
                 api_key=model_config["api_key"],
                 base_url=base_url,
+                callbacks=callbacks,
             )
         except ImportError as e:
             print(f"[WARNING] init_chat_model provider={provider} 加载失败，回退不指定 provider：{e}")
-            self.llm = init_chat_model(
+            return init_chat_model(
                 model=model_config["model_name"],
                 temperature=temperature,
                 timeout=timeout,
                 max_tokens=model_config.get("max_tokens"),
                 api_key=model_config["api_key"],
                 base_url=base_url,
+                callbacks=callbacks,
             )
-        self.embeddings = OpenAIEmbeddings(
-            api_key=model_config["api_key"],
-            base_url=model_config["api_base"] if model_config["api_base"] else None
-        )
-        # 初始化基于结构化输出的 Agent
-        self.agent_executor = self._build_agent_executor()
 
     def _get_model_config(self, model_config_id: int = None) -> Dict[str, Any]:
         """
@@ -121,37 +207,7 @@ class AIService:
                     ).first()
 
                 if config:
-                    # 解析模型名称列表
-                    import json
-                    model_names = config.model_name
-                    if isinstance(model_names, str):
-                        try:
-                            model_names = json.loads(model_names)
-                        except (json.JSONDecodeError, ValueError):
-                            model_names = [model_names] if model_names else []
-
-                    # 确保是列表
-                    if not isinstance(model_names, list):
-                        model_names = [model_names] if model_names else []
-
-                    # 使用 selected_model，如果没有则使用第一个模型
-                    actual_model = config.selected_model
-                    if not actual_model or not actual_model.strip():
-                        actual_model = model_names[0] if model_names else settings.MODEL_NAME
-
-                    # 处理 temperature: 如果为空字符串或 None,使用默认值
-                    temp = config.temperature
-                    if not temp or (isinstance(temp, str) and not temp.strip()):
-                        temp = "1.0"
-
-                    return {
-                        "api_key": config.api_key,
-                        "api_base": config.api_base,
-                        "model_name": actual_model,  # 使用选中的模型，而不是整个列表
-                        "temperature": temp,
-                        "max_tokens": config.max_tokens,
-                        "provider": config.provider,
-                    }
+                    return self._config_to_dict(config)
             except Exception as e:
                 print(f"[WARNING] 从数据库获取模型配置失败: {e}")
 
@@ -165,8 +221,77 @@ class AIService:
             "temperature": str(default_temp),
             "max_tokens": None,
             "provider": None,
+            "id": None,
+            "name": None,
+            "pool_name": None,
+            "weight": 1,
+        }
+
+    @staticmethod
+    def _config_to_dict(config) -> Dict[str, Any]:
+        """ModelConfig 记录转换为模型配置字典"""
+        import json
+
+        # 解析模型名称列表
+        model_names = config.model_name
+        if isinstance(model_names, str):
+            try:
+                model_names = json.loads(model_names)
+            except (json.JSONDecodeError, ValueError):
+                model_names = [model_names] if model_names else []
+
+        # 确保是列表
+        if not isinstance(model_names, list):
+            model_names = [model_names] if model_names else []
+
+        # 使用 selected_model，如果没有则使用第一个模型
+        actual_model = config.selected_model
+        if not actual_model or not actual_model.strip():
+            actual_model = model_names[0] if model_names else settings.MODEL_NAME
+
+        # 处理 temperature: 如果为空字符串或 None,使用默认值
+        temp = config.temperature
+        if not temp or (isinstance(temp, str) and not temp.strip()):
+            temp = "1.0"
+
+        return {
+            "api_key": config.api_key,
+            "api_base": config.api_base,
+            "model_name": actual_model,  # 使用选中的模型，而不是整个列表
+            "temperature": temp,
+            "max_tokens": config.max_tokens,
+            "provider": config.provider,
+            "id": config.id,
+            "name": config.name,
+            "pool_name": config.pool_name,
+            "weight": config.weight or 1,
         }
 
+    def _get_pool_configs(self, model_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        获取与当前配置同一端点池的全部可用配置
+
+        Returns:
+            端点池配置列表；未启用负载均衡、未设置 pool_name 或池内不足两个端点时返回空列表
+        """
+        if settings.LLM_ROUTING_MODE not in (ROUTING_WEIGHTED, ROUTING_LEAST_LATENCY):
+            return []
+        if not self.db or not model_config.get("pool_name") or model_config.get("id") is None:
+            return []
+        try:
+            from app.models.model_config import ModelConfig
+
+            configs = self.db.query(ModelConfig).filter(
+                ModelConfig.pool_name == model_config["pool_name"],
+                ModelConfig.is_active == True
+            ).order_by(ModelConfig.id).all()
+        except Exception as e:
+            print(f"[WARNING] 获取模型端点池失败，使用单一端点: {e}")
+            return []
+        if len(configs) < 2:
+            return []
+        return [self._config_to_dict(config) for config in configs]
+
     def agent_chat(self, prompt: str) -> str:
         """通过 LangChain Agent 调用 LLM, 支持使用内置工具"""
         config = {"configurable": {"thread_id": "default"}}
@@ -197,7 +322,8 @@ class AIService:
         获取测试数据生成专用 Agent（带缓存）
 
         Agent 结构（tools + response_format）固定不变，缓存后复用。
-        每次调用只更新工具的元数据（metadata/base_url/usercase_id）。
+        工具的元数据（metadata/base_url/usercase_id）写入当前调用上下文，
+        需在同一上下文中调用返回的 Agent，并发调用互不覆盖。
 
         Args:
             field_metadata: 字段元数据（包含枚举值和联动规则），
@@ -210,7 +336,7 @@ class AIService:
         from app.tools import ALL_CASE_BODY_TOOLS, setup_metadata_for_tools
         from app.schemas.case_body import CaseBodyResponse
 
-        # 每次调用都更新工具元数据（元数据随请求变化）
+        # 每次调用都设置工具元数据（元数据随请求变化，按调用上下文隔离）
         setup_metadata_for_tools(field_metadata or {}, base_url=base_url, usercase_id=usercase_id)
 
         # Agent 结构不变，缓存复用
@@ -232,40 +358,19 @@ class AIService:
         return self.embeddings.embed_query(text)
 
     def _get_prompt_from_db(self, key: str, default: str) -> str:
-        """从数据库获取 Prompt 配置"""
-        if not self.db:
-            return default
-
-        try:
-            from app.models.system_config import SystemConfig
-            config = self.db.query(SystemConfig).filter(SystemConfig.config_key == key).first()
-            if config:
-                return config.config_value
-        except Exception as e:
-            print(f"[WARNING] 获取 Prompt 配置失败: {str(e)}")
-
-        return default
+        """获取 Prompt 配置（读取进程级系统配置缓存）"""
+        return system_config_cache.get(key, default)
     
-    def extract_test_points(
-        self,
-        requirement_text: str,
-        user_feedback: str = None,
-        allow_fallback: bool = True,
-    ) -> List[Dict[str, Any]]:
-        """从需求文档中提取测试点"""
-
-        try:
-            if not requirement_text or not requirement_text.strip():
-                raise ValueError("Requirement text is empty")
-
-            max_length = max(settings.TEST_POINT_MAX_INPUT_CHARS, 1000)
-            if len(requirement_text) > max_length:
-                print(
-                    f"[WARNING] 需求文本过长 ({len(requirement_text)} 字符)，截取前 {max_length} 字符"
-                )
-                requirement_text = requirement_text[:max_length] + "..."
+    def build_test_point_messages(self, requirement_text: str, user_feedback: str = None):
+        """构建测试点提取消息（超长需求文本按 TEST_POINT_MAX_INPUT_CHARS 截断）"""
+        max_length = max(settings.TEST_POINT_MAX_INPUT_CHARS, 1000)
+        if len(requirement_text) > max_length:
+            print(
+                f"[WARNING] 需求文本过长 ({len(requirement_text)} 字符)，截取前 {max_length} 字符"
+            )
+            requirement_text = requirement_text[:max_length] + "..."
 
-            default_prompt = """你是一个专业的保险行业测试专家。请从需求文档中识别所有测试点。
+        default_prompt = """你是一个专业的保险行业测试专家。请从需求文档中识别所有测试点。
 
 测试点应该包括：
 1. 功能性测试点
@@ -282,101 +387,136 @@ class AIService:
 
 {feedback_instruction}"""
 
-            system_prompt = self._get_prompt_from_db("TEST_POINT_PROMPT", default_prompt)
+        system_prompt = self._get_prompt_from_db("TEST_POINT_PROMPT", default_prompt)
 
-            prompt_template = ChatPromptTemplate.from_messages(
-                [
-                    ("system", system_prompt),
-                    ("user", "需求文档内容：\n{requirement_text}"),
-                ]
-            )
-
-            feedback_instruction = ""
-            if user_feedback:
-                feedback_instruction = (
-                    f"\n用户反馈意见：{user_feedback}\n请根据用户反馈调整测试点。"
-                )
+        prompt_template = ChatPromptTemplate.from_messages(
+            [
+                ("system", system_prompt),
+                ("user", "需求文档内容：\n{requirement_text}"),
+            ]
+        )
 
-            messages = prompt_template.format_messages(
-                requirement_text=requirement_text,
-                feedback_instruction=feedback_instruction,
+        feedback_instruction = ""
+        if user_feedback:
+            feedback_instruction = (
+                f"\n用户反馈意见：{user_feedback}\n请根据用户反馈调整测试点。"
             )
 
-            print(f"[INFO] 调用 OpenAI API 提取测试点...")
-            print(f"[INFO] 配置信息 - 超时: {getattr(settings, 'AI_REQUEST_TIMEOUT', 180)}秒, 最大重试: {settings.AI_MAX_RETRIES}次")
-            retries = max(settings.AI_MAX_RETRIES, 1)
-            delay = max(settings.AI_RETRY_INTERVAL, 1)
-            response = None
-            last_error = None
-            for attempt in range(1, retries + 1):
-                try:
-                    start_time = time.time()
-                    print(f"[INFO] 第 {attempt}/{retries} 次尝试...")
-                    response = self.llm.invoke(messages)
-                    elapsed_time = time.time() - start_time
-                    print(f"[INFO] API 调用成功，耗时: {elapsed_time:.2f}秒")
-                    break
-                except Exception as invoke_error:
-                    elapsed_time = time.time() - start_time
-                    last_error = invoke_error
-                    error_type = type(invoke_error).__name__
-                    print(
-                        f"[WARNING] OpenAI API 调用失败（第 {attempt}/{retries} 次，耗时: {elapsed_time:.2f}秒）"
-                    )
-                    print(f"[WARNING] 错误类型: {error_type}, 错误信息: {str(invoke_error)[:200]}")
-                    if attempt < retries:
-                        print(f"[INFO] 等待 {delay} 秒后重试...")
-                        time.sleep(delay)
-            if response is None:
-                print(f"[ERROR] 所有 {retries} 次尝试均失败")
-                raise last_error or RuntimeError("OpenAI 响应为空")
-            print(f"[INFO] OpenAI API 响应成功，内容长度: {len(response.content)}")
+        return prompt_template.format_messages(
+            requirement_text=requirement_text,
+            feedback_instruction=feedback_instruction,
+        )
 
-            import json
+    def extract_test_points(
+        self,
+        requirement_text: str,
+        user_feedback: str = None,
+        use_cache: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        从需求文档中提取测试点
 
-            content = response.content
-            start_idx = content.find('[')
-            end_idx = content.rfind(']') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = content[start_idx:end_idx]
-                test_points = json.loads(json_str)
-                print(f"[INFO] 成功解析 {len(test_points)} 个测试点")
-                return test_points
+        use_cache=False 时跳过 LLM 响应缓存（用户主动重新生成时需要新的结果）；
+        提取失败时抛出异常并计入结构化输出统计（extract_failures），不返回示例数据
+        """
+
+        try:
+            if not requirement_text or not requirement_text.strip():
+                raise ValueError("Requirement text is empty")
 
-            print("[WARNING] 未找到 JSON 数组，尝试解析整个响应")
-            test_points = json.loads(content)
-            if isinstance(test_points, list):
-                return test_points
+            messages = self.build_test_point_messages(requirement_text, user_feedback)
 
-            raise ValueError("AI 响应格式不正确，未返回测试点列表")
+            print(f"[INFO] 调用 OpenAI API 提取测试点（结构化输出）...")
+            result, _ = self._invoke_structured(TestPointDraftList, messages, use_cache=use_cache)
+            test_points = self._validate_items(result.get("test_points"), TestPointDraft, messages, "测试点")
+            print(f"[INFO] 成功解析 {len(test_points)} 个测试点")
+            return test_points
 
         except Exception as e:
+            _count_structured_output("extract_failures")
             print(f"[ERROR] AI 提取测试点失败: {str(e)}")
             import traceback
 
             traceback.print_exc()
-            if allow_fallback:
-                print("[WARNING] 使用示例数据")
-                return [
-                    {
-                        "title": "功能测试点示例",
-                        "description": "这是一个示例测试点，AI 解析失败时显示",
-                        "category": "功能",
-                        "priority": "high",
-                        "business_line": "contract",
-                    },
-                    {
-                        "title": "边界测试点示例",
-                        "description": "请检查 OpenAI API Key 配置和网络连接",
-                        "category": "边界",
-                        "priority": "medium",
-                        "business_line": "preservation",
-                    },
-                ]
             raise
 
-    def generate_test_cases(self, test_point: Dict[str, Any], requirement_context: str = "") -> List[Dict[str, Any]]:
-        """根据测试点生成测试用例"""
+    def stream_test_points(self, requirement_text: str, user_feedback: str = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式提取测试点：边生成边解析 JSON 数组，每个测试点对象闭合即校验并产出
+
+        首个测试点在数秒内即可返回，无需等待完整响应；不合法的测试点在流结束后逐项修复再产出。
+        尚未产出任何测试点时调用失败按重试策略（llm_retry）重试，已产出部分结果后失败直接抛出。
+        """
+        if not requirement_text or not requirement_text.strip():
+            raise ValueError("Requirement text is empty")
+        messages = self.build_test_point_messages(requirement_text, user_feedback)
+
+        cached = self._cached_response(messages)
+        budget = RetryBudget("流式提取测试点")
+        while True:
+            budget.start_attempt()
+            parser = IncrementalJSONArrayParser()
+            invalid_items = []
+            content_parts = []
+            produced = 0
+            start_time = time.time()
+            try:
+                chunks = [cached.content] if cached is not None else (chunk.content for chunk in self.llm.stream(messages, config=attempt_config(budget.attempt)))
+                for text in chunks:
+                    if not isinstance(text, str):
+                        continue
+                    content_parts.append(text)
+                    for item in parser.feed(text):
+                        try:
+                            test_point = TestPointDraft.model_validate(item).model_dump()
+                        except ValidationError as e:
+                            invalid_items.append((item, e))
+                            continue
+                        produced += 1
+                        yield test_point
+            except Exception as stream_error:
+                print(
+                    f"[WARNING] 流式提取测试点失败（第 {budget.attempt}/{budget.max_attempts} 次，耗时: {time.time() - start_time:.2f}秒）: "
+                    f"{type(stream_error).__name__}: {str(stream_error)[:200]}"
+                )
+                delay = None if produced else budget.next_delay(stream_error)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            break
+
+        if not parser.started:
+            _count_structured_output("parse_failures")
+            raise ValueError("AI 响应格式不正确，未返回测试点列表")
+        if cached is None:
+            self._store_response(messages, AIMessage(content="".join(content_parts)))
+
+        invalid_items.extend(parser.errors)
+        if invalid_items:
+            _count_structured_output("parse_failures")
+        for index, (item, error) in enumerate(invalid_items, 1):
+            _count_structured_output("invalid_items")
+            repaired = self._repair_item(item, TestPointDraft, messages, error, "测试点", produced + index)
+            if repaired is None:
+                _count_structured_output("dropped_items")
+                continue
+            _count_structured_output("repaired_items")
+            produced += 1
+            yield repaired
+
+        if invalid_items and not produced:
+            raise ValueError("AI 返回的测试点均不合法")
+        print(f"[INFO] 流式提取完成，测试点数量: {produced}，耗时: {time.time() - start_time:.2f}秒")
+
+    def build_test_case_messages(self, test_point: Dict[str, Any], requirement_context: str = ""):
+        """
+        构建测试用例生成消息（按业务线选择 Prompt）
+
+        消息按变化频率排列：系统 Prompt、需求上下文、生成要求在前，测试点字段放在最后。
+        同一需求的各测试点请求共享逐字节相同的前缀，可命中 provider 的前缀缓存（prompt caching）。
+        Prompt 不经模板渲染，配置内容原样发送。
+        """
 
         # 根据业务线选择对应的 Prompt
         business_line = test_point.get('business_line', '')
@@ -411,97 +551,339 @@ class AIService:
 
         system_prompt = self._get_prompt_from_db(prompt_key, default_prompt)
 
-        prompt_template = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
-            ("user", """测试点信息：
-标题：{title}
-描述：{description}
-分类：{category}
+        user_prompt = (
+            f"需求上下文：\n{requirement_context}\n\n"
+            "请针对以下测试点生成 2-3 个相关的测试用例。\n\n"
+            f"测试点信息：\n"
+            f"标题：{test_point.get('title', '')}\n"
+            f"描述：{test_point.get('description', '')}\n"
+            f"分类：{test_point.get('category', '')}\n"
+        )
+        return [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
+
+    def _cached_response(self, messages) -> Optional[AIMessage]:
+        """查找 LLM 响应缓存（未开启缓存时直接返回 None）"""
+        if not llm_response_cache.enabled:
+            return None
+        content = llm_response_cache.get(self.llm_cache_scope, messages)
+        if content is None:
+            return None
+        self._record_cache_hit()
+        return AIMessage(content=content, response_metadata={"cache_hit": True})
 
-需求上下文：
-{context}
+    def _record_cache_hit(self):
+        record_cache_hit(CALL_TYPE_CHAT, self.llm_cache_scope.get("provider", ""), self.llm_cache_scope.get("model", ""))
 
-请生成 2-3 个相关的测试用例。
-""")
-        ])
-        
-        messages = prompt_template.format_messages(
-            title=test_point.get('title', ''),
-            description=test_point.get('description', ''),
-            category=test_point.get('category', ''),
-            context=requirement_context
+    def _store_response(self, messages, response):
+        if llm_response_cache.enabled:
+            llm_response_cache.set(self.llm_cache_scope, messages, response.content)
+
+    def _flight_key(self, kind: str, messages, schema=None) -> str:
+        """在途请求合并的指纹：调用方式 + 模型参数 + 消息内容"""
+        scope = dict(self.llm_cache_scope, call=kind, schema=schema.__name__ if schema else None)
+        return make_cache_key(scope, messages)
+
+    def _invoke_coalesced(self, messages, attempt: int = 1):
+        """调用 LLM，相同请求的并发调用合并为一次"""
+        return llm_single_flight.do(
+            self._flight_key("invoke", messages), lambda: self.llm.invoke(messages, config=attempt_config(attempt))
         )
-        
-        # 添加重试机制
-        print(f"[INFO] 调用 OpenAI API 生成测试用例...")
+
+    def invoke_llm(self, messages, use_cache: bool = True):
+        """单次调用 LLM（经过响应缓存与在途请求合并，不重试）"""
+        if use_cache:
+            cached = self._cached_response(messages)
+            if cached is not None:
+                return cached
+        response = self._invoke_coalesced(messages)
+        if use_cache:
+            self._store_response(messages, response)
+        return response
+
+    def _invoke_with_retry(self, messages, use_cache: bool = True):
+        """同步调用 LLM（先查响应缓存，失败按重试策略退避重试）"""
+        if use_cache:
+            cached = self._cached_response(messages)
+            if cached is not None:
+                return cached
         print(f"[INFO] 配置信息 - 超时: {getattr(settings, 'AI_REQUEST_TIMEOUT', 180)}秒, 最大重试: {settings.AI_MAX_RETRIES}次")
-        retries = max(settings.AI_MAX_RETRIES, 1)
-        delay = max(settings.AI_RETRY_INTERVAL, 1)
-        response = None
-        last_error = None
-        
-        for attempt in range(1, retries + 1):
+        budget = RetryBudget("LLM 调用")
+
+        while True:
+            attempt = budget.start_attempt()
             try:
                 start_time = time.time()
-                print(f"[INFO] 第 {attempt}/{retries} 次尝试...")
-                response = self.llm.invoke(messages)
+                print(f"[INFO] 第 {attempt}/{budget.max_attempts} 次尝试...")
+                response = self._invoke_coalesced(messages, attempt)
                 elapsed_time = time.time() - start_time
                 print(f"[INFO] API 调用成功，耗时: {elapsed_time:.2f}秒，内容长度: {len(response.content)}")
-                break
+                if use_cache:
+                    self._store_response(messages, response)
+                return response
             except Exception as invoke_error:
                 elapsed_time = time.time() - start_time
-                last_error = invoke_error
                 error_type = type(invoke_error).__name__
                 print(
-                    f"[WARNING] OpenAI API 调用失败（第 {attempt}/{retries} 次，耗时: {elapsed_time:.2f}秒）"
+                    f"[WARNING] OpenAI API 调用失败（第 {attempt}/{budget.max_attempts} 次，耗时: {elapsed_time:.2f}秒）"
                 )
                 print(f"[WARNING] 错误类型: {error_type}, 错误信息: {str(invoke_error)[:200]}")
-                if attempt < retries:
-                    print(f"[INFO] 等待 {delay} 秒后重试...")
-                    time.sleep(delay)
-        
-        if response is None:
-            print(f"[ERROR] 所有 {retries} 次尝试均失败")
-            raise last_error or RuntimeError("OpenAI 响应为空")
-        
-        # 解析响应
+                delay = budget.next_delay(invoke_error)
+                if delay is None:
+                    print(f"[ERROR] 共 {attempt} 次尝试均失败")
+                    raise
+                time.sleep(delay)
+
+    async def _ainvoke_with_retry(self, messages, use_cache: bool = True):
+        """异步调用 LLM（先查响应缓存，失败按重试策略退避重试，等待期间不阻塞事件循环）"""
+        if use_cache and llm_response_cache.enabled:
+            cached = await asyncio.to_thread(self._cached_response, messages)
+            if cached is not None:
+                return cached
+        budget = RetryBudget("LLM 调用")
+
+        while True:
+            attempt = budget.start_attempt()
+            start_time = time.time()
+            try:
+                response = await llm_single_flight.ado(
+                    self._flight_key("invoke", messages), lambda: self.llm.ainvoke(messages, config=attempt_config(attempt))
+                )
+                print(f"[INFO] API 调用成功，耗时: {time.time() - start_time:.2f}秒，内容长度: {len(response.content)}")
+                if use_cache and llm_response_cache.enabled:
+                    await asyncio.to_thread(self._store_response, messages, response)
+                return response
+            except Exception as invoke_error:
+                print(
+                    f"[WARNING] OpenAI API 调用失败（第 {attempt}/{budget.max_attempts} 次，耗时: {time.time() - start_time:.2f}秒）: "
+                    f"{type(invoke_error).__name__}: {str(invoke_error)[:200]}"
+                )
+                delay = budget.next_delay(invoke_error)
+                if delay is None:
+                    print(f"[ERROR] 共 {attempt} 次尝试均失败")
+                    raise
+                await asyncio.sleep(delay)
+
+    def _structured_agent(self, schema):
+        """
+        获取结构化输出 Agent（按 schema 缓存复用）
+
+        校验失败时不在 Agent 内整体重新生成（handle_errors=False），由调用方逐项校验修复。
+        """
+        agents = self.__dict__.setdefault("_structured_agents", {})
+        if schema not in agents:
+            agents[schema] = create_agent(
+                model=self.llm,
+                tools=[],
+                response_format=ToolStrategy(schema, handle_errors=False),
+            )
+        return agents[schema]
+
+    @staticmethod
+    def _usage_tokens(messages) -> int:
+        return sum((getattr(message, "usage_metadata", None) or {}).get("total_tokens", 0) for message in messages)
+
+    def _structured_args(self, schema, outcome) -> Tuple[Dict[str, Any], int]:
+        """从 Agent 结果或校验异常中取出结构化参数与消耗的 token 数"""
+        if isinstance(outcome, StructuredOutputError):
+            _count_structured_output("parse_failures")
+            tool_calls = outcome.ai_message.tool_calls or []
+            if not tool_calls:
+                raise outcome
+            print(f"[WARNING] 结构化输出 {schema.__name__} 校验失败，改为逐项校验: {str(outcome)[:200]}")
+            return tool_calls[0]["args"], self._usage_tokens([outcome.ai_message])
+
+        structured = outcome.get("structured_response")
+        if structured is None:
+            _count_structured_output("parse_failures")
+            raise ValueError(f"模型未返回结构化输出 {schema.__name__}")
+        return structured.model_dump(), self._usage_tokens(outcome.get("messages", []))
+
+    def _structured_cache_scope(self, schema) -> Dict[str, Any]:
+        return dict(self.llm_cache_scope, schema=schema.__name__)
+
+    def _invoke_structured(self, schema, messages, use_cache: bool = True) -> Tuple[Dict[str, Any], int]:
+        """
+        结构化调用 LLM（Agent + ToolStrategy），失败按重试策略退避重试
+
+        Returns:
+            (结构化参数, 消耗的 token 数)；schema 校验未通过时返回原始参数，由 _validate_items 逐项修复
+        """
+        if use_cache and llm_response_cache.enabled:
+            cached = llm_response_cache.get(self._structured_cache_scope(schema), messages)
+            if cached is not None:
+                self._record_cache_hit()
+                return json.loads(cached), 0
+        _count_structured_output("calls")
+        agent = self._structured_agent(schema)
+        budget = RetryBudget(f"结构化输出 {schema.__name__}")
+
+        while True:
+            attempt = budget.start_attempt()
+            start_time = time.time()
+            try:
+                try:
+                    outcome = llm_single_flight.do(
+                        self._flight_key("structured", messages, schema),
+                        lambda: agent.invoke({"messages": messages}, config=attempt_config(attempt)),
+                    )
+                except StructuredOutputError as e:
+                    outcome = e
+                result, tokens = self._structured_args(schema, outcome)
+            except Exception as invoke_error:
+                print(
+                    f"[WARNING] OpenAI API 调用失败（第 {attempt}/{budget.max_attempts} 次，耗时: {time.time() - start_time:.2f}秒）: "
+                    f"{type(invoke_error).__name__}: {str(invoke_error)[:200]}"
+                )
+                delay = budget.next_delay(invoke_error)
+                if delay is None:
+                    print(f"[ERROR] 共 {attempt} 次尝试均失败")
+                    raise
+                time.sleep(delay)
+                continue
+            print(f"[INFO] API 调用成功，耗时: {time.time() - start_time:.2f}秒")
+            if use_cache and llm_response_cache.enabled and not isinstance(outcome, StructuredOutputError):
+                llm_response_cache.set(self._structured_cache_scope(schema), messages, json.dumps(result, ensure_ascii=False))
+            return result, tokens
+
+    async def _ainvoke_structured(self, schema, messages, use_cache: bool = True) -> Tuple[Dict[str, Any], int]:
+        """异步结构化调用 LLM（同 _invoke_structured，等待期间不阻塞事件循环）"""
+        if use_cache and llm_response_cache.enabled:
+            cached = await asyncio.to_thread(llm_response_cache.get, self._structured_cache_scope(schema), messages)
+            if cached is not None:
+                self._record_cache_hit()
+                return json.loads(cached), 0
+        _count_structured_output("calls")
+        agent = self._structured_agent(schema)
+        budget = RetryBudget(f"结构化输出 {schema.__name__}")
+
+        while True:
+            attempt = budget.start_attempt()
+            start_time = time.time()
+            try:
+                try:
+                    outcome = await llm_single_flight.ado(
+                        self._flight_key("structured", messages, schema),
+                        lambda: agent.ainvoke({"messages": messages}, config=attempt_config(attempt)),
+                    )
+                except StructuredOutputError as e:
+                    outcome = e
+                result, tokens = self._structured_args(schema, outcome)
+            except Exception as invoke_error:
+                print(
+                    f"[WARNING] OpenAI API 调用失败（第 {attempt}/{budget.max_attempts} 次，耗时: {time.time() - start_time:.2f}秒）: "
+                    f"{type(invoke_error).__name__}: {str(invoke_error)[:200]}"
+                )
+                delay = budget.next_delay(invoke_error)
+                if delay is None:
+                    print(f"[ERROR] 共 {attempt} 次尝试均失败")
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            print(f"[INFO] API 调用成功，耗时: {time.time() - start_time:.2f}秒")
+            if use_cache and llm_response_cache.enabled and not isinstance(outcome, StructuredOutputError):
+                await asyncio.to_thread(
+                    llm_response_cache.set,
+                    self._structured_cache_scope(schema),
+                    messages,
+                    json.dumps(result, ensure_ascii=False),
+                )
+            return result, tokens
+
+    def _validate_items(self, items, item_schema, messages, label: str) -> List[Dict[str, Any]]:
+        """
+        逐项校验结构化输出
+
+        不合法的条目单独重新询问修复，其余条目直接保留；修复失败的条目丢弃。
+        全部条目均不合法时抛出异常，由调用方按失败处理（不再返回示例数据）。
+        """
+        if not isinstance(items, list):
+            raise ValueError(f"AI 响应格式不正确，未返回{label}列表")
+
+        valid_items = []
+        for index, item in enumerate(items, 1):
+            try:
+                valid_items.append(item_schema.model_validate(item).model_dump())
+                continue
+            except ValidationError as e:
+                validation_error = e
+            _count_structured_output("invalid_items")
+            repaired = self._repair_item(item, item_schema, messages, validation_error, label, index)
+            if repaired is None:
+                _count_structured_output("dropped_items")
+            else:
+                _count_structured_output("repaired_items")
+                valid_items.append(repaired)
+
+        if items and not valid_items:
+            raise ValueError(f"AI 返回的{label}均不合法")
+        return valid_items
+
+    def _repair_item(self, item, item_schema, messages, validation_error: Exception, label: str, index: int):
+        """重新询问修复单个不合法的条目，返回修复后的数据，失败返回 None"""
+        print(f"[INFO] 第 {index} 个{label}字段不合法，单独修复: {str(validation_error)[:200]}")
+        repair_messages = list(messages) + [HumanMessage(content=(
+            f"你返回的第 {index} 个{label}字段不合法：\n"
+            f"{json.dumps(item, ensure_ascii=False, default=str)}\n\n"
+            f"校验错误：\n{validation_error}\n\n"
+            f"请只修正这一个{label}，按要求的格式重新返回。"
+        ))]
+        _count_structured_output("repair_calls")
         try:
-            import json
-            content = response.content
-            start = content.find('[')
-            end = content.rfind(']') + 1
-            if start != -1 and end > start:
-                test_cases = json.loads(content[start:end])
-                print(f"[INFO] 成功解析 {len(test_cases)} 个测试用例")
-                return test_cases
-            
-            print("[WARNING] 未找到 JSON 数组，尝试解析整个响应")
-            test_cases = json.loads(content)
-            if isinstance(test_cases, list):
-                return test_cases
-            
-            raise ValueError("AI 响应格式不正确，未返回测试用例列表")
-        except Exception as parse_error:
-            print(f"[ERROR] 解析测试用例失败: {parse_error}")
-            # 返回示例数据
-            return [
-                {
-                    "title": f"{test_point.get('title', '')} - 正常流程",
-                    "description": "验证正常业务流程（AI生成失败，返回示例数据）",
-                    "preconditions": "系统正常运行，用户已登录",
-                    "test_steps": [
-                        {"step": 1, "action": "打开功能页面", "expected": "页面正常显示"},
-                        {"step": 2, "action": "输入有效数据", "expected": "数据验证通过"},
-                        {"step": 3, "action": "提交表单", "expected": "操作成功"}
-                    ],
-                    "expected_result": "功能正常执行",
-                    "priority": test_point.get('priority', 'medium'),
-                    "test_type": "functional"
-                }
-            ]
+            result, tokens = self._invoke_structured(item_schema, repair_messages, use_cache=False)
+            _count_structured_output("repair_tokens", tokens)
+            return item_schema.model_validate(result).model_dump()
+        except Exception as e:
+            print(f"[WARNING] 第 {index} 个{label}修复失败，已丢弃: {str(e)[:200]}")
+            return None
+
+    def generate_test_cases_from_messages(self, messages, use_cache: bool = True) -> List[Dict[str, Any]]:
+        """使用 build_test_case_messages 构建的消息生成测试用例（结构化输出，逐项修复）"""
+        result, _ = self._invoke_structured(TestCaseDraftList, messages, use_cache=use_cache)
+        test_cases = self._validate_items(result.get("test_cases"), TestCaseDraft, messages, "测试用例")
+        print(f"[INFO] 成功解析 {len(test_cases)} 个测试用例")
+        return test_cases
+
+    def generate_test_cases(
+        self,
+        test_point: Dict[str, Any],
+        requirement_context: str = "",
+        use_cache: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """根据测试点生成测试用例"""
+        messages = self.build_test_case_messages(test_point, requirement_context)
+        print(f"[INFO] 调用 OpenAI API 生成测试用例...")
+        return self.generate_test_cases_from_messages(messages, use_cache=use_cache)
+
+    async def agenerate_test_cases(
+        self,
+        messages,
+        test_point: Dict[str, Any],
+        use_cache: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        异步生成测试用例（批量并发生成使用）
+
+        Args:
+            messages: build_test_case_messages 构建的消息（读取 Prompt 配置需访问数据库，由调用方在线程中构建）
+            test_point: 测试点数据
+            use_cache: 是否使用 LLM 响应缓存
+        """
+        result, _ = await self._ainvoke_structured(TestCaseDraftList, messages, use_cache=use_cache)
+        # 少数不合法条目的修复在线程中进行，不阻塞事件循环
+        test_cases = await asyncio.to_thread(
+            self._validate_items, result.get("test_cases"), TestCaseDraft, messages, "测试用例"
+        )
+        print(f"[INFO] 测试点 {test_point.get('title', '')} 成功解析 {len(test_cases)} 个测试用例")
+        return test_cases
     
     def create_workflow(self):
-        """创建 LangGraph 工作流 - 使用 LangGraph 1.0+ API"""
+        """
+        创建 LangGraph 工作流 - 使用 LangGraph 1.0+ API
+
+        analyze 提取测试点后，通过 Send 为每个测试点分发独立的 generate_case 分支并行生成用例，
+        并发数由 TEST_CASE_GENERATION_CONCURRENCY 限制；单个分支按重试策略（llm_retry）重试，
+        最终失败只记录到 failed_test_points，不影响其他分支，最后由 collect 汇总。
+        """
 
         workflow = StateGraph(GraphState)
 
@@ -516,28 +898,56 @@ class AIService:
                 "current_step": "test_points_generated"
             }
 
-        def generate_cases(state: GraphState) -> Dict[str, Any]:
-            """生成测试用例节点 - 返回状态更新字典"""
-            test_cases = []
-            for test_point in state.get("test_points", []):
-                cases = self.generate_test_cases(test_point, state["requirement_text"])
-                test_cases.extend(cases)
+        def dispatch_test_points(state: GraphState):
+            """为每个测试点分发一个生成分支（Prompt 在此处构建，读取配置只访问一次数据库会话）"""
+            test_points = state.get("test_points", [])
+            if not test_points:
+                return "collect"
+            return [
+                Send("generate_case", {
+                    "test_point": test_point,
+                    "messages": self.build_test_case_messages(test_point, state["requirement_text"]),
+                })
+                for test_point in test_points
+            ]
+
+        def generate_case(state: TestPointBranchState) -> Dict[str, Any]:
+            """单个测试点生成用例节点 - 失败只记录该测试点，不中断整个工作流"""
+            test_point = state["test_point"]
+            try:
+                test_cases = self.generate_test_cases_from_messages(state["messages"])
+            except Exception as e:
+                print(f"[ERROR] 测试点 {test_point.get('title', '')} 生成用例失败: {str(e)}")
+                return {"failed_test_points": [{"test_point": test_point, "error": str(e)}]}
+            return {"test_cases": test_cases}
+
+        def collect_cases(state: GraphState) -> Dict[str, Any]:
+            """汇总各分支结果"""
+            failed = state.get("failed_test_points", [])
+            print(
+                f"[INFO] 工作流生成测试用例 {len(state.get('test_cases', []))} 个, "
+                f"测试点 {len(state.get('test_points', []))} 个, 失败 {len(failed)} 个"
+            )
             return {
-                "test_cases": test_cases,
-                "current_step": "test_cases_generated"
+                "current_step": "test_cases_generated" if not failed else "test_cases_partially_generated"
             }
 
         # 添加节点
         workflow.add_node("analyze", analyze_requirement)
-        workflow.add_node("generate", generate_cases)
+        workflow.add_node("generate_case", generate_case)
+        workflow.add_node("collect", collect_cases)
 
         # 添加边 - LangGraph 1.0+ 使用 START 代替 set_entry_point
         workflow.add_edge(START, "analyze")
-        workflow.add_edge("analyze", "generate")
-        workflow.add_edge("generate", END)
+        workflow.add_conditional_edges("analyze", dispatch_test_points, ["generate_case", "collect"])
+        workflow.add_edge("generate_case", "collect")
+        workflow.add_edge("collect", END)
 
-        return workflow.compile()
+        return workflow.compile().with_config(
+            max_concurrency=max(settings.TEST_CASE_GENERATION_CONCURRENCY, 1)
+        )
     
+    @llm_feature("select_scenario")
     def select_best_scenario(
         self,
         test_case_info: Dict[str, Any],
@@ -604,7 +1014,7 @@ class AIService:
             print(f"[INFO] 使用AI选择最佳场景...")
             print(f"[DEBUG] 可选场景数量: {len(scenarios)}")
             
-            response = self.llm.invoke(prompt)
+            response = self.invoke_llm(prompt)
             
             selected_code = response.content.strip()
             print(f"[INFO] AI选择的场景编号: {selected_code}")
@@ -638,7 +1048,8 @@ def get_ai_service(db: Session = None, model_config_id: int = None) -> AIService
     获取 AI 服务实例（带缓存）
 
     相同 model_config_id 复用同一实例，避免重复初始化 LLM。
-    db 会话每次更新到缓存实例上，保证 Prompt 配置可从当前会话读取。
+    db 会话只绑定到当前调用上下文（ContextVar），不写入共享实例，
+    后台线程、工作流线程与请求处理并发使用同一实例时互不覆盖。
 
     Args:
         db: 数据库会话（支持 Prompt 配置和模型配置）
@@ -648,14 +1059,13 @@ def get_ai_service(db: Session = None, model_config_id: int = None) -> AIService
         AIService 实例
     """
     cache_key = model_config_id  # None 表示默认配置
+    # 绑定当前调用上下文的 db 会话
+    _request_db.set(db)
 
     with _ai_service_cache_lock:
         if cache_key in _ai_service_cache:
-            instance = _ai_service_cache[cache_key]
-            # 更新 db 会话，保证当前请求可读取 Prompt 配置
-            instance.db = db
             print(f"[INFO] 复用缓存的 AIService 实例 (config_id={cache_key})")
-            return instance
+            return _ai_service_cache[cache_key]
 
     # 缓存未命中，创建新实例（在锁外创建，避免阻塞其他请求）
     print(f"[INFO] 创建新的 AIService 实例 (config_id={cache_key})")
@@ -667,13 +1077,41 @@ def get_ai_service(db: Session = None, model_config_id: int = None) -> AIService
             _ai_service_cache[cache_key] = instance
         else:
             instance = _ai_service_cache[cache_key]
-            instance.db = db
 
     return instance
 
 
 def clear_ai_service_cache():
-    """清除 AIService 缓存（模型配置变更时调用）"""
+    """清除 AIService 缓存（模型或 Prompt 配置变更后，系统配置重新加载时调用）"""
     with _ai_service_cache_lock:
         _ai_service_cache.clear()
     print("[INFO] AIService 缓存已清除")
+
+
+system_config_cache.add_reload_hook(clear_ai_service_cache)
+
+
+# --- 结构化输出统计 ---
+# 解析失败次数、测试点提取失败次数、不合法条目的逐项修复次数与修复消耗的 token 数
+_structured_output_stats: Dict[str, int] = {
+    "calls": 0,
+    "parse_failures": 0,
+    "extract_failures": 0,
+    "invalid_items": 0,
+    "repaired_items": 0,
+    "dropped_items": 0,
+    "repair_calls": 0,
+    "repair_tokens": 0,
+}
+_structured_output_lock = threading.Lock()
+
+
+def _count_structured_output(name: str, amount: int = 1):
+    with _structured_output_lock:
+        _structured_output_stats[name] += amount
+
+
+def get_structured_output_stats() -> Dict[str, int]:
+    """获取结构化输出解析统计"""
+    with _structured_output_lock:
+        return dict(_structured_output_stats)
@@ -0,0 +1,238 @@
+"""
+语义答案缓存
+基于 QARecord 历史问答：新问题与同一集合中高评价历史问题的向量距离足够小、
+且集合在该回答之后未发生变更时，直接复用历史答案与来源，跳过 LLM 调用。
+历史问题向量在反馈提交后或首次查询时于后台计算，不占用用户请求的耗时。
+"""
+import json
+import math
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.knowledge_base import KnowledgeDocument, QARecord
+from app.services.chat_history import estimate_tokens
+from app.services.llm_telemetry import CALL_TYPE_EMBEDDING, track_llm_call
+from app.services.query_cache import LRUCache
+
+
+def cosine_distance(a: List[float], b: List[float]) -> float:
+    """余弦距离 = 1 - 余弦相似度"""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(y * y for y in b))
+    if not norm_a or not norm_b:
+        return 1.0
+    return 1.0 - dot / (norm_a * norm_b)
+
+
+class SemanticAnswerCache:
+    """语义答案缓存（默认关闭，通过 RAG_ANSWER_CACHE_ENABLED 开启）"""
+
+    def __init__(self):
+        # (embedding_model, qa_record_id) -> 历史问题向量，按 LRU 淘汰
+        self._question_embeddings = LRUCache(settings.RAG_ANSWER_CACHE_EMBEDDING_SIZE)
+        # 正在后台计算向量的 (embedding_model, qa_record_id)
+        self._warming: Set[Tuple[str, int]] = set()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.RAG_ANSWER_CACHE_ENABLED)
+
+    def _record(self, collection_name: str, outcome: str, reason: Optional[str] = None):
+        with self._lock:
+            stats = self._stats.setdefault(
+                collection_name, {"hits": 0, "bypasses": 0, "bypass_reasons": {}}
+            )
+            if outcome == "hit":
+                stats["hits"] += 1
+            else:
+                stats["bypasses"] += 1
+                reasons = stats["bypass_reasons"]
+                reasons[reason] = reasons.get(reason, 0) + 1
+
+    def bypass(self, collection_name: str, reason: str):
+        """记录一次未走缓存的请求"""
+        if self.enabled:
+            self._record(collection_name, "bypass", reason)
+
+    @staticmethod
+    def _collection_changed_at(db: Session, collection_name: str):
+        """集合最后一次变更时间（文档新增、更新或删除）"""
+        return (
+            db.query(
+                func.max(func.coalesce(KnowledgeDocument.updated_at, KnowledgeDocument.created_at))
+            )
+            .filter(KnowledgeDocument.collection_name == collection_name)
+            .scalar()
+        )
+
+    def _load_candidates(self, db: Session, collection_name: str) -> List[QARecord]:
+        query = db.query(QARecord).filter(
+            QARecord.collection_name == collection_name,
+            or_(
+                QARecord.is_helpful == True,
+                QARecord.rating >= settings.RAG_ANSWER_CACHE_MIN_RATING,
+            ),
+            or_(QARecord.is_helpful.is_(None), QARecord.is_helpful == True),
+        )
+        changed_at = self._collection_changed_at(db, collection_name)
+        if changed_at is not None:
+            query = query.filter(QARecord.created_at > changed_at)
+        return (
+            query.order_by(QARecord.created_at.desc())
+            .limit(max(settings.RAG_ANSWER_CACHE_CANDIDATES, 1))
+            .all()
+        )
+
+    @staticmethod
+    def is_eligible(record: QARecord) -> bool:
+        """历史答案是否可被复用：标记有帮助，或评分达标且未被标记为无帮助"""
+        if record.is_helpful is False:
+            return False
+        return bool(record.is_helpful) or (record.rating or 0) >= settings.RAG_ANSWER_CACHE_MIN_RATING
+
+    @staticmethod
+    def _model_key(rag_service) -> str:
+        return str(rag_service.config.get("embedding_model", ""))
+
+    def warm(self, rag_service, items: List[Tuple[int, str]]):
+        """
+        计算并缓存历史问题向量（同步执行，供后台任务调用）
+
+        Args:
+            rag_service: RAGService 实例
+            items: [(qa_record_id, question), ...]
+        """
+        model_key = self._model_key(rag_service)
+        keys = [(model_key, record_id) for record_id, _ in items]
+        try:
+            if items:
+                questions = [question for _, question in items]
+                with track_llm_call(
+                    CALL_TYPE_EMBEDDING,
+                    model_name=model_key,
+                    prompt_tokens=sum(estimate_tokens(question) for question in questions),
+                ):
+                    vectors = rag_service.embeddings.embed_documents(questions)
+                for key, vector in zip(keys, vectors):
+                    self._question_embeddings.set(key, vector)
+                print(f"[INFO] 语义答案缓存已预热 {len(items)} 条历史问题向量")
+        except Exception as e:
+            print(f"[WARNING] 语义答案缓存预热失败: {e}")
+        finally:
+            with self._lock:
+                self._warming.difference_update(keys)
+
+    def schedule_warm(self, rag_service, items: List[Tuple[int, str]]) -> Optional[threading.Thread]:
+        """在后台线程中预热尚未计算且不在计算中的历史问题向量"""
+        if not self.enabled or not items:
+            return None
+        model_key = self._model_key(rag_service)
+        with self._lock:
+            pending = [
+                (record_id, question) for record_id, question in items
+                if (model_key, record_id) not in self._warming
+            ]
+            self._warming.update((model_key, record_id) for record_id, _ in pending)
+        if not pending:
+            return None
+        thread = threading.Thread(target=self.warm, args=(rag_service, pending), daemon=True)
+        thread.start()
+        return thread
+
+    def _cached_candidates(self, rag_service, records: List[QARecord]) -> List[Tuple[QARecord, List[float]]]:
+        """返回已缓存向量的候选记录，未缓存的交给后台预热"""
+        model_key = self._model_key(rag_service)
+        cached, missing = [], []
+        for record in records:
+            vector = self._question_embeddings.get((model_key, record.id))
+            if vector is None:
+                missing.append((record.id, record.question))
+            else:
+                cached.append((record, vector))
+        if missing:
+            self.schedule_warm(rag_service, missing)
+        return cached
+
+    def lookup(
+        self,
+        db: Session,
+        rag_service,
+        question: str,
+        collection_name: str,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        查找可复用的历史答案
+
+        Args:
+            db: 数据库会话
+            rag_service: RAGService 实例（提供问题向量）
+            question: 用户问题
+            collection_name: 集合名称
+
+        Returns:
+            命中时返回 {"answer", "sources", "source_qa_record_id", "distance"}，否则返回 None
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            records = self._load_candidates(db, collection_name)
+            if not records:
+                self._record(collection_name, "bypass", "no_candidate")
+                return None
+
+            candidates = self._cached_candidates(rag_service, records)
+            if not candidates:
+                self._record(collection_name, "bypass", "warming")
+                return None
+
+            query_embedding = rag_service._embed_query(question)
+            best_record, best_distance = None, None
+            for record, vector in candidates:
+                distance = cosine_distance(query_embedding, vector)
+                if best_distance is None or distance < best_distance:
+                    best_record, best_distance = record, distance
+
+            if best_distance is None or best_distance > settings.RAG_ANSWER_CACHE_MAX_DISTANCE:
+                self._record(collection_name, "bypass", "distance")
+                return None
+
+            try:
+                sources = json.loads(best_record.sources) if best_record.sources else []
+            except (json.JSONDecodeError, ValueError):
+                sources = []
+
+            self._record(collection_name, "hit")
+            print(
+                f"[INFO] 命中语义答案缓存: collection={collection_name}, "
+                f"qa_record_id={best_record.id}, distance={best_distance:.4f}"
+            )
+            return {
+                "answer": best_record.answer,
+                "sources": sources,
+                "source_qa_record_id": best_record.id,
+                "distance": best_distance,
+            }
+        except Exception as e:
+            print(f"[WARNING] 语义答案缓存查询失败，回退到正常问答: {e}")
+            self._record(collection_name, "bypass", "error")
+            return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "collections": json.loads(json.dumps(self._stats)),
+                "question_embeddings": self._question_embeddings.stats(),
+                "warming": len(self._warming),
+            }
+
+
+semantic_answer_cache = SemanticAnswerCache()
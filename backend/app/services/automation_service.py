@@ -1,8 +1,10 @@
 """自动化测试平台服务"""
+import contextvars
 import requests
 import json
 from typing import Dict, Any, Optional, List
 from app.core.config import settings
+from app.services.llm_telemetry import llm_feature
 
 
 class AutomationPlatformService:
@@ -146,6 +148,7 @@ class AutomationPlatformService:
         except requests.RequestException as e:
             raise Exception(f"获取场景列表失败: {str(e)}")
 
+    @llm_feature("match_scenario")
     def match_scenario_by_ai(
         self,
         test_case_info: Dict[str, Any],
@@ -203,10 +206,10 @@ class AutomationPlatformService:
             print(f"[INFO] 使用AI匹配场景（超时限制60秒）...")
 
             def call_ai():
-                return ai_service.llm.invoke(prompt)
+                return ai_service.invoke_llm(prompt)
 
             with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(call_ai)
+                future = executor.submit(contextvars.copy_context().run, call_ai)
                 try:
                     response = future.result(timeout=160)
                     selected_id = response.content.strip()
@@ -333,6 +336,7 @@ class AutomationPlatformService:
         except requests.RequestException as e:
             raise Exception(f"获取用例详情失败: {str(e)}")
     
+    @llm_feature("select_case")
     def select_best_case_by_ai(
         self,
         test_case_info: Dict[str, Any],
@@ -395,10 +399,10 @@ class AutomationPlatformService:
 
             # 使用线程池和超时机制调用AI
             def call_ai():
-                return ai_service.llm.invoke(prompt)
+                return ai_service.invoke_llm(prompt)
 
             with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(call_ai)
+                future = executor.submit(contextvars.copy_context().run, call_ai)
                 try:
                     # 600秒超时
                     response = future.result(timeout=600)
@@ -657,6 +661,7 @@ class AutomationPlatformService:
 
         return field_text or fallback_text
 
+    @llm_feature("generate_case_body")
     def generate_case_body_by_ai(
         self,
         header_fields: List[Dict[str, Any]],
@@ -905,7 +910,8 @@ class AutomationPlatformService:
 
             agent_start = _time.time()
             with ThreadPoolExecutor(max_workers=1) as executor:
-                future = executor.submit(call_agent)
+                # 在当前上下文的副本中执行，工具才能读到本次调用设置的元数据
+                future = executor.submit(contextvars.copy_context().run, call_agent)
                 try:
                     result = future.result(timeout=600)  # 600秒超时
                     elapsed = _time.time() - agent_start
@@ -1114,7 +1120,7 @@ class AutomationPlatformService:
 只返回JSON数组。"""
 
             print("[INFO] 降级模式: 直接调用 LLM 生成测试数据")
-            response = ai_service.llm.invoke(prompt)
+            response = ai_service.invoke_llm(prompt)
             content = getattr(response, 'content', str(response))
 
             # 简化解析
@@ -1150,6 +1156,7 @@ class AutomationPlatformService:
 
         return []
 
+    @llm_feature("generate_case_body")
     def generate_case_body_by_ai_v2(
         self,
         header_fields: List[Dict],
@@ -1339,7 +1346,7 @@ class AutomationPlatformService:
             print(f"[DEBUG] 字段数: {len(header_fields)}, 枚举约束: {len(field_metadata.get('fields', [])) if field_metadata else 0}, 联动规则: {len(linkage_rules) if linkage_rules else 0}")
 
             # 调用AI
-            response = ai_service.llm.invoke(prompt)
+            response = ai_service.invoke_llm(prompt)
             response_str = getattr(response, "content", None)
             if response_str is None:
                 response_str = str(response)
@@ -1603,12 +1610,9 @@ def get_automation_service(db=None) -> Optional[AutomationPlatformService]:
         api_base = None
         if db:
             try:
-                from app.models.system_config import SystemConfig
-                config = db.query(SystemConfig).filter(
-                    SystemConfig.config_key == "AUTOMATION_PLATFORM_API_BASE"
-                ).first()
-                if config and config.config_value:
-                    api_base = config.config_value
+                from app.services.system_config_cache import system_config_cache
+                api_base = system_config_cache.get("AUTOMATION_PLATFORM_API_BASE") or None
+                if api_base:
                     print(f"[INFO] 从数据库读取自动化平台API地址: {api_base}")
             except Exception as e:
                 print(f"[WARNING] 从数据库读取自动化平台配置失败: {e}")
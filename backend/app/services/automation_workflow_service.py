@@ -13,6 +13,7 @@ import requests
 from app.core.config import settings
 from .automation_service import get_automation_service
 from .body_validator import BodyValidator
+from .llm_telemetry import bind_llm_call_context
 
 
 # 定义状态类型
@@ -311,16 +312,14 @@ class AutomationWorkflowService:
             }
 
         try:
-            from app.models.system_config import SystemConfig
+            from app.services.system_config_cache import system_config_cache
 
             # 优先读取新键 AUTOMATION_PLATFORM_MODULE_ID，兼容旧键 default_module_id
-            configs = self.db.query(SystemConfig).filter(
-                SystemConfig.config_key.in_(["AUTOMATION_PLATFORM_MODULE_ID", "default_module_id"])
-            ).all()
+            configs = system_config_cache.get_many(["AUTOMATION_PLATFORM_MODULE_ID", "default_module_id"])
             config_map = {
-                c.config_key: str(c.config_value).strip()
-                for c in configs
-                if c.config_value is not None and str(c.config_value).strip()
+                key: str(value).strip()
+                for key, value in configs.items()
+                if value is not None and str(value).strip()
             }
             module_id = config_map.get("AUTOMATION_PLATFORM_MODULE_ID") or config_map.get("default_module_id")
 
@@ -778,6 +777,7 @@ class AutomationWorkflowService:
         print(f"[工作流] 启动工作流，线程ID: {thread_id}")
 
         config = {"configurable": {"thread_id": thread_id}}
+        bind_llm_call_context("automation_workflow", thread_id=thread_id)
 
         # 初始化状态
         state = {
@@ -857,6 +857,7 @@ class AutomationWorkflowService:
         print(f"[工作流] 恢复工作流执行: {review_status}")
 
         config = {"configurable": {"thread_id": thread_id}}
+        bind_llm_call_context("automation_workflow", thread_id=thread_id)
 
         # 构建人工审核结果
         human_response = {
@@ -0,0 +1,198 @@
+"""
+多轮对话历史压缩
+最近 N 轮对话原样保留，更早的对话折叠为滚动摘要；摘要按历史前缀缓存并增量更新，
+按模型限制历史部分的 token 预算，并统计每次请求节省的 token 数。
+"""
+import hashlib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from app.core.config import settings
+from app.services.query_cache import LRUCache
+
+_CJK_PATTERN = re.compile(r"[一-鿿㐀-䶿　-〿＀-￯]")
+
+SUMMARY_PREFIX = "以下是此前对话的摘要，请结合它理解用户的问题：\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：中日韩字符按 1 个 token，其余字符约 4 个折合 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """估算消息列表的 token 数（每条消息额外计 4 个 token 的格式开销）"""
+    return sum(estimate_tokens(str(message.content)) + 4 for message in messages)
+
+
+def _chain_hash(previous: str, message: BaseMessage) -> str:
+    payload = f"{previous}|{message.type}|{message.content}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CompactionPlan:
+    """一次压缩的计划：哪些消息需要（增量）摘要、哪些原样保留"""
+    original_tokens: int
+    recent: List[BaseMessage]
+    older: List[BaseMessage] = field(default_factory=list)
+    # 已缓存摘要覆盖的前缀长度及摘要内容
+    cached_prefix: int = 0
+    cached_summary: Optional[str] = None
+    prefix_hashes: List[str] = field(default_factory=list)
+
+    @property
+    def needs_summary(self) -> bool:
+        return len(self.older) > self.cached_prefix
+
+
+class ChatHistoryManager:
+    """对话历史管理：按 token 预算压缩历史消息"""
+
+    def __init__(self):
+        # 历史前缀哈希 -> 摘要
+        self._summaries = LRUCache(settings.RAG_HISTORY_SUMMARY_CACHE_SIZE)
+        self._stats = {"requests": 0, "compacted": 0, "tokens_saved": 0, "summary_calls": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def budget_for(model_name: Optional[str]) -> int:
+        """历史部分的 token 预算（按模型覆盖，未配置时使用默认值）"""
+        return settings.rag_history_model_budgets.get(model_name or "", settings.RAG_HISTORY_TOKEN_BUDGET)
+
+    def plan(self, messages: List[BaseMessage], model_name: Optional[str] = None) -> CompactionPlan:
+        """计算压缩计划；历史未超预算时不做任何摘要"""
+        original_tokens = count_message_tokens(messages)
+        budget = self.budget_for(model_name)
+        if original_tokens <= budget:
+            return CompactionPlan(original_tokens=original_tokens, recent=list(messages))
+
+        keep = max(settings.RAG_HISTORY_KEEP_TURNS, 1) * 2
+        # 保留的最近消息仍超预算时逐轮减少，至少保留最后一轮
+        while keep > 2 and count_message_tokens(messages[-keep:]) > budget * 3 // 4:
+            keep -= 2
+        older, recent = list(messages[:-keep]), list(messages[-keep:])
+
+        prefix_hashes: List[str] = []
+        current = ""
+        for message in older:
+            current = _chain_hash(current, message)
+            prefix_hashes.append(current)
+
+        # 找到已缓存摘要的最长历史前缀，只对新增部分增量摘要
+        cached_prefix, cached_summary = 0, None
+        for length in range(len(prefix_hashes), 0, -1):
+            summary = self._summaries.get(prefix_hashes[length - 1])
+            if summary is not None:
+                cached_prefix, cached_summary = length, summary
+                break
+
+        return CompactionPlan(
+            original_tokens=original_tokens,
+            recent=recent,
+            older=older,
+            cached_prefix=cached_prefix,
+            cached_summary=cached_summary,
+            prefix_hashes=prefix_hashes,
+        )
+
+    @staticmethod
+    def summary_messages(plan: CompactionPlan) -> List[BaseMessage]:
+        """构建（增量）摘要请求"""
+        new_messages = plan.older[plan.cached_prefix:]
+        transcript = "\n".join(
+            f"{'用户' if message.type == 'human' else '助手'}: {message.content}"
+            for message in new_messages
+        )
+        previous = plan.cached_summary or "（无）"
+        return [
+            SystemMessage(content=(
+                "你负责压缩保险知识库问答的对话历史。请在已有摘要的基础上合并新增对话，"
+                "输出一段简洁的中文摘要，保留用户关注的产品、条款编号、字段名、数值与已得出的结论，"
+                f"不超过 {settings.RAG_HISTORY_SUMMARY_MAX_CHARS} 字。只输出摘要内容。"
+            )),
+            HumanMessage(content=f"已有摘要:\n{previous}\n\n新增对话:\n{transcript}"),
+        ]
+
+    def finish(self, plan: CompactionPlan, summary: Optional[str]) -> Tuple[List[BaseMessage], Dict[str, Any]]:
+        """
+        组装压缩后的历史并记录统计
+
+        Args:
+            plan: 压缩计划
+            summary: 摘要文本；为空表示无可用摘要，此时仅保留最近对话
+
+        Returns:
+            (压缩后的消息列表, 本次统计)
+        """
+        if summary:
+            messages = [SystemMessage(content=SUMMARY_PREFIX + summary)] + plan.recent
+        else:
+            messages = plan.recent
+
+        compacted_tokens = count_message_tokens(messages)
+        usage = {
+            "original_tokens": plan.original_tokens,
+            "compacted_tokens": compacted_tokens,
+            "tokens_saved": max(plan.original_tokens - compacted_tokens, 0),
+            "summarized_messages": len(plan.older),
+        }
+        with self._lock:
+            self._stats["requests"] += 1
+            if plan.older:
+                self._stats["compacted"] += 1
+            self._stats["tokens_saved"] += usage["tokens_saved"]
+        if plan.older:
+            print(
+                f"[INFO] 对话历史已压缩: {plan.original_tokens} -> {compacted_tokens} tokens, "
+                f"摘要 {len(plan.older)} 条消息"
+            )
+        return messages, usage
+
+    def _record_summary(self, plan: CompactionPlan, summary: str):
+        """缓存覆盖全部早期消息的新摘要，供下一轮增量更新"""
+        self._summaries.set(plan.prefix_hashes[-1], summary)
+        with self._lock:
+            self._stats["summary_calls"] += 1
+
+    def compact(self, llm, messages: List[BaseMessage], model_name: Optional[str] = None):
+        """同步压缩对话历史，返回 (消息列表, 统计)"""
+        plan = self.plan(messages, model_name)
+        summary = plan.cached_summary
+        if plan.needs_summary:
+            try:
+                summary = str(llm.invoke(self.summary_messages(plan)).content).strip()
+                self._record_summary(plan, summary)
+            except Exception as e:
+                print(f"[WARNING] 对话历史摘要失败，沿用已缓存摘要: {e}")
+                summary = plan.cached_summary
+        return self.finish(plan, summary)
+
+    async def acompact(self, llm, messages: List[BaseMessage], model_name: Optional[str] = None):
+        """异步压缩对话历史，返回 (消息列表, 统计)"""
+        plan = self.plan(messages, model_name)
+        summary = plan.cached_summary
+        if plan.needs_summary:
+            try:
+                summary = str((await llm.ainvoke(self.summary_messages(plan))).content).strip()
+                self._record_summary(plan, summary)
+            except Exception as e:
+                print(f"[WARNING] 对话历史摘要失败，沿用已缓存摘要: {e}")
+                summary = plan.cached_summary
+        return self.finish(plan, summary)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["summary_cache"] = self._summaries.stats()
+        return stats
+
+
+chat_history_manager = ChatHistoryManager()
@@ -0,0 +1,227 @@
+"""
+向量集合路由
+逻辑集合名（knowledge_base、test_cases 等）映射到实际读取的物理集合及其 Embedding 模型。
+Embedding 模型变更后，读取继续走旧集合与旧模型，直到重建任务完成后原子切换；
+重建期间新写入同时双写到影子集合。
+
+路由持久化在 system_configs 表，双写目标即未结束的重建任务（vector_reindex_jobs），双写失败记录在
+vector_reindex_shadow_failures 表。变更提交后递增系统配置共享版本号，各 worker 在下一次版本检查时
+重新加载路由与双写状态；切换前尚未刷新的 worker 仍按旧路由读取并继续双写到新集合，不会丢失写入。
+"""
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.system_config import SystemConfig
+from app.models.vector_reindex_job import VectorReindexJob, VectorReindexShadowFailure
+from app.services.system_config_cache import system_config_cache
+
+ROUTES_CONFIG_KEY = "VECTOR_COLLECTION_ROUTES"
+# 未结束的重建任务（其影子集合处于双写状态）
+ACTIVE_JOB_STATUSES = ("pending", "running", "paused", "failed")
+
+# routes: 逻辑集合 -> {"collection", "embedding_model"}
+# shadow_targets: 逻辑集合 -> 正在重建的影子集合 {"collection", "embedding_model", "job_id"}
+# generation: 配置重新加载次数；loaded_generation 与之不同时，下次读取前从数据库重新加载
+_state: Dict[str, Any] = {"routes": {}, "shadow_targets": {}, "generation": 0, "loaded_generation": -1}
+_routes_lock = threading.Lock()
+
+
+def _parse_routes(value: Optional[str]) -> Dict[str, Dict[str, str]]:
+    if not value:
+        return {}
+    try:
+        return json.loads(value) or {}
+    except (json.JSONDecodeError, ValueError):
+        print(f"[WARNING] {ROUTES_CONFIG_KEY} 配置格式错误，忽略集合路由")
+        return {}
+
+
+def _read_routes(db: Session) -> Dict[str, Dict[str, str]]:
+    config = db.query(SystemConfig).filter(SystemConfig.config_key == ROUTES_CONFIG_KEY).first()
+    return _parse_routes(config.config_value if config else None)
+
+
+def _write_routes(db: Session, routes: Dict[str, Dict[str, str]]):
+    config = db.query(SystemConfig).filter(SystemConfig.config_key == ROUTES_CONFIG_KEY).first()
+    value = json.dumps(routes, ensure_ascii=False, sort_keys=True)
+    if config is None:
+        db.add(SystemConfig(
+            config_key=ROUTES_CONFIG_KEY,
+            config_value=value,
+            description="向量集合路由（逻辑集合 -> 物理集合与 Embedding 模型）",
+        ))
+    else:
+        config.config_value = value
+
+
+def _read_shadow_targets(db: Session) -> Dict[str, Dict[str, Any]]:
+    jobs = db.query(VectorReindexJob).filter(VectorReindexJob.status.in_(ACTIVE_JOB_STATUSES)).all()
+    return {
+        job.collection_name: {
+            "collection": job.target_collection,
+            "embedding_model": job.target_model,
+            "job_id": job.id,
+        }
+        for job in jobs
+    }
+
+
+def _mark_stale():
+    """系统配置快照重新加载（共享版本号变化）后，下次读取前重新加载路由与双写状态"""
+    with _routes_lock:
+        _state["generation"] += 1
+
+
+system_config_cache.add_reload_hook(_mark_stale)
+
+
+def _sync():
+    """按共享版本号同步路由与双写状态（版本未变化时只读内存）"""
+    raw_routes = system_config_cache.get(ROUTES_CONFIG_KEY)
+    with _routes_lock:
+        generation = _state["generation"]
+        if generation == _state["loaded_generation"]:
+            return
+    db = SessionLocal()
+    try:
+        shadow_targets = _read_shadow_targets(db)
+    except Exception as e:
+        # 保留已有状态，下次读取时重试
+        print(f"[WARNING] 加载向量重建双写状态失败: {e}")
+        return
+    finally:
+        db.close()
+    routes = _parse_routes(raw_routes)
+    with _routes_lock:
+        _state["routes"] = routes
+        _state["shadow_targets"] = shadow_targets
+        if _state["generation"] == generation:
+            _state["loaded_generation"] = generation
+
+
+def notify_collection_state_changed():
+    """路由或重建任务状态提交后调用：递增共享版本号，所有 worker 重新加载路由与双写状态"""
+    system_config_cache.invalidate()
+
+
+def load_collection_routes(db: Optional[Session] = None):
+    """立即从数据库重新加载集合路由与双写状态（启动时调用）"""
+    _mark_stale()
+    _sync()
+    with _routes_lock:
+        routes = dict(_state["routes"])
+    if routes:
+        print(f"[INFO] 已加载向量集合路由: {routes}")
+
+
+def resolve_collection(collection_name: str, default_model: str) -> Tuple[str, str]:
+    """
+    解析逻辑集合当前读写的物理集合与 Embedding 模型
+
+    Args:
+        collection_name: 逻辑集合名称
+        default_model: 未配置路由时使用的模型（当前 Embedding 配置）
+
+    Returns:
+        (物理集合名称, Embedding 模型)
+    """
+    _sync()
+    with _routes_lock:
+        route = _state["routes"].get(collection_name)
+    if not route:
+        return collection_name, default_model
+    return route["collection"], route.get("embedding_model") or default_model
+
+
+def pin_collection_models(db: Session, collection_names: Iterable[str], embedding_model: str) -> List[str]:
+    """
+    Embedding 模型变更前，为尚无路由的集合记录其构建时的模型，保证切换前读取不受影响
+
+    Returns:
+        新记录路由的集合名称
+    """
+    routes = _read_routes(db)
+    pinned = []
+    for name in collection_names:
+        if name and name not in routes:
+            routes[name] = {"collection": name, "embedding_model": embedding_model}
+            pinned.append(name)
+    if not pinned:
+        return []
+    _write_routes(db, routes)
+    db.commit()
+    notify_collection_state_changed()
+    print(f"[INFO] 集合 {pinned} 继续使用 Embedding 模型 {embedding_model}，等待重建")
+    return pinned
+
+
+def switch_collection_route(db: Session, collection_name: str, target_collection: str, embedding_model: str):
+    """
+    原子切换逻辑集合的读取目标
+
+    新路由与调用方在同一会话中的变更（重建任务结束，即停止双写）在同一事务中提交，
+    随后递增共享版本号；各 worker 在下一次版本检查时同时切换读取并停止双写。
+    """
+    routes = _read_routes(db)
+    routes[collection_name] = {"collection": target_collection, "embedding_model": embedding_model}
+    try:
+        _write_routes(db, routes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    notify_collection_state_changed()
+    print(f"[INFO] 集合 {collection_name} 已切换到 {target_collection} (model={embedding_model})")
+
+
+def get_shadow_target(collection_name: str) -> Optional[Dict[str, Any]]:
+    _sync()
+    with _routes_lock:
+        target = _state["shadow_targets"].get(collection_name)
+        return dict(target) if target else None
+
+
+def record_shadow_write_failure(collection_name: str, item_id: int):
+    """记录双写失败的源记录，重建任务切换前补写（使用独立会话）"""
+    shadow = get_shadow_target(collection_name)
+    if not shadow:
+        return
+    db = SessionLocal()
+    try:
+        db.add(VectorReindexShadowFailure(job_id=shadow["job_id"], item_id=int(item_id)))
+        db.commit()
+    except IntegrityError:
+        # 已记录过
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(f"[WARNING] 记录双写失败项失败: collection={collection_name}, item_id={item_id}, {e}")
+    finally:
+        db.close()
+
+
+def shadow_write_failures(db: Session, job_id: int) -> List[int]:
+    """重建任务的双写失败记录（补写成功后调用 clear_shadow_write_failures 删除）"""
+    rows = db.query(VectorReindexShadowFailure.item_id).filter(VectorReindexShadowFailure.job_id == job_id).all()
+    return sorted(item_id for (item_id,) in rows)
+
+
+def clear_shadow_write_failures(db: Session, job_id: int, item_ids: List[int]):
+    if item_ids:
+        db.query(VectorReindexShadowFailure).filter(
+            VectorReindexShadowFailure.job_id == job_id,
+            VectorReindexShadowFailure.item_id.in_(item_ids),
+        ).delete(synchronize_session=False)
+
+
+def clear_collection_routes_cache():
+    """清除内存中的路由与双写状态，下次读取时重新加载（测试使用）"""
+    with _routes_lock:
+        _state["routes"] = {}
+        _state["shadow_targets"] = {}
+        _state["generation"] += 1
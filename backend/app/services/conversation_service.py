@@ -0,0 +1,139 @@
+"""
+知识库多轮对话会话服务
+对话历史由服务端持久化（conversation_sessions / conversation_messages），
+并在内存中缓存热点会话，客户端每轮只需携带 session_id。
+"""
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.knowledge_base import ConversationMessage, ConversationSession
+from app.services.query_cache import LRUCache
+
+
+class ConversationStore:
+    """对话会话存储（数据库 + 内存热缓存）"""
+
+    def __init__(self):
+        # session_id -> {"user_id", "collection_name", "title", "messages": [{"role", "content"}]}
+        self._hot = LRUCache(settings.RAG_SESSION_CACHE_SIZE, ttl_seconds=settings.RAG_SESSION_CACHE_TTL)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _snapshot(session: ConversationSession) -> Dict[str, Any]:
+        return {
+            "user_id": session.user_id,
+            "collection_name": session.collection_name,
+            "title": session.title,
+            "messages": [
+                {"role": message.role, "content": message.content}
+                for message in session.messages
+            ],
+        }
+
+    def create(
+        self,
+        db: Session,
+        user_id: int,
+        collection_name: str = "knowledge_base",
+        title: Optional[str] = None,
+    ) -> ConversationSession:
+        """创建会话"""
+        session = ConversationSession(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            collection_name=collection_name,
+            title=title,
+            message_count=0,
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+        self._hot.set(session.id, self._snapshot(session))
+        return session
+
+    def _load(self, db: Session, session_id: str) -> Optional[Dict[str, Any]]:
+        snapshot = self._hot.get(session_id)
+        if snapshot is None:
+            session = db.query(ConversationSession).filter(ConversationSession.id == session_id).first()
+            if session is None:
+                return None
+            snapshot = self._snapshot(session)
+            self._hot.set(session_id, snapshot)
+        return snapshot
+
+    def get_history(self, db: Session, session_id: str, user_id: int) -> Optional[List[Dict[str, str]]]:
+        """
+        获取会话历史
+
+        Returns:
+            [{"role", "content"}, ...]；会话不存在或不属于该用户时返回 None
+        """
+        snapshot = self._load(db, session_id)
+        if snapshot is None or snapshot["user_id"] != user_id:
+            return None
+        with self._lock:
+            return list(snapshot["messages"])
+
+    def append_turn(
+        self,
+        db: Session,
+        session_id: str,
+        question: str,
+        answer: str,
+        qa_record_id: Optional[int] = None,
+    ):
+        """追加一轮问答（用户问题 + 助手回答）"""
+        session = db.query(ConversationSession).filter(ConversationSession.id == session_id).first()
+        if session is None:
+            return
+        db.add(ConversationMessage(session_id=session_id, role="user", content=question))
+        db.add(ConversationMessage(
+            session_id=session_id, role="assistant", content=answer, qa_record_id=qa_record_id
+        ))
+        session.message_count = (session.message_count or 0) + 2
+        if not session.title:
+            session.title = question[:100]
+        db.commit()
+
+        snapshot = self._hot.get(session_id)
+        if snapshot is not None:
+            with self._lock:
+                snapshot["messages"].extend([
+                    {"role": "user", "content": question},
+                    {"role": "assistant", "content": answer},
+                ])
+                snapshot["title"] = session.title
+
+    def delete(self, db: Session, session_id: str, user_id: int) -> bool:
+        """删除会话及其消息"""
+        session = db.query(ConversationSession).filter(
+            ConversationSession.id == session_id,
+            ConversationSession.user_id == user_id,
+        ).first()
+        if session is None:
+            return False
+        db.delete(session)
+        db.commit()
+        self._hot.discard_where(lambda key: key == session_id)
+        return True
+
+    def list_sessions(self, db: Session, user_id: int, skip: int = 0, limit: int = 50) -> List[ConversationSession]:
+        """按最后活跃时间倒序列出用户会话"""
+        return (
+            db.query(ConversationSession)
+            .filter(ConversationSession.user_id == user_id)
+            .order_by(ConversationSession.updated_at.desc())
+            .offset(skip)
+            .limit(limit)
+            .all()
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return self._hot.stats()
+
+
+conversation_store = ConversationStore()
@@ -6,7 +6,10 @@ from httpx import HTTPStatusError
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from app.core.config import settings
-from app.services.milvus_service import milvus_service
+from app.services.chat_history import estimate_tokens
+from app.services.collection_routes import get_shadow_target, record_shadow_write_failure
+from app.services.llm_telemetry import CALL_TYPE_EMBEDDING, track_llm_call
+from app.services.milvus_service import MilvusService, milvus_service
 
 
 class DocumentEmbeddingService:
@@ -90,24 +93,34 @@ class DocumentEmbeddingService:
         )
         return context
 
-    def _fetch_embeddings(self, batch: List[str]) -> List[List[float]]:
+    def _fetch_embeddings(self, batch: List[str], model_name: Optional[str] = None) -> List[List[float]]:
         headers = {
             "Authorization": f"Bearer {settings.EMBEDDING_API_KEY}",
             "Content-Type": "application/json",
         }
         payload = {
-            "model": self.model_name,
+            "model": model_name or self.model_name,
             "input": batch,
         }
-        response = httpx.post(self.api_url, headers=headers, json=payload, timeout=60)
-        response.raise_for_status()
-        body = response.json()
+        with track_llm_call(
+            CALL_TYPE_EMBEDDING,
+            model_name=payload["model"],
+            prompt_tokens=sum(estimate_tokens(text) for text in batch),
+        ) as usage:
+            response = httpx.post(self.api_url, headers=headers, json=payload, timeout=60)
+            response.raise_for_status()
+            body = response.json()
+            usage["prompt_tokens"] = (body.get("usage") or {}).get("prompt_tokens")
         data = body.get("data", [])
         embeddings = [item.get("embedding", []) for item in data]
         if len(embeddings) != len(batch):
             raise ValueError("硅基流动返回的向量数量与输入不一致")
         return embeddings
 
+    def embed_query(self, text: str, model_name: Optional[str] = None) -> List[float]:
+        """嵌入单条查询文本"""
+        return self._fetch_embeddings([text], model_name)[0]
+
     def _split_large_chunk(self, chunk: str) -> List[str]:
         target_size = max(self._min_single_chunk, 100)
         if len(chunk) <= target_size:
@@ -129,7 +142,8 @@ class DocumentEmbeddingService:
         )
         return pieces
 
-    def _embed_chunks(self, chunks: List[str]) -> List[List[float]]:
+    def _embed_chunks(self, chunks: List[str], model_name: Optional[str] = None) -> List[List[float]]:
+        """分批嵌入；单段超限时会原地拆分 chunks，调用方应使用拆分后的 chunks"""
         embeddings: List[List[float]] = []
         idx = 0
         batch_id = 1
@@ -142,7 +156,7 @@ class DocumentEmbeddingService:
                 f"[EMBED] 批次 {batch_id}: 处理段 {idx}-{end - 1}（本批 {len(batch)} 段）"
             )
             try:
-                batch_embeddings = self._fetch_embeddings(batch)
+                batch_embeddings = self._fetch_embeddings(batch, model_name)
             except HTTPStatusError as exc:
                 status = exc.response.status_code
                 if status == 413:
@@ -188,7 +202,7 @@ class DocumentEmbeddingService:
 
         self._log_configuration(len(chunks))
 
-        embeddings = self._embed_chunks(chunks)
+        embeddings = self._embed_chunks(chunks, milvus_service.embedding_model)
         if not embeddings:
             print("[EMBED] 嵌入结果为空，跳过写入")
             return 0
@@ -201,7 +215,30 @@ class DocumentEmbeddingService:
         milvus_service.insert_batch(requirement_id, chunks, embeddings, chunk_indices)
         print("[EMBED] 写入 Milvus 完成")
 
+        self._write_shadow(requirement_id, chunks)
+
         return len(embeddings)
 
+    def embed_and_store(self, collection: MilvusService, model_name: str, requirement_id: int, chunks: List[str]) -> int:
+        """使用指定模型嵌入并写入指定集合（双写与重建回填使用），返回写入条数"""
+        chunks = list(chunks)
+        embeddings = self._embed_chunks(chunks, model_name)
+        if not embeddings:
+            return 0
+        collection.insert_batch(requirement_id, chunks, embeddings, list(range(len(chunks))))
+        return len(embeddings)
+
+    def _write_shadow(self, requirement_id: int, chunks: List[str]):
+        """重建期间双写影子集合（失败时记录，由重建任务切换前补写）"""
+        shadow = get_shadow_target(settings.MILVUS_COLLECTION_NAME)
+        if not shadow:
+            return
+        try:
+            self.embed_and_store(MilvusService(shadow["collection"]), shadow["embedding_model"], requirement_id, chunks)
+            print(f"[EMBED] 已双写影子集合 {shadow['collection']}")
+        except Exception as exc:
+            print(f"[WARNING] 双写影子集合 {shadow['collection']} 失败，等待重建任务补写: {exc}")
+            record_shadow_write_failure(settings.MILVUS_COLLECTION_NAME, requirement_id)
+
 
 document_embedding_service = DocumentEmbeddingService()
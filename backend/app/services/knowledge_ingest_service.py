@@ -0,0 +1,246 @@
+"""
+知识库批量导入服务
+批量上传的文档先落盘并创建记录，随后在后台用有界线程池并行完成解析、分块与向量化，
+每个文档完成后立即更新 is_vectorized / chunk_count（失败时记录 ingest_error），并通过 WebSocket 推送任务进度。
+任务进度存于 knowledge_ingest_jobs 表，任意 worker 均可查询。
+"""
+import asyncio
+import json
+import os
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge_base import KnowledgeDocument, KnowledgeIngestJob
+from app.services.document_parser import DocumentParser
+from app.services.websocket_service import manager
+
+SUPPORTED_EXTENSIONS = {"docx", "pdf", "txt", "xls", "xlsx"}
+
+def file_extension(file_name: str) -> str:
+    return os.path.splitext(file_name or "")[1].lstrip(".").lower()
+
+
+def extract_zip(zip_path: Path, target_dir: Path) -> List[Tuple[str, Path]]:
+    """
+    解压 zip 中受支持的文档（只取文件名，防止路径穿越）
+
+    Returns:
+        [(原始文件名, 解压后路径), ...]
+    """
+    extracted = []
+    with zipfile.ZipFile(zip_path) as archive:
+        for index, info in enumerate(archive.infolist()):
+            if info.is_dir():
+                continue
+            name = os.path.basename(info.filename)
+            if not name or file_extension(name) not in SUPPORTED_EXTENSIONS:
+                continue
+            if info.file_size > settings.MAX_UPLOAD_SIZE:
+                print(f"[WARNING] 跳过超出大小限制的文件: {info.filename}")
+                continue
+            target = target_dir / f"{zip_path.stem}_{index}_{name}"
+            with archive.open(info) as source, open(target, "wb") as dest:
+                while True:
+                    block = source.read(1024 * 1024)
+                    if not block:
+                        break
+                    dest.write(block)
+            extracted.append((name, target))
+    return extracted
+
+
+def create_ingest_job(user_id: int, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """登记导入任务并关联文档，documents: [{"document_id", "title"}, ...]"""
+    job_id = uuid.uuid4().hex
+    document_ids = [doc["document_id"] for doc in documents]
+    db = SessionLocal()
+    try:
+        db.add(KnowledgeIngestJob(id=job_id, user_id=user_id, status="pending", total=len(documents)))
+        db.query(KnowledgeDocument).filter(KnowledgeDocument.id.in_(document_ids)).update(
+            {KnowledgeDocument.ingest_job_id: job_id, KnowledgeDocument.ingest_error: None},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+    return get_ingest_job(job_id)
+
+
+def _document_status(document: KnowledgeDocument) -> str:
+    if document.ingest_error:
+        return "failed"
+    return "completed" if document.is_vectorized else "pending"
+
+
+def _job_snapshot(job: KnowledgeIngestJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "total": job.total,
+        "completed": job.completed,
+        "failed": job.failed,
+        "total_chunks": job.total_chunks,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def get_ingest_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """获取导入任务状态（任务与文档进度均存于数据库，任意 worker 均可查询）"""
+    db = SessionLocal()
+    try:
+        job = db.query(KnowledgeIngestJob).filter(KnowledgeIngestJob.id == job_id).first()
+        if job is None:
+            return None
+        snapshot = _job_snapshot(job)
+        documents = (
+            db.query(KnowledgeDocument)
+            .filter(KnowledgeDocument.ingest_job_id == job_id)
+            .order_by(KnowledgeDocument.id)
+            .all()
+        )
+        snapshot["documents"] = [
+            {
+                "document_id": document.id,
+                "title": document.title,
+                "status": _document_status(document),
+                "chunk_count": document.chunk_count or 0,
+                "error": document.ingest_error,
+            }
+            for document in documents
+        ]
+        return snapshot
+    finally:
+        db.close()
+
+
+def _update_job(job_id: str, values: Dict[Any, Any]) -> Dict[str, Any]:
+    """更新任务计数（在数据库中原子累加），返回不含文档明细的任务快照"""
+    db = SessionLocal()
+    try:
+        db.query(KnowledgeIngestJob).filter(KnowledgeIngestJob.id == job_id).update(values, synchronize_session=False)
+        db.commit()
+        return _job_snapshot(db.query(KnowledgeIngestJob).filter(KnowledgeIngestJob.id == job_id).one())
+    finally:
+        db.close()
+
+
+def _notify(loop: Optional[asyncio.AbstractEventLoop], user_id: int, job: Dict[str, Any], message: str):
+    """从工作线程推送任务进度（不等待发送结果，避免拖慢导入）"""
+    if not loop:
+        return
+    finished = job["completed"] + job["failed"]
+    progress = int(finished / job["total"] * 100) if job["total"] else 100
+    notification = {
+        "type": "knowledge_ingest_progress",
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "progress": progress,
+        "completed": job["completed"],
+        "failed": job["failed"],
+        "total": job["total"],
+        "message": message,
+    }
+    try:
+        asyncio.run_coroutine_threadsafe(manager.send_personal_message(notification, user_id), loop)
+    except Exception as notify_error:
+        print(f"[WARNING] 发送知识库导入进度失败: {notify_error}")
+
+
+def _ingest_document(rag_service, document_id: int, file_type: str) -> int:
+    """解析并向量化单个文档，返回分块数（在工作线程中运行，使用独立会话）"""
+    db = SessionLocal()
+    try:
+        document = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
+        if document is None:
+            raise ValueError("文档记录不存在")
+
+        content = DocumentParser.parse(document.file_path, file_type)
+        if not content or not content.strip():
+            raise ValueError("文档解析失败，内容为空")
+        document.content = content
+        db.commit()
+
+        result = rag_service.add_documents(
+            documents=[content],
+            metadatas=[{
+                "document_id": document.id,
+                "title": document.title,
+                "category": document.category or "",
+                "tags": document.tags or "",
+            }],
+            collection_name=document.collection_name,
+        )
+        if not result["success"]:
+            raise RuntimeError(result.get("error", "向量化失败"))
+
+        document.is_vectorized = True
+        document.chunk_count = result["total_chunks"]
+        document.vector_ids = json.dumps(result["vector_ids"][0], default=str)
+        document.ingest_error = None
+        db.commit()
+        return result["total_chunks"]
+    except Exception as e:
+        db.rollback()
+        # 状态保持不变（仍出现在默认文档列表中），失败原因单独记录，便于查看与重试
+        document = db.query(KnowledgeDocument).filter(KnowledgeDocument.id == document_id).first()
+        if document is not None:
+            document.ingest_error = str(e) or type(e).__name__
+            db.commit()
+        raise
+    finally:
+        db.close()
+
+
+def run_ingest_job(
+    job_id: str,
+    rag_service,
+    items: List[Dict[str, Any]],
+    loop: Optional[asyncio.AbstractEventLoop] = None,
+):
+    """
+    执行批量导入任务（在线程池运行）
+
+    Args:
+        job_id: 任务ID
+        rag_service: RAGService 实例
+        items: [{"document_id", "file_type"}, ...]
+        loop: 事件循环，用于推送 WebSocket 进度
+    """
+    job = _update_job(job_id, {KnowledgeIngestJob.status: "processing"})
+    user_id = job["user_id"]
+    snapshot = job
+    print(f"[INFO] 开始知识库批量导入任务 {job_id}，共 {len(items)} 个文档")
+
+    workers = max(1, min(settings.KB_INGEST_WORKERS, len(items) or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kb-ingest") as executor:
+        futures = {
+            executor.submit(_ingest_document, rag_service, item["document_id"], item["file_type"]): item
+            for item in items
+        }
+        for future in as_completed(futures):
+            document_id = futures[future]["document_id"]
+            try:
+                chunk_count = future.result()
+                snapshot = _update_job(job_id, {
+                    KnowledgeIngestJob.completed: KnowledgeIngestJob.completed + 1,
+                    KnowledgeIngestJob.total_chunks: KnowledgeIngestJob.total_chunks + chunk_count,
+                })
+                message = f"文档 {document_id} 向量化完成，共 {chunk_count} 个文本块"
+            except Exception as e:
+                print(f"[ERROR] 导入文档失败 ID: {document_id}, 错误: {str(e)}")
+                snapshot = _update_job(job_id, {KnowledgeIngestJob.failed: KnowledgeIngestJob.failed + 1})
+                message = f"文档 {document_id} 导入失败: {str(e)}"
+            _notify(loop, user_id, snapshot, message)
+
+    status = "completed" if not snapshot["failed"] else ("failed" if not snapshot["completed"] else "partial")
+    snapshot = _update_job(job_id, {KnowledgeIngestJob.status: status, KnowledgeIngestJob.finished_at: datetime.now()})
+    _notify(loop, user_id, snapshot, f"批量导入结束：成功 {snapshot['completed']} 个，失败 {snapshot['failed']} 个")
+    print(f"[INFO] 知识库批量导入任务 {job_id} 结束: {snapshot['status']}")
@@ -0,0 +1,123 @@
+"""
+知识库向量清理服务
+删除或归档的知识库文档需要同步从 Milvus 中移除向量，避免继续被检索、占用 top_k 与 LLM 上下文。
+"""
+import json
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.knowledge_base import KnowledgeDocument
+
+INACTIVE_STATUSES = ("deleted", "archived")
+
+
+def load_vector_ids(document: KnowledgeDocument) -> Optional[List[Any]]:
+    """读取文档记录的向量主键列表"""
+    if not document.vector_ids:
+        return None
+    try:
+        return json.loads(document.vector_ids) or None
+    except (json.JSONDecodeError, ValueError):
+        return None
+
+
+def mark_vectors_removed(document: KnowledgeDocument):
+    """向量已删除后更新文档状态"""
+    document.is_vectorized = False
+    document.vector_ids = None
+
+
+def remove_document_vectors(db: Session, rag_service, document: KnowledgeDocument) -> bool:
+    """
+    删除单个文档的向量（失败时保留标记，由后台清理任务重试）
+
+    Returns:
+        是否删除成功
+    """
+    if not document.is_vectorized:
+        return True
+    try:
+        success = rag_service.delete_document_vectors(
+            [(document.id, load_vector_ids(document))],
+            collection_name=document.collection_name,
+        )
+    except Exception as e:
+        print(f"[WARNING] 删除文档向量失败，等待后台清理: document_id={document.id}, {e}")
+        return False
+    if success:
+        mark_vectors_removed(document)
+        db.commit()
+    return success
+
+
+def purge_inactive_document_vectors(
+    db: Session,
+    rag_service,
+    batch_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    分批清理已删除/已归档文档的向量，并对涉及的集合触发压缩
+
+    Args:
+        db: 数据库会话
+        rag_service: RAGService 实例
+        batch_size: 每批处理的文档数，默认读取 RAG_VECTOR_PURGE_BATCH_SIZE
+
+    Returns:
+        {"purged_documents", "failed_documents", "collections"}
+    """
+    batch_size = max(batch_size or settings.RAG_VECTOR_PURGE_BATCH_SIZE, 1)
+    purged, failed = 0, 0
+    collections = set()
+    last_id = 0
+
+    while True:
+        batch = (
+            db.query(KnowledgeDocument)
+            .filter(
+                KnowledgeDocument.status.in_(INACTIVE_STATUSES),
+                KnowledgeDocument.is_vectorized == True,
+                KnowledgeDocument.id > last_id,
+            )
+            .order_by(KnowledgeDocument.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        by_collection: Dict[str, List[KnowledgeDocument]] = defaultdict(list)
+        for document in batch:
+            by_collection[document.collection_name or "knowledge_base"].append(document)
+
+        for collection_name, documents in by_collection.items():
+            try:
+                success = rag_service.delete_document_vectors(
+                    [(document.id, load_vector_ids(document)) for document in documents],
+                    collection_name=collection_name,
+                )
+            except Exception as e:
+                print(f"[WARNING] 清理集合 {collection_name} 的向量失败: {e}")
+                success = False
+            if success:
+                for document in documents:
+                    mark_vectors_removed(document)
+                purged += len(documents)
+                collections.add(collection_name)
+            else:
+                failed += len(documents)
+        db.commit()
+
+    for collection_name in collections:
+        rag_service.compact_collection(collection_name)
+
+    print(f"[INFO] 向量清理完成: 清理 {purged} 个文档, 失败 {failed} 个, 集合 {sorted(collections)}")
+    return {
+        "purged_documents": purged,
+        "failed_documents": failed,
+        "collections": sorted(collections),
+    }
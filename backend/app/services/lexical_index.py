@@ -0,0 +1,316 @@
+"""
+知识库词法索引
+基于中文字符二元组 (bigram) 的倒排索引，使用 BM25 打分，
+用于补足向量检索对条款编号、产品代码、字段名（如 payintv）等精确词的召回。
+倒排项存于数据库（lexical_chunks / lexical_postings），所有 worker 共享；
+在 RAGService.add_documents / delete_document_vectors 中按文档增量写入与删除，BM25 打分在数据库中完成。
+"""
+import json
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from sqlalchemy import case, func, select
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.lexical_index import LexicalChunk, LexicalPosting
+from app.services.knowledge_vector_service import INACTIVE_STATUSES
+
+# 连续的中日韩字符 / 连续的字母数字（保留 . _ - 以完整匹配条款编号与字段名）
+_TOKEN_PATTERN = re.compile(r"[一-鿿㐀-䶿]+|[0-9a-z][0-9a-z._\-]*[0-9a-z]|[0-9a-z]")
+# 超长词项（如长串编码）不入索引，与 lexical_postings.term 列宽一致
+MAX_TERM_LENGTH = 200
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：中文按字符二元组切分，英文、数字与编号保持完整
+
+    Examples:
+        "犹豫期条款 payintv" -> ["犹豫", "豫期", "期条", "条款", "payintv"]
+    """
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer((text or "").casefold()):
+        run = match.group()
+        if "㐀" <= run[0] <= "鿿":
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def _document_key(doc: Document) -> str:
+    """同一文本块在向量检索与词法检索中的统一标识"""
+    metadata = doc.metadata or {}
+    if "document_id" in metadata and "chunk_index" in metadata:
+        return f"{metadata['document_id']}:{metadata['chunk_index']}"
+    return doc.page_content
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[Sequence[Document]],
+    k: int = 60,
+    limit: Optional[int] = None,
+) -> List[Document]:
+    """
+    倒数排名融合 (RRF)：score = Σ 1 / (k + rank)
+
+    Args:
+        result_lists: 各路检索结果（按相关度降序）
+        k: 平滑常数，越大则各路排名差异的影响越小
+        limit: 返回数量上限
+
+    Returns:
+        融合后的文档列表
+    """
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = _document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    ordered = sorted(scores, key=lambda key: scores[key], reverse=True)
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [docs[key] for key in ordered]
+
+
+class BM25Index:
+    """单个集合的 BM25 倒排索引（数据库存储，各操作使用独立会话）"""
+
+    def __init__(self, collection_name: str, k1: float = 1.5, b: float = 0.75):
+        self.collection_name = collection_name
+        self.k1 = k1
+        self.b = b
+
+    def __len__(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.count(LexicalChunk.id)).filter(
+                LexicalChunk.collection_name == self.collection_name
+            ).scalar() or 0
+        finally:
+            db.close()
+
+    @staticmethod
+    def _delete_documents(db, collection_name: str, document_ids: List[int]) -> int:
+        chunk_ids = select(LexicalChunk.id).where(
+            LexicalChunk.collection_name == collection_name,
+            LexicalChunk.document_id.in_(document_ids),
+        )
+        db.query(LexicalPosting).filter(LexicalPosting.chunk_id.in_(chunk_ids)).delete(synchronize_session=False)
+        return db.query(LexicalChunk).filter(
+            LexicalChunk.collection_name == collection_name,
+            LexicalChunk.document_id.in_(document_ids),
+        ).delete(synchronize_session=False)
+
+    def add(
+        self,
+        texts: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        replace_document_ids: Optional[List[int]] = None,
+    ):
+        """
+        添加文本块（只写入本批文本块的倒排项，耗时与索引规模无关）
+
+        Args:
+            texts: 文本块
+            metadatas: 文本块元数据
+            replace_document_ids: 写入前先删除这些文档已有的文本块，保证重复写入幂等
+        """
+        db = SessionLocal()
+        try:
+            if replace_document_ids:
+                self._delete_documents(db, self.collection_name, [int(i) for i in replace_document_ids])
+            chunks, chunk_terms = [], []
+            for i, text in enumerate(texts):
+                metadata = dict(metadatas[i]) if metadatas and i < len(metadatas) else {}
+                terms = Counter(term for term in tokenize(text) if len(term) <= MAX_TERM_LENGTH)
+                document_id = metadata.get("document_id")
+                chunks.append(LexicalChunk(
+                    collection_name=self.collection_name,
+                    document_id=int(document_id) if document_id is not None else None,
+                    chunk_index=metadata.get("chunk_index"),
+                    text=text,
+                    metadata_json=json.dumps(metadata, ensure_ascii=False, default=str),
+                    length=sum(terms.values()),
+                ))
+                chunk_terms.append(terms)
+            db.add_all(chunks)
+            db.flush()
+            db.bulk_insert_mappings(LexicalPosting, [
+                {"chunk_id": chunk.id, "term": term, "collection_name": self.collection_name, "tf": tf}
+                for chunk, terms in zip(chunks, chunk_terms)
+                for term, tf in terms.items()
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def remove_documents(self, document_ids: List[int]) -> int:
+        """删除指定文档的文本块，返回删除数量"""
+        if not document_ids:
+            return 0
+        db = SessionLocal()
+        try:
+            removed = self._delete_documents(db, self.collection_name, [int(i) for i in document_ids])
+            db.commit()
+            return removed
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        """BM25 检索，返回 [(Document, score), ...]"""
+        terms = {term for term in tokenize(query) if len(term) <= MAX_TERM_LENGTH}
+        if not terms:
+            return []
+        db = SessionLocal()
+        try:
+            total, total_length = db.query(func.count(LexicalChunk.id), func.sum(LexicalChunk.length)).filter(
+                LexicalChunk.collection_name == self.collection_name
+            ).one()
+            if not total:
+                return []
+            avg_length = (total_length or 0) / total or 1.0
+
+            doc_freqs = db.query(LexicalPosting.term, func.count(LexicalPosting.chunk_id)).filter(
+                LexicalPosting.collection_name == self.collection_name,
+                LexicalPosting.term.in_(terms),
+            ).group_by(LexicalPosting.term).all()
+            if not doc_freqs:
+                return []
+            idf = {
+                term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+                for term, df in doc_freqs
+            }
+
+            tf = LexicalPosting.tf * 1.0
+            norm = self.k1 * (1 - self.b + self.b * LexicalChunk.length / avg_length)
+            score = func.sum(case(idf, value=LexicalPosting.term, else_=0.0) * tf * (self.k1 + 1) / (tf + norm))
+            top = (
+                db.query(LexicalPosting.chunk_id, score.label("score"))
+                .join(LexicalChunk, LexicalChunk.id == LexicalPosting.chunk_id)
+                .filter(
+                    LexicalPosting.collection_name == self.collection_name,
+                    LexicalPosting.term.in_(list(idf)),
+                )
+                .group_by(LexicalPosting.chunk_id)
+                .order_by(score.desc(), LexicalPosting.chunk_id)
+                .limit(k)
+                .all()
+            )
+            chunks = {
+                chunk.id: chunk
+                for chunk in db.query(LexicalChunk).filter(LexicalChunk.id.in_([chunk_id for chunk_id, _ in top]))
+            }
+            return [
+                (
+                    Document(
+                        page_content=chunks[chunk_id].text,
+                        metadata=json.loads(chunks[chunk_id].metadata_json or "{}"),
+                    ),
+                    float(chunk_score),
+                )
+                for chunk_id, chunk_score in top
+                if chunk_id in chunks
+            ]
+        finally:
+            db.close()
+
+
+def get_lexical_index(collection_name: str) -> BM25Index:
+    """获取集合的词法索引"""
+    return BM25Index(collection_name)
+
+
+def drop_lexical_index(collection_name: str):
+    """删除集合的全部词法索引数据"""
+    db = SessionLocal()
+    try:
+        db.query(LexicalPosting).filter(LexicalPosting.collection_name == collection_name).delete(synchronize_session=False)
+        db.query(LexicalChunk).filter(LexicalChunk.collection_name == collection_name).delete(synchronize_session=False)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def backfill_lexical_index(db, rag_service, batch_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    为尚未建立词法索引的已向量化文档补建索引（按文档 ID 分批，可重复执行）
+
+    Args:
+        db: 数据库会话
+        rag_service: RAGService 实例（使用与入库一致的分块规则）
+        batch_size: 每批处理的文档数，默认读取 RAG_LEXICAL_BACKFILL_BATCH_SIZE
+
+    Returns:
+        {"documents", "chunks", "failed_documents"}
+    """
+    batch_size = max(batch_size or settings.RAG_LEXICAL_BACKFILL_BATCH_SIZE, 1)
+    indexed = select(LexicalChunk.id).where(LexicalChunk.document_id == KnowledgeDocument.id).exists()
+    documents_done, chunks_done, failed = 0, 0, 0
+    collections = set()
+    last_id = 0
+
+    while True:
+        batch = (
+            db.query(KnowledgeDocument)
+            .filter(
+                KnowledgeDocument.is_vectorized == True,
+                ~KnowledgeDocument.status.in_(INACTIVE_STATUSES),
+                KnowledgeDocument.id > last_id,
+                ~indexed,
+            )
+            .order_by(KnowledgeDocument.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        for document in batch:
+            if not document.content:
+                continue
+            splits, metadatas, _ = rag_service.split_documents(
+                [document.content],
+                [{
+                    "document_id": document.id,
+                    "title": document.title,
+                    "category": document.category or "",
+                    "tags": document.tags or "",
+                }],
+            )
+            collection_name = document.collection_name or "knowledge_base"
+            try:
+                get_lexical_index(collection_name).add(splits, metadatas, replace_document_ids=[document.id])
+            except Exception as e:
+                print(f"[WARNING] 建立词法索引失败: document_id={document.id}, {e}")
+                failed += 1
+                continue
+            documents_done += 1
+            chunks_done += len(splits)
+            collections.add(collection_name)
+
+    # 已缓存的检索结果不含新建索引的文本块
+    for collection_name in collections:
+        rag_service.invalidate_collection(collection_name)
+    print(f"[INFO] 词法索引补建完成: 文档 {documents_done} 个, 文本块 {chunks_done} 个, 失败 {failed} 个")
+    return {"documents": documents_done, "chunks": chunks_done, "failed_documents": failed}
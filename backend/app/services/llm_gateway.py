@@ -0,0 +1,522 @@
+"""
+LLM 网关
+所有 Chat 模型实例通过 LLMGatewayCallbackHandler 接入：每次模型调用（invoke / stream / Agent 内部调用）
+开始前在对应 provider 的闸门排队，按令牌桶限制每分钟请求数与 token 数，并限制同时进行的请求数。
+排队按优先级通道（interactive 先于 background）调度，同一通道内按用户轮转，避免单个用户的批量任务占满配额。
+调用优先级与用户通过 llm_request_context / bind_llm_request_context 设置（contextvars），未设置时视为后台任务。
+同步调用在调用线程中阻塞排队；异步调用（ainvoke / astream）在事件循环中 await 排队，不占用线程池线程。
+"""
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.core.config import settings
+from app.services.chat_history import estimate_tokens
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+_priority_var: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=PRIORITY_BACKGROUND)
+_user_var: contextvars.ContextVar[Optional[Any]] = contextvars.ContextVar("llm_user", default=None)
+
+
+class LLMGatewayTimeout(TimeoutError):
+    """排队超过 LLM_GATEWAY_MAX_WAIT_SECONDS 仍未获得调用配额"""
+
+
+@contextmanager
+def llm_request_context(priority: str = PRIORITY_BACKGROUND, user_id: Any = None):
+    """设置当前上下文中 LLM 调用的优先级与用户（用于优先级通道与按用户公平排队）"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的 LLM 调用优先级: {priority}")
+    priority_token = _priority_var.set(priority)
+    user_token = _user_var.set(user_id)
+    try:
+        yield
+    finally:
+        _user_var.reset(user_token)
+        _priority_var.reset(priority_token)
+
+
+def bind_llm_request_context(priority: str = PRIORITY_BACKGROUND, user_id: Any = None):
+    """
+    设置当前上下文的 LLM 调用优先级与用户（不自动恢复）
+
+    用于后台任务与流式响应生成器：它们运行在独立复制的上下文中，生命周期结束即失效。
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的 LLM 调用优先级: {priority}")
+    _priority_var.set(priority)
+    _user_var.set(user_id)
+
+
+class TokenBucket:
+    """按分钟配额持续补充的令牌桶，limit 为 0 表示不限"""
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = max(float(limit_per_minute or 0), 0)
+        self.level = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """获得 amount 个令牌还需等待的秒数（超过桶容量的请求按桶容量计）"""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float):
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta: float):
+        """按实际用量修正（delta > 0 为超出预估的部分，允许透支，由后续补充抵消）"""
+        if self.capacity:
+            self._refill()
+            self.level = min(self.capacity, self.level - delta)
+
+
+class _Ticket:
+    __slots__ = ("priority", "user", "tokens", "enqueued_at")
+
+    def __init__(self, priority: str, user: Any, tokens: int):
+        self.priority = priority
+        self.user = user
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class ProviderGate:
+    """单个 provider 的调用闸门：令牌桶限流 + 并发上限 + 优先级通道 + 通道内按用户轮转"""
+
+    def __init__(self, provider: str, rpm: int = 0, tpm: int = 0, concurrency: int = 0):
+        self.provider = provider
+        self.concurrency = max(int(concurrency or 0), 0)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        # 异步排队者的 (事件循环, Event)，闸门状态变化时跨线程唤醒
+        self._async_waiters = set()
+        # 优先级 -> {用户 -> 该用户的排队请求}，字典顺序即轮转顺序
+        self._lanes: Dict[str, "OrderedDict[Any, Deque[_Ticket]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._in_flight = 0
+        self._metrics = {
+            p: {"admitted": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for p in PRIORITIES
+        }
+        self._rate_limited = 0
+
+    def _head(self) -> Optional[_Ticket]:
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            if lane:
+                return next(iter(lane.values()))[0]
+        return None
+
+    def _remove(self, ticket: _Ticket, rotate: bool):
+        lane = self._lanes[ticket.priority]
+        queue = lane.get(ticket.user)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            return
+        if not queue:
+            del lane[ticket.user]
+        elif rotate:
+            # 该用户的下一个请求排到通道末尾，其他用户先获得配额
+            lane.move_to_end(ticket.user)
+
+    def _notify(self):
+        """闸门状态变化：唤醒同步与异步排队者（调用方持有 self._cond）"""
+        self._cond.notify_all()
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                self._async_waiters.discard((loop, event))
+
+    def _enqueue(self, priority: str, user: Any, tokens: int, timeout: float):
+        ticket = _Ticket(priority, user, tokens)
+        deadline = ticket.enqueued_at + timeout if timeout > 0 else None
+        self._lanes[priority].setdefault(user, deque()).append(ticket)
+        return ticket, deadline
+
+    def _try_admit(self, ticket: _Ticket, deadline: Optional[float], state: Dict[str, bool]) -> Optional[float]:
+        """
+        尝试放行排队请求（调用方持有 self._cond）
+
+        Returns:
+            0 表示已放行；否则为下一次检查前的等待秒数（None 表示等待状态变化通知）
+
+        Raises:
+            LLMGatewayTimeout: 超过排队时限
+        """
+        wait = None
+        if self._head() is ticket and (not self.concurrency or self._in_flight < self.concurrency):
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(ticket.tokens))
+            if wait <= 0:
+                self.requests.consume(1)
+                self.tokens.consume(ticket.tokens)
+                self._remove(ticket, rotate=True)
+                self._in_flight += 1
+                self._record_admission(ticket)
+                self._notify()
+                return 0
+            if not state.get("rate_limited"):
+                state["rate_limited"] = True
+                self._rate_limited += 1
+
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            self._remove(ticket, rotate=False)
+            self._metrics[ticket.priority]["timeouts"] += 1
+            self._notify()
+            raise LLMGatewayTimeout(
+                f"LLM 网关排队超时 (provider={self.provider}, priority={ticket.priority}, "
+                f"等待 {deadline - ticket.enqueued_at:.0f} 秒)"
+            )
+        if wait is not None and remaining is not None:
+            return min(wait, remaining)
+        return wait if wait is not None else remaining
+
+    def acquire(self, priority: str, user: Any, tokens: int, timeout: float) -> _Ticket:
+        """排队直到获得调用配额（阻塞当前线程），超时抛出 LLMGatewayTimeout"""
+        state: Dict[str, bool] = {}
+        with self._cond:
+            ticket, deadline = self._enqueue(priority, user, tokens, timeout)
+            while True:
+                wait = self._try_admit(ticket, deadline, state)
+                if wait == 0:
+                    return ticket
+                self._cond.wait(wait)
+
+    async def aacquire(self, priority: str, user: Any, tokens: int, timeout: float) -> _Ticket:
+        """排队直到获得调用配额（在事件循环中等待，不阻塞线程），超时抛出 LLMGatewayTimeout"""
+        state: Dict[str, bool] = {}
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        event = waiter[1]
+        with self._cond:
+            ticket, deadline = self._enqueue(priority, user, tokens, timeout)
+            self._async_waiters.add(waiter)
+        admitted = False
+        try:
+            while True:
+                with self._cond:
+                    # 先清除再检查：检查之后的状态变化一定会再次唤醒
+                    event.clear()
+                    wait = self._try_admit(ticket, deadline, state)
+                if wait == 0:
+                    admitted = True
+                    return ticket
+                try:
+                    await asyncio.wait_for(event.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                if not admitted:
+                    # 调用方被取消：退出队列，不阻塞后面的请求
+                    self._remove(ticket, rotate=False)
+                    self._notify()
+
+    def _record_admission(self, ticket: _Ticket):
+        waited = time.monotonic() - ticket.enqueued_at
+        metrics = self._metrics[ticket.priority]
+        metrics["admitted"] += 1
+        metrics["wait_seconds_total"] += waited
+        metrics["wait_seconds_max"] = max(metrics["wait_seconds_max"], waited)
+
+    def release(self, ticket: _Ticket, actual_tokens: Optional[int] = None):
+        """调用结束后释放并发名额，并按实际 token 用量修正令牌桶"""
+        with self._cond:
+            self._in_flight = max(self._in_flight - 1, 0)
+            if actual_tokens is not None:
+                self.tokens.adjust(actual_tokens - ticket.tokens)
+            self._notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            lanes = {}
+            for priority in PRIORITIES:
+                metrics = self._metrics[priority]
+                lanes[priority] = {
+                    "queue_depth": sum(len(queue) for queue in self._lanes[priority].values()),
+                    "queued_users": len(self._lanes[priority]),
+                    "admitted": metrics["admitted"],
+                    "timeouts": metrics["timeouts"],
+                    "avg_wait_seconds": round(metrics["wait_seconds_total"] / metrics["admitted"], 4)
+                    if metrics["admitted"] else 0.0,
+                    "max_wait_seconds": round(metrics["wait_seconds_max"], 4),
+                }
+            return {
+                "provider": self.provider,
+                "in_flight": self._in_flight,
+                "concurrency": self.concurrency,
+                "requests_per_minute": int(self.requests.capacity),
+                "tokens_per_minute": int(self.tokens.capacity),
+                "rate_limited_waits": self._rate_limited,
+                "lanes": lanes,
+            }
+
+
+def _provider_limits(provider: str) -> Dict[str, int]:
+    """读取 provider 的限流配置：LLM_GATEWAY_PROVIDER_LIMITS 覆盖默认值"""
+    limits = {
+        "rpm": settings.LLM_GATEWAY_REQUESTS_PER_MINUTE,
+        "tpm": settings.LLM_GATEWAY_TOKENS_PER_MINUTE,
+        "concurrency": settings.LLM_GATEWAY_MAX_CONCURRENCY,
+    }
+    if settings.LLM_GATEWAY_PROVIDER_LIMITS:
+        try:
+            overrides = json.loads(settings.LLM_GATEWAY_PROVIDER_LIMITS).get(provider) or {}
+            limits.update({key: int(value) for key, value in overrides.items() if key in limits})
+        except (json.JSONDecodeError, ValueError, TypeError, AttributeError):
+            print("[WARNING] LLM_GATEWAY_PROVIDER_LIMITS 配置格式错误，使用默认限流配置")
+    return limits
+
+
+class LLMGateway:
+    """按 provider 管理调用闸门"""
+
+    def __init__(self):
+        self._gates: Dict[str, ProviderGate] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def gate(self, provider: str) -> ProviderGate:
+        provider = provider or "default"
+        with self._lock:
+            gate = self._gates.get(provider)
+            if gate is None:
+                gate = ProviderGate(provider, **_provider_limits(provider))
+                self._gates[provider] = gate
+            return gate
+
+    def record_usage(self, provider: str, usage: Dict[str, int]):
+        """累计 provider 的实际 token 用量（含前缀缓存命中的输入 token）"""
+        provider = provider or "default"
+        with self._lock:
+            totals = self._usage.setdefault(
+                provider, {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+            )
+            totals["calls"] += 1
+            for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens"):
+                totals[key] += usage.get(key, 0)
+
+    def usage_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            usage = {provider: dict(totals) for provider, totals in self._usage.items()}
+        for totals in usage.values():
+            totals["prefix_cache_hit_ratio"] = (
+                round(totals["cached_prompt_tokens"] / totals["prompt_tokens"], 4) if totals["prompt_tokens"] else 0.0
+            )
+        return usage
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            gates = list(self._gates.values())
+        return {
+            "enabled": bool(settings.LLM_GATEWAY_ENABLED),
+            "providers": {gate.provider: gate.stats() for gate in gates},
+            "usage": self.usage_stats(),
+        }
+
+    def reset(self):
+        """丢弃现有闸门，下次调用按最新配置重建（限流配置变更或测试时使用）"""
+        with self._lock:
+            self._gates.clear()
+            self._usage.clear()
+
+
+llm_gateway = LLMGateway()
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(
+        estimate_tokens(str(getattr(message, "content", message))) + 4
+        for batch in messages for message in batch
+    )
+
+
+def _usage_tokens(response) -> Optional[int]:
+    """从 LLMResult 中读取实际 token 用量（provider 未返回时为 None）"""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    total = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            total += metadata.get("total_tokens") or 0
+    return total or None
+
+
+def _cached_tokens(token_usage: Dict[str, Any]) -> int:
+    """OpenAI 兼容接口的缓存命中字段：prompt_tokens_details.cached_tokens，DeepSeek 为 prompt_cache_hit_tokens"""
+    details = token_usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens") or token_usage.get("prompt_cache_hit_tokens") or 0)
+
+
+def token_usage(response) -> Optional[Dict[str, int]]:
+    """
+    从 LLMResult 中读取本次调用的 token 用量（provider 未返回时为 None）
+
+    Returns:
+        {"prompt_tokens", "cached_prompt_tokens", "completion_tokens"}，cached_prompt_tokens 为命中
+        provider 前缀缓存的输入 token 数
+    """
+    usage = {"prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0}
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "usage_metadata", None) or {}
+            raw = (getattr(message, "response_metadata", None) or {}).get("token_usage") or {}
+            if metadata:
+                usage["prompt_tokens"] += metadata.get("input_tokens") or 0
+                usage["completion_tokens"] += metadata.get("output_tokens") or 0
+                cache_read = (metadata.get("input_token_details") or {}).get("cache_read") or 0
+            elif raw:
+                usage["prompt_tokens"] += raw.get("prompt_tokens") or 0
+                usage["completion_tokens"] += raw.get("completion_tokens") or 0
+                cache_read = 0
+            else:
+                continue
+            found = True
+            usage["cached_prompt_tokens"] += max(int(cache_read), _cached_tokens(raw))
+    if not found:
+        raw = (response.llm_output or {}).get("token_usage") or {}
+        if not raw:
+            return None
+        usage = {
+            "prompt_tokens": raw.get("prompt_tokens") or 0,
+            "cached_prompt_tokens": _cached_tokens(raw),
+            "completion_tokens": raw.get("completion_tokens") or 0,
+        }
+    return usage
+
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class _LoopAwareHook:
+    """
+    回调方法描述符：当前线程运行着事件循环时返回协程版本，否则返回同步版本
+
+    LangChain 对协程回调直接 await，对 run_inline 的同步回调在调用线程内执行：
+    异步调用在事件循环中 await 排队，同步调用在调用线程中阻塞排队，都不占用线程池线程。
+    """
+
+    def __init__(self, sync_name: str, async_name: str):
+        self.sync_name = sync_name
+        self.async_name = async_name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return getattr(instance, self.async_name if _in_event_loop() else self.sync_name)
+
+
+class LLMGatewayCallbackHandler(BaseCallbackHandler):
+    """
+    挂在 Chat 模型上的网关回调：模型请求发出前排队获取配额，结束或出错时释放
+
+    回调在模型实例级别注册，Agent 与 LangGraph 内部对模型的每次调用都会经过网关；
+    异步调用在事件循环中 await 排队（ProviderGate.aacquire），不阻塞线程池线程。
+    """
+
+    raise_error = True
+    # 同步回调（释放配额）不阻塞，直接在调用线程执行
+    run_inline = True
+
+    def __init__(self, provider: str):
+        self.provider = provider or "default"
+        self._tickets: Dict[UUID, Any] = {}
+        self._lock = threading.Lock()
+
+    def _admission(self, prompt_tokens: int, invocation_params: Optional[Dict[str, Any]]):
+        max_tokens = (invocation_params or {}).get("max_tokens") or settings.LLM_GATEWAY_COMPLETION_TOKENS
+        return (
+            _priority_var.get(),
+            _user_var.get(),
+            prompt_tokens + int(max_tokens),
+            float(settings.LLM_GATEWAY_MAX_WAIT_SECONDS),
+        )
+
+    def _acquire(self, run_id: UUID, prompt_tokens: int, invocation_params: Optional[Dict[str, Any]]):
+        if not settings.LLM_GATEWAY_ENABLED:
+            return
+        gate = llm_gateway.gate(self.provider)
+        ticket = gate.acquire(*self._admission(prompt_tokens, invocation_params))
+        with self._lock:
+            self._tickets[run_id] = (gate, ticket)
+
+    async def _aacquire(self, run_id: UUID, prompt_tokens: int, invocation_params: Optional[Dict[str, Any]]):
+        if not settings.LLM_GATEWAY_ENABLED:
+            return
+        gate = llm_gateway.gate(self.provider)
+        ticket = await gate.aacquire(*self._admission(prompt_tokens, invocation_params))
+        with self._lock:
+            self._tickets[run_id] = (gate, ticket)
+
+    def _release(self, run_id: UUID, actual_tokens: Optional[int] = None):
+        with self._lock:
+            entry = self._tickets.pop(run_id, None)
+        if entry is not None:
+            gate, ticket = entry
+            gate.release(ticket, actual_tokens)
+
+    def _on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._acquire(run_id, _prompt_tokens(messages), kwargs.get("invocation_params"))
+
+    async def _aon_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        await self._aacquire(run_id, _prompt_tokens(messages), kwargs.get("invocation_params"))
+
+    def _on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._acquire(run_id, sum(estimate_tokens(prompt) for prompt in prompts), kwargs.get("invocation_params"))
+
+    async def _aon_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        await self._aacquire(run_id, sum(estimate_tokens(prompt) for prompt in prompts), kwargs.get("invocation_params"))
+
+    on_chat_model_start = _LoopAwareHook("_on_chat_model_start", "_aon_chat_model_start")
+    on_llm_start = _LoopAwareHook("_on_llm_start", "_aon_llm_start")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._release(run_id, _usage_tokens(response))
+        usage = token_usage(response)
+        if usage is not None:
+            llm_gateway.record_usage(self.provider, usage)
+            print(
+                f"[INFO] LLM 调用用量 (provider={self.provider}): 输入 {usage['prompt_tokens']} tokens"
+                f"（前缀缓存命中 {usage['cached_prompt_tokens']}），输出 {usage['completion_tokens']} tokens"
+            )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._release(run_id)
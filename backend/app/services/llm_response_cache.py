@@ -0,0 +1,187 @@
+"""
+LLM 响应缓存
+按 (provider, 模型, 温度, max_tokens, 消息内容哈希) 持久化 LLM 输出到数据库，
+LLM 调用成功但后续步骤（如数据库提交）失败时，重试不再重复付费；温度为 0 或回放场景基本零成本。
+默认关闭（LLM_CACHE_ENABLED），条目按 TTL 过期，超出容量时淘汰最久未命中的条目。
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.llm_response_cache import LLMResponseCache
+
+
+def _serialize_messages(messages: Any) -> list:
+    """消息归一化为 [(角色, 内容), ...]，字符串 Prompt 视为单条用户消息"""
+    if isinstance(messages, str):
+        return [["human", messages]]
+    serialized = []
+    for message in messages:
+        if isinstance(message, (tuple, list)) and len(message) == 2:
+            serialized.append([str(message[0]), message[1]])
+        elif isinstance(message, dict):
+            serialized.append([str(message.get("role", "")), message.get("content")])
+        else:
+            serialized.append([getattr(message, "type", type(message).__name__), getattr(message, "content", str(message))])
+    return serialized
+
+
+def make_cache_key(scope: Dict[str, Any], messages: Any) -> str:
+    """计算缓存键：scope 为 {"provider", "model", "temperature", "max_tokens"}"""
+    payload = json.dumps(
+        {"scope": scope, "messages": _serialize_messages(messages)},
+        ensure_ascii=False,
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCacheService:
+    """LLM 响应持久化缓存（使用独立会话，可在工作线程中调用）"""
+
+    def __init__(self):
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.LLM_CACHE_ENABLED)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, scope: Dict[str, Any], messages: Any) -> Optional[str]:
+        """查找缓存的响应内容，未启用、未命中或已过期时返回 None"""
+        if not self.enabled:
+            return None
+        cache_key = make_cache_key(scope, messages)
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponseCache).filter(LLMResponseCache.cache_key == cache_key).first()
+            now = datetime.now()
+            if entry is None or (entry.expires_at is not None and entry.expires_at.replace(tzinfo=None) <= now):
+                self._count("misses")
+                return None
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_hit_at = now
+            db.commit()
+            self._count("hits")
+            print(f"[INFO] 命中 LLM 响应缓存 (model={scope.get('model')}, key={cache_key[:12]})")
+            return entry.content
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"[WARNING] 读取 LLM 响应缓存失败，直接调用 LLM: {e}")
+            return None
+        finally:
+            db.close()
+
+    def set(self, scope: Dict[str, Any], messages: Any, content: Any):
+        """写入响应内容（仅缓存文本响应），写入后按容量淘汰"""
+        if not self.enabled or not isinstance(content, str) or not content:
+            return
+        cache_key = make_cache_key(scope, messages)
+        ttl = max(settings.LLM_CACHE_TTL_SECONDS, 0)
+        db = SessionLocal()
+        try:
+            entry = db.query(LLMResponseCache).filter(LLMResponseCache.cache_key == cache_key).first()
+            now = datetime.now()
+            expires_at = now + timedelta(seconds=ttl) if ttl else None
+            if entry is None:
+                db.add(LLMResponseCache(
+                    cache_key=cache_key,
+                    provider=str(scope.get("provider") or ""),
+                    model_name=str(scope.get("model") or ""),
+                    content=content,
+                    hit_count=0,
+                    created_at=now,
+                    expires_at=expires_at,
+                ))
+            else:
+                # 已过期条目被重新生成，覆盖旧内容
+                entry.content = content
+                entry.created_at = now
+                entry.expires_at = expires_at
+            db.commit()
+            self._count("writes")
+            self._evict(db)
+        except IntegrityError:
+            # 并发请求已写入相同键
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            self._count("errors")
+            print(f"[WARNING] 写入 LLM 响应缓存失败: {e}")
+        finally:
+            db.close()
+
+    def _evict(self, db) -> int:
+        """删除过期条目，并在超出 LLM_CACHE_MAX_ENTRIES 时淘汰最久未命中的条目"""
+        removed = (
+            db.query(LLMResponseCache)
+            .filter(LLMResponseCache.expires_at.isnot(None), LLMResponseCache.expires_at <= datetime.now())
+            .delete(synchronize_session=False)
+        )
+        max_entries = max(settings.LLM_CACHE_MAX_ENTRIES, 0)
+        if max_entries:
+            overflow = db.query(func.count(LLMResponseCache.id)).scalar() - max_entries
+            if overflow > 0:
+                stale_ids = [
+                    row.id for row in (
+                        db.query(LLMResponseCache.id)
+                        .order_by(
+                            func.coalesce(LLMResponseCache.last_hit_at, LLMResponseCache.created_at),
+                            LLMResponseCache.id,
+                        )
+                        .limit(overflow)
+                        .all()
+                    )
+                ]
+                removed += (
+                    db.query(LLMResponseCache)
+                    .filter(LLMResponseCache.id.in_(stale_ids))
+                    .delete(synchronize_session=False)
+                )
+        db.commit()
+        if removed:
+            self._count("evictions", removed)
+        return removed
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的条目数"""
+        db = SessionLocal()
+        try:
+            removed = db.query(LLMResponseCache).delete(synchronize_session=False)
+            db.commit()
+            print(f"[INFO] 已清空 {removed} 条 LLM 响应缓存")
+            return removed
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / total, 4) if total else 0.0
+        stats["enabled"] = self.enabled
+        stats["entries"] = None
+        db = SessionLocal()
+        try:
+            stats["entries"] = db.query(func.count(LLMResponseCache.id)).scalar()
+        except Exception as e:
+            print(f"[WARNING] 统计 LLM 响应缓存条目失败: {e}")
+        finally:
+            db.close()
+        return stats
+
+
+llm_response_cache = LLMResponseCacheService()
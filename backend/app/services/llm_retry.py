@@ -0,0 +1,172 @@
+"""
+LLM 调用重试策略
+按错误类型区分可重试（超时、连接失败、429、5xx、模型输出不合规）与不可重试（其他 4xx、程序错误），
+可重试错误按指数退避加抖动等待，服务端返回 Retry-After 时至少等待该时长；
+单次逻辑调用的总耗时不超过 AI_RETRY_DEADLINE_SECONDS，预算不足以再等待一次时直接放弃。
+"""
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+# 可重试的 HTTP 状态码（4xx 中只有请求超时、冲突、过早请求与限流值得重试）
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429}
+# 程序错误，重试不会得到不同结果
+FATAL_ERROR_TYPES = (TypeError, AttributeError, KeyError, NotImplementedError, ImportError)
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(error: BaseException) -> Tuple[bool, str]:
+    """
+    判断错误是否值得重试
+
+    Returns:
+        (是否可重试, 错误分类)；未能识别的错误视为可重试，避免不同 provider 的异常类型导致漏重试
+    """
+    status = _status_code(error)
+    if status is not None:
+        if status == 429:
+            return True, "rate_limited"
+        if status >= 500:
+            return True, "server_error"
+        if status in RETRYABLE_STATUS_CODES:
+            return True, f"http_{status}"
+        if 400 <= status < 500:
+            return False, f"http_{status}"
+    name = type(error).__name__
+    if isinstance(error, TimeoutError) or "Timeout" in name:
+        return True, "timeout"
+    if isinstance(error, ConnectionError) or "Connection" in name:
+        return True, "connection"
+    if "RateLimit" in name:
+        return True, "rate_limited"
+    if isinstance(error, FATAL_ERROR_TYPES):
+        return False, "client_error"
+    if isinstance(error, ValueError):
+        # 模型未按要求输出（如缺少结构化结果），重新生成通常可以恢复
+        return True, "invalid_output"
+    return True, "unknown"
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """读取服务端响应头中的 Retry-After / retry-after-ms（秒数或 HTTP 日期）"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(float(value) / 1000, 0.0)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    第 attempt 次失败后的等待时间
+
+    AI_RETRY_INTERVAL * 2^(attempt-1)，上限 AI_RETRY_MAX_INTERVAL；取一半固定、一半随机，
+    避免并发请求同时重试。服务端要求的 Retry-After 优先（不受上限约束，由总耗时预算兜底）。
+    """
+    base = max(settings.AI_RETRY_INTERVAL, 0.0)
+    ceiling = max(settings.AI_RETRY_MAX_INTERVAL, base)
+    delay = min(base * (2 ** max(attempt - 1, 0)), ceiling)
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RetryBudget:
+    """
+    单次逻辑调用的重试预算：最多 AI_MAX_RETRIES 次尝试，总耗时不超过 AI_RETRY_DEADLINE_SECONDS
+
+    用法：每次尝试前调用 start_attempt()；失败时调用 next_delay(error)，
+    返回 None 表示不再重试（直接抛出原错误），否则等待返回的秒数后继续。
+    """
+
+    def __init__(self, label: str, max_attempts: Optional[int] = None, deadline_seconds: Optional[float] = None):
+        self.label = label
+        self.max_attempts = max(max_attempts if max_attempts is not None else settings.AI_MAX_RETRIES, 1)
+        if deadline_seconds is None:
+            deadline_seconds = settings.AI_RETRY_DEADLINE_SECONDS
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds and deadline_seconds > 0 else None
+        self.attempt = 0
+
+    def start_attempt(self) -> int:
+        self.attempt += 1
+        _count_retry("attempts")
+        return self.attempt
+
+    def next_delay(self, error: BaseException) -> Optional[float]:
+        retryable, reason = classify_error(error)
+        _count_retry_error(reason)
+        if not retryable:
+            _count_retry("fatal_errors")
+            print(f"[WARNING] {self.label} 调用失败且不可重试（{reason}）: {type(error).__name__}: {str(error)[:200]}")
+            return None
+        if self.attempt >= self.max_attempts:
+            _count_retry("exhausted")
+            return None
+        retry_after = retry_after_seconds(error)
+        delay = backoff_delay(self.attempt, retry_after)
+        if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+            _count_retry("deadline_exceeded")
+            print(f"[WARNING] {self.label} 重试超出总耗时预算 {settings.AI_RETRY_DEADLINE_SECONDS} 秒，停止重试")
+            return None
+        _count_retry("retries")
+        if retry_after is not None:
+            _count_retry("retry_after_honoured")
+        _count_retry("sleep_seconds", delay)
+        print(f"[INFO] {self.label} 第 {self.attempt}/{self.max_attempts} 次失败（{reason}），{delay:.2f} 秒后重试")
+        return delay
+
+
+# --- 重试统计 ---
+_retry_stats: Dict[str, Any] = {
+    "attempts": 0,
+    "retries": 0,
+    "fatal_errors": 0,
+    "exhausted": 0,
+    "deadline_exceeded": 0,
+    "retry_after_honoured": 0,
+    "sleep_seconds": 0.0,
+    "errors_by_class": {},
+}
+_retry_lock = threading.Lock()
+
+
+def _count_retry(name: str, amount: float = 1):
+    with _retry_lock:
+        _retry_stats[name] += amount
+
+
+def _count_retry_error(reason: str):
+    with _retry_lock:
+        errors = _retry_stats["errors_by_class"]
+        errors[reason] = errors.get(reason, 0) + 1
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """获取 LLM 调用重试统计"""
+    with _retry_lock:
+        stats = dict(_retry_stats)
+        stats["errors_by_class"] = dict(_retry_stats["errors_by_class"])
+        stats["sleep_seconds"] = round(stats["sleep_seconds"], 2)
+        return stats
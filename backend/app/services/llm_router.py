@@ -0,0 +1,311 @@
+"""
+模型端点负载均衡
+相同 pool_name 的 ModelConfig 视为等价端点：按加权轮询（weighted）或最低延迟（least_latency）选择端点，
+调用失败时转移到池内其他健康端点。连续失败达到阈值的端点被摘除，冷却期过后放行一次探测请求，
+探测成功即恢复。端点健康状态按配置 ID 保存在进程内，AIService 实例重建后仍然保留。
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.core.config import settings
+from app.services.llm_gateway import LLMGatewayTimeout
+
+ROUTING_SINGLE = "single"
+ROUTING_WEIGHTED = "weighted"
+ROUTING_LEAST_LATENCY = "least_latency"
+ROUTING_MODES = (ROUTING_SINGLE, ROUTING_WEIGHTED, ROUTING_LEAST_LATENCY)
+
+# 延迟滑动平均的平滑系数
+LATENCY_EWMA_ALPHA = 0.3
+
+
+@dataclass
+class EndpointState:
+    """单个端点的健康与负载状态"""
+    config_id: int
+    name: str
+    weight: int = 1
+    current_weight: int = 0  # 平滑加权轮询的当前权重
+    latency_ewma: Optional[float] = None
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    requests: int = 0
+    failures: int = 0
+
+    def is_ejected(self) -> bool:
+        return self.consecutive_failures >= max(settings.LLM_ENDPOINT_FAILURE_THRESHOLD, 1)
+
+
+_endpoint_states: Dict[int, EndpointState] = {}
+_router_lock = threading.Lock()
+
+
+def register_endpoints(endpoints: Sequence[Tuple[int, str, int]]):
+    """登记端点 [(config_id, 名称, 权重), ...]，已存在的端点保留健康状态只更新权重"""
+    with _router_lock:
+        for config_id, name, weight in endpoints:
+            state = _endpoint_states.get(config_id)
+            if state is None:
+                _endpoint_states[config_id] = EndpointState(config_id=config_id, name=name, weight=max(weight or 1, 1))
+            else:
+                state.name = name
+                state.weight = max(weight or 1, 1)
+
+
+def _pick_weighted(states: List[EndpointState]) -> EndpointState:
+    """平滑加权轮询（权重 3:1 时依次为 A A B A，而不是 A A A B）"""
+    total = sum(state.weight for state in states)
+    for state in states:
+        state.current_weight += state.weight
+    chosen = max(states, key=lambda state: state.current_weight)
+    chosen.current_weight -= total
+    return chosen
+
+
+def _pick_least_latency(states: List[EndpointState]) -> EndpointState:
+    # 尚无延迟数据的端点优先，保证每个端点都能被测量
+    return min(states, key=lambda state: (state.latency_ewma is not None, state.latency_ewma or 0.0))
+
+
+def choose_endpoints(config_ids: Sequence[int], mode: str) -> List[int]:
+    """
+    选择本次调用的端点顺序
+
+    Returns:
+        [首选端点, 故障转移端点...]；全部端点被摘除时按恢复时间排序，尽力而为
+    """
+    now = time.monotonic()
+    with _router_lock:
+        states = [_endpoint_states[config_id] for config_id in config_ids if config_id in _endpoint_states]
+        healthy = [state for state in states if not state.is_ejected()]
+        probes = [state for state in states if state.is_ejected() and now >= state.ejected_until]
+
+        if probes:
+            # 冷却期已过的端点放行一次探测请求（探测期间顺延冷却，避免并发请求同时探测），其他端点作为故障转移
+            primary = probes[0]
+            primary.ejected_until = now + max(settings.LLM_ENDPOINT_COOLDOWN_SECONDS, 0)
+            print(f"[INFO] 探测已摘除的模型端点: {primary.name}")
+        elif healthy:
+            primary = _pick_weighted(healthy) if mode == ROUTING_WEIGHTED else _pick_least_latency(healthy)
+        else:
+            return [state.config_id for state in sorted(states, key=lambda state: state.ejected_until)]
+
+        fallbacks = sorted(
+            (state for state in healthy if state is not primary),
+            key=lambda state: (state.latency_ewma is None, state.latency_ewma or 0.0),
+        )
+        return [primary.config_id] + [state.config_id for state in fallbacks]
+
+
+def record_success(config_id: int, latency: float):
+    with _router_lock:
+        state = _endpoint_states.get(config_id)
+        if state is None:
+            return
+        if state.is_ejected():
+            print(f"[INFO] 模型端点 {state.name} 探测成功，恢复使用")
+        state.requests += 1
+        state.consecutive_failures = 0
+        state.ejected_until = 0.0
+        state.latency_ewma = latency if state.latency_ewma is None else (
+            LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * state.latency_ewma
+        )
+
+
+def record_failure(config_id: int, error: BaseException):
+    with _router_lock:
+        state = _endpoint_states.get(config_id)
+        if state is None:
+            return
+        state.requests += 1
+        state.failures += 1
+        state.consecutive_failures += 1
+        if state.is_ejected():
+            state.ejected_until = time.monotonic() + max(settings.LLM_ENDPOINT_COOLDOWN_SECONDS, 0)
+            print(
+                f"[WARNING] 模型端点 {state.name} 连续失败 {state.consecutive_failures} 次，"
+                f"摘除 {settings.LLM_ENDPOINT_COOLDOWN_SECONDS} 秒: {type(error).__name__}: {str(error)[:200]}"
+            )
+
+
+def _record_call_failure(config_id: int, error: BaseException):
+    # 网关排队超时说明本地配额不足，不代表端点故障：只转移，不计入失败次数
+    if not isinstance(error, LLMGatewayTimeout):
+        record_failure(config_id, error)
+
+
+def routing_stats() -> Dict[str, Any]:
+    now = time.monotonic()
+    with _router_lock:
+        return {
+            "mode": settings.LLM_ROUTING_MODE,
+            "endpoints": [
+                {
+                    "config_id": state.config_id,
+                    "name": state.name,
+                    "weight": state.weight,
+                    "healthy": not state.is_ejected(),
+                    "consecutive_failures": state.consecutive_failures,
+                    "retry_in_seconds": round(max(state.ejected_until - now, 0.0), 1) if state.is_ejected() else 0.0,
+                    "latency_ms": round(state.latency_ewma * 1000, 1) if state.latency_ewma is not None else None,
+                    "requests": state.requests,
+                    "failures": state.failures,
+                }
+                for state in _endpoint_states.values()
+            ],
+        }
+
+
+def clear_endpoint_states():
+    """清除端点健康状态（测试使用）"""
+    with _router_lock:
+        _endpoint_states.clear()
+
+
+class PooledChatModel(BaseChatModel):
+    """
+    端点池 Chat 模型：每次调用选择一个端点模型执行，失败时转移到池内其他端点
+
+    端点模型各自挂载 LLM 网关回调，按各自的 provider 限流；外层回调（追踪、流式 token 事件）
+    由本模型的运行记录上报，不再传给端点模型，避免重复上报。
+    bind_tools 延迟到选定端点后由该端点的模型实现绑定。
+    """
+
+    endpoints: List[Tuple[int, Any]]
+    routing_mode: str = ROUTING_WEIGHTED
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-chat"
+
+    def _candidates(self) -> List[Tuple[int, BaseChatModel]]:
+        models = dict(self.endpoints)
+        return [(config_id, models[config_id]) for config_id in choose_endpoints(list(models), self.routing_mode)]
+
+    @staticmethod
+    def _bound(model: BaseChatModel, kwargs: Dict[str, Any]):
+        bound_tools = kwargs.pop("bound_tools", None)
+        if bound_tools is None:
+            return model, kwargs
+        tools, tool_kwargs = bound_tools
+        return model.bind_tools(tools, **tool_kwargs), kwargs
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(bound_tools=(list(tools), kwargs))
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        last_error: Optional[BaseException] = None
+        for config_id, model in self._candidates():
+            runnable, call_kwargs = self._bound(model, dict(kwargs))
+            start = time.monotonic()
+            try:
+                message = runnable.invoke(
+                    messages,
+                    stop=stop,
+                    **call_kwargs,
+                )
+            except Exception as e:
+                _record_call_failure(config_id, e)
+                last_error = e
+                continue
+            record_success(config_id, time.monotonic() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise last_error or RuntimeError("端点池中没有可用的模型端点")
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        last_error: Optional[BaseException] = None
+        for config_id, model in self._candidates():
+            runnable, call_kwargs = self._bound(model, dict(kwargs))
+            start = time.monotonic()
+            try:
+                message = await runnable.ainvoke(
+                    messages,
+                    stop=stop,
+                    **call_kwargs,
+                )
+            except Exception as e:
+                _record_call_failure(config_id, e)
+                last_error = e
+                continue
+            record_success(config_id, time.monotonic() - start)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        raise last_error or RuntimeError("端点池中没有可用的模型端点")
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        # 只在尚未输出任何内容时转移端点，避免拼接两个端点的部分回答
+        last_error: Optional[BaseException] = None
+        for config_id, model in self._candidates():
+            runnable, call_kwargs = self._bound(model, dict(kwargs))
+            start = time.monotonic()
+            started = False
+            try:
+                for chunk in runnable.stream(
+                    messages,
+                    stop=stop,
+                    **call_kwargs,
+                ):
+                    started = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                _record_call_failure(config_id, e)
+                if started:
+                    raise
+                last_error = e
+                continue
+            record_success(config_id, time.monotonic() - start)
+            return
+        raise last_error or RuntimeError("端点池中没有可用的模型端点")
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        last_error: Optional[BaseException] = None
+        for config_id, model in self._candidates():
+            runnable, call_kwargs = self._bound(model, dict(kwargs))
+            start = time.monotonic()
+            started = False
+            try:
+                async for chunk in runnable.astream(
+                    messages,
+                    stop=stop,
+                    **call_kwargs,
+                ):
+                    started = True
+                    yield ChatGenerationChunk(message=chunk)
+            except Exception as e:
+                _record_call_failure(config_id, e)
+                if started:
+                    raise
+                last_error = e
+                continue
+            record_success(config_id, time.monotonic() - start)
+            return
+        raise last_error or RuntimeError("端点池中没有可用的模型端点")
@@ -0,0 +1,406 @@
+"""
+LLM 调用遥测
+每次 Chat 模型调用（含 Agent / LangGraph 内部调用）、Embedding 调用与缓存命中记录到 llm_calls 表：
+调用方（功能、需求、测试点、工作流线程）、模型、token 用量、耗时、第几次尝试、是否命中缓存与错误。
+调用方通过 llm_call_context / bind_llm_call_context / llm_feature 设置（contextvars），嵌套设置时内层覆盖外层的非空字段；
+重试次数由调用方通过 attempt_config() 写入运行 metadata。
+记录先进入内存队列，由后台线程按 LLM_TELEMETRY_FLUSH_SECONDS 批量写入（使用独立会话），不阻塞模型调用。
+"""
+import contextvars
+import functools
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.llm_call import LLMCall
+from app.services.chat_history import estimate_tokens
+from app.services.llm_gateway import token_usage
+
+CALL_TYPE_CHAT = "chat"
+CALL_TYPE_EMBEDDING = "embedding"
+ATTEMPT_METADATA_KEY = "llm_attempt"
+CONTEXT_FIELDS = ("feature", "requirement_id", "test_point_id", "thread_id")
+
+_call_context: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("llm_call_context", default=None)
+
+
+def _merged_context(**fields: Any) -> Dict[str, Any]:
+    context = dict(_call_context.get() or {})
+    context.update({key: value for key, value in fields.items() if value is not None})
+    return context
+
+
+@contextmanager
+def llm_call_context(feature: str = None, requirement_id: int = None, test_point_id: int = None, thread_id: str = None):
+    """设置当前上下文中 LLM 调用的调用方（功能、需求、测试点、工作流线程），未指定的字段沿用外层设置"""
+    token = _call_context.set(_merged_context(
+        feature=feature, requirement_id=requirement_id, test_point_id=test_point_id, thread_id=thread_id
+    ))
+    try:
+        yield
+    finally:
+        _call_context.reset(token)
+
+
+def bind_llm_call_context(feature: str = None, requirement_id: int = None, test_point_id: int = None, thread_id: str = None):
+    """
+    设置当前上下文中 LLM 调用的调用方（不自动恢复）
+
+    用于后台任务与流式响应生成器：它们运行在独立复制的上下文中，生命周期结束即失效。
+    """
+    _call_context.set(_merged_context(
+        feature=feature, requirement_id=requirement_id, test_point_id=test_point_id, thread_id=thread_id
+    ))
+
+
+def llm_feature(feature: str):
+    """装饰器：函数执行期间以 feature 作为 LLM 调用的功能名（需求、测试点等字段沿用外层设置）"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with llm_call_context(feature):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_call_context() -> Dict[str, Any]:
+    context = _call_context.get() or {}
+    return {field: context.get(field) for field in CONTEXT_FIELDS}
+
+
+def attempt_config(attempt: int) -> Dict[str, Any]:
+    """模型 / Agent 调用的 config：在运行 metadata 中标记第几次尝试"""
+    return {"metadata": {ATTEMPT_METADATA_KEY: attempt}}
+
+
+class LLMCallRecorder:
+    """调用记录的内存队列与后台批量写入"""
+
+    def __init__(self):
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {"recorded": 0, "written": 0, "dropped": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.LLM_TELEMETRY_ENABLED)
+
+    def record(self, context: Optional[Dict[str, Any]] = None, **fields: Any):
+        """登记一次调用；context 为调用开始时的调用方信息，未提供时读取当前上下文"""
+        if not self.enabled:
+            return
+        row = dict(context if context is not None else current_call_context())
+        row.update(fields)
+        row["feature"] = row.get("feature") or "other"
+        if row.get("error_message"):
+            row["error_message"] = str(row["error_message"])[:500]
+        row["created_at"] = datetime.now()
+        with self._lock:
+            # 数据库长时间不可用时只保留最近的记录，避免内存无限增长
+            if len(self._pending) >= max(settings.LLM_TELEMETRY_MAX_PENDING, 1):
+                self._pending.popleft()
+                self._stats["dropped"] += 1
+            self._pending.append(row)
+            self._stats["recorded"] += 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="llm-telemetry", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            time.sleep(max(settings.LLM_TELEMETRY_FLUSH_SECONDS, 0.1))
+            self.flush()
+
+    def flush(self) -> int:
+        """写入所有待写记录，返回写入条数；写入失败的记录丢弃，不影响后续调用"""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._pending)
+                self._pending.clear()
+            if not rows:
+                return 0
+            db = SessionLocal()
+            try:
+                db.bulk_insert_mappings(LLMCall, rows)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["dropped"] += len(rows)
+                print(f"[WARNING] 写入 LLM 调用记录失败，丢弃 {len(rows)} 条: {e}")
+                return 0
+            finally:
+                db.close()
+            with self._lock:
+                self._stats["written"] += len(rows)
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["enabled"] = self.enabled
+        return stats
+
+
+llm_call_recorder = LLMCallRecorder()
+
+
+def record_cache_hit(call_type: str, provider: str = "", model_name: str = ""):
+    """记录命中响应缓存 / 向量缓存的调用（未调用模型，不消耗 token）"""
+    llm_call_recorder.record(
+        call_type=call_type,
+        provider=provider,
+        model_name=model_name,
+        prompt_tokens=0,
+        cached_prompt_tokens=0,
+        completion_tokens=0,
+        latency_ms=0.0,
+        cache_hit=True,
+        success=True,
+    )
+
+
+@contextmanager
+def track_llm_call(call_type: str, provider: str = "", model_name: str = "", prompt_tokens: Optional[int] = None):
+    """
+    记录一次非 Chat 模型调用（如 Embedding）的耗时与结果
+
+    with 块中可更新 yield 的字典（如 provider 返回的 prompt_tokens）；未更新时使用传入的估算值。
+    """
+    usage: Dict[str, Any] = {"prompt_tokens": None}
+    context = current_call_context()
+    start = time.monotonic()
+    try:
+        yield usage
+    except Exception as e:
+        llm_call_recorder.record(
+            context,
+            call_type=call_type,
+            provider=provider,
+            model_name=model_name,
+            prompt_tokens=prompt_tokens,
+            tokens_estimated=True,
+            latency_ms=(time.monotonic() - start) * 1000,
+            success=False,
+            error_type=type(e).__name__,
+            error_message=str(e),
+        )
+        raise
+    reported = usage.get("prompt_tokens")
+    llm_call_recorder.record(
+        context,
+        call_type=call_type,
+        provider=provider,
+        model_name=model_name,
+        prompt_tokens=reported if reported is not None else prompt_tokens,
+        completion_tokens=0,
+        tokens_estimated=reported is None,
+        latency_ms=(time.monotonic() - start) * 1000,
+        success=True,
+    )
+
+
+def _prompt_tokens(messages) -> int:
+    return sum(
+        estimate_tokens(str(getattr(message, "content", message))) + 4
+        for batch in messages for message in batch
+    )
+
+
+def _completion_tokens(response) -> int:
+    return sum(
+        estimate_tokens(generation.text or "")
+        for generations in response.generations for generation in generations
+    )
+
+
+class LLMTelemetryCallbackHandler(BaseCallbackHandler):
+    """
+    挂在 Chat 模型上的遥测回调：模型请求开始时记录调用方与时间，结束或出错时登记调用记录
+
+    与 LLM 网关回调一样在模型实例级别注册，Agent 与 LangGraph 内部对模型的每次调用都会被记录。
+    """
+
+    def __init__(self, provider: str, model_name: str):
+        self.provider = provider or "default"
+        self.model_name = model_name or ""
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, prompt_tokens: int, metadata: Optional[Dict[str, Any]]):
+        if not llm_call_recorder.enabled:
+            return
+        metadata = metadata or {}
+        context = current_call_context()
+        # LangGraph 将 configurable 中的 thread_id 与当前节点名写入运行 metadata，调用方未设置时使用
+        if context["thread_id"] is None and metadata.get("thread_id") is not None:
+            context["thread_id"] = str(metadata["thread_id"])
+        if context["feature"] is None and metadata.get("langgraph_node"):
+            context["feature"] = str(metadata["langgraph_node"])
+        with self._lock:
+            self._runs[run_id] = {
+                "context": context,
+                "started_at": time.monotonic(),
+                "prompt_tokens": prompt_tokens,
+                "attempt": int(metadata.get(ATTEMPT_METADATA_KEY) or 1),
+            }
+
+    def _finish(self, run_id: UUID, **fields: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        llm_call_recorder.record(
+            run["context"],
+            call_type=CALL_TYPE_CHAT,
+            provider=self.provider,
+            model_name=self.model_name,
+            latency_ms=(time.monotonic() - run["started_at"]) * 1000,
+            attempt=run["attempt"],
+            cache_hit=False,
+            **{"prompt_tokens": run["prompt_tokens"], **fields},
+        )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs: Any):
+        self._start(run_id, _prompt_tokens(messages), metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, metadata=None, **kwargs: Any):
+        self._start(run_id, sum(estimate_tokens(prompt) for prompt in prompts), metadata)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        usage = token_usage(response)
+        if usage is None:
+            self._finish(
+                run_id,
+                cached_prompt_tokens=0,
+                completion_tokens=_completion_tokens(response),
+                tokens_estimated=True,
+                success=True,
+            )
+        else:
+            self._finish(run_id, tokens_estimated=False, success=True, **usage)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish(
+            run_id,
+            completion_tokens=0,
+            tokens_estimated=True,
+            success=False,
+            error_type=type(error).__name__,
+            error_message=str(error),
+        )
+
+
+PERCENTILES = {"p50_latency_ms": 0.5, "p95_latency_ms": 0.95}
+
+
+def _latency_sample():
+    """延迟分布只统计实际调用模型的记录（排除缓存命中）"""
+    return and_(LLMCall.latency_ms.isnot(None), or_(LLMCall.cache_hit.is_(None), LLMCall.cache_hit.is_(False)))
+
+
+def _interpolated_percentile(db: Session, conditions, count: int, fraction: float) -> Optional[float]:
+    """
+    不支持 percentile_cont 的数据库（如 SQLite）：按排序位置取相邻两个值线性插值，结果与 percentile_cont 一致
+
+    只读取两行，不加载整组记录。
+    """
+    if not count:
+        return None
+    position = fraction * (count - 1)
+    lower = math.floor(position)
+    values = [
+        value for (value,) in db.query(LLMCall.latency_ms)
+        .filter(*conditions, _latency_sample())
+        .order_by(LLMCall.latency_ms)
+        .offset(lower)
+        .limit(2)
+    ]
+    if len(values) < 2:
+        return values[0]
+    return values[0] + (values[1] - values[0]) * (position - lower)
+
+
+def aggregate_llm_calls(db: Session, hours: float = 24, feature: Optional[str] = None) -> Dict[str, Any]:
+    """
+    按 (功能, 调用类型, 模型) 汇总最近 hours 小时的调用记录（在数据库中 GROUP BY 聚合）
+
+    延迟百分位只统计实际调用模型的记录（排除缓存命中），PostgreSQL 使用
+    percentile_cont(...) WITHIN GROUP (ORDER BY latency_ms)，其他数据库按同样的线性插值逐组计算。
+    """
+    since = datetime.now() - timedelta(hours=hours)
+    conditions = [LLMCall.created_at >= since]
+    if feature:
+        conditions.append(LLMCall.feature == feature)
+
+    use_percentile_cont = db.get_bind().dialect.name == "postgresql"
+    columns = [
+        LLMCall.feature,
+        LLMCall.call_type,
+        LLMCall.model_name,
+        func.count(LLMCall.id).label("calls"),
+        func.sum(case((LLMCall.success.is_(False), 1), else_=0)).label("errors"),
+        func.sum(case((LLMCall.attempt > 1, 1), else_=0)).label("retries"),
+        func.sum(case((LLMCall.cache_hit.is_(True), 1), else_=0)).label("cache_hits"),
+        func.sum(func.coalesce(LLMCall.prompt_tokens, 0)).label("prompt_tokens"),
+        func.sum(func.coalesce(LLMCall.cached_prompt_tokens, 0)).label("cached_prompt_tokens"),
+        func.sum(func.coalesce(LLMCall.completion_tokens, 0)).label("completion_tokens"),
+        func.sum(case((_latency_sample(), 1), else_=0)).label("latency_samples"),
+    ]
+    if use_percentile_cont:
+        columns += [
+            func.percentile_cont(fraction).within_group(LLMCall.latency_ms).filter(_latency_sample()).label(name)
+            for name, fraction in PERCENTILES.items()
+        ]
+    rows = (
+        db.query(*columns)
+        .filter(*conditions)
+        .group_by(LLMCall.feature, LLMCall.call_type, LLMCall.model_name)
+        .all()
+    )
+
+    items = []
+    for row in rows:
+        group = {
+            "feature": row.feature,
+            "call_type": row.call_type,
+            "model_name": row.model_name,
+            "calls": row.calls,
+            "errors": int(row.errors or 0),
+            "retries": int(row.retries or 0),
+            "cache_hits": int(row.cache_hits or 0),
+            "prompt_tokens": int(row.prompt_tokens or 0),
+            "cached_prompt_tokens": int(row.cached_prompt_tokens or 0),
+            "completion_tokens": int(row.completion_tokens or 0),
+        }
+        group["total_tokens"] = group["prompt_tokens"] + group["completion_tokens"]
+        group_conditions = conditions + [
+            LLMCall.feature.is_(None) if row.feature is None else LLMCall.feature == row.feature,
+            LLMCall.call_type == row.call_type,
+            LLMCall.model_name.is_(None) if row.model_name is None else LLMCall.model_name == row.model_name,
+        ]
+        for name, fraction in PERCENTILES.items():
+            if use_percentile_cont:
+                value = getattr(row, name)
+            else:
+                value = _interpolated_percentile(db, group_conditions, int(row.latency_samples or 0), fraction)
+            group[name] = round(float(value), 1) if value is not None else None
+        items.append(group)
+    items.sort(key=lambda item: item["total_tokens"], reverse=True)
+    return {"since": since.isoformat(), "hours": hours, "items": items}
@@ -4,16 +4,37 @@ import time
 from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, utility
 
 from app.core.config import settings
+from app.services.collection_routes import get_shadow_target, resolve_collection
 
 
 class MilvusService:
     """Milvus 向量数据库服务"""
 
-    def __init__(self):
-        self.collection_name = settings.MILVUS_COLLECTION_NAME
+    def __init__(self, collection_name: Optional[str] = None):
+        """
+        Args:
+            collection_name: 固定的物理集合名称；为空时按 MILVUS_COLLECTION_NAME 的集合路由解析
+        """
+        self._fixed_collection_name = collection_name
         self.collection: Optional[Collection] = None
         self._manual_pk_counter = int(time.time() * 1e6)
 
+    @property
+    def collection_name(self) -> str:
+        if self._fixed_collection_name:
+            return self._fixed_collection_name
+        return resolve_collection(settings.MILVUS_COLLECTION_NAME, settings.EMBEDDING_MODEL)[0]
+
+    @property
+    def embedding_model(self) -> str:
+        """当前集合使用的 Embedding 模型"""
+        return resolve_collection(settings.MILVUS_COLLECTION_NAME, settings.EMBEDDING_MODEL)[1]
+
+    def _reset_if_switched(self):
+        """集合路由切换后丢弃旧集合句柄"""
+        if self.collection is not None and self.collection.name != self.collection_name:
+            self.collection = None
+
     def connect(self):
         """连接 Milvus，若已连接则跳过"""
         try:
@@ -44,12 +65,14 @@ class MilvusService:
     def _ensure_loaded_collection(self):
         """保证 self.collection 已经指向现有集合"""
         self.connect()
+        self._reset_if_switched()
         if not self.collection and utility.has_collection(self.collection_name):
             self.collection = Collection(self.collection_name)
 
     def _ensure_collection(self, dim: int):
         """集合不存在时创建；存在则直接加载"""
         self.connect()
+        self._reset_if_switched()
         if not utility.has_collection(self.collection_name):
             fields = [
                 FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
@@ -146,21 +169,32 @@ class MilvusService:
         self.collection.insert(payload)
         self.collection.flush()
 
-    def search(self, embedding: List[float], top_k: int = 5) -> List[Dict[str, Any]]:
-        """搜索相似向量"""
+    def search(
+        self,
+        embedding: List[float],
+        top_k: int = 5,
+        requirement_id: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """搜索相似向量，指定 requirement_id 时只在该需求的文本块中检索"""
         self._ensure_loaded_collection()
         if not self.collection:
             return []
 
         self.collection.load()
 
+        output_fields = ["requirement_id", "text"]
+        has_chunk_index = any(field.name == "chunk_index" for field in self.collection.schema.fields)
+        if has_chunk_index:
+            output_fields.append("chunk_index")
+
         search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
         results = self.collection.search(
             data=[embedding],
             anns_field="embedding",
             param=search_params,
             limit=top_k,
-            output_fields=["requirement_id", "text"],
+            expr=f"requirement_id == {int(requirement_id)}" if requirement_id is not None else None,
+            output_fields=output_fields,
         )
 
         if not results:
@@ -170,6 +204,7 @@ class MilvusService:
             {
                 "id": hit.id,
                 "requirement_id": hit.entity.get("requirement_id"),
+                "chunk_index": hit.entity.get("chunk_index") if has_chunk_index else None,
                 "text": hit.entity.get("text"),
                 "distance": hit.distance,
             }
@@ -177,7 +212,15 @@ class MilvusService:
         ]
 
     def delete_by_requirement(self, requirement_id: int):
-        """删除指定需求的向量"""
+        """删除指定需求的向量（重建期间同步删除影子集合）"""
+        if not self._fixed_collection_name:
+            shadow = get_shadow_target(settings.MILVUS_COLLECTION_NAME)
+            if shadow:
+                try:
+                    MilvusService(shadow["collection"]).delete_by_requirement(requirement_id)
+                except Exception as exc:
+                    print(f"[WARNING] 删除影子集合 {shadow['collection']} 中的向量失败: {exc}")
+
         self._ensure_loaded_collection()
         if not self.collection:
             return
@@ -190,5 +233,17 @@ class MilvusService:
         expr = f"requirement_id == {requirement_id}"
         self.collection.delete(expr)
 
+    def query_chunks(self, requirement_ids: List[int]) -> List[Dict[str, Any]]:
+        """读取指定需求的全部文本块（重建回填使用）"""
+        self._ensure_loaded_collection()
+        if not self.collection or not requirement_ids:
+            return []
+
+        self.collection.load()
+        return self.collection.query(
+            expr=f"requirement_id in {[int(i) for i in requirement_ids]}",
+            output_fields=["requirement_id", "chunk_index", "text"],
+        )
+
 
 milvus_service = MilvusService()
@@ -0,0 +1,136 @@
+"""
+知识库问答查询缓存
+一级缓存：(Embedding 模型, 归一化问题文本) -> 问题向量
+二级缓存：(集合, 向量哈希, top_k) -> 检索结果，按集合失效
+"""
+import hashlib
+import re
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+def normalize_question(text: str) -> str:
+    """归一化问题文本：去除首尾空白、合并连续空白、统一大小写"""
+    return re.sub(r"\s+", " ", (text or "").strip()).casefold()
+
+
+def embedding_hash(embedding: List[float]) -> str:
+    """计算向量哈希，用作检索结果缓存键的一部分"""
+    return hashlib.sha1(array("f", embedding).tobytes()).hexdigest()
+
+
+def merge_cache_stats(stats_list: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并多个 LRUCache.stats() 结果（多个 RAGService 实例汇总）"""
+    merged = {"size": 0, "max_size": 0, "hits": 0, "misses": 0, "evictions": 0}
+    for stats in stats_list:
+        for key in merged:
+            merged[key] += stats.get(key, 0)
+    total = merged["hits"] + merged["misses"]
+    merged["hit_ratio"] = round(merged["hits"] / total, 4) if total else 0.0
+    return merged
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，支持可选 TTL 与命中率统计"""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 0):
+        self.max_size = max(int(max_size), 0)
+        self.ttl_seconds = max(float(ttl_seconds or 0), 0)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                stored_at, value = item
+                if not self.ttl_seconds or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: Any):
+        if not self.max_size:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def discard_where(self, predicate) -> int:
+        """删除满足条件的缓存键，返回删除数量"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+class QueryCache:
+    """知识库问答两级缓存"""
+
+    def __init__(
+        self,
+        embedding_cache_size: int = 1024,
+        retrieval_cache_size: int = 512,
+        retrieval_ttl_seconds: float = 0,
+    ):
+        self.embeddings = LRUCache(embedding_cache_size)
+        self.retrievals = LRUCache(retrieval_cache_size, ttl_seconds=retrieval_ttl_seconds)
+
+    def get_embedding(self, question: str, model: str = "") -> Optional[List[float]]:
+        return self.embeddings.get((model, normalize_question(question)))
+
+    def set_embedding(self, question: str, embedding: List[float], model: str = ""):
+        self.embeddings.set((model, normalize_question(question)), embedding)
+
+    @staticmethod
+    def _retrieval_key(collection_name: str, embedding: List[float], top_k: int) -> Tuple[str, str, int]:
+        return (collection_name, embedding_hash(embedding), int(top_k))
+
+    def get_retrieval(self, collection_name: str, embedding: List[float], top_k: int) -> Optional[List[Any]]:
+        docs = self.retrievals.get(self._retrieval_key(collection_name, embedding, top_k))
+        return list(docs) if docs is not None else None
+
+    def set_retrieval(self, collection_name: str, embedding: List[float], top_k: int, docs: List[Any]):
+        self.retrievals.set(self._retrieval_key(collection_name, embedding, top_k), list(docs))
+
+    def invalidate_collection(self, collection_name: str) -> int:
+        """集合内容变更时清除该集合的检索结果缓存"""
+        removed = self.retrievals.discard_where(lambda key: key[0] == collection_name)
+        if removed:
+            print(f"[INFO] 已清除集合 {collection_name} 的 {removed} 条检索缓存")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "embedding": self.embeddings.stats(),
+            "retrieval": self.retrievals.stats(),
+        }
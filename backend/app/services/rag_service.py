@@ -3,7 +3,7 @@ RAG (Retrieval-Augmented Generation) 服务
 使用 LangChain 和 Milvus 实现知识库问答
 支持 Short-term Memory (对话历史)
 """
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from pydantic import BaseModel
 from langchain.chat_models import init_chat_model
 from langchain_openai import OpenAIEmbeddings
@@ -18,8 +18,25 @@ from langchain.agents.structured_output import ToolStrategy
 from langchain.agents import create_agent
 from app.core.config import settings
 from app.tools.date_tools import current_date_tool, current_datetime_tool
+from app.services.query_cache import QueryCache, merge_cache_stats
+from app.services.chat_history import chat_history_manager, estimate_tokens
+from app.services.llm_gateway import LLMGatewayCallbackHandler
+from app.services.llm_telemetry import (
+    CALL_TYPE_EMBEDDING,
+    LLMTelemetryCallbackHandler,
+    record_cache_hit,
+    track_llm_call,
+)
+from app.services.single_flight import embedding_single_flight
+from app.services.system_config_cache import system_config_cache
+from app.services.lexical_index import drop_lexical_index, get_lexical_index, reciprocal_rank_fusion
+from app.services.collection_routes import get_shadow_target, record_shadow_write_failure, resolve_collection
 from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import json
 import os
+import threading
 
 
 class AgentContext(BaseModel):
@@ -32,71 +49,109 @@ class AgentResponseFormat(BaseModel):
     answer: str
     detail: Optional[str] = None
 
+def resolve_rag_config(db: Session = None) -> Dict[str, Any]:
+    """
+    解析 RAG 服务使用的模型、Embedding 与 Milvus 配置
+
+    优先级：model_configs 表默认模型 -> system_config 表 -> 环境变量
+
+    Args:
+        db: 数据库会话，为空时只使用环境变量
+
+    Returns:
+        扁平化的配置字典，可直接用于计算配置指纹
+    """
+    api_key = settings.OPENAI_API_KEY
+    api_base = settings.OPENAI_API_BASE
+    model_name = settings.MODEL_NAME
+    temperature = 1.0
+    model_provider = None
+    embedding_model = settings.EMBEDDING_MODEL
+    embedding_api_key = settings.EMBEDDING_API_KEY
+    embedding_api_base = settings.EMBEDDING_API_BASE
+
+    if db:
+        # 先从 model_configs 取默认启用的模型
+        try:
+            from app.models.model_config import ModelConfig
+
+            default_model = db.query(ModelConfig).filter(
+                ModelConfig.is_default == True,
+                ModelConfig.is_active == True
+            ).first()
+            if default_model:
+                api_key = default_model.api_key or api_key
+                api_base = default_model.api_base or api_base
+                model_name = default_model.model_name or model_name
+                model_provider = default_model.provider or model_provider
+                if default_model.temperature and str(default_model.temperature).strip():
+                    try:
+                        temperature = float(default_model.temperature)
+                    except Exception:
+                        temperature = 1.0
+                print("[INFO] RAG 使用默认模型配置（model_configs 表）")
+        except Exception as e:
+            print(f"[WARNING] 读取默认模型配置失败，回退到系统配置: {e}")
+
+        # 再从 system_config 读取覆盖
+        try:
+            config_dict = system_config_cache.get_many([
+                'OPENAI_API_KEY', 'OPENAI_API_BASE', 'MODEL_NAME',
+                'EMBEDDING_MODEL', 'EMBEDDING_API_KEY', 'EMBEDDING_API_BASE'
+            ])
+            api_key = config_dict.get('OPENAI_API_KEY', api_key)
+            api_base = config_dict.get('OPENAI_API_BASE', api_base)
+            model_name = config_dict.get('MODEL_NAME', model_name)
+            embedding_model = config_dict.get('EMBEDDING_MODEL', embedding_model)
+            embedding_api_key = config_dict.get('EMBEDDING_API_KEY', embedding_api_key)
+            embedding_api_base = config_dict.get('EMBEDDING_API_BASE', embedding_api_base)
+        except Exception as e:
+            print(f"[WARNING] 读取 system_config 配置失败，继续使用环境变量: {e}")
+
+    # 如果 Embedding 配置为空,使用 LLM 的配置
+    if not embedding_api_key:
+        embedding_api_key = api_key
+    if not embedding_api_base:
+        embedding_api_base = api_base
+
+    return {
+        "api_key": api_key,
+        "api_base": api_base,
+        "model_name": model_name,
+        "model_provider": model_provider,
+        "temperature": temperature,
+        "embedding_model": embedding_model,
+        "embedding_api_key": embedding_api_key,
+        "embedding_api_base": embedding_api_base,
+        "milvus_uri": settings.MILVUS_URI,
+        "milvus_token": settings.MILVUS_TOKEN,
+        "milvus_user": settings.MILVUS_USER,
+        "milvus_password": settings.MILVUS_PASSWORD,
+    }
+
+
 class RAGService:
     """RAG 知识库问答服务"""
 
-    def __init__(self, db: Session = None):
-        """初始化 RAG 服务"""
-        self.db = db
-
-        # 读取模型与向量配置（优先 model_configs 表，其次 system_config 表，最后环境变量）
-        api_key = settings.OPENAI_API_KEY
-        api_base = settings.OPENAI_API_BASE
-        model_name = settings.MODEL_NAME
-        temperature = 1.0
-        model_provider = None
-        embedding_model = settings.EMBEDDING_MODEL
-        embedding_api_key = settings.EMBEDDING_API_KEY
-        embedding_api_base = settings.EMBEDDING_API_BASE
-
-        if db:
-            # 先从 model_configs 取默认启用的模型
-            try:
-                from app.models.model_config import ModelConfig
-
-                default_model = db.query(ModelConfig).filter(
-                    ModelConfig.is_default == True,
-                    ModelConfig.is_active == True
-                ).first()
-                if default_model:
-                    api_key = default_model.api_key or api_key
-                    api_base = default_model.api_base or api_base
-                    model_name = default_model.model_name or model_name
-                    model_provider = default_model.provider or model_provider
-                    if default_model.temperature and str(default_model.temperature).strip():
-                        try:
-                            temperature = float(default_model.temperature)
-                        except Exception:
-                            temperature = 1.0
-                    print("[INFO] RAG 使用默认模型配置（model_configs 表）")
-            except Exception as e:
-                print(f"[WARNING] 读取默认模型配置失败，回退到系统配置: {e}")
+    def __init__(self, db: Session = None, config: Optional[Dict[str, Any]] = None):
+        """
+        初始化 RAG 服务
 
-            # 再从 system_config 读取覆盖
-            try:
-                from app.models.system_config import SystemConfig
-                configs = db.query(SystemConfig).filter(
-                    SystemConfig.config_key.in_([
-                        'OPENAI_API_KEY', 'OPENAI_API_BASE', 'MODEL_NAME',
-                        'EMBEDDING_MODEL', 'EMBEDDING_API_KEY', 'EMBEDDING_API_BASE'
-                    ])
-                ).all()
-
-                config_dict = {c.config_key: c.config_value for c in configs}
-                api_key = config_dict.get('OPENAI_API_KEY', api_key)
-                api_base = config_dict.get('OPENAI_API_BASE', api_base)
-                model_name = config_dict.get('MODEL_NAME', model_name)
-                embedding_model = config_dict.get('EMBEDDING_MODEL', embedding_model)
-                embedding_api_key = config_dict.get('EMBEDDING_API_KEY', embedding_api_key)
-                embedding_api_base = config_dict.get('EMBEDDING_API_BASE', embedding_api_base)
-            except Exception as e:
-                print(f"[WARNING] 读取 system_config 配置失败，继续使用环境变量: {e}")
+        Args:
+            db: 数据库会话，仅在未传入 config 时用于解析配置
+            config: 已解析的配置（见 resolve_rag_config），传入时不再查询数据库
+        """
+        self.db = db
+        self.config = config if config is not None else resolve_rag_config(db)
 
-        # 如果 Embedding 配置为空,使用 LLM 的配置
-        if not embedding_api_key:
-            embedding_api_key = api_key
-        if not embedding_api_base:
-            embedding_api_base = api_base
+        api_key = self.config["api_key"]
+        api_base = self.config["api_base"]
+        model_name = self.config["model_name"]
+        model_provider = self.config["model_provider"]
+        temperature = self.config["temperature"]
+        embedding_model = self.config["embedding_model"]
+        embedding_api_key = self.config["embedding_api_key"]
+        embedding_api_base = self.config["embedding_api_base"]
 
         print(f"[INFO] RAG 服务配置:")
         print(f"  LLM API Base: {api_base}")
@@ -107,6 +162,11 @@ class RAGService:
 
         # 初始化 LLM
         base_url = api_base if api_base else None
+        # 所有模型调用经过 LLM 网关（按 provider 限流、限并发、优先级排队），并记录调用遥测
+        callbacks = [
+            LLMGatewayCallbackHandler(model_provider or "default"),
+            LLMTelemetryCallbackHandler(model_provider or "default", model_name),
+        ]
         try:
             self.llm = init_chat_model(
                 model=model_name,
@@ -116,6 +176,7 @@ class RAGService:
                 max_tokens=None,
                 api_key=api_key,
                 base_url=base_url,
+                callbacks=callbacks,
             )
         except ImportError as e:
             print(f"[WARNING] init_chat_model provider={model_provider} 加载失败，回退不指定 provider：{e}")
@@ -126,6 +187,7 @@ class RAGService:
                 max_tokens=None,
                 api_key=api_key,
                 base_url=base_url,
+                callbacks=callbacks,
             )
 
         # 初始化 Embeddings
@@ -145,37 +207,144 @@ class RAGService:
             separators=["\n\n", "\n", "。", "！", "？", ".", "!", "?", " ", ""]
         )
 
-        self.vector_store = None
-        
+        # 按物理集合名缓存的向量存储，复用 Milvus 连接
+        self._vector_stores: Dict[str, Milvus] = {}
+        self._vector_stores_lock = threading.Lock()
+        # 按模型缓存的 Embedding 客户端（重建期间旧集合与影子集合使用不同模型）
+        self._embedding_clients: Dict[str, OpenAIEmbeddings] = {embedding_model: self.embeddings}
+
+        # 问题向量与检索结果缓存
+        self.query_cache = QueryCache(
+            embedding_cache_size=settings.RAG_EMBEDDING_CACHE_SIZE,
+            retrieval_cache_size=settings.RAG_RETRIEVAL_CACHE_SIZE,
+            retrieval_ttl_seconds=settings.RAG_RETRIEVAL_CACHE_TTL,
+        )
+
+    def _embeddings_for(self, embedding_model: str) -> OpenAIEmbeddings:
+        """获取指定模型的 Embedding 客户端（与当前配置共用 API Key 与地址）"""
+        with self._vector_stores_lock:
+            embeddings = self._embedding_clients.get(embedding_model)
+            if embeddings is not None:
+                return embeddings
+        embedding_api_base = self.config["embedding_api_base"]
+        embeddings = OpenAIEmbeddings(
+            model=embedding_model,
+            api_key=self.config["embedding_api_key"],
+            base_url=embedding_api_base if embedding_api_base else None
+        )
+        with self._vector_stores_lock:
+            return self._embedding_clients.setdefault(embedding_model, embeddings)
+
+    def _resolve_collection(self, collection_name: str) -> Tuple[str, str]:
+        """逻辑集合 -> (物理集合, Embedding 模型)"""
+        return resolve_collection(collection_name, self.config["embedding_model"])
+
     def _get_vector_store(self, collection_name: str = "knowledge_base") -> Milvus:
-        """获取或创建向量存储"""
+        """获取逻辑集合当前读取的向量存储"""
+        return self._open_vector_store(*self._resolve_collection(collection_name))
+
+    def _open_vector_store(self, physical_name: str, embedding_model: str) -> Milvus:
+        """获取或创建物理集合的向量存储（同一集合复用已建立的连接）"""
+        with self._vector_stores_lock:
+            vector_store = self._vector_stores.get(physical_name)
+            if vector_store is not None:
+                return vector_store
+
         try:
             # 连接到 Milvus
             connection_args = {
-                "uri": settings.MILVUS_URI,
+                "uri": self.config["milvus_uri"],
             }
-            
+
             # 如果有认证信息，添加到连接参数
-            if settings.MILVUS_TOKEN:
-                connection_args["token"] = settings.MILVUS_TOKEN
-            elif settings.MILVUS_USER and settings.MILVUS_PASSWORD:
-                connection_args["user"] = settings.MILVUS_USER
-                connection_args["password"] = settings.MILVUS_PASSWORD
-            
+            if self.config["milvus_token"]:
+                connection_args["token"] = self.config["milvus_token"]
+            elif self.config["milvus_user"] and self.config["milvus_password"]:
+                connection_args["user"] = self.config["milvus_user"]
+                connection_args["password"] = self.config["milvus_password"]
+
             # 创建或连接到向量存储
             vector_store = Milvus(
-                embedding_function=self.embeddings,
-                collection_name=collection_name,
+                embedding_function=self._embeddings_for(embedding_model),
+                collection_name=physical_name,
                 connection_args=connection_args,
                 auto_id=True,
             )
-            
-            return vector_store
-            
+
         except Exception as e:
             print(f"[ERROR] 连接 Milvus 失败: {str(e)}")
             raise
-    
+
+        with self._vector_stores_lock:
+            return self._vector_stores.setdefault(physical_name, vector_store)
+
+    def _embed_query(self, question: str, collection_name: Optional[str] = None) -> List[float]:
+        """获取问题向量（优先读取缓存），指定集合时使用该集合当前的 Embedding 模型"""
+        model = self._resolve_collection(collection_name)[1] if collection_name else self.config["embedding_model"]
+        embedding = self.query_cache.get_embedding(question, model)
+        if embedding is not None:
+            record_cache_hit(CALL_TYPE_EMBEDDING, model_name=model)
+            return embedding
+        embedding = embedding_single_flight.do(f"{model}\n{question}", lambda: self._fetch_query_embedding(model, question))
+        self.query_cache.set_embedding(question, embedding, model)
+        return embedding
+
+    def _fetch_query_embedding(self, model: str, question: str) -> List[float]:
+        with track_llm_call(CALL_TYPE_EMBEDDING, model_name=model, prompt_tokens=estimate_tokens(question)):
+            return self._embeddings_for(model).embed_query(question)
+
+    def _retrieve_documents(self, question: str, collection_name: str, top_k: int) -> List[Document]:
+        """检索相关文档（问题向量与检索结果均走缓存）"""
+        embedding = self._embed_query(question, collection_name)
+        docs = self.query_cache.get_retrieval(collection_name, embedding, top_k)
+        if docs is not None:
+            print(f"[INFO] 命中检索缓存: collection={collection_name}, top_k={top_k}")
+            return docs
+
+        vector_store = self._get_vector_store(collection_name)
+        if settings.RAG_HYBRID_ENABLED:
+            candidates = self._hybrid_candidates(top_k)
+            vector_docs = vector_store.similarity_search_by_vector(embedding, k=candidates)
+            docs = self._fuse_results(question, collection_name, vector_docs, candidates, top_k)
+        else:
+            docs = vector_store.similarity_search_by_vector(embedding, k=top_k)
+        self.query_cache.set_retrieval(collection_name, embedding, top_k, docs)
+        return docs
+
+    @staticmethod
+    def _hybrid_candidates(top_k: int) -> int:
+        """每路检索的候选数：不少于 top_k，不超过配置的候选预算"""
+        return max(top_k, settings.RAG_HYBRID_CANDIDATES)
+
+    def _lexical_search(self, question: str, collection_name: str, k: int) -> List[Document]:
+        try:
+            return [doc for doc, _ in get_lexical_index(collection_name).search(question, k=k)]
+        except Exception as e:
+            print(f"[WARNING] 词法检索失败，仅使用向量检索: {e}")
+            return []
+
+    def _fuse_results(
+        self,
+        question: str,
+        collection_name: str,
+        vector_docs: List[Document],
+        candidates: int,
+        top_k: int,
+    ) -> List[Document]:
+        """融合向量检索与词法检索结果 (RRF)"""
+        lexical_docs = self._lexical_search(question, collection_name, candidates)
+        if not lexical_docs:
+            return vector_docs[:top_k]
+        return reciprocal_rank_fusion([vector_docs, lexical_docs], k=settings.RAG_RRF_K, limit=top_k)
+
+    def invalidate_collection(self, collection_name: str):
+        """集合内容变更后清除该集合的检索缓存"""
+        self.query_cache.invalidate_collection(collection_name)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """查询缓存命中统计"""
+        return self.query_cache.stats()
+
     def add_documents(
         self, 
         documents: List[str], 
@@ -197,40 +366,43 @@ class RAGService:
             print(f"[INFO] 开始处理 {len(documents)} 个文档...")
             
             # 分割文档
-            all_splits = []
-            all_metadatas = []
-            
-            for i, doc_text in enumerate(documents):
-                # 分割文本
-                splits = self.text_splitter.split_text(doc_text)
-                all_splits.extend(splits)
-                
-                # 为每个分块添加元数据
-                metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
-                for j, split in enumerate(splits):
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata["chunk_index"] = j
-                    chunk_metadata["total_chunks"] = len(splits)
-                    all_metadatas.append(chunk_metadata)
+            all_splits, all_metadatas, split_counts = self.split_documents(documents, metadatas)
             
             print(f"[INFO] 文档分割完成，共 {len(all_splits)} 个文本块")
             
             # 获取向量存储
             vector_store = self._get_vector_store(collection_name)
             
-            # 添加文档到向量存储
-            vector_store.add_texts(
+            # 添加文档到向量存储，记录每个文档对应的向量主键，便于精确删除与重建
+            inserted_ids = vector_store.add_texts(
                 texts=all_splits,
                 metadatas=all_metadatas
-            )
+            ) or []
+            document_vector_ids = []
+            offset = 0
+            for count in split_counts:
+                document_vector_ids.append(list(inserted_ids[offset:offset + count]))
+                offset += count
             
             print(f"[INFO] 成功添加 {len(all_splits)} 个文本块到知识库")
+
+            # 重建期间双写影子集合（失败时记录，由重建任务切换前补写）
+            self._write_shadow(collection_name, all_splits, all_metadatas)
+
+            # 同步更新词法索引（失败不影响向量入库）
+            try:
+                get_lexical_index(collection_name).add(all_splits, all_metadatas)
+            except Exception as e:
+                print(f"[WARNING] 更新词法索引失败: {e}")
+
+            self.invalidate_collection(collection_name)
             
             return {
                 "success": True,
                 "total_documents": len(documents),
                 "total_chunks": len(all_splits),
-                "collection_name": collection_name
+                "collection_name": collection_name,
+                "vector_ids": document_vector_ids
             }
             
         except Exception as e:
@@ -242,6 +414,131 @@ class RAGService:
                 "error": str(e)
             }
     
+    def split_documents(
+        self,
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[str], List[Dict[str, Any]], List[int]]:
+        """
+        分割文档并为每个文本块生成元数据
+
+        Returns:
+            (文本块列表, 元数据列表, 每个文档的分块数)
+        """
+        all_splits = []
+        all_metadatas = []
+        split_counts = []
+
+        for i, doc_text in enumerate(documents):
+            splits = self.text_splitter.split_text(doc_text)
+            all_splits.extend(splits)
+            split_counts.append(len(splits))
+
+            metadata = metadatas[i] if metadatas and i < len(metadatas) else {}
+            for j, split in enumerate(splits):
+                chunk_metadata = metadata.copy()
+                chunk_metadata["chunk_index"] = j
+                chunk_metadata["total_chunks"] = len(splits)
+                all_metadatas.append(chunk_metadata)
+
+        return all_splits, all_metadatas, split_counts
+
+    def write_chunks(
+        self,
+        physical_name: str,
+        embedding_model: str,
+        splits: List[str],
+        metadatas: List[Dict[str, Any]],
+        replace_document_ids: Optional[List[int]] = None,
+    ):
+        """
+        将文本块写入指定物理集合（重建回填使用）
+
+        Args:
+            physical_name: 物理集合名称
+            embedding_model: 该集合使用的 Embedding 模型
+            splits: 文本块
+            metadatas: 文本块元数据
+            replace_document_ids: 写入前先删除这些文档已有的向量，保证重复回填幂等
+        """
+        vector_store = self._open_vector_store(physical_name, embedding_model)
+        if replace_document_ids and vector_store.col is not None:
+            vector_store.delete(expr=f"document_id in {[int(i) for i in replace_document_ids]}")
+        if splits:
+            vector_store.add_texts(texts=splits, metadatas=metadatas)
+
+    def _write_shadow(self, collection_name: str, splits: List[str], metadatas: List[Dict[str, Any]]):
+        shadow = get_shadow_target(collection_name)
+        if not shadow or not splits:
+            return
+        try:
+            self.write_chunks(shadow["collection"], shadow["embedding_model"], splits, metadatas)
+        except Exception as e:
+            print(f"[WARNING] 双写影子集合 {shadow['collection']} 失败，等待重建任务补写: {e}")
+            for document_id in {metadata.get("document_id") for metadata in metadatas}:
+                if document_id is not None:
+                    record_shadow_write_failure(collection_name, document_id)
+
+    def delete_document_vectors(
+        self,
+        documents: List[Tuple[int, Optional[List[Any]]]],
+        collection_name: str = "knowledge_base",
+    ) -> bool:
+        """
+        删除文档对应的向量
+
+        Args:
+            documents: [(document_id, vector_ids), ...]，vector_ids 为空时按元数据 document_id 删除
+            collection_name: 集合名称
+
+        Returns:
+            是否全部删除成功
+        """
+        if not documents:
+            return True
+
+        vector_ids = [vid for _, ids in documents if ids for vid in ids]
+        legacy_ids = [int(document_id) for document_id, ids in documents if not ids]
+        vector_store = self._get_vector_store(collection_name)
+
+        success = True
+        if vector_ids:
+            success = bool(vector_store.delete(ids=vector_ids)) and success
+        if legacy_ids:
+            # 早期入库的文档未记录向量主键，回退到按元数据过滤删除
+            success = bool(vector_store.delete(expr=f"document_id in {legacy_ids}")) and success
+
+        document_ids = {int(document_id) for document_id, _ in documents}
+        shadow = get_shadow_target(collection_name)
+        if shadow:
+            # 影子集合中的向量主键与当前集合不同，按元数据删除
+            try:
+                shadow_store = self._open_vector_store(shadow["collection"], shadow["embedding_model"])
+                if shadow_store.col is not None:
+                    shadow_store.delete(expr=f"document_id in {sorted(document_ids)}")
+            except Exception as e:
+                print(f"[WARNING] 删除影子集合 {shadow['collection']} 中的向量失败: {e}")
+                success = False
+
+        try:
+            get_lexical_index(collection_name).remove_documents(sorted(document_ids))
+        except Exception as e:
+            print(f"[WARNING] 删除词法索引失败: {e}")
+            success = False
+        self.invalidate_collection(collection_name)
+        print(f"[INFO] 已删除 {len(document_ids)} 个文档的向量 (collection={collection_name}, success={success})")
+        return success
+
+    def compact_collection(self, collection_name: str = "knowledge_base"):
+        """触发 Milvus 压缩，回收已删除向量占用的空间（尽力而为）"""
+        try:
+            physical_name, embedding_model = self._resolve_collection(collection_name)
+            vector_store = self._open_vector_store(physical_name, embedding_model)
+            vector_store.client.compact(physical_name)
+            print(f"[INFO] 已提交集合压缩任务: {physical_name}")
+        except Exception as e:
+            print(f"[WARNING] 集合压缩失败: {collection_name}, {e}")
+
     def _parse_chat_history(self, chat_history: Optional[List[Dict[str, str]]]) -> List[BaseMessage]:
         """
         解析对话历史为 LangChain 消息格式
@@ -267,50 +564,23 @@ class RAGService:
 
         return messages
 
-    def query(
+    def _build_qa_messages(
         self,
         question: str,
-        collection_name: str = "knowledge_base",
-        top_k: int = 5,
-        return_source: bool = True,
-        stream: bool = False,
-        chat_history: Optional[List[Dict[str, str]]] = None
-    ) -> Dict[str, Any]:
-        """
-        查询知识库 (支持对话历史)
+        relevant_docs: List[Document],
+        history_messages: Optional[List[BaseMessage]] = None,
+    ) -> List[BaseMessage]:
+        """基于检索结果构建问答消息 (支持对话历史)"""
+        # 构建上下文
+        context = "\n\n".join([
+            f"文档片段 {i+1}:\n{doc.page_content}"
+            for i, doc in enumerate(relevant_docs)
+        ])
 
-        Args:
-            question: 用户问题
-            collection_name: 集合名称
-            top_k: 返回最相关的文档数量
-            return_source: 是否返回来源文档
-            stream: 是否使用流式输出
-            chat_history: 对话历史 [{"role": "user", "content": "..."}, ...]
-
-        Returns:
-            查询结果或生成器
-        """
-        try:
-            print(f"[INFO] 查询问题: {question}")
-
-            # 解析对话历史
-            history_messages = self._parse_chat_history(chat_history)
-            if history_messages:
-                print(f"[INFO] 对话历史: {len(history_messages)} 条消息")
-
-            # 获取向量存储
-            vector_store = self._get_vector_store(collection_name)
-
-            # 创建检索器
-            retriever = vector_store.as_retriever(
-                search_kwargs={"k": top_k}
-            )
-
-            # 创建 QA 链 (支持对话历史)
-            if history_messages:
-                # 有对话历史,使用包含历史的 prompt
-                qa_prompt = ChatPromptTemplate.from_messages([
-                    ("system", """你是一个专业的保险行业知识助手。请根据以下上下文信息和对话历史回答用户的问题。
+        if history_messages:
+            # 有对话历史,使用包含历史的 prompt
+            qa_prompt = ChatPromptTemplate.from_messages([
+                ("system", """你是一个专业的保险行业知识助手。请根据以下上下文信息和对话历史回答用户的问题。
 
 上下文信息:
 {context}
@@ -322,13 +592,18 @@ class RAGService:
 4. 回答要简洁明了,重点突出
 5. 如果涉及专业术语,请适当解释
 6. 可以引用上下文中的具体内容来支持你的回答"""),
-                    MessagesPlaceholder(variable_name="chat_history"),
-                    ("human", "{question}"),
-                ])
-            else:
-                # 无对话历史,使用简单 prompt
-                qa_prompt = ChatPromptTemplate.from_messages([
-                    ("system", """你是一个专业的保险行业知识助手。请根据以下上下文信息回答用户的问题。
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("human", "{question}"),
+            ])
+            return qa_prompt.format_messages(
+                context=context,
+                chat_history=history_messages,
+                question=question
+            )
+
+        # 无对话历史,使用简单 prompt
+        qa_prompt = ChatPromptTemplate.from_messages([
+            ("system", """你是一个专业的保险行业知识助手。请根据以下上下文信息回答用户的问题。
 
 上下文信息:
 {context}
@@ -339,26 +614,22 @@ class RAGService:
 3. 回答要简洁明了,重点突出
 4. 如果涉及专业术语,请适当解释
 5. 可以引用上下文中的具体内容来支持你的回答"""),
-                    ("human", "{question}"),
-                ])
-
-            # 获取相关文档 (使用新的 invoke 方法)
-            relevant_docs = retriever.invoke(question)
-
-            print(f"[INFO] 找到 {len(relevant_docs)} 个相关文档")
+            ("human", "{question}"),
+        ])
+        return qa_prompt.format_messages(
+            context=context,
+            question=question
+        )
 
-            if not relevant_docs:
-                # 如果是流式输出,返回流式生成器
-                if stream:
-                    return self._stream_no_docs_response(question, history_messages)
-                # 非流式输出,直接调用 LLM 对话
-                else:
-                    print(f"[INFO] 没有找到相关文档,直接使用 LLM 对话(非流式)")
-
-                    # 创建对话提示词 (支持对话历史)
-                    if history_messages:
-                        chat_prompt = ChatPromptTemplate.from_messages([
-                            ("system", """你是一个专业的保险行业知识助手。
+    def _build_no_docs_messages(
+        self,
+        question: str,
+        history_messages: Optional[List[BaseMessage]] = None,
+    ) -> List[BaseMessage]:
+        """没有检索到文档时构建通用对话消息 (支持对话历史)"""
+        if history_messages:
+            chat_prompt = ChatPromptTemplate.from_messages([
+                ("system", """你是一个专业的保险行业知识助手。
 
 虽然当前知识库中没有找到与用户问题直接相关的文档,但你可以基于你的通用知识和对话历史来回答问题。
 
@@ -369,16 +640,16 @@ class RAGService:
 4. 回答要简洁明了,重点突出
 5. 如果涉及专业术语,请适当解释
 6. 可以建议用户上传相关文档以获得更准确的答案"""),
-                            MessagesPlaceholder(variable_name="chat_history"),
-                            ("human", "{question}"),
-                        ])
-                        messages = chat_prompt.format_messages(
-                            chat_history=history_messages,
-                            question=question
-                        )
-                    else:
-                        chat_prompt = ChatPromptTemplate.from_messages([
-                            ("system", """你是一个专业的保险行业知识助手。
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("human", "{question}"),
+            ])
+            return chat_prompt.format_messages(
+                chat_history=history_messages,
+                question=question
+            )
+
+        chat_prompt = ChatPromptTemplate.from_messages([
+            ("system", """你是一个专业的保险行业知识助手。
 
 虽然当前知识库中没有找到与用户问题直接相关的文档,但你可以基于你的通用知识来回答问题。
 
@@ -388,45 +659,84 @@ class RAGService:
 3. 回答要简洁明了,重点突出
 4. 如果涉及专业术语,请适当解释
 5. 可以建议用户上传相关文档以获得更准确的答案"""),
-                            ("human", "{question}"),
-                        ])
-                        messages = chat_prompt.format_messages(question=question)
-
-                    # 调用 LLM
-                    response = self.llm.invoke(messages)
-                    answer = response.content
-
-                    return {
-                        "success": True,
-                        "answer": answer,
-                        "sources": [],
-                        "question": question
-                    }
-
-            # 构建上下文
-            context = "\n\n".join([
-                f"文档片段 {i+1}:\n{doc.page_content}"
-                for i, doc in enumerate(relevant_docs)
-            ])
+            ("human", "{question}"),
+        ])
+        return chat_prompt.format_messages(question=question)
+
+    @staticmethod
+    def _format_sources(relevant_docs: List[Document]) -> List[Dict[str, Any]]:
+        """将检索到的文档转换为来源列表"""
+        return [
+            {
+                "index": i + 1,
+                "content": doc.page_content,
+                "metadata": doc.metadata
+            }
+            for i, doc in enumerate(relevant_docs)
+        ]
 
-            # 生成回答 (支持对话历史)
+    def query(
+        self,
+        question: str,
+        collection_name: str = "knowledge_base",
+        top_k: int = 5,
+        return_source: bool = True,
+        chat_history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """
+        查询知识库 (支持对话历史)
+
+        流式输出请使用 aquery_stream
+
+        Args:
+            question: 用户问题
+            collection_name: 集合名称
+            top_k: 返回最相关的文档数量
+            return_source: 是否返回来源文档
+            chat_history: 对话历史 [{"role": "user", "content": "..."}, ...]
+
+        Returns:
+            查询结果
+        """
+        try:
+            print(f"[INFO] 查询问题: {question}")
+
+            # 解析对话历史
+            history_messages = self._parse_chat_history(chat_history)
+            history_tokens_saved = 0
             if history_messages:
-                messages = qa_prompt.format_messages(
-                    context=context,
-                    chat_history=history_messages,
-                    question=question
-                )
-            else:
-                messages = qa_prompt.format_messages(
-                    context=context,
-                    question=question
+                print(f"[INFO] 对话历史: {len(history_messages)} 条消息")
+                # 超出 token 预算时将早期对话折叠为摘要
+                history_messages, history_usage = chat_history_manager.compact(
+                    self.llm, history_messages, self.config.get("model_name")
                 )
+                history_tokens_saved = history_usage["tokens_saved"]
+
+            # 获取相关文档 (问题向量与检索结果走缓存)
+            relevant_docs = self._retrieve_documents(question, collection_name, top_k)
+
+            print(f"[INFO] 找到 {len(relevant_docs)} 个相关文档")
+
+            if not relevant_docs:
+                # 直接调用 LLM 对话
+                print(f"[INFO] 没有找到相关文档,直接使用 LLM 对话")
+                messages = self._build_no_docs_messages(question, history_messages)
+
+                # 调用 LLM
+                response = self.llm.invoke(messages)
+                answer = response.content
+
+                return {
+                    "success": True,
+                    "answer": answer,
+                    "sources": [],
+                    "question": question,
+                    "history_tokens_saved": history_tokens_saved
+                }
 
-            # 如果使用流式输出
-            if stream:
-                return self._stream_response(messages, relevant_docs, question, return_source)
+            # 生成回答 (支持对话历史)
+            messages = self._build_qa_messages(question, relevant_docs, history_messages)
 
-            # 非流式输出
             response = self.llm.invoke(messages)
             answer = response.content
 
@@ -434,20 +744,13 @@ class RAGService:
             result = {
                 "success": True,
                 "answer": answer,
-                "question": question
+                "question": question,
+                "history_tokens_saved": history_tokens_saved
             }
             
             # 如果需要返回来源文档
             if return_source:
-                sources = []
-                for i, doc in enumerate(relevant_docs):
-                    source = {
-                        "index": i + 1,
-                        "content": doc.page_content,
-                        "metadata": doc.metadata
-                    }
-                    sources.append(source)
-                result["sources"] = sources
+                result["sources"] = self._format_sources(relevant_docs)
             
             print(f"[INFO] 查询成功，返回答案长度: {len(answer)}")
             
@@ -463,155 +766,107 @@ class RAGService:
                 "question": question
             }
 
-    def _stream_no_docs_response(self, question, history_messages: Optional[List[BaseMessage]] = None):
-        """
-        当没有找到相关文档时的流式响应
-        直接调用 LLM 进行对话(不依赖知识库,支持对话历史)
-
-        Args:
-            question: 用户问题
-            history_messages: 对话历史消息
-
-        Yields:
-            流式响应数据
-        """
-        import json
-
-        print(f"[INFO] 没有找到相关文档,直接使用 LLM 对话")
-
-        # 创建对话提示词 (支持对话历史)
-        from langchain_core.prompts import ChatPromptTemplate
-
-        if history_messages:
-            chat_prompt = ChatPromptTemplate.from_messages([
-                ("system", """你是一个专业的保险行业知识助手。
-
-虽然当前知识库中没有找到与用户问题直接相关的文档,但你可以基于你的通用知识和对话历史来回答问题。
-
-回答要求:
-1. 提供准确、专业的回答
-2. 如果用户的问题涉及之前的对话内容,请结合对话历史理解问题
-3. 如果问题超出你的知识范围,请诚实说明
-4. 回答要简洁明了,重点突出
-5. 如果涉及专业术语,请适当解释
-6. 可以建议用户上传相关文档以获得更准确的答案"""),
-                MessagesPlaceholder(variable_name="chat_history"),
-                ("human", "{question}"),
-            ])
-            messages = chat_prompt.format_messages(
-                chat_history=history_messages,
-                question=question
+    async def _aembed_query(self, question: str, collection_name: Optional[str] = None) -> List[float]:
+        """异步获取问题向量（优先读取缓存），指定集合时使用该集合当前的 Embedding 模型"""
+        model = self._resolve_collection(collection_name)[1] if collection_name else self.config["embedding_model"]
+        embedding = self.query_cache.get_embedding(question, model)
+        if embedding is not None:
+            record_cache_hit(CALL_TYPE_EMBEDDING, model_name=model)
+            return embedding
+        embedding = await embedding_single_flight.ado(
+            f"{model}\n{question}", lambda: self._afetch_query_embedding(model, question)
+        )
+        self.query_cache.set_embedding(question, embedding, model)
+        return embedding
+
+    async def _afetch_query_embedding(self, model: str, question: str) -> List[float]:
+        with track_llm_call(CALL_TYPE_EMBEDDING, model_name=model, prompt_tokens=estimate_tokens(question)):
+            return await self._embeddings_for(model).aembed_query(question)
+
+    async def _aretrieve_documents(self, question: str, collection_name: str, top_k: int) -> List[Document]:
+        """异步检索相关文档（问题向量与检索结果均走缓存）"""
+        embedding = await self._aembed_query(question, collection_name)
+        docs = self.query_cache.get_retrieval(collection_name, embedding, top_k)
+        if docs is not None:
+            print(f"[INFO] 命中检索缓存: collection={collection_name}, top_k={top_k}")
+            return docs
+
+        # 首次连接集合是同步的网络调用，放到线程中避免阻塞事件循环
+        vector_store = await asyncio.to_thread(self._get_vector_store, collection_name)
+        if settings.RAG_HYBRID_ENABLED:
+            candidates = self._hybrid_candidates(top_k)
+            vector_docs = await vector_store.asimilarity_search_by_vector(embedding, k=candidates)
+            # 词法索引首次访问需读取本地文件，放到线程中执行
+            docs = await asyncio.to_thread(
+                self._fuse_results, question, collection_name, vector_docs, candidates, top_k
             )
         else:
-            chat_prompt = ChatPromptTemplate.from_messages([
-                ("system", """你是一个专业的保险行业知识助手。
-
-虽然当前知识库中没有找到与用户问题直接相关的文档,但你可以基于你的通用知识来回答问题。
-
-回答要求:
-1. 提供准确、专业的回答
-2. 如果问题超出你的知识范围,请诚实说明
-3. 回答要简洁明了,重点突出
-4. 如果涉及专业术语,请适当解释
-5. 可以建议用户上传相关文档以获得更准确的答案"""),
-                ("human", "{question}"),
-            ])
-            messages = chat_prompt.format_messages(question=question)
-
-        # 流式生成回答
-        full_answer = ""
-        token_count = 0
-
-        try:
-            print(f"[DEBUG] 开始调用 LLM 流式生成(无知识库模式)")
-
-            for chunk in self.llm.stream(messages):
-                if chunk.content:
-                    token_count += 1
-                    full_answer += chunk.content
-                    # 发送文本块
-                    if token_count <= 5:  # 只打印前5个token
-                        print(f"[DEBUG] Token {token_count}: {repr(chunk.content)}")
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk.content}, ensure_ascii=False)}\n\n"
+            docs = await vector_store.asimilarity_search_by_vector(embedding, k=top_k)
+        self.query_cache.set_retrieval(collection_name, embedding, top_k, docs)
+        return docs
 
-            print(f"[DEBUG] LLM 流式生成完成,总共 {token_count} 个 token")
-            print(f"[DEBUG] 完整答案长度: {len(full_answer)} 字符")
-
-        except Exception as e:
-            print(f"[ERROR] LLM 流式生成失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            # 发送错误信息
-            error_msg = "抱歉,生成回答时出现错误。请稍后重试。"
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
-            full_answer = error_msg
-
-        # 发送完成信号
-        print(f"[DEBUG] 发送完成信号")
-        yield f"data: {json.dumps({'type': 'done', 'answer': full_answer}, ensure_ascii=False)}\n\n"
-
-    def _stream_response(self, messages, relevant_docs, question, return_source):
+    async def aquery_stream(
+        self,
+        question: str,
+        collection_name: str = "knowledge_base",
+        top_k: int = 5,
+        return_source: bool = True,
+        chat_history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        流式响应生成器
+        异步流式查询知识库 (支持对话历史)
+
+        检索与生成全程使用 aembed_query / asimilarity_search_by_vector / astream，
+        不阻塞事件循环；客户端断开时生成器被取消，底层 LLM 请求随之关闭。
 
         Args:
-            messages: 格式化的消息
-            relevant_docs: 相关文档
             question: 用户问题
-            return_source: 是否返回来源
+            collection_name: 集合名称
+            top_k: 返回最相关的文档数量
+            return_source: 是否返回来源文档
+            chat_history: 对话历史 [{"role": "user", "content": "..."}, ...]
 
         Yields:
-            流式响应数据
+            结构化事件：sources / token / done / error，由接口层合并 token 并序列化为 SSE
         """
-        import json
-
-        print(f"[DEBUG] 开始流式响应生成")
-        print(f"[DEBUG] 相关文档数量: {len(relevant_docs)}")
-        print(f"[DEBUG] 是否返回来源: {return_source}")
-
-        # 首先发送来源信息
-        if return_source and relevant_docs:
-            sources = []
-            for i, doc in enumerate(relevant_docs):
-                source = {
-                    "index": i + 1,
-                    "content": doc.page_content,
-                    "metadata": doc.metadata
-                }
-                sources.append(source)
+        print(f"[INFO] 异步流式查询问题: {question}")
 
-            # 发送来源数据
-            print(f"[DEBUG] 发送来源信息: {len(sources)} 个来源")
-            yield f"data: {json.dumps({'type': 'sources', 'sources': sources}, ensure_ascii=False)}\n\n"
-
-        # 流式生成回答
-        print(f"[DEBUG] 开始调用 LLM 流式生成")
         full_answer = ""
-        token_count = 0
-
+        history_tokens_saved = 0
         try:
-            for chunk in self.llm.stream(messages):
+            history_messages = self._parse_chat_history(chat_history)
+            if history_messages:
+                history_messages, history_usage = await chat_history_manager.acompact(
+                    self.llm, history_messages, self.config.get("model_name")
+                )
+                history_tokens_saved = history_usage["tokens_saved"]
+            relevant_docs = await self._aretrieve_documents(question, collection_name, top_k)
+            print(f"[INFO] 找到 {len(relevant_docs)} 个相关文档")
+
+            if relevant_docs:
+                messages = self._build_qa_messages(question, relevant_docs, history_messages)
+                if return_source:
+                    sources = self._format_sources(relevant_docs)
+                    yield {"type": "sources", "sources": sources}
+            else:
+                print(f"[INFO] 没有找到相关文档,直接使用 LLM 对话")
+                messages = self._build_no_docs_messages(question, history_messages)
+
+            async for chunk in self.llm.astream(messages):
                 if chunk.content:
-                    token_count += 1
                     full_answer += chunk.content
-                    # 发送文本块
-                    if token_count <= 5:  # 只打印前5个token
-                        print(f"[DEBUG] Token {token_count}: {repr(chunk.content)}")
-                    yield f"data: {json.dumps({'type': 'token', 'content': chunk.content}, ensure_ascii=False)}\n\n"
-
-            print(f"[DEBUG] LLM 流式生成完成,总共 {token_count} 个 token")
-            print(f"[DEBUG] 完整答案长度: {len(full_answer)} 字符")
+                    yield {"type": "token", "content": chunk.content}
+        except asyncio.CancelledError:
+            print(f"[INFO] 客户端已断开，取消流式生成（已生成 {len(full_answer)} 字符）")
+            raise
         except Exception as e:
-            print(f"[ERROR] LLM 流式生成失败: {str(e)}")
+            print(f"[ERROR] 异步流式生成失败: {str(e)}")
             import traceback
             traceback.print_exc()
-            # 发送错误信息
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
+            yield {"type": "error", "error": str(e)}
             return
 
-        # 发送完成信号
-        print(f"[DEBUG] 发送完成信号")
-        yield f"data: {json.dumps({'type': 'done', 'answer': full_answer}, ensure_ascii=False)}\n\n"
+        yield {"type": "done", "answer": full_answer, "history_tokens_saved": history_tokens_saved}
 
     def search_similar(
         self, 
@@ -636,9 +891,9 @@ class RAGService:
             # 获取向量存储
             vector_store = self._get_vector_store(collection_name)
             
-            # 搜索相似文档
-            results = vector_store.similarity_search_with_score(
-                query=query,
+            # 搜索相似文档 (复用问题向量缓存)
+            results = vector_store.similarity_search_with_score_by_vector(
+                embedding=self._embed_query(query, collection_name),
                 k=top_k
             )
             
@@ -663,7 +918,7 @@ class RAGService:
     
     def delete_collection(self, collection_name: str = "knowledge_base") -> bool:
         """
-        删除知识库集合
+        删除知识库集合（删除逻辑集合当前读取的物理集合）
         
         Args:
             collection_name: 集合名称
@@ -672,22 +927,29 @@ class RAGService:
             是否成功
         """
         try:
+            physical_name, _ = self._resolve_collection(collection_name)
             from pymilvus import connections, utility
             
             # 连接到 Milvus
-            connections.connect(
-                alias="default",
-                uri=settings.MILVUS_URI,
-                token=settings.MILVUS_TOKEN if settings.MILVUS_TOKEN else None
-            )
+            connect_kwargs = {"uri": self.config["milvus_uri"]}
+            if self.config["milvus_token"]:
+                connect_kwargs["token"] = self.config["milvus_token"]
+            elif self.config["milvus_user"] and self.config["milvus_password"]:
+                connect_kwargs["user"] = self.config["milvus_user"]
+                connect_kwargs["password"] = self.config["milvus_password"]
+            connections.connect(alias="default", **connect_kwargs)
             
             # 删除集合
-            if utility.has_collection(collection_name):
-                utility.drop_collection(collection_name)
-                print(f"[INFO] 成功删除集合: {collection_name}")
+            if utility.has_collection(physical_name):
+                utility.drop_collection(physical_name)
+                with self._vector_stores_lock:
+                    self._vector_stores.pop(physical_name, None)
+                drop_lexical_index(collection_name)
+                self.invalidate_collection(collection_name)
+                print(f"[INFO] 成功删除集合: {collection_name} ({physical_name})")
                 return True
             else:
-                print(f"[WARNING] 集合不存在: {collection_name}")
+                print(f"[WARNING] 集合不存在: {physical_name}")
                 return False
                 
         except Exception as e:
@@ -737,3 +999,116 @@ class RAGService:
             current_d = current_date_tool()
             return f"当前日期（东八区）：{current_d}，当前时间（东八区）：{current_dt}。"
         return ""
+
+
+# --- RAGService 实例注册表 ---
+# 按解析后的模型/Embedding/Milvus 配置指纹缓存实例，避免每个请求重复初始化 LLM、Agent 和 Milvus 连接。
+# 解析结果本身也被缓存；clear_rag_service_cache() 注册为系统配置重新加载回调，
+# 任一 worker 写入配置（递增共享版本号）后，各 worker 在下一次版本检查时清除。
+
+_rag_service_cache: Dict[str, "RAGService"] = {}
+_rag_config_cache: Optional[Dict[str, Any]] = None
+# 每次清除缓存时递增，解析配置期间发生清除则不回写旧配置与旧实例
+_rag_cache_generation = 0
+# 已被清除实例的累计命中统计，保证配置变更后统计不归零
+_retired_cache_stats: Dict[str, Dict[str, Any]] = {}
+_rag_service_cache_lock = threading.Lock()
+
+
+def rag_config_fingerprint(config: Dict[str, Any]) -> str:
+    """计算配置指纹（包含密钥，仅输出哈希值）"""
+    payload = json.dumps(config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_rag_service(db: Session = None) -> RAGService:
+    """
+    获取 RAG 服务实例（带缓存）
+
+    首次调用时解析配置并按指纹创建实例，之后的调用只做一次字典查找。
+
+    Args:
+        db: 数据库会话，仅在配置未缓存时用于解析配置
+
+    Returns:
+        RAGService 实例
+    """
+    global _rag_config_cache
+
+    with _rag_service_cache_lock:
+        generation = _rag_cache_generation
+        config = _rag_config_cache
+        if config is not None:
+            instance = _rag_service_cache.get(rag_config_fingerprint(config))
+            if instance is not None:
+                return instance
+
+    if config is None:
+        config = resolve_rag_config(db)
+    fingerprint = rag_config_fingerprint(config)
+
+    with _rag_service_cache_lock:
+        instance = _rag_service_cache.get(fingerprint)
+        if instance is not None:
+            if generation == _rag_cache_generation:
+                _rag_config_cache = config
+            return instance
+
+    # 缓存未命中，创建新实例（在锁外创建，避免阻塞其他请求）
+    print(f"[INFO] 创建新的 RAGService 实例 (fingerprint={fingerprint[:12]})")
+    instance = RAGService(config=config)
+
+    with _rag_service_cache_lock:
+        if generation != _rag_cache_generation:
+            # 创建期间配置已变更，实例仅供本次请求使用，不写入缓存
+            return instance
+        # 双重检查，防止并发创建
+        instance = _rag_service_cache.setdefault(fingerprint, instance)
+        _rag_config_cache = config
+
+    return instance
+
+
+def invalidate_rag_collection(collection_name: str):
+    """集合内容变更时清除所有已缓存 RAGService 实例中该集合的检索缓存"""
+    with _rag_service_cache_lock:
+        instances = list(_rag_service_cache.values())
+    for instance in instances:
+        instance.invalidate_collection(collection_name)
+
+
+def rag_cache_stats() -> Dict[str, Any]:
+    """汇总所有已缓存 RAGService 实例的查询缓存统计（不会创建新实例）"""
+    with _rag_service_cache_lock:
+        instances = list(_rag_service_cache.values())
+        retired = dict(_retired_cache_stats)
+    per_instance = [instance.cache_stats() for instance in instances]
+    return {
+        "instances": len(instances),
+        "embedding": merge_cache_stats(
+            [retired.get("embedding", {})] + [stats["embedding"] for stats in per_instance]
+        ),
+        "retrieval": merge_cache_stats(
+            [retired.get("retrieval", {})] + [stats["retrieval"] for stats in per_instance]
+        ),
+    }
+
+
+def clear_rag_service_cache():
+    """清除 RAGService 缓存（模型、Embedding 或 Milvus 配置变更时调用）"""
+    global _rag_config_cache, _rag_cache_generation
+
+    with _rag_service_cache_lock:
+        for instance in _rag_service_cache.values():
+            for name, stats in instance.cache_stats().items():
+                retired = merge_cache_stats([_retired_cache_stats.get(name, {}), stats])
+                # 实例已释放，只保留累计计数
+                retired.update(size=0, max_size=0)
+                _retired_cache_stats[name] = retired
+        _rag_service_cache.clear()
+        _rag_config_cache = None
+        _rag_cache_generation += 1
+    print("[INFO] RAGService 缓存已清除")
+
+
+system_config_cache.add_reload_hook(clear_rag_service_cache)
@@ -0,0 +1,127 @@
+"""
+合并相同的在途请求（single-flight）
+按请求指纹（模型参数 + 消息内容哈希、Embedding 模型 + 文本）登记在途调用：
+相同指纹的并发调用只执行一次，其余调用等待同一个结果（各自获得一份副本），执行失败时一起失败。
+异步调用在独立任务中执行，任一调用方被取消只是停止等待，不影响共享执行与其他调用方。
+调用结束即移除登记，不缓存结果；结果缓存由 llm_response_cache / query_cache 负责。
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+
+class SingleFlight:
+    """相同键的并发调用合并为一次执行（同步与异步调用共用在途登记）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, Tuple[Future, int]] = {}  # 键 -> (结果, 执行线程)
+        self._lock = threading.Lock()
+        # 异步共享执行的任务（事件循环只保留任务的弱引用）
+        self._tasks = set()
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    def _join(self, key: str, blocking: bool) -> Tuple[Optional[Future], bool]:
+        """
+        登记调用
+
+        Returns:
+            (需要等待的在途调用, 当前调用是否负责发布结果)；前者为 None 时由当前调用执行
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._stats["calls"] += 1
+            inflight = self._calls.get(key)
+            if inflight is None:
+                self._calls[key] = (Future(), thread_id)
+                self._stats["executions"] += 1
+                return None, True
+            # 同步等待同一线程上的在途调用（如事件循环线程中的异步调用）会死锁，改为独立执行
+            if blocking and inflight[1] == thread_id:
+                self._stats["executions"] += 1
+                return None, False
+            self._stats["coalesced"] += 1
+            return inflight[0], False
+
+    def _finish(self, key: str, owner: bool, result: Any = None, error: BaseException = None):
+        with self._lock:
+            if error is not None:
+                self._stats["errors"] += 1
+            if not owner:
+                return
+            future, _ = self._calls.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """执行 func，相同 key 的并发调用等待第一次调用的结果"""
+        if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+            return func()
+        inflight, owner = self._join(key, blocking=True)
+        if inflight is not None:
+            return copy.deepcopy(inflight.result())
+        try:
+            result = func()
+        except BaseException as e:
+            self._finish(key, owner, error=e)
+            raise
+        self._finish(key, owner, result)
+        return result
+
+    async def _run(self, key: str, owner: bool, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await func()
+        except BaseException as e:
+            self._finish(key, owner, error=e)
+            raise
+        self._finish(key, owner, result)
+        return result
+
+    def _task_done(self, task: "asyncio.Task"):
+        self._tasks.discard(task)
+        # 所有调用方都已取消时，异常不再有人读取
+        if not task.cancelled():
+            task.exception()
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        异步版本：等待在途调用时不阻塞事件循环
+
+        共享调用在独立任务中执行，各调用方通过 asyncio.shield 等待：
+        调用方被取消只停止自身等待，只有 func 自身的异常传给所有调用方。
+        """
+        if not settings.LLM_SINGLE_FLIGHT_ENABLED:
+            return await func()
+        inflight, owner = self._join(key, blocking=False)
+        if inflight is not None:
+            return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(inflight)))
+        task = asyncio.ensure_future(self._run(key, owner, func))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["inflight"] = len(self._calls)
+        stats["coalesced_ratio"] = round(stats["coalesced"] / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
+
+
+llm_single_flight = SingleFlight("llm")
+embedding_single_flight = SingleFlight("embedding")
+
+
+def single_flight_stats() -> Dict[str, Any]:
+    """获取 LLM 与 Embedding 调用的合并统计"""
+    return {
+        "enabled": bool(settings.LLM_SINGLE_FLIGHT_ENABLED),
+        "llm": llm_single_flight.stats(),
+        "embedding": embedding_single_flight.stats(),
+    }
@@ -0,0 +1,99 @@
+"""
+SSE 流式输出工具
+流式生成器产出结构化事件（dict），由接口层统一序列化为 SSE 帧；
+token 事件按时间窗口或字符数合并，减少小帧写入与重复序列化。
+"""
+import asyncio
+import json
+from contextlib import suppress
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.config import settings
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """将事件序列化为一帧 SSE 数据"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def coalesce_token_events(
+    events: AsyncIterator[Dict[str, Any]],
+    interval: float = None,
+    max_chars: int = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    合并连续的 token 事件
+
+    缓冲区在以下任一条件满足时输出为一个 token 事件：
+    距缓冲区首个 token 已过 interval 秒、累计字符数达到 max_chars、遇到非 token 事件或流结束。
+    即使上游暂时没有新 token，到时也会按时输出，不会无限延迟。
+
+    Args:
+        events: 上游事件流
+        interval: 合并时间窗口(秒)，默认读取 RAG_STREAM_FLUSH_INTERVAL_MS
+        max_chars: 单帧最大字符数，默认读取 RAG_STREAM_FLUSH_CHARS
+
+    Yields:
+        合并后的事件
+    """
+    if interval is None:
+        interval = settings.RAG_STREAM_FLUSH_INTERVAL_MS / 1000
+    if max_chars is None:
+        max_chars = settings.RAG_STREAM_FLUSH_CHARS
+
+    loop = asyncio.get_running_loop()
+    iterator = events.__aiter__()
+    buffer: List[str] = []
+    buffered_chars = 0
+    deadline = None
+    pending = None
+
+    def flush() -> Dict[str, Any]:
+        nonlocal buffer, buffered_chars, deadline
+        event = {"type": "token", "content": "".join(buffer)}
+        buffer, buffered_chars, deadline = [], 0, None
+        return event
+
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # 时间窗口到期，上游仍在生成
+                yield flush()
+                continue
+
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                break
+
+            if event.get("type") == "token":
+                content = event.get("content") or ""
+                if not content:
+                    continue
+                buffer.append(content)
+                buffered_chars += len(content)
+                if deadline is None:
+                    deadline = loop.time() + interval
+                if buffered_chars >= max_chars:
+                    yield flush()
+            else:
+                if buffer:
+                    yield flush()
+                yield event
+
+        if buffer:
+            yield flush()
+    finally:
+        # 客户端断开时取消上游并等待其清理（关闭 LLM 流）
+        if pending is not None and not pending.done():
+            pending.cancel()
+            with suppress(asyncio.CancelledError, StopAsyncIteration):
+                await pending
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
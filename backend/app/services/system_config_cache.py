@@ -0,0 +1,138 @@
+"""
+系统配置缓存
+system_configs 表整体加载到进程内存，读取不再逐次查询数据库。
+配置写入后调用 invalidate() 递增共享版本号（system_config_version 表）并清空本进程快照；
+其他 worker 每隔 SYSTEM_CONFIG_VERSION_CHECK_SECONDS 检查一次版本号，变化时重新加载。
+依赖配置构建的进程内状态（模型实例、集合路由等）通过 add_reload_hook 注册回调，快照重新加载或失效时清除。
+"""
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.system_config import SystemConfig, SystemConfigVersion
+
+VERSION_ROW_ID = 1
+
+
+class SystemConfigCache:
+    """进程级系统配置快照（使用独立会话，不影响调用方事务）"""
+
+    def __init__(self):
+        self._values: Optional[Dict[str, str]] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload_hooks: List[Callable[[], None]] = []
+        self._stats = {"loads": 0, "version_checks": 0, "invalidations": 0, "errors": 0}
+
+    def add_reload_hook(self, hook: Callable[[], None]):
+        """注册回调：本进程快照因版本号变化重新加载、或本进程写入后失效时调用（在锁外执行）"""
+        with self._lock:
+            if hook not in self._reload_hooks:
+                self._reload_hooks.append(hook)
+
+    def _run_reload_hooks(self):
+        with self._lock:
+            hooks = list(self._reload_hooks)
+        for hook in hooks:
+            try:
+                hook()
+            except Exception as e:
+                print(f"[WARNING] 系统配置重新加载回调失败: {getattr(hook, '__name__', hook)}, {e}")
+
+    def _is_fresh(self) -> bool:
+        interval = max(settings.SYSTEM_CONFIG_VERSION_CHECK_SECONDS, 0)
+        return self._values is not None and time.monotonic() - self._checked_at < interval
+
+    def _read_version(self, db) -> Optional[int]:
+        try:
+            row = db.query(SystemConfigVersion.version).filter(SystemConfigVersion.id == VERSION_ROW_ID).first()
+            return row.version if row else 0
+        except Exception as e:
+            # 未执行迁移时没有版本号表：退化为每个检查间隔重新加载一次
+            db.rollback()
+            print(f"[WARNING] 读取系统配置版本号失败: {e}")
+            return None
+
+    def _refresh(self):
+        """快照未加载或版本号变化时重新加载全部配置"""
+        if self._is_fresh():
+            return
+        changed = False
+        with self._lock:
+            if self._is_fresh():
+                return
+            db = SessionLocal()
+            try:
+                version = self._read_version(db)
+                self._stats["version_checks"] += 1
+                if self._values is None or version is None or version != self._version:
+                    rows = db.query(SystemConfig.config_key, SystemConfig.config_value).all()
+                    values = {row.config_key: row.config_value for row in rows}
+                    # 首次加载（或本进程失效后重新加载，失效时已执行回调）不触发回调；
+                    # 版本号表缺失时按内容比较，避免每个检查间隔都清除依赖的实例
+                    changed = self._values is not None and (
+                        values != self._values or (version is not None and version != self._version)
+                    )
+                    self._values = values
+                    self._version = version
+                    self._stats["loads"] += 1
+                    print(f"[INFO] 已加载系统配置 {len(self._values)} 项 (version={version})")
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"[WARNING] 加载系统配置失败，沿用{'已有快照' if self._values is not None else '默认值'}: {e}")
+            finally:
+                # 加载失败也推迟到下一个检查间隔再试，避免数据库异常时每次读取都重试
+                self._checked_at = time.monotonic()
+                db.close()
+        if changed:
+            self._run_reload_hooks()
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """读取配置值，配置项不存在时返回 default"""
+        self._refresh()
+        values = self._values
+        if values is None or key not in values:
+            return default
+        return values[key]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """批量读取配置，只返回存在的配置项"""
+        self._refresh()
+        values = self._values or {}
+        return {key: values[key] for key in keys if key in values}
+
+    def invalidate(self):
+        """配置写入提交后调用：递增共享版本号通知其他 worker，并清空本进程快照"""
+        db = SessionLocal()
+        try:
+            updated = (
+                db.query(SystemConfigVersion)
+                .filter(SystemConfigVersion.id == VERSION_ROW_ID)
+                .update({SystemConfigVersion.version: SystemConfigVersion.version + 1}, synchronize_session=False)
+            )
+            if not updated:
+                db.add(SystemConfigVersion(id=VERSION_ROW_ID, version=1))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[WARNING] 递增系统配置版本号失败，其他 worker 将在下次加载时生效: {e}")
+        finally:
+            db.close()
+        with self._lock:
+            self._values = None
+            self._version = None
+            self._stats["invalidations"] += 1
+        self._run_reload_hooks()
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["version"] = self._version
+            stats["entries"] = len(self._values) if self._values is not None else None
+        return stats
+
+
+system_config_cache = SystemConfigCache()
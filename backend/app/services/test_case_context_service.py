@@ -0,0 +1,137 @@
+"""
+测试用例生成上下文
+按测试点标题与描述在需求文本块（test_cases 集合）中检索最相关的 top_k 段，
+并限制在 token 预算内，替代把整篇需求文档塞进每个测试点的 Prompt。
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.models.requirement import Requirement
+from app.services.chat_history import estimate_tokens
+from app.services.document_embedding_service import document_embedding_service
+from app.services.document_parser import DocumentParser
+from app.services.milvus_service import milvus_service
+from app.services.query_cache import LRUCache
+
+# requirement_id -> 需求全文估算 token 数（需求文件上传后不再变化，只需解析一次用于统计）
+_document_tokens = LRUCache(512)
+
+
+def _test_point_query(test_point: Dict[str, Any]) -> str:
+    return "\n".join(
+        part for part in (test_point.get("title"), test_point.get("description")) if part
+    ).strip()
+
+
+def retrieve_requirement_chunks(requirement_id: int, query: str, top_k: int) -> List[Dict[str, Any]]:
+    """在指定需求的文本块中检索与查询最相关的片段（按相关度排序）"""
+    if not query or not settings.EMBEDDING_API_KEY:
+        return []
+    embedding = document_embedding_service.embed_query(query, milvus_service.embedding_model)
+    return milvus_service.search(embedding, top_k=top_k, requirement_id=requirement_id)
+
+
+def select_chunks_within_budget(chunks: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """
+    按相关度依次选取片段直到 token 预算用尽，再按原文顺序排列
+
+    超出剩余预算的片段跳过；若最相关的片段本身超出预算，则截断后单独使用。
+    """
+    selected: List[Dict[str, Any]] = []
+    used = 0
+    for chunk in chunks:
+        text = (chunk.get("text") or "").strip()
+        if not text:
+            continue
+        tokens = estimate_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        selected.append(chunk)
+        used += tokens
+
+    if not selected and chunks:
+        first = dict(chunks[0])
+        # 中文约 1 字 1 token，按预算字符数截断是保守估计
+        first["text"] = (first.get("text") or "")[:max(token_budget, 1)]
+        selected = [first]
+
+    return sorted(
+        selected,
+        key=lambda chunk: chunk.get("chunk_index") if chunk.get("chunk_index") is not None else 0,
+    )
+
+
+def format_context(chunks: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        f"[片段 {order}/{len(chunks)}]\n{(chunk.get('text') or '').strip()}"
+        for order, chunk in enumerate(chunks, start=1)
+    )
+
+
+def _full_document_tokens(requirement: Requirement, text: Optional[str] = None) -> int:
+    cached = _document_tokens.get(requirement.id)
+    if cached is not None:
+        return cached
+    if text is None:
+        text = DocumentParser.parse(requirement.file_path, requirement.file_type.value) or ""
+    tokens = estimate_tokens(text)
+    _document_tokens.set(requirement.id, tokens)
+    return tokens
+
+
+def build_test_case_context(
+    requirement: Requirement,
+    test_point: Dict[str, Any],
+    top_k: Optional[int] = None,
+    token_budget: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    构建测试用例生成的需求上下文
+
+    优先检索该需求中与测试点最相关的文本块；需求未向量化或检索失败时回退为截断后的全文。
+
+    Args:
+        requirement: 需求记录
+        test_point: 测试点数据（title / description ...）
+        top_k: 检索片段数，默认读取 TEST_CASE_CONTEXT_TOP_K
+        token_budget: 上下文 token 上限，默认读取 TEST_CASE_CONTEXT_TOKEN_BUDGET
+
+    Returns:
+        (上下文文本, 统计信息 {"source", "chunks", "context_tokens", "document_tokens", "tokens_saved"})
+    """
+    top_k = max(top_k or settings.TEST_CASE_CONTEXT_TOP_K, 1)
+    token_budget = max(token_budget or settings.TEST_CASE_CONTEXT_TOKEN_BUDGET, 1)
+
+    chunks: List[Dict[str, Any]] = []
+    try:
+        chunks = retrieve_requirement_chunks(requirement.id, _test_point_query(test_point), top_k)
+    except Exception as e:
+        print(f"[WARNING] 检索需求片段失败，回退为需求全文: {e}")
+
+    full_text = None
+    if chunks:
+        selected = select_chunks_within_budget(chunks, token_budget)
+        context = format_context(selected)
+        source = "retrieval"
+    else:
+        full_text = DocumentParser.parse(requirement.file_path, requirement.file_type.value) or ""
+        selected = []
+        # 中文约 1 字 1 token，按预算字符数截断是保守估计
+        context = full_text[:token_budget]
+        source = "document"
+
+    document_tokens = _full_document_tokens(requirement, full_text)
+    context_tokens = estimate_tokens(context)
+    stats = {
+        "source": source,
+        "chunks": len(selected),
+        "context_tokens": context_tokens,
+        "document_tokens": document_tokens,
+        "tokens_saved": max(document_tokens - context_tokens, 0),
+    }
+    print(
+        f"[INFO] 测试用例上下文 (requirement={requirement.id}, source={source}): "
+        f"{len(selected)} 段, ~{context_tokens} tokens, 全文 ~{document_tokens} tokens, "
+        f"节省 ~{stats['tokens_saved']} tokens"
+    )
+    return context, stats
@@ -0,0 +1,436 @@
+"""
+向量重建服务
+Embedding 模型变更后，在影子集合中用新模型重建逻辑集合的向量：
+创建任务即开启双写（各 worker 在下一次共享版本检查时生效），后台按源记录 ID 分批限速回填并提交检查点
+（可暂停/断点续跑）；回填完成后补写双写失败与任务创建后新增的记录、清除期间删除的文档，再原子切换读取路由。
+旧集合保留，便于回滚或手动删除。
+"""
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymilvus import utility
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.requirement import Requirement
+from app.models.vector_reindex_job import VectorReindexJob
+from app.services.collection_routes import (
+    ACTIVE_JOB_STATUSES,
+    clear_shadow_write_failures,
+    load_collection_routes,
+    notify_collection_state_changed,
+    pin_collection_models,
+    resolve_collection,
+    shadow_write_failures,
+    switch_collection_route,
+)
+from app.services.document_embedding_service import document_embedding_service
+from app.services.knowledge_vector_service import INACTIVE_STATUSES
+from app.services.milvus_service import MilvusService, milvus_service
+from app.services.rag_service import get_rag_service, invalidate_rag_collection, resolve_rag_config
+
+RESUMABLE_STATUSES = ("paused", "failed")
+
+
+class RateLimiter:
+    """按文本块数限速：每获取 n 个配额，下一次获取至少延后 n / rate 秒"""
+
+    def __init__(self, rate: float):
+        self.rate = max(float(rate or 0), 0)
+        self._next_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: int = 1):
+        if not self.rate or amount <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(self._next_at, now) + amount / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+def is_requirement_collection(collection_name: str) -> bool:
+    """需求文档向量集合（MILVUS_COLLECTION_NAME）由 milvus_service 维护，其余为知识库集合"""
+    return collection_name == settings.MILVUS_COLLECTION_NAME
+
+
+def shadow_collection_name(collection_name: str, job_id: int) -> str:
+    safe_name = re.sub(r"[^0-9A-Za-z_]", "_", collection_name)
+    return f"{safe_name}_v{job_id}"
+
+
+def known_collections(db: Session) -> List[str]:
+    """当前使用中的逻辑集合"""
+    names = {settings.MILVUS_COLLECTION_NAME, "knowledge_base"}
+    names.update(
+        name for (name,) in db.query(KnowledgeDocument.collection_name).distinct().all() if name
+    )
+    return sorted(names)
+
+
+def pin_current_embedding_model(db: Session, previous_model: str) -> List[str]:
+    """Embedding 模型变更时调用：现有集合继续用旧模型读取，直到各自的重建任务完成"""
+    return pin_collection_models(db, known_collections(db), previous_model)
+
+
+def _source_id_column(job: VectorReindexJob):
+    return Requirement.id if is_requirement_collection(job.collection_name) else KnowledgeDocument.id
+
+
+def _source_query(db: Session, job: VectorReindexJob):
+    if is_requirement_collection(job.collection_name):
+        return db.query(Requirement.id)
+    return db.query(KnowledgeDocument.id).filter(
+        KnowledgeDocument.collection_name == job.collection_name,
+        KnowledgeDocument.is_vectorized == True,
+        KnowledgeDocument.status.notin_(INACTIVE_STATUSES),
+    )
+
+
+def create_reindex_job(db: Session, collection_name: str, user_id: Optional[int] = None) -> VectorReindexJob:
+    """
+    创建重建任务并立即开启双写
+
+    Raises:
+        ValueError: 该集合已有未结束的重建任务，或已在使用当前模型
+    """
+    existing = db.query(VectorReindexJob).filter(
+        VectorReindexJob.collection_name == collection_name,
+        VectorReindexJob.status.in_(ACTIVE_JOB_STATUSES),
+    ).first()
+    if existing:
+        raise ValueError(f"集合 {collection_name} 已有未结束的重建任务 (ID: {existing.id})")
+
+    target_model = resolve_rag_config(db)["embedding_model"]
+    source_collection, source_model = resolve_collection(collection_name, target_model)
+    if source_model == target_model and source_collection != collection_name:
+        raise ValueError(f"集合 {collection_name} 已使用模型 {target_model}，无需重建")
+
+    job = VectorReindexJob(
+        collection_name=collection_name,
+        source_collection=source_collection,
+        source_model=source_model,
+        target_collection="",
+        target_model=target_model,
+        status="pending",
+        created_by=user_id,
+    )
+    db.add(job)
+    db.flush()
+    job.target_collection = shadow_collection_name(collection_name, job.id)
+
+    # 任务提交即开启双写；上界之后新增的记录在切换前统一补写，不依赖各 worker 刷新双写状态的时机
+    try:
+        job.total_items = _source_query(db, job).count()
+        job.max_item_id = _source_query(db, job).with_entities(func.max(_source_id_column(job))).scalar() or 0
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    notify_collection_state_changed()
+    db.refresh(job)
+    print(
+        f"[INFO] 创建向量重建任务 {job.id}: {collection_name} "
+        f"{source_collection}({source_model}) -> {job.target_collection}({target_model}), 共 {job.total_items} 条"
+    )
+    return job
+
+
+def _backfill_documents(
+    rag_service,
+    job: VectorReindexJob,
+    documents: List[KnowledgeDocument],
+    limiter: RateLimiter,
+) -> int:
+    """回填知识库文档，返回写入的文本块数"""
+    splits, metadatas, _ = rag_service.split_documents(
+        [document.content for document in documents],
+        [{
+            "document_id": document.id,
+            "title": document.title,
+            "category": document.category or "",
+            "tags": document.tags or "",
+        } for document in documents],
+    )
+    limiter.acquire(len(splits))
+    rag_service.write_chunks(
+        job.target_collection, job.target_model, splits, metadatas,
+        replace_document_ids=[document.id for document in documents],
+    )
+    return len(splits)
+
+
+def _backfill_requirements(job: VectorReindexJob, requirement_ids: List[int], limiter: RateLimiter) -> int:
+    """从源集合读取需求文本块，用新模型嵌入后写入影子集合，返回写入的文本块数"""
+    rows = MilvusService(job.source_collection).query_chunks(requirement_ids)
+    chunks_by_requirement: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+    for row in rows:
+        chunks_by_requirement[int(row["requirement_id"])].append((int(row["chunk_index"]), row["text"]))
+
+    target = MilvusService(job.target_collection)
+    written = 0
+    for requirement_id in requirement_ids:
+        chunks = [text for _, text in sorted(chunks_by_requirement.get(requirement_id, []))]
+        if not chunks:
+            continue
+        limiter.acquire(len(chunks))
+        # 先删除再写入，断点续跑或与双写重叠时保持幂等
+        target.delete_by_requirement(requirement_id)
+        written += document_embedding_service.embed_and_store(target, job.target_model, requirement_id, chunks)
+    return written
+
+
+def _backfill_batch(
+    db: Session,
+    rag_service,
+    job: VectorReindexJob,
+    limiter: RateLimiter,
+    item_ids: Optional[List[int]] = None,
+) -> Tuple[int, int, int]:
+    """
+    回填一批源记录
+
+    Args:
+        item_ids: 指定回填的记录（补写双写失败项）；为空时从检查点之后取下一批
+
+    Returns:
+        (记录数, 文本块数, 本批最大记录ID)
+    """
+    batch_size = max(settings.VECTOR_REINDEX_BATCH_SIZE, 1)
+    if is_requirement_collection(job.collection_name):
+        query = _source_query(db, job)
+        if item_ids is not None:
+            query = query.filter(Requirement.id.in_(item_ids))
+        else:
+            query = query.filter(Requirement.id > job.checkpoint_id, Requirement.id <= job.max_item_id)
+        ids = [requirement_id for (requirement_id,) in query.order_by(Requirement.id).limit(batch_size).all()]
+        if not ids:
+            return 0, 0, job.checkpoint_id
+        return len(ids), _backfill_requirements(job, ids, limiter), ids[-1]
+
+    query = db.query(KnowledgeDocument).filter(
+        KnowledgeDocument.collection_name == job.collection_name,
+        KnowledgeDocument.is_vectorized == True,
+        KnowledgeDocument.status.notin_(INACTIVE_STATUSES),
+    )
+    if item_ids is not None:
+        query = query.filter(KnowledgeDocument.id.in_(item_ids))
+    else:
+        query = query.filter(KnowledgeDocument.id > job.checkpoint_id, KnowledgeDocument.id <= job.max_item_id)
+    documents = query.order_by(KnowledgeDocument.id).limit(batch_size).all()
+    if not documents:
+        return 0, 0, job.checkpoint_id
+    return len(documents), _backfill_documents(rag_service, job, documents, limiter), documents[-1].id
+
+
+def _drop_collection(collection_name: str):
+    """删除影子集合（取消任务时调用，尽力而为）"""
+    try:
+        milvus_service.connect()
+        if utility.has_collection(collection_name):
+            utility.drop_collection(collection_name)
+            print(f"[INFO] 已删除影子集合: {collection_name}")
+    except Exception as e:
+        print(f"[WARNING] 删除影子集合失败: {collection_name}, {e}")
+
+
+def _repair_item_ids(db: Session, job: VectorReindexJob) -> Tuple[List[int], List[int]]:
+    """
+    切换前需要补写的源记录
+
+    Returns:
+        (双写失败的记录, 任务创建后新增的记录)；其他 worker 刷新双写状态前写入的记录只在旧集合中
+    """
+    failed_ids = shadow_write_failures(db, job.id)
+    id_column = _source_id_column(job)
+    new_ids = [
+        item_id for (item_id,) in
+        _source_query(db, job).filter(id_column > (job.max_item_id or 0)).order_by(id_column).all()
+    ]
+    return failed_ids, new_ids
+
+
+def _removed_document_ids(db: Session, job: VectorReindexJob) -> List[int]:
+    """任务期间删除/归档的知识库文档（可能已回填，且删除时该 worker 尚未开启双写）"""
+    if is_requirement_collection(job.collection_name):
+        return []
+    # 在数据库中比较两个时间列，避免与驱动返回的时间值精度/时区不一致
+    job_created_at = select(VectorReindexJob.created_at).where(VectorReindexJob.id == job.id).scalar_subquery()
+    return [
+        document_id for (document_id,) in db.query(KnowledgeDocument.id).filter(
+            KnowledgeDocument.collection_name == job.collection_name,
+            KnowledgeDocument.status.in_(INACTIVE_STATUSES),
+            KnowledgeDocument.updated_at >= job_created_at,
+        ).all()
+    ]
+
+
+def _switch(db: Session, job: VectorReindexJob):
+    """回填完成：切换读取路由，并清空旧集合的向量主键记录（删除时回退为按 document_id 过滤）"""
+    if not is_requirement_collection(job.collection_name):
+        db.query(KnowledgeDocument).filter(
+            KnowledgeDocument.collection_name == job.collection_name
+        ).update({KnowledgeDocument.vector_ids: None}, synchronize_session=False)
+    job.status = "completed"
+    job.finished_at = datetime.now()
+    switch_collection_route(db, job.collection_name, job.target_collection, job.target_model)
+    invalidate_rag_collection(job.collection_name)
+
+
+def run_reindex_job(job_id: int):
+    """执行（或恢复）重建任务（在线程池运行，使用独立会话）"""
+    db = SessionLocal()
+    try:
+        job = db.query(VectorReindexJob).filter(VectorReindexJob.id == job_id).first()
+        if job is None or job.status != "pending":
+            return
+
+        rag_service = None if is_requirement_collection(job.collection_name) else get_rag_service(db)
+        job.status = "running"
+        job.error_message = None
+        job.run_started_at = datetime.now()
+        job.run_start_items = job.processed_items or 0
+        db.commit()
+        print(f"[INFO] 向量重建任务 {job.id} 开始，检查点 {job.checkpoint_id}/{job.max_item_id}")
+
+        limiter = RateLimiter(settings.VECTOR_REINDEX_CHUNKS_PER_SECOND)
+        run_clock = time.monotonic()
+        while True:
+            db.refresh(job)
+            if job.status != "running":
+                print(f"[INFO] 向量重建任务 {job.id} 已{'取消' if job.status == 'cancelled' else '暂停'}")
+                if job.status == "cancelled":
+                    _drop_collection(job.target_collection)
+                return
+
+            count, chunks, last_id = _backfill_batch(db, rag_service, job, limiter)
+            if not count:
+                break
+            job.processed_items = (job.processed_items or 0) + count
+            job.processed_chunks = (job.processed_chunks or 0) + chunks
+            job.checkpoint_id = last_id
+            elapsed = time.monotonic() - run_clock
+            if elapsed > 0:
+                job.items_per_second = round((job.processed_items - job.run_start_items) / elapsed, 3)
+            db.commit()
+
+        # 补写双写失败与任务创建后新增的记录（写入前先删除，与双写重叠时保持幂等）
+        failed_ids, new_ids = _repair_item_ids(db, job)
+        repair_ids = sorted(set(failed_ids) | set(new_ids))
+        batch_size = max(settings.VECTOR_REINDEX_BATCH_SIZE, 1)
+        for start in range(0, len(repair_ids), batch_size):
+            _backfill_batch(db, rag_service, job, limiter, item_ids=repair_ids[start:start + batch_size])
+        removed_ids = _removed_document_ids(db, job)
+        if removed_ids:
+            rag_service.write_chunks(job.target_collection, job.target_model, [], [], replace_document_ids=removed_ids)
+        clear_shadow_write_failures(db, job.id, failed_ids)
+        db.commit()
+        if repair_ids or removed_ids:
+            print(
+                f"[INFO] 向量重建任务 {job.id} 已补写 {len(failed_ids)} 条双写失败记录、"
+                f"{len(new_ids)} 条新增记录，清除 {len(removed_ids)} 个已删除文档"
+            )
+
+        _switch(db, job)
+        print(
+            f"[INFO] 向量重建任务 {job.id} 完成: {job.processed_items} 条记录, "
+            f"{job.processed_chunks} 个文本块, 旧集合 {job.source_collection} 已保留"
+        )
+    except Exception as e:
+        print(f"[ERROR] 向量重建任务 {job_id} 失败: {str(e)}")
+        db.rollback()
+        job = db.query(VectorReindexJob).filter(VectorReindexJob.id == job_id).first()
+        if job is not None:
+            # 保持双写，恢复后从检查点继续
+            job.status = "failed"
+            job.error_message = str(e)
+            db.commit()
+    finally:
+        db.close()
+
+
+def pause_reindex_job(db: Session, job: VectorReindexJob):
+    if job.status not in ("pending", "running"):
+        raise ValueError(f"任务状态为 {job.status}，无法暂停")
+    job.status = "paused"
+    db.commit()
+
+
+def resume_reindex_job(db: Session, job: VectorReindexJob):
+    """将暂停或失败的任务重新排队，由调用方在后台执行 run_reindex_job"""
+    if job.status not in RESUMABLE_STATUSES:
+        raise ValueError(f"任务状态为 {job.status}，无法恢复")
+    job.status = "pending"
+    db.commit()
+
+
+def cancel_reindex_job(db: Session, job: VectorReindexJob):
+    """取消任务并停止双写；运行中的任务在下一批开始前删除影子集合"""
+    if job.status not in ACTIVE_JOB_STATUSES:
+        raise ValueError(f"任务状态为 {job.status}，无法取消")
+    was_running = job.status == "running"
+    job.status = "cancelled"
+    job.finished_at = datetime.now()
+    clear_shadow_write_failures(db, job.id, shadow_write_failures(db, job.id))
+    db.commit()
+    notify_collection_state_changed()
+    if not was_running:
+        _drop_collection(job.target_collection)
+
+
+def reindex_job_report(job: VectorReindexJob) -> Dict[str, Any]:
+    """任务进度报告（含吞吐与预计剩余时间）"""
+    total = job.total_items or 0
+    processed = job.processed_items or 0
+    items_per_second = job.items_per_second or 0
+    remaining = max(total - processed, 0)
+    eta_seconds = None
+    if job.status in ("pending", "running") and items_per_second > 0:
+        eta_seconds = int(remaining / items_per_second)
+    return {
+        "id": job.id,
+        "collection_name": job.collection_name,
+        "source_collection": job.source_collection,
+        "source_model": job.source_model,
+        "target_collection": job.target_collection,
+        "target_model": job.target_model,
+        "status": job.status,
+        "total_items": total,
+        "processed_items": processed,
+        "processed_chunks": job.processed_chunks or 0,
+        "checkpoint_id": job.checkpoint_id or 0,
+        "progress": int(processed / total * 100) if total else (100 if job.status == "completed" else 0),
+        "items_per_second": items_per_second,
+        "eta_seconds": eta_seconds,
+        "error_message": job.error_message,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def restore_reindex_state(db: Session):
+    """
+    启动时恢复集合路由与双写状态
+
+    未结束任务的影子集合保持双写（双写状态从任务表读取）；上次进程退出时仍在运行的任务标记为暂停，
+    由管理员恢复后从检查点继续。
+    """
+    jobs = db.query(VectorReindexJob).filter(VectorReindexJob.status.in_(ACTIVE_JOB_STATUSES)).all()
+    interrupted = [job for job in jobs if job.status in ("pending", "running")]
+    for job in interrupted:
+        job.status = "paused"
+        job.error_message = "服务重启中断，恢复后从检查点继续"
+    if interrupted:
+        db.commit()
+    load_collection_routes(db)
+    if jobs:
+        print(f"[INFO] 已恢复 {len(jobs)} 个未完成向量重建任务的双写状态")
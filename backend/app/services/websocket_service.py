@@ -57,6 +57,16 @@ class ConnectionManager:
         }
         await self.send_personal_message(message, user_id)
     
+    async def notify_test_point_created(self, user_id: int, requirement_id: int, test_point: dict, index: int):
+        """通知单个测试点已保存（流式提取时逐个推送）"""
+        message = {
+            "type": "test_point_created",
+            "requirement_id": requirement_id,
+            "index": index,
+            "test_point": test_point,
+        }
+        await self.send_personal_message(message, user_id)
+    
     async def notify_test_point_failed(self, user_id: int, requirement_id: int, error_message: str):
         """Notify client that test point regeneration failed"""
         message = {
@@ -32,11 +32,14 @@ ALL_CASE_BODY_TOOLS = ALL_DATE_TOOLS + ALL_ENUM_TOOLS + ALL_FIELD_TOOLS + ALL_FU
 
 
 def setup_metadata_for_tools(metadata: dict, base_url: str = "", usercase_id: str = ""):
-    """统一设置元数据、平台地址和用例ID到所有需要的工具模块"""
+    """
+    统一设置元数据、平台地址和用例ID到所有需要的工具模块
+
+    设置写入当前调用上下文（ContextVar），只对本次调用及其派生的线程/任务可见，
+    因此每次调用都完整设置，未提供的值重置为空，不沿用其他调用的配置。
+    """
     set_validation_metadata(metadata)
-    if base_url:
-        set_enum_base_url(base_url)
-        set_field_var_base_url(base_url)
-        set_func_base_url(base_url)
-    if usercase_id:
-        set_field_var_usercase_id(usercase_id)
+    set_enum_base_url(base_url)
+    set_field_var_base_url(base_url)
+    set_func_base_url(base_url)
+    set_field_var_usercase_id(usercase_id)
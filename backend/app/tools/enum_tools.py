@@ -1,18 +1,18 @@
 """枚举值查询工具 - 供 Agent 在生成测试数据时查询字段的有效值范围"""
 
 import json
+from contextvars import ContextVar
 import requests
 from langchain.tools import tool
 
 
-# 模块级变量，由调用方在创建 Agent 前注入
-_base_url: str = ""
+# 调用上下文变量，由调用方在调用 Agent 前注入（按请求/线程上下文隔离，并发调用互不覆盖）
+_base_url: ContextVar[str] = ContextVar("enum_tools_base_url", default="")
 
 
 def set_base_url(base_url: str):
     """注入自动化平台 API 基础地址（在创建 Agent 前调用）"""
-    global _base_url
-    _base_url = (base_url or "").rstrip("/")
+    _base_url.set((base_url or "").rstrip("/"))
 
 
 @tool("query_enum_values")
@@ -29,11 +29,12 @@ def query_enum_values_tool(dict_name: str) -> str:
     """
     if not dict_name:
         return "未提供字典名，无法查询枚举值。"
-    if not _base_url:
+    base_url = _base_url.get()
+    if not base_url:
         return "未配置平台地址，无法查询枚举值。"
 
     try:
-        url = f"{_base_url}/ai/case/dict/{dict_name}"
+        url = f"{base_url}/ai/case/dict/{dict_name}"
         print(f"[TOOL] 查询枚举值: {url}")
         response = requests.get(url, timeout=10)
         response.raise_for_status()
@@ -73,11 +74,12 @@ def query_linkage_rules_tool(flag: str) -> str:
     """
     if not flag:
         return "未提供 flag，无法查询联动规则。"
-    if not _base_url:
+    base_url = _base_url.get()
+    if not base_url:
         return "未配置平台地址，无法查询联动规则。"
 
     try:
-        url = f"{_base_url}/linkage/list/{flag}/API"
+        url = f"{base_url}/linkage/list/{flag}/API"
         print(f"[TOOL] 查询联动规则: POST {url}")
         response = requests.post(url, timeout=10)
         response.raise_for_status()
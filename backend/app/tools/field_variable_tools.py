@@ -1,25 +1,24 @@
 """字段变量查询工具 - 供 Agent 实时获取用例的字段定义和示例值"""
 
 import json
+from contextvars import ContextVar
 import requests
 from langchain.tools import tool
 
 
-# 模块级变量，由调用方在创建 Agent 前注入
-_base_url: str = ""
-_usercase_id: str = ""
+# 调用上下文变量，由调用方在调用 Agent 前注入（按请求/线程上下文隔离，并发调用互不覆盖）
+_base_url: ContextVar[str] = ContextVar("field_variable_tools_base_url", default="")
+_usercase_id: ContextVar[str] = ContextVar("field_variable_tools_usercase_id", default="")
 
 
 def set_base_url(base_url: str):
     """注入自动化平台 API 基础地址"""
-    global _base_url
-    _base_url = (base_url or "").rstrip("/")
+    _base_url.set((base_url or "").rstrip("/"))
 
 
 def set_usercase_id(usercase_id: str):
     """注入当前用例 ID"""
-    global _usercase_id
-    _usercase_id = usercase_id or ""
+    _usercase_id.set(usercase_id or "")
 
 
 @tool("query_field_variables")
@@ -39,15 +38,16 @@ def query_field_variables_tool(usercase_id: str = "") -> str:
         - dataKey: 数据字典名（可用于 query_enum_values 查询枚举值）
         - flag: 联动标识（可用于 query_linkage_rules 查询关联选项）
     """
-    case_id = usercase_id or _usercase_id
+    case_id = usercase_id or _usercase_id.get()
     if not case_id:
         return "未提供用例ID，无法查询字段变量。"
 
-    if not _base_url:
+    base_url = _base_url.get()
+    if not base_url:
         return "未配置平台地址，无法查询字段变量。"
 
     try:
-        url = f"{_base_url}/ai/case/variables/{case_id}"
+        url = f"{base_url}/ai/case/variables/{case_id}"
         print(f"[TOOL] 查询字段变量: GET {url}")
         response = requests.get(url, timeout=15)
         response.raise_for_status()
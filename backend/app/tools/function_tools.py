@@ -1,19 +1,19 @@
 """函数信息查询工具 - 供 Agent 查询系统函数/自定义函数的详细信息"""
 
 import json
+from contextvars import ContextVar
 import requests
 from urllib.parse import quote
 from langchain.tools import tool
 
 
-# 模块级变量，由调用方在创建 Agent 前注入
-_base_url: str = ""
+# 调用上下文变量，由调用方在调用 Agent 前注入（按请求/线程上下文隔离，并发调用互不覆盖）
+_base_url: ContextVar[str] = ContextVar("function_tools_base_url", default="")
 
 
 def set_base_url(base_url: str):
     """注入自动化平台 API 基础地址"""
-    global _base_url
-    _base_url = (base_url or "").rstrip("/")
+    _base_url.set((base_url or "").rstrip("/"))
 
 
 @tool("query_function_info")
@@ -31,11 +31,12 @@ def query_function_info_tool(function_id: str) -> str:
     if not function_id:
         return "未提供函数ID，无法查询函数信息。"
 
-    if not _base_url:
+    base_url = _base_url.get()
+    if not base_url:
         return "未配置平台地址，无法查询函数信息。"
 
     try:
-        url = f"{_base_url}/ai/case/function/{function_id}"
+        url = f"{base_url}/ai/case/function/{function_id}"
         print(f"[TOOL] 查询函数信息: GET {url}")
         response = requests.get(url, timeout=10)
         response.raise_for_status()
@@ -71,12 +72,13 @@ def query_risk_config_tool(query: str) -> str:
     if not query:
         return "未提供 query，无法查询险种配置。"
 
-    if not _base_url:
+    base_url = _base_url.get()
+    if not base_url:
         return "未配置平台地址，无法查询险种配置。"
 
     try:
         safe_query = quote(str(query), safe="")
-        url = f"{_base_url}/ai/case/risk/config/{safe_query}"
+        url = f"{base_url}/ai/case/risk/config/{safe_query}"
         print(f"[TOOL] 查询险种配置: GET {url}")
         response = requests.get(url, timeout=10)
         response.raise_for_status()
@@ -1,17 +1,18 @@
 """数据校验工具 - 供 Agent 在生成测试数据后自行校验"""
 
 import json
+from contextvars import ContextVar
+from typing import Optional
 from langchain.tools import tool
 
 
-# 模块级变量，由调用方在创建 Agent 前注入
-_field_metadata: dict = {}
+# 调用上下文变量，由调用方在调用 Agent 前注入（按请求/线程上下文隔离，并发调用互不覆盖）
+_field_metadata: ContextVar[Optional[dict]] = ContextVar("validation_tools_field_metadata", default=None)
 
 
 def set_field_metadata(metadata: dict):
     """注入字段元数据"""
-    global _field_metadata
-    _field_metadata = metadata or {}
+    _field_metadata.set(metadata or {})
 
 
 @tool("validate_body_data")
@@ -25,7 +26,8 @@ def validate_body_data_tool(body_json: str) -> str:
     Returns:
         校验结果，包含是否通过、错误列表和修改建议。
     """
-    if not _field_metadata or not _field_metadata.get('fields'):
+    field_metadata = _field_metadata.get() or {}
+    if not field_metadata.get('fields'):
         return json.dumps({"valid": True, "message": "无元数据，跳过校验"}, ensure_ascii=False)
 
     try:
@@ -34,6 +36,6 @@ def validate_body_data_tool(body_json: str) -> str:
         return json.dumps({"valid": False, "errors": [f"JSON解析失败: {e}"]}, ensure_ascii=False)
 
     from app.services.body_validator import BodyValidator
-    validator = BodyValidator(_field_metadata)
+    validator = BodyValidator(field_metadata)
     result = validator.validate(body_data)
     return json.dumps(result, ensure_ascii=False, default=str)
@@ -0,0 +1,70 @@
+"""
+增量 JSON 数组解析
+流式输出时逐块喂入文本，数组中每个对象闭合即解析返回，无需等待整个响应结束。
+数组之前的说明文字、Markdown 代码块标记会被忽略。
+"""
+import json
+from typing import Any, List, Tuple
+
+
+class IncrementalJSONArrayParser:
+    """解析第一个顶层 JSON 数组中的对象元素"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0  # 0 表示尚未进入数组（或数组已结束）
+        self.in_string = False
+        self.escaped = False
+        self.object_start = -1
+        self.started = False
+        self.finished = False
+        self.errors: List[Tuple[str, str]] = []  # [(对象原文, 错误信息), ...]
+
+    def feed(self, text: str) -> List[Any]:
+        """追加文本，返回本次新闭合的对象"""
+        if self.finished or not text:
+            return []
+        self.buffer += text
+        completed = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif not self.started:
+                if char == "[":
+                    self.started = True
+                    self.depth = 1
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+                if char == "{" and self.depth == 2:
+                    self.object_start = self.position
+            elif char in "}]":
+                self.depth -= 1
+                if char == "}" and self.depth == 1 and self.object_start != -1:
+                    raw = self.buffer[self.object_start:self.position + 1]
+                    self.object_start = -1
+                    try:
+                        completed.append(json.loads(raw))
+                    except json.JSONDecodeError as e:
+                        self.errors.append((raw, str(e)))
+                elif self.depth == 0:
+                    self.finished = True
+                    self.position += 1
+                    break
+            self.position += 1
+
+        # 已解析的部分不再保留，避免长响应反复拼接
+        keep_from = self.object_start if self.object_start != -1 else self.position
+        self.buffer = self.buffer[keep_from:]
+        self.position -= keep_from
+        if self.object_start != -1:
+            self.object_start = 0
+        return completed
@@ -6,7 +6,7 @@ import os
 
 from app.core.config import settings
 from app.api.v1 import api_router
-from app.db.session import engine
+from app.db.session import SessionLocal, engine
 from app.db.base import Base, import_models
 from app.utils.file_paths import get_upload_dir_path
 
@@ -19,6 +19,13 @@ async def lifespan(app: FastAPI):
     import_models()
     # Create tables
     Base.metadata.create_all(bind=engine)
+    # Restore vector collection routes and in-progress re-index jobs
+    from app.services.vector_reindex_service import restore_reindex_state
+    db = SessionLocal()
+    try:
+        restore_reindex_state(db)
+    finally:
+        db.close()
     yield
     # Shutdown
     pass
@@ -0,0 +1,47 @@
+-- 添加知识库多轮对话会话表，客户端只需携带 session_id，历史由服务端维护
+-- 执行日期: 2026-10-19
+
+-- 1. 会话表
+CREATE TABLE IF NOT EXISTS conversation_sessions (
+    id VARCHAR(36) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    collection_name VARCHAR(200) DEFAULT 'knowledge_base',
+    title VARCHAR(500),
+    message_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE conversation_sessions IS '知识库多轮对话会话表';
+COMMENT ON COLUMN conversation_sessions.id IS '会话ID (UUID)';
+COMMENT ON COLUMN conversation_sessions.user_id IS '所属用户ID';
+COMMENT ON COLUMN conversation_sessions.collection_name IS '使用的集合名称';
+COMMENT ON COLUMN conversation_sessions.title IS '会话标题(首个问题)';
+COMMENT ON COLUMN conversation_sessions.message_count IS '消息数量';
+COMMENT ON COLUMN conversation_sessions.created_at IS '创建时间';
+COMMENT ON COLUMN conversation_sessions.updated_at IS '最后活跃时间';
+
+CREATE INDEX IF NOT EXISTS idx_conversation_sessions_user_id ON conversation_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_sessions_updated_at ON conversation_sessions(updated_at DESC);
+
+
+-- 2. 对话消息表（只追加）
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(36) NOT NULL REFERENCES conversation_sessions(id) ON DELETE CASCADE,
+    role VARCHAR(20) NOT NULL,
+    content TEXT NOT NULL,
+    qa_record_id INTEGER REFERENCES qa_records(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE conversation_messages IS '对话消息表';
+COMMENT ON COLUMN conversation_messages.session_id IS '会话ID';
+COMMENT ON COLUMN conversation_messages.role IS '角色: user/assistant';
+COMMENT ON COLUMN conversation_messages.content IS '消息内容';
+COMMENT ON COLUMN conversation_messages.qa_record_id IS '关联问答记录ID';
+COMMENT ON COLUMN conversation_messages.created_at IS '创建时间';
+
+CREATE INDEX IF NOT EXISTS idx_conversation_messages_session_id ON conversation_messages(session_id, id);
+
+SELECT 'conversation_sessions / conversation_messages 表已创建' AS status;
@@ -0,0 +1,12 @@
+-- 知识库文档记录 Milvus 向量主键，删除与重建时按主键精确操作
+-- 执行日期: 2026-10-19
+
+ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS vector_ids TEXT;
+
+COMMENT ON COLUMN knowledge_documents.vector_ids IS 'Milvus 向量主键列表(JSON)';
+
+-- 后台清理任务按状态与向量化标记扫描
+CREATE INDEX IF NOT EXISTS idx_knowledge_documents_purge
+    ON knowledge_documents(status, is_vectorized, id);
+
+SELECT 'knowledge_documents.vector_ids 已添加' AS status;
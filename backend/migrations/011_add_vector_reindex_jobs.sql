@@ -0,0 +1,39 @@
+-- 添加向量重建任务表：Embedding 模型变更后在影子集合中重建向量，完成后原子切换读取
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS vector_reindex_jobs (
+    id SERIAL PRIMARY KEY,
+    collection_name VARCHAR(200) NOT NULL,
+    source_collection VARCHAR(200) NOT NULL,
+    source_model VARCHAR(200),
+    target_collection VARCHAR(200) NOT NULL,
+    target_model VARCHAR(200) NOT NULL,
+    status VARCHAR(50) DEFAULT 'pending',
+    total_items INTEGER DEFAULT 0,
+    processed_items INTEGER DEFAULT 0,
+    processed_chunks INTEGER DEFAULT 0,
+    checkpoint_id INTEGER DEFAULT 0,
+    max_item_id INTEGER DEFAULT 0,
+    run_started_at TIMESTAMP WITH TIME ZONE,
+    run_start_items INTEGER DEFAULT 0,
+    items_per_second DOUBLE PRECISION DEFAULT 0,
+    error_message TEXT,
+    created_by INTEGER REFERENCES users(id),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE vector_reindex_jobs IS '向量重建任务表';
+COMMENT ON COLUMN vector_reindex_jobs.collection_name IS '逻辑集合名称';
+COMMENT ON COLUMN vector_reindex_jobs.source_collection IS '当前读取的物理集合';
+COMMENT ON COLUMN vector_reindex_jobs.source_model IS '当前集合使用的 Embedding 模型';
+COMMENT ON COLUMN vector_reindex_jobs.target_collection IS '影子集合';
+COMMENT ON COLUMN vector_reindex_jobs.target_model IS '新 Embedding 模型';
+COMMENT ON COLUMN vector_reindex_jobs.status IS '状态: pending/running/paused/completed/failed/cancelled';
+COMMENT ON COLUMN vector_reindex_jobs.checkpoint_id IS '已回填的最大源记录ID（断点续跑）';
+COMMENT ON COLUMN vector_reindex_jobs.max_item_id IS '回填上界，之后新增的记录由双写覆盖';
+
+CREATE INDEX IF NOT EXISTS idx_vector_reindex_jobs_collection ON vector_reindex_jobs(collection_name, status);
+
+SELECT 'vector_reindex_jobs 表已创建' AS status;
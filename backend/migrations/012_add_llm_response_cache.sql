@@ -0,0 +1,26 @@
+-- 添加 LLM 响应缓存表：相同模型、参数与消息的 LLM 调用复用已持久化的响应
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+    id SERIAL PRIMARY KEY,
+    cache_key VARCHAR(64) NOT NULL UNIQUE,
+    provider VARCHAR(100),
+    model_name VARCHAR(200),
+    content TEXT NOT NULL,
+    hit_count INTEGER DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_hit_at TIMESTAMP WITH TIME ZONE,
+    expires_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE llm_response_cache IS 'LLM 响应缓存表';
+COMMENT ON COLUMN llm_response_cache.cache_key IS '缓存键: SHA-256(provider, 模型, 温度, max_tokens, 消息)';
+COMMENT ON COLUMN llm_response_cache.content IS 'LLM 响应内容';
+COMMENT ON COLUMN llm_response_cache.last_hit_at IS '最近命中时间（超出容量时按此淘汰）';
+COMMENT ON COLUMN llm_response_cache.expires_at IS '过期时间';
+
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_model ON llm_response_cache(model_name);
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_expires ON llm_response_cache(expires_at);
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_hit ON llm_response_cache(last_hit_at);
+
+SELECT 'llm_response_cache 表已创建' AS status;
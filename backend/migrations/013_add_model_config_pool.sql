@@ -0,0 +1,12 @@
+-- 为模型配置添加端点池与权重：相同 pool_name 的配置按加权轮询或最低延迟分摊请求，故障时自动转移
+-- 执行日期: 2026-10-19
+
+ALTER TABLE model_configs ADD COLUMN IF NOT EXISTS pool_name VARCHAR(100);
+ALTER TABLE model_configs ADD COLUMN IF NOT EXISTS weight INTEGER DEFAULT 1;
+
+COMMENT ON COLUMN model_configs.pool_name IS '端点池名称（相同池内的配置互为负载均衡与故障转移端点）';
+COMMENT ON COLUMN model_configs.weight IS '加权轮询权重';
+
+CREATE INDEX IF NOT EXISTS idx_model_configs_pool_name ON model_configs(pool_name);
+
+SELECT 'model_configs 端点池字段已添加' AS status;
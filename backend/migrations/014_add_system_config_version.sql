@@ -0,0 +1,15 @@
+-- 添加系统配置版本号表：配置写入时递增版本号，各 worker 据此刷新内存中的配置快照
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS system_config_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE system_config_version IS '系统配置版本号（单行）';
+COMMENT ON COLUMN system_config_version.version IS '配置版本号，system_configs 写入后递增';
+
+INSERT INTO system_config_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
+
+SELECT 'system_config_version 表已创建' AS status;
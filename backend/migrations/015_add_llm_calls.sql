@@ -0,0 +1,40 @@
+-- 添加 LLM 调用记录表：每次 Chat / Agent / Embedding 调用的调用方、token 用量、耗时、重试、缓存命中与错误
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS llm_calls (
+    id SERIAL PRIMARY KEY,
+    feature VARCHAR(100),
+    requirement_id INTEGER,
+    test_point_id INTEGER,
+    thread_id VARCHAR(100),
+    call_type VARCHAR(20) NOT NULL DEFAULT 'chat',
+    provider VARCHAR(100),
+    model_name VARCHAR(200),
+    prompt_tokens INTEGER,
+    cached_prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    tokens_estimated BOOLEAN DEFAULT FALSE,
+    latency_ms DOUBLE PRECISION,
+    attempt INTEGER DEFAULT 1,
+    cache_hit BOOLEAN DEFAULT FALSE,
+    success BOOLEAN DEFAULT TRUE,
+    error_type VARCHAR(200),
+    error_message TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE llm_calls IS 'LLM 调用记录表（遥测数据，不与业务表建立外键）';
+COMMENT ON COLUMN llm_calls.feature IS '调用功能，如 extract_test_points';
+COMMENT ON COLUMN llm_calls.call_type IS '调用类型: chat / embedding';
+COMMENT ON COLUMN llm_calls.cached_prompt_tokens IS '命中 provider 前缀缓存的输入 token 数';
+COMMENT ON COLUMN llm_calls.tokens_estimated IS 'provider 未返回用量，token 数为估算值';
+COMMENT ON COLUMN llm_calls.attempt IS '第几次尝试，大于 1 表示重试';
+COMMENT ON COLUMN llm_calls.cache_hit IS '是否命中响应缓存 / 向量缓存（未调用模型）';
+
+CREATE INDEX IF NOT EXISTS idx_llm_calls_created_at ON llm_calls(created_at);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_feature_model ON llm_calls(feature, model_name);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_requirement ON llm_calls(requirement_id);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_test_point ON llm_calls(test_point_id);
+CREATE INDEX IF NOT EXISTS idx_llm_calls_thread ON llm_calls(thread_id);
+
+SELECT 'llm_calls 表已创建' AS status;
@@ -0,0 +1,35 @@
+-- 添加知识库词法索引表：BM25 倒排索引从各 worker 的本地 JSON 文件迁移到数据库，增量写入、所有 worker 共享
+-- 执行日期: 2026-10-19
+-- 执行后调用 POST /api/v1/knowledge-base/maintenance/backfill-lexical-index 为已有文档建立索引，
+-- 之后可删除旧的 data/lexical_index 目录
+
+CREATE TABLE IF NOT EXISTS lexical_chunks (
+    id SERIAL PRIMARY KEY,
+    collection_name VARCHAR(200) NOT NULL,
+    document_id INTEGER,
+    chunk_index INTEGER,
+    text TEXT NOT NULL,
+    metadata_json TEXT,
+    length INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS lexical_postings (
+    chunk_id INTEGER NOT NULL REFERENCES lexical_chunks(id) ON DELETE CASCADE,
+    term VARCHAR(200) NOT NULL,
+    collection_name VARCHAR(200) NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (chunk_id, term)
+);
+
+COMMENT ON TABLE lexical_chunks IS '知识库词法索引文本块表';
+COMMENT ON COLUMN lexical_chunks.collection_name IS '逻辑集合名称';
+COMMENT ON COLUMN lexical_chunks.length IS '词项数（BM25 长度归一化）';
+COMMENT ON TABLE lexical_postings IS '知识库词法索引倒排项表';
+COMMENT ON COLUMN lexical_postings.tf IS '词频';
+
+CREATE INDEX IF NOT EXISTS idx_lexical_chunks_collection ON lexical_chunks(collection_name);
+CREATE INDEX IF NOT EXISTS idx_lexical_chunks_document ON lexical_chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_lexical_postings_collection_term ON lexical_postings(collection_name, term);
+
+SELECT 'lexical_chunks / lexical_postings 表已创建' AS status;
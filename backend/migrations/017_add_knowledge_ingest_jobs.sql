@@ -0,0 +1,34 @@
+-- 持久化知识库批量导入任务：任务进度在所有 worker 上可查询；导入失败原因记录在文档上，文档状态保持 active 以便查看与重试
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS knowledge_ingest_jobs (
+    id VARCHAR(32) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    total INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    total_chunks INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+COMMENT ON TABLE knowledge_ingest_jobs IS '知识库批量导入任务表';
+COMMENT ON COLUMN knowledge_ingest_jobs.status IS '状态: pending/processing/completed/partial/failed';
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_ingest_jobs_user ON knowledge_ingest_jobs(user_id);
+
+ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS ingest_job_id VARCHAR(32);
+ALTER TABLE knowledge_documents ADD COLUMN IF NOT EXISTS ingest_error TEXT;
+
+COMMENT ON COLUMN knowledge_documents.ingest_job_id IS '最近一次批量导入任务ID';
+COMMENT ON COLUMN knowledge_documents.ingest_error IS '最近一次解析/向量化失败的原因，成功后清空';
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_documents_ingest_job ON knowledge_documents(ingest_job_id);
+
+-- 早期版本将导入失败的文档标记为 failed（不在状态枚举内，默认列表不可见），恢复为 active
+UPDATE knowledge_documents
+SET status = 'active', ingest_error = COALESCE(ingest_error, '导入失败')
+WHERE status = 'failed';
+
+SELECT 'knowledge_ingest_jobs 表已创建' AS status;
@@ -0,0 +1,15 @@
+-- 添加向量重建双写失败记录表：双写状态由各 worker 从 vector_reindex_jobs 读取，
+-- 任意 worker 双写失败的源记录持久化于此，由重建任务在切换前补写
+-- 执行日期: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS vector_reindex_shadow_failures (
+    job_id INTEGER NOT NULL REFERENCES vector_reindex_jobs(id) ON DELETE CASCADE,
+    item_id INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (job_id, item_id)
+);
+
+COMMENT ON TABLE vector_reindex_shadow_failures IS '向量重建双写失败的源记录';
+COMMENT ON COLUMN vector_reindex_shadow_failures.item_id IS '源记录ID（文档ID或需求ID）';
+
+SELECT 'vector_reindex_shadow_failures 表已创建' AS status;
@@ -0,0 +1,130 @@
+import re
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService, clear_ai_service_cache, get_ai_service
+from app.tools import enum_tools, field_variable_tools, function_tools, setup_metadata_for_tools, validation_tools
+
+WORKERS = 16
+ROUNDS = 4
+
+
+class EchoToolCallingLLM(BaseChatModel):
+    """按请求中的测试点标题返回用例，记录同时在途的最大调用数"""
+    active: int = 0
+    max_active: int = 0
+    lock: object = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo-tool-calling"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(0.01)
+            title = re.findall(r"TP-\d+-\d+", messages[-1].content)[0]
+            case = {
+                "title": f"{title}-case",
+                "description": "",
+                "test_steps": [{"step": 1, "action": "提交", "expected": "成功"}],
+                "expected_result": "成功",
+            }
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": "TestCaseDraftList", "args": {"test_cases": [case]}, "id": f"call-{title}"}],
+            )
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class AIServiceConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        clear_ai_service_cache()
+        self.service = AIService.__new__(AIService)
+        self.service.llm = EchoToolCallingLLM(lock=threading.Lock())
+        ai_service_module._ai_service_cache[None] = self.service
+        self.patches = [
+            patch.object(ai_service_module.settings, "AI_MAX_RETRIES", 1),
+            patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False),
+            # Prompt 读取走进程级配置缓存，这里只验证会话按上下文隔离
+            patch.object(ai_service_module, "system_config_cache", SimpleNamespace(get=lambda key, default=None: default)),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+        clear_ai_service_cache()
+
+    def test_concurrent_callers_keep_their_own_session_and_tool_config(self):
+        barrier = threading.Barrier(WORKERS)
+
+        def worker(index):
+            db = SimpleNamespace(name=f"db-{index}")
+            base_url = f"http://platform-{index}"
+            metadata = {"fields": [f"field-{index}"]}
+            service = get_ai_service(db)
+            setup_metadata_for_tools(metadata, base_url=base_url, usercase_id=str(index))
+            # 所有线程都完成设置后再读取，放大互相覆盖的窗口
+            barrier.wait()
+            seen = []
+            for round_index in range(ROUNDS):
+                test_cases = service.generate_test_cases({"title": f"TP-{index}-{round_index}"})
+                seen.append((
+                    service.db,
+                    enum_tools._base_url.get(),
+                    function_tools._base_url.get(),
+                    field_variable_tools._base_url.get(),
+                    field_variable_tools._usercase_id.get(),
+                    validation_tools._field_metadata.get(),
+                    [case["title"] for case in test_cases],
+                ))
+            return service, db, base_url, metadata, seen
+
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            results = list(pool.map(worker, range(WORKERS)))
+
+        for index, (service, db, base_url, metadata, seen) in enumerate(results):
+            self.assertIs(self.service, service)
+            for round_index, observed in enumerate(seen):
+                self.assertEqual(
+                    (db, base_url, base_url, base_url, str(index), metadata, [f"TP-{index}-{round_index}-case"]),
+                    observed,
+                )
+        # 共享的 LLM 客户端确实被并发调用
+        self.assertGreater(self.service.llm.max_active, 1)
+
+    def test_cached_instance_does_not_keep_caller_session(self):
+        db = SimpleNamespace(name="request-db")
+        service = get_ai_service(db)
+        self.assertIs(db, service.db)
+
+        other_thread_view = []
+        thread = threading.Thread(target=lambda: other_thread_view.append(service.db))
+        thread.start()
+        thread.join()
+
+        self.assertEqual([None], other_thread_view)
+        self.assertNotIn("db", vars(service))
+
+
+if __name__ == "__main__":
+    unittest.main()
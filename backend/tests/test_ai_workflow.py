@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+from typing import Any, Dict, Set
+from unittest.mock import patch
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService
+
+
+class FakeLLM(BaseChatModel):
+    """按测试点标题返回结构化用例的 tool call，可模拟失败与并发"""
+    delay: float = 0.1
+    fail_always: Set[str] = set()
+    fail_once: Set[str] = set()
+    calls: Dict[str, int] = {}
+    active: int = 0
+    max_active: int = 0
+    lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        title = messages[-1].content.split("标题：")[1].split("\n")[0]
+        with self.lock:
+            self.calls[title] = self.calls.get(title, 0) + 1
+            attempt = self.calls[title]
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self.lock:
+                self.active -= 1
+        if title in self.fail_always or (title in self.fail_once and attempt == 1):
+            raise RuntimeError("rate limited")
+        case = {
+            "title": f"{title}-case",
+            "description": "",
+            "test_steps": [{"step": 1, "action": "提交", "expected": "成功"}],
+            "expected_result": "成功",
+        }
+        message = AIMessage(content="", tool_calls=[
+            {"name": "TestCaseDraftList", "args": {"test_cases": [case]}, "id": f"call-{title}-{attempt}"}
+        ])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class AIWorkflowTest(unittest.TestCase):
+    def setUp(self):
+        self.service = AIService.__new__(AIService)
+        self.service.db = None
+        self.test_points = [{"title": f"TP-{index}", "description": "", "category": "功能"} for index in range(8)]
+        self.patches = [
+            patch.object(self.service, "extract_test_points", lambda text, feedback="": list(self.test_points)),
+            patch.object(ai_service_module.settings, "TEST_CASE_GENERATION_CONCURRENCY", 4),
+            patch.object(ai_service_module.settings, "AI_MAX_RETRIES", 2),
+            patch.object(ai_service_module.settings, "AI_RETRY_INTERVAL", 1),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def test_fans_out_test_points_with_isolated_retries_and_failures(self):
+        self.service.llm = FakeLLM(fail_always={"TP-2"}, fail_once={"TP-5"})
+
+        start = time.monotonic()
+        result = self.service.create_workflow().invoke({"requirement_text": "需求"})
+        elapsed = time.monotonic() - start
+
+        titles = sorted(case["title"] for case in result["test_cases"])
+        self.assertEqual(sorted(f"TP-{index}-case" for index in range(8) if index != 2), titles)
+        self.assertEqual(["TP-2"], [item["test_point"]["title"] for item in result["failed_test_points"]])
+        self.assertEqual("test_cases_partially_generated", result["current_step"])
+        self.assertEqual(2, self.service.llm.calls["TP-5"])
+        self.assertEqual(4, self.service.llm.max_active)
+        # 失败分支的重试等待与其他分支重叠，不再串行拖慢整个工作流
+        self.assertLess(elapsed, 2.0)
+
+    def test_no_test_points_skips_generation(self):
+        self.service.llm = FakeLLM()
+        self.test_points = []
+
+        result = self.service.create_workflow().invoke({"requirement_text": "需求"})
+
+        self.assertEqual([], result["test_cases"])
+        self.assertEqual("test_cases_generated", result["current_step"])
+        self.assertEqual({}, self.service.llm.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, import_models
+from app.models.knowledge_base import KnowledgeDocument, QARecord
+from app.models.workflow_task import WorkflowTask
+from app.services import answer_cache as answer_cache_module
+from app.services.answer_cache import SemanticAnswerCache
+
+import_models()
+
+
+class FakeEmbeddings:
+    VECTORS = {
+        "犹豫期有多长？": [1.0, 0.0],
+        "犹豫期是多少天？": [0.99, 0.05],
+        "如何申请理赔？": [0.0, 1.0],
+    }
+
+    def embed_documents(self, texts):
+        return [self.VECTORS[text] for text in texts]
+
+
+class FakeRAGService:
+    def __init__(self):
+        self.config = {"embedding_model": "fake"}
+        self.embeddings = FakeEmbeddings()
+
+    def _embed_query(self, question):
+        return FakeEmbeddings.VECTORS[question]
+
+
+class SemanticAnswerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+        self.now = datetime.now()
+        self.db.add(
+            KnowledgeDocument(
+                title="条款",
+                content="犹豫期 15 天",
+                collection_name="knowledge_base",
+                created_at=self.now - timedelta(days=1),
+            )
+        )
+        self.record = QARecord(
+            question="犹豫期有多长？",
+            answer="犹豫期为 15 天。",
+            collection_name="knowledge_base",
+            sources=json.dumps([{"index": 1, "content": "犹豫期 15 天"}], ensure_ascii=False),
+            rating=5,
+            created_at=self.now - timedelta(hours=1),
+        )
+        self.db.add(self.record)
+        self.db.commit()
+        self.rag_service = FakeRAGService()
+        self.cache = SemanticAnswerCache()
+        self.cache.warm(self.rag_service, [(self.record.id, self.record.question)])
+        self.settings_patch = patch.object(answer_cache_module.settings, "RAG_ANSWER_CACHE_ENABLED", True)
+        self.settings_patch.start()
+
+    def tearDown(self):
+        self.settings_patch.stop()
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self.engine.dispose()
+
+    def test_similar_question_reuses_highly_rated_answer(self):
+        hit = self.cache.lookup(self.db, self.rag_service, "犹豫期是多少天？", "knowledge_base")
+
+        self.assertIsNotNone(hit)
+        self.assertEqual("犹豫期为 15 天。", hit["answer"])
+        self.assertEqual(1, len(hit["sources"]))
+        self.assertEqual(1, self.cache.stats()["collections"]["knowledge_base"]["hits"])
+
+    def test_distant_question_bypasses_cache(self):
+        hit = self.cache.lookup(self.db, self.rag_service, "如何申请理赔？", "knowledge_base")
+
+        self.assertIsNone(hit)
+        stats = self.cache.stats()["collections"]["knowledge_base"]
+        self.assertEqual({"distance": 1}, stats["bypass_reasons"])
+
+    def test_collection_change_after_answer_invalidates_it(self):
+        self.db.add(
+            KnowledgeDocument(
+                title="新条款",
+                content="犹豫期调整为 20 天",
+                collection_name="knowledge_base",
+                created_at=self.now,
+            )
+        )
+        self.db.commit()
+
+        hit = self.cache.lookup(self.db, self.rag_service, "犹豫期是多少天？", "knowledge_base")
+
+        self.assertIsNone(hit)
+        stats = self.cache.stats()["collections"]["knowledge_base"]
+        self.assertEqual({"no_candidate": 1}, stats["bypass_reasons"])
+
+    def test_cold_candidates_are_warmed_in_background(self):
+        cache = SemanticAnswerCache()
+
+        first = cache.lookup(self.db, self.rag_service, "犹豫期是多少天？", "knowledge_base")
+        deadline = time.monotonic() + 5
+        while cache.stats()["warming"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        second = cache.lookup(self.db, self.rag_service, "犹豫期是多少天？", "knowledge_base")
+
+        self.assertIsNone(first)
+        self.assertIsNotNone(second)
+        stats = cache.stats()["collections"]["knowledge_base"]
+        self.assertEqual({"warming": 1}, stats["bypass_reasons"])
+        self.assertEqual(1, stats["hits"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from app.api.deps import get_current_active_user
+from app.api.v1.endpoints import knowledge_base as kb_endpoints
+from app.db.base import Base, import_models
+from app.db.session import get_db
+from app.models.knowledge_base import QARecord
+from app.services import rag_service as rag_module
+from app.services.rag_service import RAGService
+
+import_models()
+
+TOKEN_COUNT = 20
+TOKEN_DELAY = 0.02
+
+
+class FakeEmbeddings:
+    async def aembed_query(self, text):
+        await asyncio.sleep(0.01)
+        return [0.1, 0.2, 0.3]
+
+
+class FakeVectorStore:
+    async def asimilarity_search_by_vector(self, embedding, k=4):
+        await asyncio.sleep(0.01)
+        return [Document(page_content="犹豫期 15 天", metadata={"title": "条款"})]
+
+
+class FakeLLM:
+    def __init__(self):
+        self.closed_streams = 0
+
+    async def astream(self, messages):
+        try:
+            for i in range(TOKEN_COUNT):
+                await asyncio.sleep(TOKEN_DELAY)
+                yield SimpleNamespace(content=f"t{i}")
+        finally:
+            self.closed_streams += 1
+
+
+def build_fake_rag_service():
+    """走真实 __init__，仅替换 LLM、Embedding 与 Milvus 连接"""
+    with (
+        patch.object(rag_module, "init_chat_model", return_value=FakeLLM()),
+        patch.object(rag_module, "OpenAIEmbeddings", return_value=FakeEmbeddings()),
+        patch.object(RAGService, "_build_agent_executor", return_value=None),
+    ):
+        service = RAGService(config=rag_module.resolve_rag_config())
+    service._vector_stores["knowledge_base"] = FakeVectorStore()
+    return service
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class AsyncRAGStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(
+            f"sqlite:///{self.db_path}",
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        Base.metadata.create_all(bind=self.engine)
+        SessionTesting = sessionmaker(bind=self.engine)
+
+        def override_get_db():
+            db = SessionTesting()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        self.SessionTesting = SessionTesting
+        self.rag_service = build_fake_rag_service()
+        main.app.dependency_overrides[get_db] = override_get_db
+        main.app.dependency_overrides[get_current_active_user] = lambda: SimpleNamespace(id=1)
+        self.rag_patch = patch.object(kb_endpoints, "get_rag_service", return_value=self.rag_service)
+        self.rag_patch.start()
+
+    async def asyncTearDown(self):
+        self.rag_patch.stop()
+        main.app.dependency_overrides.clear()
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    async def test_concurrent_streams_do_not_block_unrelated_endpoints(self):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+
+            async def run_stream():
+                async with client.stream(
+                    "POST", "/api/v1/knowledge-base/query/stream",
+                    json={"question": "犹豫期有多长？"},
+                ) as response:
+                    frames = [line async for line in response.aiter_lines() if line.startswith("data: ")]
+                return [json.loads(frame[6:]) for frame in frames]
+
+            async def probe_latencies():
+                latencies = []
+                for _ in range(100):
+                    start = time.perf_counter()
+                    response = await client.get("/")
+                    latencies.append(time.perf_counter() - start)
+                    self.assertEqual(200, response.status_code)
+                    await asyncio.sleep(0.002)
+                return latencies
+
+            streams = [asyncio.create_task(run_stream()) for _ in range(50)]
+            latencies = await probe_latencies()
+            results = await asyncio.gather(*streams)
+
+        p95 = percentile(latencies, 95)
+        print(f"\n50 个并发流式问答期间 GET / 延迟: p50={percentile(latencies, 50) * 1000:.1f}ms, p95={p95 * 1000:.1f}ms")
+        self.assertLess(p95, 0.2)
+
+        for events in results:
+            self.assertEqual("sources", events[0]["type"])
+            done = next(event for event in events if event["type"] == "done")
+            self.assertEqual("".join(f"t{i}" for i in range(TOKEN_COUNT)), done["answer"])
+            self.assertEqual("qa_record_id", events[-1]["type"])
+
+        db = self.SessionTesting()
+        try:
+            self.assertEqual(50, db.query(QARecord).count())
+        finally:
+            db.close()
+
+    async def test_cancelling_stream_closes_llm_stream(self):
+        received = []
+
+        async def consume():
+            async for event in self.rag_service.aquery_stream("犹豫期有多长？"):
+                received.append(event)
+
+        async def wait_for_tokens():
+            while len(received) < 3:
+                await asyncio.sleep(TOKEN_DELAY)
+
+        task = asyncio.create_task(consume())
+        await asyncio.wait_for(wait_for_tokens(), timeout=5)
+        self.assertEqual("sources", received[0]["type"])
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertEqual(1, self.rag_service.llm.closed_streams)
+        self.assertFalse(any(event["type"] == "done" for event in received))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from app.api.v1.endpoints import test_cases as test_cases_module
+
+
+class FakeAIService:
+    def __init__(self, delay=0.1, fail_ids=()):
+        self.delay = delay
+        self.fail_ids = set(fail_ids)
+        self.active = 0
+        self.max_active = 0
+        self.started = 0
+
+    async def agenerate_test_cases(self, messages, test_point):
+        self.started += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if messages in self.fail_ids:
+            raise RuntimeError("rate limited")
+        return [{"title": f"{test_point['title']}-1"}, {"title": f"{test_point['title']}-2"}]
+
+
+class BulkTestCaseGenerationTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.ai_service = FakeAIService()
+        self.saved = {}
+
+        def prepare(test_point_id):
+            return self.ai_service, test_point_id, {"title": f"TP-{test_point_id}"}
+
+        def persist(test_point_id, test_cases_data):
+            self.saved[test_point_id] = test_cases_data
+            return len(test_cases_data)
+
+        self.patches = [
+            patch.object(test_cases_module, "_prepare_test_case_generation", prepare),
+            patch.object(test_cases_module, "_persist_generated_test_cases", persist),
+            patch.object(test_cases_module.settings, "TEST_CASE_GENERATION_CONCURRENCY", 5),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    async def test_fans_out_with_bounded_concurrency_and_persists_each_point(self):
+        self.ai_service.fail_ids = {3}
+        start = time.monotonic()
+        events = [
+            event async for event in test_cases_module.generate_requirement_test_cases_events(list(range(1, 11)))
+        ]
+        elapsed = time.monotonic() - start
+
+        self.assertEqual("start", events[0]["type"])
+        self.assertEqual(
+            {"completed": 9, "failed": 1, "test_case_count": 18},
+            {key: events[-1][key] for key in ("completed", "failed", "test_case_count")},
+        )
+        per_point = events[1:-1]
+        self.assertEqual(list(range(1, 11)), [event["finished"] for event in per_point])
+        self.assertEqual(["test_point_failed"], [e["type"] for e in per_point if e["test_point_id"] == 3])
+        self.assertEqual(5, self.ai_service.max_active)
+        # 10 个测试点、并发 5：约两轮 LLM 往返
+        self.assertLess(elapsed, 0.6)
+        self.assertEqual(set(range(1, 11)) - {3}, set(self.saved))
+
+    async def test_closing_stream_cancels_pending_calls_and_keeps_saved_results(self):
+        self.ai_service.delay = 0.05
+        stream = test_cases_module.generate_requirement_test_cases_events(list(range(1, 21)))
+        self.assertEqual("start", (await stream.__anext__())["type"])
+        first = await stream.__anext__()
+        await stream.aclose()
+
+        self.assertEqual("test_point_completed", first["type"])
+        self.assertIn(first["test_point_id"], self.saved)
+        self.assertLess(self.ai_service.started, 20)
+        await asyncio.sleep(0.1)
+        self.assertEqual(0, self.ai_service.active)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.services import chat_history as chat_history_module
+from app.services.chat_history import ChatHistoryManager, count_message_tokens
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(messages[-1].content)
+        return SimpleNamespace(content=f"摘要{len(self.calls)}")
+
+
+def build_history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"第{i}轮问题：" + "犹豫期条款" * 20))
+        messages.append(AIMessage(content=f"第{i}轮回答：" + "犹豫期为十五天" * 20))
+    return messages
+
+
+class ChatHistoryManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.object(chat_history_module.settings, "RAG_HISTORY_TOKEN_BUDGET", 800),
+            patch.object(chat_history_module.settings, "RAG_HISTORY_KEEP_TURNS", 2),
+        ]
+        for p in self.patches:
+            p.start()
+        self.manager = ChatHistoryManager()
+        self.llm = FakeLLM()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_short_history_is_forwarded_verbatim(self):
+        history = build_history(2)
+
+        messages, usage = self.manager.compact(self.llm, history)
+
+        self.assertEqual(history, messages)
+        self.assertEqual(0, usage["tokens_saved"])
+        self.assertEqual([], self.llm.calls)
+
+    def test_long_history_keeps_recent_turns_and_summarizes_older(self):
+        history = build_history(6)
+
+        messages, usage = self.manager.compact(self.llm, history)
+
+        self.assertIsInstance(messages[0], SystemMessage)
+        self.assertEqual(history[-4:], messages[1:])
+        self.assertLessEqual(count_message_tokens(messages), 800)
+        self.assertEqual(8, usage["summarized_messages"])
+        self.assertGreater(usage["tokens_saved"], 0)
+        self.assertEqual(usage["tokens_saved"], self.manager.stats()["tokens_saved"])
+
+    def test_summary_is_updated_incrementally_on_next_turn(self):
+        history = build_history(6)
+        self.manager.compact(self.llm, history)
+
+        # 下一轮：新增一轮对话，只有新滑出窗口的一轮需要合并进摘要
+        self.manager.compact(self.llm, build_history(7))
+
+        self.assertEqual(2, len(self.llm.calls))
+        self.assertIn("已有摘要:\n摘要1", self.llm.calls[1])
+        self.assertEqual(1, self.llm.calls[1].count("轮问题"))
+
+        # 相同历史重复请求直接命中摘要缓存
+        self.manager.compact(self.llm, build_history(7))
+        self.assertEqual(2, len(self.llm.calls))
+
+    def test_per_model_budget_override(self):
+        with patch.object(chat_history_module.settings, "RAG_HISTORY_MODEL_BUDGETS", "big-model:100000"):
+            messages, usage = self.manager.compact(self.llm, build_history(6), model_name="big-model")
+
+        self.assertEqual(12, len(messages))
+        self.assertEqual(0, usage["summarized_messages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from app.api.deps import get_current_active_user
+from app.api.v1.endpoints import knowledge_base as kb_endpoints
+from app.db.base import Base, import_models
+from app.db.session import get_db
+from app.models.knowledge_base import ConversationMessage
+from app.models.user import User
+from app.services.conversation_service import ConversationStore
+
+import_models()
+
+
+class FakeRAGService:
+    def __init__(self):
+        self.histories = []
+
+    def query(self, question, collection_name, top_k, return_source, chat_history):
+        self.histories.append(chat_history)
+        return {"success": True, "answer": f"回答：{question}", "sources": []}
+
+
+class ConversationSessionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.engine = create_engine(f"sqlite:///{self.db_path}", connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionTesting = sessionmaker(bind=self.engine)
+        db = self.SessionTesting()
+        db.add_all([
+            User(id=1, username="alice", email="alice@example.com", hashed_password="x"),
+            User(id=2, username="bob", email="bob@example.com", hashed_password="x"),
+        ])
+        db.commit()
+        db.close()
+
+        def override_get_db():
+            db = self.SessionTesting()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        self.current_user = SimpleNamespace(id=1)
+        self.rag_service = FakeRAGService()
+        main.app.dependency_overrides[get_db] = override_get_db
+        main.app.dependency_overrides[get_current_active_user] = lambda: self.current_user
+        self.patches = [
+            patch.object(kb_endpoints, "get_rag_service", return_value=self.rag_service),
+            patch.object(kb_endpoints, "conversation_store", ConversationStore()),
+        ]
+        for p in self.patches:
+            p.start()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+        for p in self.patches:
+            p.stop()
+        main.app.dependency_overrides.clear()
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    async def test_session_history_is_kept_server_side(self):
+        session_id = (await self.client.post("/api/v1/knowledge-base/sessions", json={})).json()["id"]
+
+        for question in ["犹豫期多长？", "那退保呢？"]:
+            response = await self.client.post(
+                "/api/v1/knowledge-base/query",
+                json={"question": question, "session_id": session_id},
+            )
+            self.assertTrue(response.json()["success"])
+
+        self.assertIsNone(self.rag_service.histories[0])
+        self.assertEqual(
+            [
+                {"role": "user", "content": "犹豫期多长？"},
+                {"role": "assistant", "content": "回答：犹豫期多长？"},
+            ],
+            self.rag_service.histories[1],
+        )
+
+        detail = (await self.client.get(f"/api/v1/knowledge-base/sessions/{session_id}")).json()
+        self.assertEqual(4, detail["message_count"])
+        self.assertEqual("犹豫期多长？", detail["title"])
+        self.assertEqual("那退保呢？", detail["messages"][2]["content"])
+
+    async def test_other_users_cannot_use_session(self):
+        session_id = (await self.client.post("/api/v1/knowledge-base/sessions", json={})).json()["id"]
+        self.current_user = SimpleNamespace(id=2)
+
+        response = await self.client.post(
+            "/api/v1/knowledge-base/query",
+            json={"question": "犹豫期多长？", "session_id": session_id},
+        )
+
+        self.assertEqual(404, response.status_code)
+
+    async def test_delete_session_removes_messages(self):
+        session_id = (await self.client.post("/api/v1/knowledge-base/sessions", json={})).json()["id"]
+        await self.client.post("/api/v1/knowledge-base/query", json={"question": "犹豫期多长？", "session_id": session_id})
+
+        response = await self.client.delete(f"/api/v1/knowledge-base/sessions/{session_id}")
+        self.assertEqual(200, response.status_code)
+
+        db = self.SessionTesting()
+        try:
+            self.assertEqual(0, db.query(ConversationMessage).count())
+        finally:
+            db.close()
+        response = await self.client.get(f"/api/v1/knowledge-base/sessions/{session_id}")
+        self.assertEqual(404, response.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
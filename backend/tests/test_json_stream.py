@@ -0,0 +1,60 @@
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService
+from app.utils.json_stream import IncrementalJSONArrayParser
+
+
+class IncrementalJSONArrayParserTest(unittest.TestCase):
+    def test_objects_are_returned_as_soon_as_they_close(self):
+        parser = IncrementalJSONArrayParser()
+
+        self.assertEqual([], parser.feed('好的，测试点如下：\n```json\n[{"title": "A", "steps": [1, '))
+        self.assertEqual([{"title": "A", "steps": [1, 2]}], parser.feed('2]}, {"title": "B \\"}\\" ['))
+        self.assertEqual([{"title": 'B "}" [', "note": "{x}"}], parser.feed('", "note": "{x}"}'))
+        self.assertFalse(parser.finished)
+        self.assertEqual([], parser.feed(']\n```\n[{"title": "ignored"}]'))
+        self.assertTrue(parser.finished)
+
+    def test_malformed_object_is_recorded_and_parsing_continues(self):
+        parser = IncrementalJSONArrayParser()
+
+        items = parser.feed('[{"title": "A",}, {"title": "B"}]')
+
+        self.assertEqual([{"title": "B"}], items)
+        self.assertEqual(1, len(parser.errors))
+        self.assertEqual('{"title": "A",}', parser.errors[0][0])
+
+
+class StreamTestPointsTest(unittest.TestCase):
+    def test_streamed_test_points_are_validated_one_by_one(self):
+        service = AIService.__new__(AIService)
+        service.db = None
+        service.llm = FakeListChatModel(responses=[
+            '测试点：[{"title": "TP-1", "description": "", "category": "功能", "priority": "高", "business_line": "保全"},'
+            ' {"title": "TP-2", "description": "", "category": "边界", "priority": "low"}]'
+        ])
+
+        with patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False):
+            stream = service.stream_test_points("需求")
+            first = next(stream)
+            rest = list(stream)
+
+        self.assertEqual(("TP-1", "high", "preservation"), (first["title"], first["priority"], first["business_line"]))
+        self.assertEqual(["TP-2"], [point["title"] for point in rest])
+
+    def test_response_without_array_fails(self):
+        service = AIService.__new__(AIService)
+        service.db = None
+        service.llm = FakeListChatModel(responses=["无法识别测试点"])
+
+        with patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False):
+            with self.assertRaises(ValueError):
+                list(service.stream_test_points("需求"))
+
+
+if __name__ == "__main__":
+    unittest.main()
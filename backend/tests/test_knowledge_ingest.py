@@ -0,0 +1,143 @@
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, import_models
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.workflow_task import WorkflowTask  # noqa: F401  注册 User.workflow_tasks 关系
+from app.services import knowledge_ingest_service as ingest_module
+
+import_models()
+
+
+class FakeRAGService:
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.barrier = threading.Barrier(2, timeout=5)
+
+    def add_documents(self, documents, metadatas, collection_name):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            # 两个文档同时处于向量化阶段才放行，验证并行执行
+            self.barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        finally:
+            with self.lock:
+                self.active -= 1
+        if "失败" in documents[0]:
+            return {"success": False, "error": "embedding error"}
+        return {"success": True, "total_chunks": 2, "vector_ids": [[1, 2]]}
+
+
+class KnowledgeIngestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp_dir.name)
+        self.engine = create_engine(
+            f"sqlite:///{self.dir / 'test.db'}", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionTesting = sessionmaker(bind=self.engine)
+        self.session_patch = patch.object(ingest_module, "SessionLocal", self.SessionTesting)
+        self.session_patch.start()
+
+    def tearDown(self):
+        self.session_patch.stop()
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def add_document(self, name, text):
+        path = self.dir / name
+        path.write_text(text, encoding="utf-8")
+        db = self.SessionTesting()
+        document = KnowledgeDocument(title=name, content="", file_name=name, file_type="txt", file_path=str(path))
+        db.add(document)
+        db.commit()
+        document_id = document.id
+        db.close()
+        return document_id
+
+    def test_documents_are_vectorized_in_parallel_and_updated_individually(self):
+        ok_id = self.add_document("条款.txt", "犹豫期为 15 天")
+        bad_id = self.add_document("坏文件.txt", "向量化失败的文档")
+        job = ingest_module.create_ingest_job(1, [
+            {"document_id": ok_id, "title": "条款"},
+            {"document_id": bad_id, "title": "坏文件"},
+        ])
+        rag_service = FakeRAGService()
+
+        with patch.object(ingest_module.settings, "KB_INGEST_WORKERS", 2):
+            ingest_module.run_ingest_job(
+                job["job_id"], rag_service,
+                [{"document_id": ok_id, "file_type": "txt"}, {"document_id": bad_id, "file_type": "txt"}],
+            )
+
+        self.assertEqual(2, rag_service.max_active)
+        snapshot = ingest_module.get_ingest_job(job["job_id"])
+        self.assertEqual("partial", snapshot["status"])
+        self.assertEqual((1, 1, 2), (snapshot["completed"], snapshot["failed"], snapshot["total_chunks"]))
+        self.assertIsNotNone(snapshot["finished_at"])
+        self.assertEqual(
+            [(ok_id, "completed", None), (bad_id, "failed", "embedding error")],
+            [(doc["document_id"], doc["status"], doc["error"]) for doc in snapshot["documents"]],
+        )
+
+        db = self.SessionTesting()
+        try:
+            ok = db.get(KnowledgeDocument, ok_id)
+            bad = db.get(KnowledgeDocument, bad_id)
+            self.assertTrue(ok.is_vectorized)
+            self.assertEqual(2, ok.chunk_count)
+            self.assertEqual("犹豫期为 15 天", ok.content)
+            # 失败文档保持 active，仍在默认列表中可见，失败原因单独记录
+            self.assertEqual("active", bad.status)
+            self.assertEqual("embedding error", bad.ingest_error)
+            self.assertFalse(bad.is_vectorized)
+        finally:
+            db.close()
+
+    def test_retried_document_clears_its_error(self):
+        document_id = self.add_document("条款.txt", "犹豫期为 15 天")
+        db = self.SessionTesting()
+        db.get(KnowledgeDocument, document_id).ingest_error = "embedding error"
+        db.commit()
+        db.close()
+
+        job = ingest_module.create_ingest_job(1, [{"document_id": document_id, "title": "条款"}])
+        self.assertEqual("pending", job["documents"][0]["status"])
+        rag_service = FakeRAGService()
+        rag_service.barrier = threading.Barrier(1)
+        ingest_module.run_ingest_job(job["job_id"], rag_service, [{"document_id": document_id, "file_type": "txt"}])
+
+        snapshot = ingest_module.get_ingest_job(job["job_id"])
+        self.assertEqual(("completed", None), (snapshot["status"], snapshot["documents"][0]["error"]))
+        self.assertIsNone(ingest_module.get_ingest_job("missing"))
+
+    def test_extract_zip_keeps_supported_files_without_paths(self):
+        zip_path = self.dir / "bulk.zip"
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            archive.writestr("../../etc/条款.txt", "犹豫期")
+            archive.writestr("images/logo.png", b"png")
+        target = self.dir / "out"
+        os.makedirs(target)
+
+        extracted = ingest_module.extract_zip(zip_path, target)
+
+        self.assertEqual(["条款.txt"], [name for name, _ in extracted])
+        self.assertEqual(target, extracted[0][1].parent)
+
+
+if __name__ == "__main__":
+    unittest.main()
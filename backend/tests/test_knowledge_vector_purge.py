@@ -0,0 +1,91 @@
+import json
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, import_models
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.workflow_task import WorkflowTask
+from app.services.knowledge_vector_service import purge_inactive_document_vectors, remove_document_vectors
+
+import_models()
+
+
+class FakeRAGService:
+    def __init__(self, fail_collections=()):
+        self.deleted = []
+        self.compacted = []
+        self.fail_collections = set(fail_collections)
+
+    def delete_document_vectors(self, documents, collection_name="knowledge_base"):
+        self.deleted.append((collection_name, documents))
+        return collection_name not in self.fail_collections
+
+    def compact_collection(self, collection_name):
+        self.compacted.append(collection_name)
+
+
+class KnowledgeVectorPurgeTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:")
+        Base.metadata.create_all(bind=self.engine)
+        self.db = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.db.close()
+        Base.metadata.drop_all(bind=self.engine)
+        self.engine.dispose()
+
+    def add_document(self, status, collection_name="knowledge_base", vector_ids=None, is_vectorized=True):
+        document = KnowledgeDocument(
+            title="条款",
+            content="犹豫期 15 天",
+            collection_name=collection_name,
+            status=status,
+            is_vectorized=is_vectorized,
+            vector_ids=json.dumps(vector_ids) if vector_ids else None,
+        )
+        self.db.add(document)
+        self.db.commit()
+        return document
+
+    def test_purge_removes_inactive_documents_in_batches_and_compacts(self):
+        active = self.add_document("active", vector_ids=[1, 2])
+        deleted = self.add_document("deleted", vector_ids=[3, 4])
+        archived = self.add_document("archived")
+        other = self.add_document("deleted", collection_name="claims", vector_ids=[9])
+        rag_service = FakeRAGService()
+
+        result = purge_inactive_document_vectors(self.db, rag_service, batch_size=2)
+
+        self.assertEqual(3, result["purged_documents"])
+        self.assertEqual(["claims", "knowledge_base"], result["collections"])
+        deleted_ids = [doc for _, documents in rag_service.deleted for doc in documents]
+        self.assertIn((deleted.id, [3, 4]), deleted_ids)
+        self.assertIn((archived.id, None), deleted_ids)
+        self.assertIn((other.id, [9]), deleted_ids)
+        self.assertTrue(active.is_vectorized)
+        self.assertFalse(deleted.is_vectorized)
+        self.assertIsNone(deleted.vector_ids)
+        self.assertEqual({"claims", "knowledge_base"}, set(rag_service.compacted))
+
+    def test_failed_collection_is_left_for_next_run(self):
+        document = self.add_document("deleted", collection_name="claims", vector_ids=[9])
+
+        result = purge_inactive_document_vectors(self.db, FakeRAGService(fail_collections={"claims"}))
+
+        self.assertEqual(1, result["failed_documents"])
+        self.assertTrue(document.is_vectorized)
+
+    def test_remove_document_vectors_uses_recorded_ids(self):
+        document = self.add_document("deleted", vector_ids=[5, 6])
+        rag_service = FakeRAGService()
+
+        self.assertTrue(remove_document_vectors(self.db, rag_service, document))
+        self.assertEqual([("knowledge_base", [(document.id, [5, 6])])], rag_service.deleted)
+        self.assertFalse(document.is_vectorized)
+
+
+if __name__ == "__main__":
+    unittest.main()
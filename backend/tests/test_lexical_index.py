@@ -0,0 +1,123 @@
+import unittest
+from unittest.mock import patch
+
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base, import_models
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.workflow_task import WorkflowTask  # noqa: F401  注册 User.workflow_tasks 关系
+from app.services import lexical_index
+from app.services.lexical_index import (
+    BM25Index,
+    backfill_lexical_index,
+    get_lexical_index,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+import_models()
+
+
+class FakeRAGService:
+    """按空行分块，记录被清除检索缓存的集合"""
+
+    def __init__(self):
+        self.invalidated = []
+
+    def split_documents(self, documents, metadatas):
+        splits, chunk_metadatas = [], []
+        for text, metadata in zip(documents, metadatas):
+            parts = [part for part in text.split("\n\n") if part]
+            splits.extend(parts)
+            chunk_metadatas.extend({**metadata, "chunk_index": j} for j in range(len(parts)))
+        return splits, chunk_metadatas, [len(splits)]
+
+    def invalidate_collection(self, collection_name):
+        self.invalidated.append(collection_name)
+
+
+class LexicalIndexTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        self.patch = patch.object(lexical_index, "SessionLocal", self.SessionLocal)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+
+    def test_tokenize_keeps_codes_and_splits_chinese_into_bigrams(self):
+        self.assertEqual(
+            ["犹豫", "豫期", "payintv", "3.2.1"],
+            tokenize("犹豫期 PayIntv 3.2.1"),
+        )
+
+    def test_exact_field_name_ranks_first_and_index_is_shared(self):
+        BM25Index("knowledge_base").add(
+            [
+                "缴费间隔字段 payintv 取值 0 表示趸交，12 表示年交",
+                "犹豫期为 15 天，犹豫期内退保无损失",
+                "保单贷款额度不超过现金价值的 80%",
+            ],
+            [{"document_id": 1, "chunk_index": 0}, {"document_id": 2, "chunk_index": 0}, {"document_id": 3, "chunk_index": 0}],
+        )
+
+        # 其他 worker 中新建的索引对象读取同一份数据
+        other = BM25Index("knowledge_base")
+        results = other.search("payintv 是什么", k=2)
+
+        self.assertEqual(1, results[0][0].metadata["document_id"])
+        self.assertEqual("犹豫期为 15 天，犹豫期内退保无损失", other.search("犹豫期多久", k=1)[0][0].page_content)
+        self.assertEqual([], BM25Index("other_collection").search("payintv"))
+
+    def test_remove_documents_drops_only_their_chunks(self):
+        index = BM25Index("knowledge_base")
+        index.add(["payintv 字段说明"], [{"document_id": 7, "chunk_index": 0}])
+        index.add(["payintv 取值范围"], [{"document_id": 8, "chunk_index": 0}])
+
+        removed = index.remove_documents([7])
+
+        self.assertEqual(1, removed)
+        self.assertEqual([8], [doc.metadata["document_id"] for doc, _ in index.search("payintv")])
+        self.assertEqual(1, len(index))
+
+    def test_backfill_indexes_existing_documents_once(self):
+        db = self.SessionLocal()
+        db.add_all([
+            KnowledgeDocument(id=1, title="缴费", content="payintv 缴费间隔\n\n趸交与年交", is_vectorized=True, status="active"),
+            KnowledgeDocument(id=2, title="犹豫期", content="犹豫期 15 天", is_vectorized=True, status="active", collection_name="products"),
+            KnowledgeDocument(id=3, title="已删除", content="payintv 旧说明", is_vectorized=True, status="deleted"),
+            KnowledgeDocument(id=4, title="未入库", content="payintv 草稿", is_vectorized=False, status="active"),
+        ])
+        db.commit()
+        get_lexical_index("knowledge_base").add(["已有索引"], [{"document_id": 5, "chunk_index": 0}])
+        rag_service = FakeRAGService()
+
+        result = backfill_lexical_index(db, rag_service, batch_size=1)
+        again = backfill_lexical_index(db, rag_service)
+        db.close()
+
+        self.assertEqual({"documents": 2, "chunks": 3, "failed_documents": 0}, result)
+        self.assertEqual(0, again["documents"])
+        self.assertEqual(["knowledge_base", "products"], sorted(rag_service.invalidated))
+        self.assertEqual([1], [doc.metadata["document_id"] for doc, _ in get_lexical_index("knowledge_base").search("payintv")])
+        self.assertEqual(1, len(get_lexical_index("products")))
+
+    def test_reciprocal_rank_fusion_merges_same_chunk_from_both_lists(self):
+        a = Document(page_content="A", metadata={"document_id": 1, "chunk_index": 0})
+        b = Document(page_content="B", metadata={"document_id": 2, "chunk_index": 0})
+        c = Document(page_content="C", metadata={"document_id": 3, "chunk_index": 0})
+
+        fused = reciprocal_rank_fusion([[a, b], [c, b]], k=60, limit=2)
+
+        self.assertEqual(["B", "A"], [doc.page_content for doc in fused])
+
+
+if __name__ == "__main__":
+    unittest.main()
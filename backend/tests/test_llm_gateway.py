@@ -0,0 +1,203 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from uuid import uuid4
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult, LLMResult
+
+from app.services import llm_gateway as gateway_module
+from app.services.llm_gateway import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMGatewayCallbackHandler,
+    LLMGatewayTimeout,
+    ProviderGate,
+    llm_request_context,
+    token_usage,
+)
+
+
+def _result(**message_fields):
+    return LLMResult(generations=[[ChatGeneration(message=AIMessage(content="ok", **message_fields))]])
+
+
+class SlowAsyncLLM(BaseChatModel):
+    """异步调用耗时 0.2 秒"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-async"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(0.2)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="ok"))])
+
+
+class ProviderGateTest(unittest.TestCase):
+    def _start_waiters(self, gate, requests, order):
+        """按顺序启动排队线程，每个线程进入队列后再启动下一个"""
+        threads = []
+        for priority, user, name in requests:
+            def run(priority=priority, user=user, name=name):
+                ticket = gate.acquire(priority, user, 10, timeout=5)
+                order.append(name)
+                gate.release(ticket)
+
+            thread = threading.Thread(target=run)
+            thread.start()
+            threads.append(thread)
+            while sum(lane["queue_depth"] for lane in gate.stats()["lanes"].values()) < len(threads):
+                time.sleep(0.005)
+        return threads
+
+    def test_interactive_lane_and_per_user_round_robin(self):
+        gate = ProviderGate("openai", concurrency=1)
+        holder = gate.acquire(PRIORITY_BACKGROUND, "system", 10, timeout=1)
+        order = []
+        threads = self._start_waiters(gate, [
+            (PRIORITY_BACKGROUND, "alice", "alice-1"),
+            (PRIORITY_BACKGROUND, "alice", "alice-2"),
+            (PRIORITY_BACKGROUND, "alice", "alice-3"),
+            (PRIORITY_BACKGROUND, "bob", "bob-1"),
+            (PRIORITY_INTERACTIVE, "carol", "carol-chat"),
+        ], order)
+
+        stats = gate.stats()
+        self.assertEqual(4, stats["lanes"][PRIORITY_BACKGROUND]["queue_depth"])
+        self.assertEqual(1, stats["lanes"][PRIORITY_INTERACTIVE]["queue_depth"])
+
+        gate.release(holder)
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(["carol-chat", "alice-1", "bob-1", "alice-2", "alice-3"], order)
+        self.assertEqual(0, gate.stats()["in_flight"])
+
+    def test_requests_per_minute_limit_times_out_queued_call(self):
+        gate = ProviderGate("openai", rpm=2)
+        gate.release(gate.acquire(PRIORITY_BACKGROUND, None, 10, timeout=1))
+        gate.release(gate.acquire(PRIORITY_BACKGROUND, None, 10, timeout=1))
+
+        with self.assertRaises(LLMGatewayTimeout):
+            gate.acquire(PRIORITY_BACKGROUND, None, 10, timeout=0.1)
+
+        stats = gate.stats()
+        self.assertEqual(1, stats["rate_limited_waits"])
+        self.assertEqual(1, stats["lanes"][PRIORITY_BACKGROUND]["timeouts"])
+        self.assertEqual(0, stats["lanes"][PRIORITY_BACKGROUND]["queue_depth"])
+
+    def test_tokens_per_minute_is_trued_up_with_actual_usage(self):
+        gate = ProviderGate("openai", tpm=1000)
+        ticket = gate.acquire(PRIORITY_BACKGROUND, None, 900, timeout=1)
+        gate.release(ticket, actual_tokens=300)
+
+        # 预估 900，实际 300，退回的 600 个 token 可立即用于下一次调用
+        gate.release(gate.acquire(PRIORITY_BACKGROUND, None, 600, timeout=0.1))
+
+
+class GatewayCallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.object(gateway_module.settings, "LLM_GATEWAY_ENABLED", True),
+            patch.object(gateway_module.settings, "LLM_GATEWAY_PROVIDER_LIMITS", '{"fake": {"concurrency": 2}}'),
+        ]
+        for item in self.patches:
+            item.start()
+        gateway_module.llm_gateway.reset()
+
+    def tearDown(self):
+        gateway_module.llm_gateway.reset()
+        for item in reversed(self.patches):
+            item.stop()
+
+    def test_model_calls_pass_through_gateway_lanes(self):
+        llm = FakeListChatModel(responses=["a", "b", "c"], callbacks=[LLMGatewayCallbackHandler("fake")])
+
+        self.assertEqual("a", llm.invoke("hello").content)
+        with llm_request_context(PRIORITY_INTERACTIVE, user_id=7):
+            self.assertEqual("b", asyncio.run(llm.ainvoke("hello")).content)
+            self.assertEqual("c", "".join(chunk.content for chunk in llm.stream("hello")))
+
+        stats = gateway_module.llm_gateway.stats()["providers"]["fake"]
+        self.assertEqual(2, stats["concurrency"])
+        self.assertEqual(0, stats["in_flight"])
+        self.assertEqual(1, stats["lanes"][PRIORITY_BACKGROUND]["admitted"])
+        self.assertEqual(2, stats["lanes"][PRIORITY_INTERACTIVE]["admitted"])
+
+    def test_async_calls_queue_on_event_loop_without_starving_executor(self):
+        llm = SlowAsyncLLM(callbacks=[LLMGatewayCallbackHandler("fake")])
+
+        async def run():
+            # 线程池很小：排队若占用线程池线程，释放与其他 to_thread 调用会被饿死
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2))
+            started = time.monotonic()
+            results = await asyncio.gather(*(llm.ainvoke(f"hello {index}") for index in range(12)))
+            return results, time.monotonic() - started
+
+        with patch.object(gateway_module.settings, "LLM_GATEWAY_MAX_WAIT_SECONDS", 5):
+            results, elapsed = asyncio.run(run())
+
+        self.assertEqual(["ok"] * 12, [result.content for result in results])
+        # 并发 2：12 个 0.2 秒的调用约 1.2 秒
+        self.assertLess(elapsed, 3)
+        stats = gateway_module.llm_gateway.stats()["providers"]["fake"]
+        self.assertEqual(0, stats["in_flight"])
+        self.assertEqual(12, stats["lanes"][PRIORITY_BACKGROUND]["admitted"])
+        self.assertEqual(0, stats["lanes"][PRIORITY_BACKGROUND]["timeouts"])
+
+    def test_cancelled_async_call_leaves_the_queue(self):
+        gate = ProviderGate("fake", concurrency=1)
+        holder = gate.acquire(PRIORITY_BACKGROUND, "system", 10, timeout=1)
+
+        async def run():
+            waiter = asyncio.ensure_future(gate.aacquire(PRIORITY_BACKGROUND, "alice", 10, timeout=5))
+            await asyncio.sleep(0.05)
+            self.assertEqual(1, gate.stats()["lanes"][PRIORITY_BACKGROUND]["queue_depth"])
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            gate.release(holder)
+            return await gate.aacquire(PRIORITY_BACKGROUND, "bob", 10, timeout=1)
+
+        ticket = asyncio.run(run())
+        self.assertEqual("bob", ticket.user)
+        self.assertEqual(0, gate.stats()["lanes"][PRIORITY_BACKGROUND]["queue_depth"])
+
+    def test_prefix_cache_hits_are_parsed_and_recorded_per_provider(self):
+        openai_style = _result(usage_metadata={
+            "input_tokens": 2000, "output_tokens": 300, "total_tokens": 2300,
+            "input_token_details": {"cache_read": 1536},
+        })
+        deepseek_style = _result(response_metadata={"token_usage": {
+            "prompt_tokens": 1000, "completion_tokens": 200, "prompt_cache_hit_tokens": 768,
+        }})
+        self.assertEqual(
+            {"prompt_tokens": 2000, "cached_prompt_tokens": 1536, "completion_tokens": 300}, token_usage(openai_style)
+        )
+        self.assertEqual(
+            {"prompt_tokens": 1000, "cached_prompt_tokens": 768, "completion_tokens": 200}, token_usage(deepseek_style)
+        )
+        self.assertIsNone(token_usage(_result()))
+
+        handler = LLMGatewayCallbackHandler("fake")
+        for response in (openai_style, deepseek_style, _result()):
+            handler.on_llm_end(response, run_id=uuid4())
+
+        usage = gateway_module.llm_gateway.stats()["usage"]["fake"]
+        self.assertEqual(2, usage["calls"])
+        self.assertEqual(3000, usage["prompt_tokens"])
+        self.assertEqual(2304, usage["cached_prompt_tokens"])
+        self.assertEqual(0.768, usage["prefix_cache_hit_ratio"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base, import_models
+from app.models.llm_response_cache import LLMResponseCache
+from app.models.workflow_task import WorkflowTask  # noqa: F401  注册 User.workflow_tasks 关系
+from app.services import llm_response_cache as cache_module
+from app.services.ai_service import AIService
+from app.services.llm_response_cache import LLMResponseCacheService
+
+import_models()
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        return SimpleNamespace(content=f"response-{self.calls}")
+
+
+class LLMResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        self.cache = LLMResponseCacheService()
+
+        self.service = AIService.__new__(AIService)
+        self.service.db = None
+        self.service.llm = FakeLLM()
+        self.service.llm_cache_scope = {"provider": "openai", "model": "gpt", "temperature": 0.0, "max_tokens": None}
+
+        self.patches = [
+            patch.object(cache_module, "SessionLocal", self.SessionLocal),
+            patch("app.services.ai_service.llm_response_cache", self.cache),
+            patch.object(cache_module.settings, "LLM_CACHE_ENABLED", True),
+            patch.object(cache_module.settings, "LLM_CACHE_TTL_SECONDS", 3600),
+            patch.object(cache_module.settings, "LLM_CACHE_MAX_ENTRIES", 100),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def test_repeated_call_is_served_from_cache(self):
+        first = self.service._invoke_with_retry("生成测试用例")
+        second = self.service._invoke_with_retry("生成测试用例")
+
+        self.assertEqual("response-1", first.content)
+        self.assertEqual("response-1", second.content)
+        self.assertTrue(second.response_metadata["cache_hit"])
+        self.assertEqual(1, self.service.llm.calls)
+
+        stats = self.cache.stats()
+        self.assertEqual((1, 1, 1, 1), (stats["hits"], stats["misses"], stats["writes"], stats["entries"]))
+
+    def test_key_covers_parameters_and_cache_can_be_bypassed(self):
+        self.service._invoke_with_retry("生成测试用例")
+
+        self.service.llm_cache_scope = dict(self.service.llm_cache_scope, temperature=1.0)
+        self.assertEqual("response-2", self.service._invoke_with_retry("生成测试用例").content)
+        self.assertEqual("response-3", self.service._invoke_with_retry("生成测试用例", use_cache=False).content)
+        self.assertEqual("response-4", self.service.invoke_llm("生成测试用例", use_cache=False).content)
+        self.assertEqual("response-2", self.service.invoke_llm("生成测试用例").content)
+
+    def test_disabled_cache_does_not_touch_database(self):
+        with patch.object(cache_module.settings, "LLM_CACHE_ENABLED", False):
+            self.service._invoke_with_retry("生成测试用例")
+            self.service._invoke_with_retry("生成测试用例")
+
+        self.assertEqual(2, self.service.llm.calls)
+        db = self.SessionLocal()
+        self.assertEqual(0, db.query(LLMResponseCache).count())
+        db.close()
+
+    def test_expired_entries_miss_and_size_limit_evicts_least_recently_hit(self):
+        scope = {"model": "gpt"}
+        self.cache.set(scope, "a", "A")
+        db = self.SessionLocal()
+        db.query(LLMResponseCache).update({"expires_at": datetime.now() - timedelta(seconds=1)})
+        db.commit()
+        self.assertIsNone(self.cache.get(scope, "a"))
+
+        with patch.object(cache_module.settings, "LLM_CACHE_MAX_ENTRIES", 2):
+            self.cache.set(scope, "b", "B")
+            self.cache.set(scope, "c", "C")
+            self.assertEqual("B", self.cache.get(scope, "b"))
+            self.cache.set(scope, "d", "D")
+
+        self.assertEqual(["B", "D"], sorted(row.content for row in db.query(LLMResponseCache).all()))
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
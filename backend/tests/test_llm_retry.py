@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+
+import httpx
+import openai
+from langchain_core.messages import AIMessage
+
+from app.services import ai_service as ai_service_module
+from app.services import llm_retry
+from app.services.ai_service import AIService
+from app.services.llm_retry import RetryBudget, backoff_delay, classify_error, get_retry_stats
+
+
+def _status_error(error_class, status, headers=None):
+    request = httpx.Request("POST", "https://llm.example.com/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return error_class("error", response=response, body=None)
+
+
+class ScriptedLLM:
+    """依次抛出预设错误，最后返回固定响应"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def invoke(self, messages, config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return AIMessage(content="ok")
+
+
+class LLMRetryPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.object(llm_retry.settings, "AI_MAX_RETRIES", 3),
+            patch.object(llm_retry.settings, "AI_RETRY_INTERVAL", 2.0),
+            patch.object(llm_retry.settings, "AI_RETRY_MAX_INTERVAL", 30.0),
+            patch.object(llm_retry.settings, "AI_RETRY_DEADLINE_SECONDS", 600.0),
+            patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False),
+        ]
+        for item in self.patches:
+            item.start()
+        self.before = get_retry_stats()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def _delta(self, name):
+        return get_retry_stats()[name] - self.before[name]
+
+    def test_errors_are_classified_by_status_and_type(self):
+        self.assertEqual((True, "rate_limited"), classify_error(_status_error(openai.RateLimitError, 429)))
+        self.assertEqual((True, "server_error"), classify_error(_status_error(openai.InternalServerError, 503)))
+        self.assertEqual((False, "http_400"), classify_error(_status_error(openai.BadRequestError, 400)))
+        self.assertEqual((False, "http_401"), classify_error(_status_error(openai.AuthenticationError, 401)))
+        timeout = openai.APITimeoutError(request=httpx.Request("POST", "https://llm.example.com"))
+        self.assertEqual((True, "timeout"), classify_error(timeout))
+        self.assertEqual((True, "connection"), classify_error(ConnectionError("reset")))
+        self.assertEqual((False, "client_error"), classify_error(TypeError("bad argument")))
+
+    def test_backoff_grows_exponentially_with_jitter_and_cap(self):
+        for attempt, (low, high) in {1: (1, 2), 3: (4, 8), 10: (15, 30)}.items():
+            for _ in range(20):
+                delay = backoff_delay(attempt)
+                self.assertGreaterEqual(delay, low)
+                self.assertLessEqual(delay, high)
+
+    def test_retry_after_is_honoured_and_deadline_enforced(self):
+        budget = RetryBudget("test")
+        budget.start_attempt()
+        error = _status_error(openai.RateLimitError, 429, {"retry-after": "7"})
+        self.assertGreaterEqual(budget.next_delay(error), 7)
+        self.assertEqual(1, self._delta("retry_after_honoured"))
+
+        budget = RetryBudget("test", deadline_seconds=5)
+        budget.start_attempt()
+        self.assertIsNone(budget.next_delay(error))
+        self.assertEqual(1, self._delta("deadline_exceeded"))
+
+    def test_transient_errors_retry_with_backoff_and_fatal_errors_fail_fast(self):
+        service = AIService.__new__(AIService)
+        service.db = None
+        service.llm = ScriptedLLM([
+            _status_error(openai.InternalServerError, 502),
+            _status_error(openai.RateLimitError, 429),
+        ])
+        with patch.object(ai_service_module.time, "sleep") as sleep:
+            response = service._invoke_with_retry([], use_cache=False)
+        self.assertEqual("ok", response.content)
+        self.assertEqual(3, service.llm.calls)
+        first, second = [call.args[0] for call in sleep.call_args_list]
+        self.assertLessEqual(first, 2)
+        self.assertGreaterEqual(second, 2)
+        self.assertEqual(2, self._delta("retries"))
+
+        service.llm = ScriptedLLM([_status_error(openai.BadRequestError, 400)])
+        with patch.object(ai_service_module.time, "sleep") as sleep:
+            with self.assertRaises(openai.BadRequestError):
+                service._invoke_with_retry([], use_cache=False)
+        self.assertEqual(1, service.llm.calls)
+        sleep.assert_not_called()
+        self.assertEqual(1, self._delta("fatal_errors"))
+
+
+if __name__ == "__main__":
+    unittest.main()
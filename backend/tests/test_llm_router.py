@@ -0,0 +1,90 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.services import llm_router as router_module
+from app.services.llm_router import (
+    ROUTING_LEAST_LATENCY,
+    ROUTING_WEIGHTED,
+    PooledChatModel,
+    choose_endpoints,
+    clear_endpoint_states,
+    record_success,
+    register_endpoints,
+    routing_stats,
+)
+
+
+class FailingChatModel(FakeListChatModel):
+    """前 failures 次调用抛出异常，之后正常返回"""
+    failures: int = 1000
+
+    def _call(self, *args, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("endpoint down")
+        return super()._call(*args, **kwargs)
+
+
+class LLMRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.object(router_module.settings, "LLM_ROUTING_MODE", ROUTING_WEIGHTED),
+            patch.object(router_module.settings, "LLM_ENDPOINT_FAILURE_THRESHOLD", 2),
+            patch.object(router_module.settings, "LLM_ENDPOINT_COOLDOWN_SECONDS", 60),
+        ]
+        for item in self.patches:
+            item.start()
+        clear_endpoint_states()
+
+    def tearDown(self):
+        clear_endpoint_states()
+        for item in reversed(self.patches):
+            item.stop()
+
+    def test_smooth_weighted_round_robin(self):
+        register_endpoints([(1, "a", 3), (2, "b", 1)])
+        picks = [choose_endpoints([1, 2], ROUTING_WEIGHTED)[0] for _ in range(8)]
+        self.assertEqual([1, 1, 2, 1, 1, 1, 2, 1], picks)
+
+    def test_least_latency_prefers_unmeasured_then_fastest(self):
+        register_endpoints([(1, "a", 1), (2, "b", 1)])
+        record_success(1, 0.5)
+        self.assertEqual([2, 1], choose_endpoints([1, 2], ROUTING_LEAST_LATENCY))
+        record_success(2, 2.0)
+        self.assertEqual([1, 2], choose_endpoints([1, 2], ROUTING_LEAST_LATENCY))
+
+    def test_failover_ejects_failing_endpoint_and_probe_readmits_it(self):
+        register_endpoints([(1, "bad", 3), (2, "good", 1)])
+        bad = FailingChatModel(responses=["bad-ok"], failures=2)
+        good = FakeListChatModel(responses=["good"])
+        pooled = PooledChatModel(endpoints=[(1, bad), (2, good)], routing_mode=ROUTING_WEIGHTED)
+
+        # 两次调用都先落到 bad 后转移到 good，达到阈值后 bad 被摘除
+        self.assertEqual("good", pooled.invoke("hi").content)
+        self.assertEqual("good", asyncio.run(pooled.ainvoke("hi")).content)
+        self.assertEqual([2], choose_endpoints([1, 2], ROUTING_WEIGHTED))
+        self.assertEqual("good", "".join(chunk.content for chunk in pooled.stream("hi")))
+
+        stats = {endpoint["config_id"]: endpoint for endpoint in routing_stats()["endpoints"]}
+        self.assertFalse(stats[1]["healthy"])
+        self.assertEqual(2, stats[1]["failures"])
+
+        # 冷却期结束后放行一次探测请求，成功后恢复
+        router_module._endpoint_states[1].ejected_until = 0.0
+        self.assertEqual("bad-ok", pooled.invoke("hi").content)
+        self.assertTrue(routing_stats()["endpoints"][0]["healthy"])
+
+    def test_all_endpoints_failing_raises_last_error(self):
+        register_endpoints([(1, "a", 1), (2, "b", 1)])
+        pooled = PooledChatModel(
+            endpoints=[(1, FailingChatModel(responses=["x"])), (2, FailingChatModel(responses=["y"]))],
+        )
+        with self.assertRaises(ConnectionError):
+            pooled.invoke("hi")
+
+
+if __name__ == "__main__":
+    unittest.main()
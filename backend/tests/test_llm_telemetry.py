@@ -0,0 +1,154 @@
+import unittest
+from unittest.mock import patch
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base, import_models
+from app.models.llm_call import LLMCall
+from app.models.workflow_task import WorkflowTask  # noqa: F401  注册 User.workflow_tasks 关系
+from app.services import llm_telemetry
+from app.services.llm_telemetry import (
+    CALL_TYPE_EMBEDDING,
+    LLMTelemetryCallbackHandler,
+    aggregate_llm_calls,
+    attempt_config,
+    llm_call_context,
+    llm_call_recorder,
+    llm_feature,
+    record_cache_hit,
+    track_llm_call,
+)
+
+import_models()
+
+
+class FailingLLM(BaseChatModel):
+    """每次调用都抛出连接错误"""
+
+    @property
+    def _llm_type(self) -> str:
+        return "failing"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ConnectionError("provider down")
+
+
+class LLMTelemetryTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        self.patches = [
+            patch.object(llm_telemetry, "SessionLocal", self.SessionLocal),
+            patch.object(llm_telemetry.settings, "LLM_TELEMETRY_ENABLED", True),
+            # 测试中手动 flush，后台线程不应抢先写入
+            patch.object(llm_telemetry.settings, "LLM_TELEMETRY_FLUSH_SECONDS", 3600),
+        ]
+        for item in self.patches:
+            item.start()
+        llm_call_recorder.flush()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def _rows(self):
+        llm_call_recorder.flush()
+        db = self.SessionLocal()
+        try:
+            return db.query(LLMCall).order_by(LLMCall.id).all()
+        finally:
+            db.close()
+
+    def test_chat_calls_are_recorded_with_caller_attempt_and_errors(self):
+        handler = LLMTelemetryCallbackHandler("fake", "fake-model")
+        llm = FakeListChatModel(responses=["测试用例内容"], callbacks=[handler])
+        failing = FailingLLM(callbacks=[handler])
+
+        with llm_call_context("generate_test_cases", requirement_id=1):
+            with llm_call_context(test_point_id=2):
+                llm.invoke("生成测试用例", config=attempt_config(2))
+            with self.assertRaises(ConnectionError):
+                failing.invoke("生成测试用例")
+        # 未设置调用方时使用 LangGraph 写入的 metadata
+        llm.invoke("继续", config={"metadata": {"thread_id": "wf-1", "langgraph_node": "generate_body"}})
+
+        ok, failed, workflow = self._rows()
+        self.assertEqual(
+            ("generate_test_cases", 1, 2, "chat", "fake", "fake-model", 2, True, False),
+            (ok.feature, ok.requirement_id, ok.test_point_id, ok.call_type, ok.provider,
+             ok.model_name, ok.attempt, ok.success, ok.cache_hit),
+        )
+        self.assertGreater(ok.prompt_tokens, 0)
+        self.assertGreater(ok.completion_tokens, 0)
+        self.assertTrue(ok.tokens_estimated)
+        self.assertEqual((1, None, False, "ConnectionError"), (failed.requirement_id, failed.test_point_id, failed.success, failed.error_type))
+        self.assertEqual(("generate_body", "wf-1", None), (workflow.feature, workflow.thread_id, workflow.requirement_id))
+
+    def test_embeddings_and_cache_hits_are_recorded(self):
+        @llm_feature("knowledge_qa")
+        def embed():
+            record_cache_hit(CALL_TYPE_EMBEDDING, "openai", "embed-model")
+            with track_llm_call(CALL_TYPE_EMBEDDING, "openai", "embed-model", prompt_tokens=5) as usage:
+                usage["prompt_tokens"] = 12
+
+        embed()
+        with self.assertRaises(TimeoutError):
+            with track_llm_call(CALL_TYPE_EMBEDDING, "openai", "embed-model", prompt_tokens=5):
+                raise TimeoutError("slow")
+
+        hit, call, failed = self._rows()
+        self.assertEqual(("knowledge_qa", True, 0), (hit.feature, hit.cache_hit, hit.prompt_tokens))
+        self.assertEqual(("knowledge_qa", False, 12, False), (call.feature, call.cache_hit, call.prompt_tokens, call.tokens_estimated))
+        self.assertEqual(("other", False, 5, True), (failed.feature, failed.success, failed.prompt_tokens, failed.tokens_estimated))
+
+    def test_aggregation_reports_percentiles_tokens_and_retries(self):
+        for index in range(20):
+            llm_call_recorder.record(
+                {"feature": "extract_test_points"},
+                call_type="chat",
+                provider="fake",
+                model_name="m",
+                prompt_tokens=100,
+                cached_prompt_tokens=40,
+                completion_tokens=10,
+                latency_ms=float(index + 1) * 100,
+                attempt=2 if index == 0 else 1,
+                cache_hit=False,
+                success=index != 1,
+            )
+        with llm_call_context("extract_test_points"):
+            record_cache_hit("chat", "fake", "m")
+        with llm_call_context("knowledge_qa"):
+            record_cache_hit("chat", "fake", "m")
+        llm_call_recorder.flush()
+
+        db = self.SessionLocal()
+        try:
+            result = aggregate_llm_calls(db, hours=1, feature="extract_test_points")
+        finally:
+            db.close()
+
+        (item,) = result["items"]
+        self.assertEqual((21, 1, 1, 1), (item["calls"], item["errors"], item["retries"], item["cache_hits"]))
+        self.assertEqual((2000, 800, 200, 2200), (
+            item["prompt_tokens"], item["cached_prompt_tokens"], item["completion_tokens"], item["total_tokens"]
+        ))
+        # 缓存命中不计入延迟分布；百分位与 PostgreSQL percentile_cont 一致（线性插值）
+        self.assertEqual((1050.0, 1905.0), (item["p50_latency_ms"], item["p95_latency_ms"]))
+
+    def test_disabled_telemetry_records_nothing(self):
+        with patch.object(llm_telemetry.settings, "LLM_TELEMETRY_ENABLED", False):
+            record_cache_hit("chat", "fake", "m")
+            FakeListChatModel(responses=["a"], callbacks=[LLMTelemetryCallbackHandler("fake", "m")]).invoke("hi")
+        self.assertEqual([], self._rows())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from app.services.query_cache import LRUCache, QueryCache
+
+
+class QueryCacheTest(unittest.TestCase):
+    def test_embedding_cache_normalizes_question_text(self):
+        cache = QueryCache()
+        cache.set_embedding("  什么是 犹豫期？ ", [0.1, 0.2])
+
+        self.assertEqual([0.1, 0.2], cache.get_embedding("什么是   犹豫期？"))
+        self.assertEqual(1, cache.stats()["embedding"]["hits"])
+
+    def test_retrieval_cache_is_invalidated_per_collection(self):
+        cache = QueryCache()
+        embedding = [0.1, 0.2, 0.3]
+        cache.set_retrieval("knowledge_base", embedding, 5, ["doc-a"])
+        cache.set_retrieval("claims", embedding, 5, ["doc-b"])
+
+        cache.invalidate_collection("knowledge_base")
+
+        self.assertIsNone(cache.get_retrieval("knowledge_base", embedding, 5))
+        self.assertEqual(["doc-b"], cache.get_retrieval("claims", embedding, 5))
+        self.assertIsNone(cache.get_retrieval("claims", embedding, 3))
+        self.assertEqual(0.3333, cache.stats()["retrieval"]["hit_ratio"])
+
+    def test_lru_evicts_least_recently_used_entry(self):
+        cache = LRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(1, cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.stats()["evictions"])
+
+
+if __name__ == "__main__":
+    unittest.main()
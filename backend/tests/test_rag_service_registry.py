@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+
+from app.services import rag_service as rag_module
+from app.services.query_cache import QueryCache
+
+
+class FakeRAGService:
+    def __init__(self, db=None, config=None):
+        self.config = config
+        self.query_cache = QueryCache()
+
+    def cache_stats(self):
+        return self.query_cache.stats()
+
+
+class RAGServiceRegistryTest(unittest.TestCase):
+    def setUp(self):
+        rag_module.clear_rag_service_cache()
+        rag_module._retired_cache_stats.clear()
+
+    def tearDown(self):
+        rag_module.clear_rag_service_cache()
+        rag_module._retired_cache_stats.clear()
+
+    def test_repeated_lookups_reuse_instance_without_resolving_config(self):
+        config = {"model_name": "gpt-4", "embedding_model": "bge", "milvus_uri": "http://milvus"}
+
+        with (
+            patch.object(rag_module, "RAGService", FakeRAGService),
+            patch.object(rag_module, "resolve_rag_config", return_value=config) as mock_resolve,
+        ):
+            first = rag_module.get_rag_service(db=None)
+            second = rag_module.get_rag_service(db=None)
+
+        self.assertIs(first, second)
+        self.assertEqual(1, mock_resolve.call_count)
+
+    def test_clear_cache_rebuilds_with_new_config(self):
+        old_config = {"model_name": "gpt-4", "embedding_model": "bge"}
+        new_config = {"model_name": "gpt-4", "embedding_model": "bge-m3"}
+
+        with (
+            patch.object(rag_module, "RAGService", FakeRAGService),
+            patch.object(rag_module, "resolve_rag_config", side_effect=[old_config, new_config]),
+        ):
+            first = rag_module.get_rag_service(db=None)
+            rag_module.clear_rag_service_cache()
+            second = rag_module.get_rag_service(db=None)
+
+        self.assertIsNot(first, second)
+        self.assertEqual("bge-m3", second.config["embedding_model"])
+        self.assertNotEqual(
+            rag_module.rag_config_fingerprint(old_config),
+            rag_module.rag_config_fingerprint(new_config),
+        )
+
+    def test_clear_during_resolve_does_not_publish_stale_instance(self):
+        configs = iter([
+            {"model_name": "gpt-4", "embedding_model": "bge"},
+            {"model_name": "gpt-4o", "embedding_model": "bge"},
+        ])
+
+        def resolve(db):
+            config = next(configs)
+            if config["model_name"] == "gpt-4":
+                # 解析出旧配置后、写回缓存前，配置更新接口清除了缓存
+                rag_module.clear_rag_service_cache()
+            return config
+
+        with (
+            patch.object(rag_module, "RAGService", FakeRAGService),
+            patch.object(rag_module, "resolve_rag_config", side_effect=resolve),
+        ):
+            stale = rag_module.get_rag_service(db=None)
+            fresh = rag_module.get_rag_service(db=None)
+
+        self.assertEqual("gpt-4", stale.config["model_name"])
+        self.assertEqual("gpt-4o", fresh.config["model_name"])
+
+    def test_cache_stats_aggregate_without_creating_instances_and_survive_clear(self):
+        self.assertEqual(0, rag_module.rag_cache_stats()["instances"])
+
+        with (
+            patch.object(rag_module, "RAGService", FakeRAGService),
+            patch.object(rag_module, "resolve_rag_config", return_value={"model_name": "gpt-4"}),
+        ):
+            service = rag_module.get_rag_service(db=None)
+        service.query_cache.set_embedding("犹豫期", [0.1])
+        service.query_cache.get_embedding("犹豫期")
+        service.query_cache.get_embedding("理赔")
+
+        rag_module.clear_rag_service_cache()
+        stats = rag_module.rag_cache_stats()
+
+        self.assertEqual(0, stats["instances"])
+        self.assertEqual(1, stats["embedding"]["hits"])
+        self.assertEqual(1, stats["embedding"]["misses"])
+        self.assertEqual(0, stats["embedding"]["size"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,17 +19,15 @@ class FakeAIService:
     def __init__(self):
         self.called = False
 
-    def extract_test_points(self, requirement_text, allow_fallback=True):
+    def stream_test_points(self, requirement_text):
         self.called = True
-        return [
-            {
-                "title": "数据库模型生成的测试点",
-                "description": "来自数据库模型配置",
-                "category": "功能",
-                "priority": "high",
-                "business_line": "contract",
-            }
-        ]
+        yield {
+            "title": "数据库模型生成的测试点",
+            "description": "来自数据库模型配置",
+            "category": "功能",
+            "priority": "high",
+            "business_line": "contract",
+        }
 
 
 class RequirementAIConfigTest(unittest.TestCase):
@@ -107,6 +105,7 @@ class RequirementAIConfigTest(unittest.TestCase):
             patch.object(requirements_module, "allocate_requirement_version", return_value="v1"),
             patch.object(requirements_module, "record_history_entry"),
             patch.object(requirements_module.manager, "notify_test_point_generated", new=Mock(return_value=None)),
+            patch.object(requirements_module.manager, "notify_test_point_created", new=Mock(return_value=None)) as notify_created,
         ):
             requirements_module.process_requirement_background(
                 self.requirement_id,
@@ -120,6 +119,7 @@ class RequirementAIConfigTest(unittest.TestCase):
             self.assertTrue(fake_ai_service.called)
             self.assertEqual(1, len(saved_points))
             self.assertEqual("数据库模型生成的测试点", saved_points[0].title)
+            self.assertEqual(1, notify_created.call_count)
         finally:
             db.close()
 
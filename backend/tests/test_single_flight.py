@@ -0,0 +1,150 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from langchain_core.messages import AIMessage
+
+from app.services import ai_service as ai_service_module
+from app.services import single_flight as single_flight_module
+from app.services.ai_service import AIService
+from app.services.single_flight import SingleFlight
+
+CALLERS = 8
+
+
+class SlowLLM:
+    """返回固定场景编号，记录实际调用次数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, messages, config=None):
+        with self.lock:
+            self.calls += 1
+        time.sleep(0.2)
+        return AIMessage(content="S-2")
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.patches = [
+            patch.object(single_flight_module.settings, "LLM_SINGLE_FLIGHT_ENABLED", True),
+            patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False),
+        ]
+        for item in self.patches:
+            item.start()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def _run_concurrently(self, func):
+        barrier = threading.Barrier(CALLERS)
+
+        def call(_):
+            barrier.wait()
+            try:
+                return func()
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+            return list(pool.map(call, range(CALLERS)))
+
+    def test_concurrent_identical_calls_share_one_execution(self):
+        flight = SingleFlight("test")
+        executions = []
+
+        def fetch():
+            executions.append(1)
+            time.sleep(0.2)
+            return {"items": [1, 2]}
+
+        results = self._run_concurrently(lambda: flight.do("same", fetch))
+
+        self.assertEqual(1, len(executions))
+        self.assertTrue(all(result == {"items": [1, 2]} for result in results))
+        # 每个调用方拿到各自的副本
+        self.assertEqual(CALLERS, len({id(result) for result in results}))
+        stats = flight.stats()
+        self.assertEqual((CALLERS, 1, CALLERS - 1, 0), (stats["calls"], stats["executions"], stats["coalesced"], stats["inflight"]))
+
+    def test_failure_is_shared_and_next_call_executes_again(self):
+        flight = SingleFlight("test")
+        executions = []
+
+        def fetch():
+            executions.append(1)
+            time.sleep(0.2)
+            raise ConnectionError("provider down")
+
+        results = self._run_concurrently(lambda: flight.do("same", fetch))
+
+        self.assertEqual(1, len(executions))
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual("ok", flight.do("same", lambda: "ok"))
+
+    def test_async_callers_are_coalesced(self):
+        flight = SingleFlight("test")
+        executions = []
+
+        async def fetch():
+            executions.append(1)
+            await asyncio.sleep(0.1)
+            return [0.1, 0.2]
+
+        async def main():
+            return await asyncio.gather(*(flight.ado("query", fetch) for _ in range(5)))
+
+        results = asyncio.run(main())
+
+        self.assertEqual(1, len(executions))
+        self.assertEqual([[0.1, 0.2]] * 5, results)
+
+    def test_cancelled_owner_does_not_cancel_waiters(self):
+        flight = SingleFlight("test")
+        executions = []
+
+        async def fetch():
+            executions.append(1)
+            await asyncio.sleep(0.1)
+            return "ok"
+
+        async def main():
+            owner = asyncio.ensure_future(flight.ado("query", fetch))
+            await asyncio.sleep(0)
+            waiters = [asyncio.ensure_future(flight.ado("query", fetch)) for _ in range(3)]
+            await asyncio.sleep(0.02)
+            owner.cancel()
+            # 取消等待方同样不影响其他调用方
+            waiters[0].cancel()
+            results = await asyncio.gather(owner, *waiters, return_exceptions=True)
+            return results, flight.stats()["inflight"]
+
+        results, inflight = asyncio.run(main())
+
+        self.assertIsInstance(results[0], asyncio.CancelledError)
+        self.assertIsInstance(results[1], asyncio.CancelledError)
+        self.assertEqual(["ok", "ok"], results[2:])
+        self.assertEqual((1, 0), (len(executions), inflight))
+
+    def test_identical_scenario_selection_calls_llm_once(self):
+        service = AIService.__new__(AIService)
+        service.db = None
+        service.llm = SlowLLM()
+        scenarios = [{"scenario_code": f"S-{index}", "name": f"场景{index}"} for index in range(3)]
+        before = single_flight_module.llm_single_flight.stats()["coalesced"]
+
+        results = self._run_concurrently(lambda: service.select_best_scenario({"title": "退保"}, scenarios))
+
+        self.assertEqual(1, service.llm.calls)
+        self.assertEqual(["S-2"] * CALLERS, [result["scenario_code"] for result in results])
+        self.assertEqual(CALLERS - 1, single_flight_module.llm_single_flight.stats()["coalesced"] - before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from app.services.sse import coalesce_token_events, format_sse
+
+
+async def token_stream(tokens, delay=0.0, tail_delay=0.0):
+    yield {"type": "sources", "sources": [{"index": 1}]}
+    for token in tokens:
+        if delay:
+            await asyncio.sleep(delay)
+        yield {"type": "token", "content": token}
+    if tail_delay:
+        await asyncio.sleep(tail_delay)
+    yield {"type": "done", "answer": "".join(tokens)}
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+class CoalesceTokenEventsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_burst_of_tokens_is_merged_into_size_bounded_frames(self):
+        tokens = ["犹豫"] * 300
+
+        events = await collect(coalesce_token_events(token_stream(tokens), interval=1, max_chars=256))
+
+        frames = [event["content"] for event in events if event["type"] == "token"]
+        self.assertEqual(["sources", "token", "token", "token", "done"], [event["type"] for event in events])
+        self.assertEqual("".join(tokens), "".join(frames))
+        self.assertTrue(all(len(frame) <= 256 for frame in frames))
+
+    async def test_buffer_is_flushed_when_window_expires_while_upstream_stalls(self):
+        events = coalesce_token_events(
+            token_stream(["犹豫期", "为 15 天"], tail_delay=0.5), interval=0.03, max_chars=256
+        )
+
+        self.assertEqual("sources", (await events.__anext__())["type"])
+        token = await asyncio.wait_for(events.__anext__(), timeout=0.3)
+        self.assertEqual({"type": "token", "content": "犹豫期为 15 天"}, token)
+        await events.aclose()
+
+    async def test_format_sse_keeps_chinese_readable(self):
+        self.assertEqual('data: {"type": "token", "content": "犹豫期"}\n\n', format_sse({"type": "token", "content": "犹豫期"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import asyncio
+import unittest
+from typing import Any, List
+from unittest.mock import patch
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from app.services import ai_service as ai_service_module
+from app.services.ai_service import AIService, get_structured_output_stats
+
+
+class ScriptedToolCallingLLM(BaseChatModel):
+    """依次返回预设的结构化 tool call，记录每次请求的最后一条消息"""
+    responses: List[Any] = []
+    requests: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-tool-calling"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.requests.append(messages[-1].content)
+        name, args = self.responses.pop(0)
+        message = AIMessage(
+            content="",
+            tool_calls=[{"name": name, "args": args, "id": f"call-{len(self.requests)}"}],
+            usage_metadata={"input_tokens": 100, "output_tokens": 20, "total_tokens": 120},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _test_point(title, priority="high", business_line="contract"):
+    return {"title": title, "description": "", "category": "功能", "priority": priority, "business_line": business_line}
+
+
+def _test_case(title, steps=True):
+    return {
+        "title": title,
+        "description": "",
+        "test_steps": [{"step": 1, "action": "提交", "expected": "成功"}] if steps else [],
+        "expected_result": "成功",
+    }
+
+
+class StructuredOutputTest(unittest.TestCase):
+    def setUp(self):
+        self.service = AIService.__new__(AIService)
+        self.service.db = None
+        self.patches = [
+            patch.object(ai_service_module.settings, "AI_MAX_RETRIES", 1),
+            patch.object(ai_service_module.settings, "LLM_CACHE_ENABLED", False),
+        ]
+        for item in self.patches:
+            item.start()
+        self.before = get_structured_output_stats()
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def _delta(self, name):
+        return get_structured_output_stats()[name] - self.before[name]
+
+    def test_only_invalid_test_point_is_repaired(self):
+        self.service.llm = ScriptedToolCallingLLM(responses=[
+            ("TestPointDraftList", {"test_points": [
+                _test_point("TP-1", business_line="contract-契约"),
+                _test_point("TP-2", priority="urgent"),
+                _test_point("TP-3", priority="低", business_line="理赔"),
+            ]}),
+            ("TestPointDraft", _test_point("TP-2", priority="medium")),
+        ])
+
+        test_points = self.service.extract_test_points("需求")
+
+        self.assertEqual(["TP-1", "TP-2", "TP-3"], [point["title"] for point in test_points])
+        self.assertEqual(["high", "medium", "low"], [point["priority"] for point in test_points])
+        self.assertEqual(["contract", "contract", "claim"], [point["business_line"] for point in test_points])
+        # 修复请求只携带不合法的那一条
+        self.assertEqual(2, len(self.service.llm.requests))
+        self.assertIn("第 2 个测试点", self.service.llm.requests[1])
+        self.assertIn('"TP-2"', self.service.llm.requests[1])
+        self.assertNotIn('"TP-1"', self.service.llm.requests[1])
+        self.assertEqual(1, self._delta("parse_failures"))
+        self.assertEqual(1, self._delta("repaired_items"))
+        self.assertEqual(120, self._delta("repair_tokens"))
+
+    def test_failed_test_point_extraction_raises_and_is_counted(self):
+        # 模型无可用响应：调用失败
+        self.service.llm = ScriptedToolCallingLLM(responses=[])
+
+        with self.assertRaises(Exception):
+            self.service.extract_test_points("需求")
+        self.assertEqual(1, self._delta("extract_failures"))
+
+    def test_unrepairable_test_case_is_dropped(self):
+        self.service.llm = ScriptedToolCallingLLM(responses=[
+            ("TestCaseDraftList", {"test_cases": [_test_case("TC-1"), _test_case("TC-2", steps=False)]}),
+            ("TestCaseDraft", _test_case("TC-2", steps=False)),
+        ])
+
+        test_cases = self.service.generate_test_cases({"title": "TP"})
+
+        self.assertEqual(["TC-1"], [case["title"] for case in test_cases])
+        self.assertEqual({"step": 1, "action": "提交", "expected": "成功"}, test_cases[0]["test_steps"][0])
+        self.assertEqual(1, self._delta("dropped_items"))
+
+    def test_test_case_prompts_share_a_stable_prefix(self):
+        context = "[片段 1/1]\n保单生效后可申请退保。{金额} 按现金价值计算。"
+        first = self.service.build_test_case_messages({"title": "TP-1", "description": "正常退保"}, context)
+        second = self.service.build_test_case_messages({"title": "TP-2", "description": "超期退保"}, context)
+
+        self.assertEqual(first[0].content, second[0].content)
+        prefix = first[1].content.split("测试点信息：")[0]
+        self.assertTrue(second[1].content.startswith(prefix))
+        self.assertIn(context, prefix)
+        self.assertNotIn("TP-1", prefix)
+
+    def test_all_invalid_test_cases_fail_instead_of_returning_example_data(self):
+        self.service.llm = ScriptedToolCallingLLM(responses=[
+            ("TestCaseDraftList", {"test_cases": [_test_case("TC-1", steps=False)]}),
+            ("TestCaseDraft", {"title": "TC-1"}),
+        ])
+        messages = self.service.build_test_case_messages({"title": "TP"})
+
+        with self.assertRaises(ValueError):
+            asyncio.run(self.service.agenerate_test_cases(messages, {"title": "TP"}))
+
+
+if __name__ == "__main__":
+    unittest.main()
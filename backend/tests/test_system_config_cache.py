@@ -0,0 +1,105 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.base import Base, import_models
+from app.models.system_config import SystemConfig
+from app.models.workflow_task import WorkflowTask  # noqa: F401  注册 User.workflow_tasks 关系
+from app.services import ai_service as ai_service_module
+from app.services import rag_service as rag_service_module
+from app.services import system_config_cache as cache_module
+from app.services.ai_service import AIService
+from app.services.system_config_cache import SystemConfigCache, system_config_cache
+
+import_models()
+
+
+class SystemConfigCacheTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.SessionLocal = sessionmaker(bind=engine)
+        self.patches = [
+            patch.object(cache_module, "SessionLocal", self.SessionLocal),
+            patch.object(cache_module.settings, "SYSTEM_CONFIG_VERSION_CHECK_SECONDS", 3600),
+        ]
+        for item in self.patches:
+            item.start()
+        self._write("TEST_POINT_PROMPT", "prompt-v1")
+
+    def tearDown(self):
+        for item in reversed(self.patches):
+            item.stop()
+
+    def _write(self, key, value):
+        db = self.SessionLocal()
+        config = db.query(SystemConfig).filter(SystemConfig.config_key == key).first()
+        if config is None:
+            db.add(SystemConfig(config_key=key, config_value=value))
+        else:
+            config.config_value = value
+        db.commit()
+        db.close()
+
+    def test_reads_are_served_from_memory_until_invalidated(self):
+        cache = SystemConfigCache()
+
+        self.assertEqual("prompt-v1", cache.get("TEST_POINT_PROMPT"))
+        self.assertEqual("默认", cache.get("MISSING", "默认"))
+        self._write("TEST_POINT_PROMPT", "prompt-v2")
+        self.assertEqual("prompt-v1", cache.get("TEST_POINT_PROMPT"))
+        self.assertEqual(1, cache.stats()["loads"])
+
+        cache.invalidate()
+
+        self.assertEqual({"TEST_POINT_PROMPT": "prompt-v2"}, cache.get_many(["TEST_POINT_PROMPT", "MISSING"]))
+        self.assertEqual((2, 1), (cache.stats()["loads"], cache.stats()["version"]))
+
+    def test_other_workers_reload_when_shared_version_changes(self):
+        writer, reader = SystemConfigCache(), SystemConfigCache()
+        self.assertEqual("prompt-v1", reader.get("TEST_POINT_PROMPT"))
+
+        self._write("TEST_POINT_PROMPT", "prompt-v2")
+        writer.invalidate()
+        self.assertEqual("prompt-v1", reader.get("TEST_POINT_PROMPT"))
+
+        with patch.object(cache_module.settings, "SYSTEM_CONFIG_VERSION_CHECK_SECONDS", 0):
+            self.assertEqual("prompt-v2", reader.get("TEST_POINT_PROMPT"))
+            reader.get("TEST_POINT_PROMPT")
+        # 版本号未变化时只检查版本，不重新加载
+        self.assertEqual(2, reader.stats()["loads"])
+
+    def test_service_registries_are_cleared_when_another_worker_writes(self):
+        writer = SystemConfigCache()
+        with patch.object(cache_module.settings, "SYSTEM_CONFIG_VERSION_CHECK_SECONDS", 0):
+            system_config_cache.get("TEST_POINT_PROMPT")
+            ai_service_module._ai_service_cache["stale"] = object()
+            rag_service_module._rag_config_cache = {"model": "old"}
+
+            # 版本号未变化：保留实例
+            system_config_cache.get("TEST_POINT_PROMPT")
+            self.assertIn("stale", ai_service_module._ai_service_cache)
+
+            self._write("TEST_POINT_PROMPT", "prompt-v2")
+            writer.invalidate()
+            self.assertEqual("prompt-v2", system_config_cache.get("TEST_POINT_PROMPT"))
+
+        self.assertNotIn("stale", ai_service_module._ai_service_cache)
+        self.assertIsNone(rag_service_module._rag_config_cache)
+
+    def test_ai_service_prompts_come_from_cache(self):
+        service = AIService.__new__(AIService)
+        service.db = None
+
+        with patch("app.services.ai_service.system_config_cache", SystemConfigCache()):
+            self.assertEqual("prompt-v1", service._get_prompt_from_db("TEST_POINT_PROMPT", "默认"))
+            self.assertEqual("默认", service._get_prompt_from_db("TEST_CASE_PROMPT", "默认"))
+
+
+if __name__ == "__main__":
+    unittest.main()
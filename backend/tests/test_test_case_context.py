@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.services import test_case_context_service as context_module
+
+
+class TestCaseContextTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = Path(self.tmp_dir.name) / "requirement.txt"
+        path.write_text("犹豫期条款。" * 2000, encoding="utf-8")
+        self.requirement = SimpleNamespace(id=1, file_path=str(path), file_type=SimpleNamespace(value="txt"))
+        context_module._document_tokens.clear()
+        self.test_point = {"title": "犹豫期退保", "description": "犹豫期内退保全额退费"}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_retrieves_chunks_for_requirement_within_token_budget(self):
+        hits = [
+            {"chunk_index": 7, "text": "犹豫期内退保退还全部保费"},
+            {"chunk_index": 2, "text": "犹豫期为 15 天"},
+            {"chunk_index": 9, "text": "超" * 500},
+        ]
+        with patch.object(context_module.settings, "EMBEDDING_API_KEY", "key"), \
+                patch.object(context_module.document_embedding_service, "embed_query", return_value=[0.1]) as embed, \
+                patch.object(context_module.milvus_service, "search", return_value=hits) as search:
+            context, stats = context_module.build_test_case_context(
+                self.requirement, self.test_point, top_k=3, token_budget=100
+            )
+
+        embed.assert_called_once()
+        self.assertEqual(1, search.call_args.kwargs["requirement_id"])
+        self.assertEqual(3, search.call_args.kwargs["top_k"])
+        # 超出预算的片段被跳过，其余按原文顺序排列
+        self.assertLess(context.index("15 天"), context.index("全部保费"))
+        self.assertNotIn("超超", context)
+        self.assertEqual(("retrieval", 2), (stats["source"], stats["chunks"]))
+        self.assertLessEqual(stats["context_tokens"], 100)
+        self.assertEqual(stats["document_tokens"] - stats["context_tokens"], stats["tokens_saved"])
+        self.assertGreater(stats["tokens_saved"], 10000)
+
+    def test_falls_back_to_truncated_document_without_vectors(self):
+        with patch.object(context_module.settings, "EMBEDDING_API_KEY", "key"), \
+                patch.object(context_module.document_embedding_service, "embed_query", return_value=[0.1]), \
+                patch.object(context_module.milvus_service, "search", side_effect=RuntimeError("milvus down")):
+            context, stats = context_module.build_test_case_context(
+                self.requirement, self.test_point, token_budget=200
+            )
+
+        self.assertEqual("document", stats["source"])
+        self.assertEqual(200, len(context))
+        self.assertLessEqual(stats["context_tokens"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
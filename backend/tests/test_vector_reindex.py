@@ -0,0 +1,221 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.base import Base, import_models
+from app.models.knowledge_base import KnowledgeDocument
+from app.models.system_config import SystemConfig, SystemConfigVersion
+from app.models.vector_reindex_job import VectorReindexJob
+from app.models.workflow_task import WorkflowTask
+from app.services import collection_routes
+from app.services import system_config_cache as cache_module
+from app.services import vector_reindex_service as reindex_module
+
+import_models()
+
+
+class FakeRAGService:
+    def __init__(self, on_write=None):
+        self.writes = []
+        self.on_write = on_write
+
+    def split_documents(self, documents, metadatas):
+        return list(documents), list(metadatas), [1] * len(documents)
+
+    def write_chunks(self, physical_name, embedding_model, splits, metadatas, replace_document_ids=None):
+        self.writes.append((physical_name, embedding_model, tuple(replace_document_ids or ())))
+        if self.on_write:
+            self.on_write()
+
+
+class VectorReindexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(
+            f"sqlite:///{Path(self.tmp_dir.name) / 'test.db'}", connect_args={"check_same_thread": False}
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.SessionTesting = sessionmaker(bind=self.engine)
+        self.db = self.SessionTesting()
+        self.rag_service = FakeRAGService()
+        self.patches = [
+            patch.object(reindex_module, "SessionLocal", self.SessionTesting),
+            patch.object(collection_routes, "SessionLocal", self.SessionTesting),
+            patch.object(cache_module, "SessionLocal", self.SessionTesting),
+            # 每次读取都检查共享版本号，模拟其他 worker 的变更立即可见
+            patch.object(cache_module.settings, "SYSTEM_CONFIG_VERSION_CHECK_SECONDS", 0),
+            patch.object(reindex_module, "get_rag_service", lambda db=None: self.rag_service),
+            patch.object(reindex_module, "resolve_rag_config", lambda db=None: {"embedding_model": "bge-m3"}),
+            patch.object(reindex_module, "invalidate_rag_collection", lambda name: None),
+            patch.object(reindex_module.settings, "VECTOR_REINDEX_BATCH_SIZE", 1),
+            patch.object(reindex_module.settings, "VECTOR_REINDEX_CHUNKS_PER_SECOND", 0),
+        ]
+        for item in self.patches:
+            item.start()
+        cache_module.system_config_cache.invalidate()
+        collection_routes.clear_collection_routes_cache()
+        # 模型变更前，集合固定到旧模型
+        collection_routes.pin_collection_models(self.db, ["knowledge_base"], "bge-large")
+
+    def tearDown(self):
+        cache_module.system_config_cache.invalidate()
+        for item in reversed(self.patches):
+            item.stop()
+        collection_routes.clear_collection_routes_cache()
+        self.db.close()
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def add_document(self, content, status="active"):
+        document = KnowledgeDocument(
+            title="条款", content=content, collection_name="knowledge_base",
+            is_vectorized=True, status=status, vector_ids=json.dumps([1]),
+        )
+        self.db.add(document)
+        self.db.commit()
+        return document.id
+
+    def job_state(self, job_id):
+        db = self.SessionTesting()
+        try:
+            return reindex_module.reindex_job_report(db.get(VectorReindexJob, job_id))
+        finally:
+            db.close()
+
+    def test_backfill_switches_reads_only_after_completion(self):
+        first = self.add_document("犹豫期 15 天")
+        second = self.add_document("等待期 90 天")
+        self.add_document("已归档条款", status="archived")
+
+        job = reindex_module.create_reindex_job(self.db, "knowledge_base", user_id=None)
+        shadow = collection_routes.get_shadow_target("knowledge_base")
+        self.assertEqual(job.target_collection, shadow["collection"])
+        # 切换前读取仍走旧集合与旧模型
+        self.assertEqual(("knowledge_base", "bge-large"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+
+        reindex_module.run_reindex_job(job.id)
+
+        self.assertEqual(
+            [(job.target_collection, "bge-m3", (first,)), (job.target_collection, "bge-m3", (second,))],
+            self.rag_service.writes,
+        )
+        report = self.job_state(job.id)
+        self.assertEqual("completed", report["status"])
+        self.assertEqual((2, 2, 100), (report["total_items"], report["processed_items"], report["progress"]))
+        self.assertEqual((job.target_collection, "bge-m3"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+        self.assertIsNone(collection_routes.get_shadow_target("knowledge_base"))
+
+        db = self.SessionTesting()
+        try:
+            self.assertIsNone(db.get(KnowledgeDocument, first).vector_ids)
+            collection_routes.load_collection_routes(db)
+        finally:
+            db.close()
+        self.assertEqual((job.target_collection, "bge-m3"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+
+    def test_paused_job_resumes_from_checkpoint(self):
+        first = self.add_document("犹豫期 15 天")
+        second = self.add_document("等待期 90 天")
+        job = reindex_module.create_reindex_job(self.db, "knowledge_base")
+
+        def pause_after_first_batch():
+            db = self.SessionTesting()
+            try:
+                reindex_module.pause_reindex_job(db, db.get(VectorReindexJob, job.id))
+            finally:
+                db.close()
+
+        self.rag_service.on_write = pause_after_first_batch
+        reindex_module.run_reindex_job(job.id)
+
+        report = self.job_state(job.id)
+        self.assertEqual(("paused", first, 1), (report["status"], report["checkpoint_id"], report["processed_items"]))
+        self.assertEqual(("knowledge_base", "bge-large"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+
+        self.rag_service.on_write = None
+        db = self.SessionTesting()
+        try:
+            reindex_module.resume_reindex_job(db, db.get(VectorReindexJob, job.id))
+        finally:
+            db.close()
+        reindex_module.run_reindex_job(job.id)
+
+        self.assertEqual([(first,), (second,)], [write[2] for write in self.rag_service.writes])
+        self.assertEqual("completed", self.job_state(job.id)["status"])
+
+    def test_failed_dual_writes_are_repaired_before_switch(self):
+        self.add_document("犹豫期 15 天")
+        job = reindex_module.create_reindex_job(self.db, "knowledge_base")
+        # 任务创建后新增的文档依赖双写，双写失败时由任务补写
+        late = self.add_document("新增条款")
+        collection_routes.record_shadow_write_failure("knowledge_base", late)
+
+        reindex_module.run_reindex_job(job.id)
+
+        self.assertIn((late,), [write[2] for write in self.rag_service.writes])
+        self.assertEqual("completed", self.job_state(job.id)["status"])
+
+    def test_other_workers_follow_shadow_and_switch_through_shared_version(self):
+        document_id = self.add_document("犹豫期 15 天")
+        self.assertEqual(("knowledge_base", "bge-large"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+
+        # 另一个 worker 创建任务并切换：直接写数据库并递增共享版本号，本进程未收到任何内存通知
+        def other_worker(change):
+            db = self.SessionTesting()
+            try:
+                change(db)
+                db.query(SystemConfigVersion).filter(SystemConfigVersion.id == 1).update(
+                    {SystemConfigVersion.version: SystemConfigVersion.version + 1}
+                )
+                db.commit()
+            finally:
+                db.close()
+
+        other_worker(lambda db: db.add(VectorReindexJob(
+            id=7, collection_name="knowledge_base", source_collection="knowledge_base", source_model="bge-large",
+            target_collection="knowledge_base_v7", target_model="bge-m3", status="running",
+        )))
+        self.assertEqual("knowledge_base_v7", collection_routes.get_shadow_target("knowledge_base")["collection"])
+
+        collection_routes.record_shadow_write_failure("knowledge_base", document_id)
+        self.assertEqual([document_id], collection_routes.shadow_write_failures(self.db, 7))
+
+        def switch(db):
+            db.get(VectorReindexJob, 7).status = "completed"
+            config = db.query(SystemConfig).filter(SystemConfig.config_key == collection_routes.ROUTES_CONFIG_KEY).one()
+            config.config_value = json.dumps({"knowledge_base": {"collection": "knowledge_base_v7", "embedding_model": "bge-m3"}})
+
+        other_worker(switch)
+        self.assertEqual(("knowledge_base_v7", "bge-m3"), collection_routes.resolve_collection("knowledge_base", "bge-m3"))
+        self.assertIsNone(collection_routes.get_shadow_target("knowledge_base"))
+
+    def test_documents_changed_before_other_workers_dual_write_are_repaired(self):
+        deleted = self.add_document("等待期 90 天")
+        job = reindex_module.create_reindex_job(self.db, "knowledge_base")
+        # 尚未刷新双写状态的 worker 新增与删除的文档只作用于旧集合
+        late = self.add_document("新增条款")
+        document = self.db.get(KnowledgeDocument, deleted)
+        document.status = "deleted"
+        self.db.commit()
+
+        reindex_module.run_reindex_job(job.id)
+
+        self.assertIn((job.target_collection, "bge-m3", (late,)), self.rag_service.writes)
+        self.assertEqual((job.target_collection, "bge-m3", (deleted,)), self.rag_service.writes[-1])
+        self.assertEqual("completed", self.job_state(job.id)["status"])
+
+    def test_second_job_for_same_collection_is_rejected(self):
+        self.add_document("犹豫期 15 天")
+        reindex_module.create_reindex_job(self.db, "knowledge_base")
+
+        with self.assertRaises(ValueError):
+            reindex_module.create_reindex_job(self.db, "knowledge_base")
+
+
+if __name__ == "__main__":
+    unittest.main()
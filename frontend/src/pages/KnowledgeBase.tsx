@@ -84,6 +84,7 @@ const KnowledgeBase: React.FC = () => {
   const [loading, setLoading] = useState(false)
   const [streaming, setStreaming] = useState(false)
   const [messages, setMessages] = useState<Message[]>([])
+  const [sessionId, setSessionId] = useState<string | null>(null)
   const [documents, setDocuments] = useState<KnowledgeDocument[]>([])
   const [uploadModalVisible, setUploadModalVisible] = useState(false)
   const [uploadForm] = Form.useForm()
@@ -146,11 +147,15 @@ const KnowledgeBase: React.FC = () => {
     setLoading(true)
     setStreaming(true)
     try {
-      // 构建对话历史 (只发送最近的消息,不包括当前问题)
-      const chatHistory = messages.map(msg => ({
-        role: msg.type === 'user' ? 'user' : 'assistant',
-        content: msg.content,
-      }))
+      // 对话历史由服务端会话维护，首次提问时创建会话
+      let currentSessionId = sessionId
+      if (!currentSessionId) {
+        const sessionResponse = await api.post('/knowledge-base/sessions', {
+          collection_name: 'knowledge_base',
+        })
+        currentSessionId = sessionResponse.data.id as string
+        setSessionId(currentSessionId)
+      }
 
       // 使用流式 API
       const response = await fetch('/api/v1/knowledge-base/query/stream', {
@@ -164,7 +169,7 @@ const KnowledgeBase: React.FC = () => {
           collection_name: 'knowledge_base',
           top_k: 5,
           return_source: true,
-          chat_history: chatHistory,  // 发送对话历史
+          session_id: currentSessionId,  // 服务端会话ID
         }),
       })
 
@@ -212,8 +217,11 @@ const KnowledgeBase: React.FC = () => {
                       : msg
                   ))
                 } else if (data.type === 'done') {
-                  // 完成
+                  // 完成 (命中语义答案缓存时来源随 done 一并返回)
                   fullAnswer = data.answer
+                  if (data.sources) {
+                    sources = data.sources
+                  }
                   setMessages(prev => prev.map(msg =>
                     msg.id === assistantMessageId
                       ? { ...msg, content: fullAnswer, sources }
@@ -282,6 +290,10 @@ const KnowledgeBase: React.FC = () => {
       title: '确认清空对话',
       content: '确定要清空当前对话记录吗?',
       onOk: () => {
+        if (sessionId) {
+          api.delete(`/knowledge-base/sessions/${sessionId}`).catch(() => {})
+        }
+        setSessionId(null)
         setMessages([])
         message.success('对话已清空')
       },